@@ -49,6 +49,8 @@ PUBLISH_DISTRIBUTION_STEP = 'distribution'
 PUBLISH_METADATA_STEP = 'metadata'
 PUBLISH_INIT_REPOMD_STEP = 'initialize_repo_metadata'
 PUBLISH_CLOSE_REPOMD_STEP = 'close_repo_metadata'
+PUBLISH_INIT_INCREMENTAL_STEP = 'initialize_incremental_export'
+PUBLISH_CLOSE_INCREMENTAL_STEP = 'close_incremental_export'
 PUBLISH_TO_MASTER_STEP = 'publish_to_master'
 PUBLISH_CLEAR_OLD_MASTERS = 'remove_old_masters'
 PUBLISH_OVER_HTTP_STEP = 'publish_over_http'
@@ -58,6 +60,9 @@ PUBLISH_GENERATE_LISTING_FILE_STEP = 'initialize_repo_metadata'
 PUBLISH_STEP_ISO = 'save_iso'
 PUBLISH_GENERATE_SQLITE_FILE_STEP = 'generate sqlite'
 PUBLISH_STEP_EXPORT_REPO_GROUP = 'export_repo_group'
+PUBLISH_STEP_CONCURRENT_EXPORT = 'concurrent_export'
+PUBLISH_REALIZE_TREE_STEP = 'realize_tree'
+PUBLISH_COPY_PUBLISHED_TREE_STEP = 'copy_published_tree'
 
 PUBLISH_STEPS = (PUBLISH_RPMS_STEP, PUBLISH_DELTA_RPMS_STEP, PUBLISH_ERRATA_STEP,
                  PUBLISH_COMPS_STEP, PUBLISH_DISTRIBUTION_STEP, PUBLISH_METADATA_STEP,
@@ -133,13 +138,24 @@ END_DATE_KEYWORD = 'end_date'
 EXPORT_DIRECTORY_KEYWORD = 'export_dir'
 ISO_PREFIX_KEYWORD = 'iso_prefix'
 ISO_SIZE_KEYWORD = 'iso_size'
+ISO_WORKERS_KEYWORD = 'iso_workers'
+ISO_PACKING_KEYWORD = 'iso_packing'
+EXPORT_WORKERS_KEYWORD = 'export_workers'
 SKIP_KEYWORD = 'skip'
 START_DATE_KEYWORD = 'start_date'
 GENERATE_SQLITE_KEYWORD = 'generate_sqlite'
+LINK_TYPE_KEYWORD = 'link_type'
 RELATIVE_URL_KEYWORD = 'relative_url'
 EXPORT_OPTIONAL_CONFIG_KEYS = (END_DATE_KEYWORD, ISO_PREFIX_KEYWORD, SKIP_KEYWORD,
                                EXPORT_DIRECTORY_KEYWORD, START_DATE_KEYWORD, ISO_SIZE_KEYWORD,
-                               GENERATE_SQLITE_KEYWORD, CREATE_PULP_MANIFEST, RELATIVE_URL_KEYWORD)
+                               GENERATE_SQLITE_KEYWORD, CREATE_PULP_MANIFEST, RELATIVE_URL_KEYWORD,
+                               ISO_WORKERS_KEYWORD, ISO_PACKING_KEYWORD, EXPORT_WORKERS_KEYWORD)
+
+# How packages and distribution files are placed in a published repository
+LINK_TYPE_SYMLINK = 'symlink'
+LINK_TYPE_HARDLINK = 'hardlink'
+LINK_TYPE_REFLINK = 'reflink'
+LINK_TYPES = (LINK_TYPE_SYMLINK, LINK_TYPE_HARDLINK, LINK_TYPE_REFLINK)
 
 EXPORT_HTTP_DIR = '/var/lib/pulp/published/http/exports/repo'
 EXPORT_HTTPS_DIR = '/var/lib/pulp/published/https/exports/repo'
@@ -181,3 +197,5 @@ REPO_AUTH_CONFIG_FILE = '/etc/pulp/repo_auth.conf'
 # used in the scratchpad
 REPOMD_REVISION_KEY = 'repomd_revision'
 PREVIOUS_SKIP_LIST = 'previous_skip_list'
+# the checksum of the PULP_MANIFEST and the settings of the last successful ISO sync
+PREVIOUS_ISO_MANIFEST = 'previous_iso_manifest'
@@ -1,4 +1,11 @@
+import errno
+import gzip
 import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+
+from pulp.common.compat import json
 
 CHECKSUM_CHUNK_SIZE = 32 * 1024 * 1024
 
@@ -34,3 +41,93 @@ def calculate_size(file_handle):
     file_handle.seek(0, 2)
     size = file_handle.tell()
     return size
+
+
+@contextmanager
+def atomic_write(path):
+    """
+    Write a file under a temporary name in the same directory and rename it into place once the
+    block exits without an exception, so readers never see a partial file. A file already at the
+    path is replaced, and missing parent directories are created.
+
+    :param path:    path of the file to write
+    :type  path:    str
+
+    :return:    context manager that yields the temporary file, opened for binary writing
+    :rtype:     contextmanager
+    """
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory)
+    except OSError, e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        temp_file = os.fdopen(fd, 'wb')
+        try:
+            yield temp_file
+        finally:
+            temp_file.close()
+        os.rename(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def write_gzipped_json(path, document):
+    """
+    Atomically write a JSON document to a gzipped file. See atomic_write().
+
+    :param path:        path of the file to write
+    :type  path:        str
+    :param document:    the document to write
+    :type  document:    object
+    """
+    with atomic_write(path) as temp_file:
+        # python 2.6 GzipFile objects can't be used as context managers
+        gzip_file = gzip.GzipFile(fileobj=temp_file, mode='wb')
+        try:
+            json.dump(document, gzip_file)
+        finally:
+            gzip_file.close()
+
+
+def read_gzipped_json(path):
+    """
+    :param path:    path of a file written by write_gzipped_json()
+    :type  path:    str
+
+    :return:    the JSON document in the file
+    :rtype:     object
+
+    :raise IOError: if the file can't be read
+    :raise ValueError: if the file does not hold a JSON document
+    """
+    gzip_file = gzip.open(path)
+    try:
+        return json.load(gzip_file)
+    finally:
+        gzip_file.close()
+
+
+def iter_gzipped_json_lines(path):
+    """
+    :param path:    path of a gzipped file holding one JSON document per line
+    :type  path:    str
+
+    :return:    generator of the JSON documents in the file
+    :rtype:     generator
+
+    :raise IOError: if the file can't be read
+    :raise ValueError: if a line does not hold a JSON document
+    """
+    # python 2.6 GzipFile objects can't be used as context managers
+    gzip_file = gzip.open(path, 'rb')
+    try:
+        for line in gzip_file:
+            yield json.loads(line)
+    finally:
+        gzip_file.close()
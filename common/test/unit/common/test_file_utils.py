@@ -1,5 +1,8 @@
-import unittest
+import gzip
 import os
+import shutil
+import tempfile
+import unittest
 
 from pulp_rpm.common import file_utils
 
@@ -29,3 +32,48 @@ class TestFileUtils(unittest.TestCase):
             test_file.close()
 
         self.assertEquals(file_size, 1675)
+
+
+class TestGzippedJson(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'sub', 'document.json.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_write_and_read(self):
+        document = {'name': u'caf\xe9', 'values': [1, 2]}
+
+        file_utils.write_gzipped_json(self.path, document)
+
+        self.assertEqual(file_utils.read_gzipped_json(self.path), document)
+        # only the written file is left in the directory
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['document.json.gz'])
+
+    def test_write_replaces(self):
+        file_utils.write_gzipped_json(self.path, {'version': 1})
+        file_utils.write_gzipped_json(self.path, {'version': 2})
+
+        self.assertEqual(file_utils.read_gzipped_json(self.path), {'version': 2})
+
+    def test_write_failure(self):
+        file_utils.write_gzipped_json(self.path, {'version': 1})
+
+        self.assertRaises(TypeError, file_utils.write_gzipped_json, self.path, {'bad': object()})
+
+        # the file is unchanged and no temporary file is left behind
+        self.assertEqual(file_utils.read_gzipped_json(self.path), {'version': 1})
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['document.json.gz'])
+
+    def test_read_missing(self):
+        self.assertRaises(IOError, file_utils.read_gzipped_json, self.path)
+
+    def test_iter_gzipped_json_lines(self):
+        gzip_file = gzip.open(os.path.join(self.tmp_dir, 'lines.json.gz'), 'wb')
+        gzip_file.write('{"a": 1}\n{"b": 2}\n')
+        gzip_file.close()
+
+        documents = file_utils.iter_gzipped_json_lines(os.path.join(self.tmp_dir, 'lines.json.gz'))
+
+        self.assertEqual(list(documents), [{'a': 1}, {'b': 2}])
@@ -1,10 +1,42 @@
 import os
 import shutil
+from cStringIO import StringIO
 
 from iniparse import ConfigParser
 from pulp.common.util import encode_unicode
 
 
+# mode of a repo file that is written for the first time
+REPO_FILE_MODE = 0644
+
+
+def write_if_changed(path, contents):
+    '''
+    Writes the contents to a file, unless the file already holds exactly these contents.
+
+    @param path: absolute path to the file
+    @type  path: string
+    @param contents: the contents of the file
+    @type  contents: string
+
+    @return: True if the file was written; False if it was unchanged
+    @rtype:  bool
+    '''
+    if os.path.isfile(path):
+        f = open(path, 'r')
+        try:
+            if f.read() == contents:
+                return False
+        finally:
+            f.close()
+    f = open(path, 'w')
+    try:
+        f.write(contents)
+    finally:
+        f.close()
+    return True
+
+
 class Repo(dict):
     '''
     Holder object for repo data. Upon instantiation, the instance will be populated with
@@ -141,22 +173,39 @@ class RepoFile(object):
 
     def save(self):
         '''
-        Saves the current repositories to the repo file.
+        Saves the current repositories to the repo file. The file is written under a
+        temporary name and renamed into place, so yum never reads a partially written file.
 
         @raise Exception: if there is an error during the write
         '''
         # If the file doesn't exist, initialize with Pulp header
         first_write = not os.path.exists(self.filename)
+        if first_write:
+            mode = REPO_FILE_MODE
+        else:
+            mode = os.stat(self.filename).st_mode & 0777
 
-        f = open(self.filename, 'w')
-
+        contents = StringIO()
         if first_write:
-            f.write(RepoFile.FILE_HEADER)
+            contents.write(RepoFile.FILE_HEADER)
 
         # Write the contents of the parser
-        self.parser.write(f)
-
-        f.close()
+        self.parser.write(contents)
+
+        temp_path = os.path.join(os.path.dirname(self.filename),
+                                 '.%s.tmp' % os.path.basename(self.filename))
+        f = open(temp_path, 'w')
+        try:
+            try:
+                f.write(contents.getvalue())
+            finally:
+                f.close()
+            os.chmod(temp_path, mode)
+            os.rename(temp_path, self.filename)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
 
     # -- contents manipulation ------------------------------------------------------------
 
@@ -323,15 +372,12 @@ class MirrorListFile(object):
 
     def save(self):
         '''
-        Writes the entries in this instance out to the file.
+        Writes the entries in this instance out to the file, unless the file already
+        holds them.
 
         @raise Exception: if there is an error during the save
         '''
-        f = open(self.filename, 'w')
-        for entry in self.entries:
-            f.write(entry)
-            f.write('\n')
-        f.close()
+        write_if_changed(self.filename, ''.join(entry + '\n' for entry in self.entries))
 
 
 class RepoKeyFiles(object):
@@ -394,27 +440,35 @@ class RepoKeyFiles(object):
     def update_filesystem(self):
         '''
         Brings the filesystem up to speed with the keys defined in this instance.
-        All existing keys for this instance's repo will be deleted at the outset
-        of this call.
+        Existing keys for this instance's repo that are not defined in it are deleted,
+        and key files are only written if their contents changed.
 
         If there were no keys added to this instance through add_keys,
         this call has the effect of deleting all keys on the repo. Any keys that
         were added will be written to disk.
         '''
 
-        # Delete the repo's key directory
-        if os.path.exists(self.repo_keys_dir):
-            shutil.rmtree(self.repo_keys_dir)
+        # If there are no keys to write, delete the repo's key directory
+        if len(self.keys) == 0:
+            if os.path.exists(self.repo_keys_dir):
+                shutil.rmtree(self.repo_keys_dir)
+            return
 
-        # If there are any keys to write, create the directory for the repo's keys
-        # and write each of them out
-        if len(self.keys) > 0:
+        if not os.path.exists(self.repo_keys_dir):
             os.makedirs(self.repo_keys_dir)
 
-            for filename in self.keys:
-                f = open(filename, 'w')
-                f.write(self.keys[filename])
-                f.close()
+        # Delete the keys that are no longer defined
+        for name in os.listdir(self.repo_keys_dir):
+            path = os.path.join(self.repo_keys_dir, name)
+            if path in self.keys:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+        for filename in self.keys:
+            write_if_changed(filename, self.keys[filename])
 
 
 class CertFiles(object):
@@ -448,21 +502,27 @@ class CertFiles(object):
 
     def apply(self):
         '''
-        Apply changes to the filesystem.
+        Apply changes to the filesystem. The client certificate is only written if it
+        changed.
 
         :return: The path to the client certificate
         :rtype:  basestring
         '''
-        self.__clear()
-
         if not self.clientcert:
+            self.__clear()
             return None
 
         self.__mkdir()
         path = os.path.join(self.rootdir, self.CLIENT)
-        f = open(path, 'w')
-        f.write(self.clientcert)
-        f.close()
+        # the client certificate is the only file kept for the repo
+        for name in os.listdir(self.rootdir):
+            if name != self.CLIENT:
+                other = os.path.join(self.rootdir, name)
+                if os.path.isdir(other):
+                    shutil.rmtree(other)
+                else:
+                    os.remove(other)
+        write_if_changed(path, self.clientcert)
         return path
 
     def __nocerts(self):
@@ -84,58 +84,120 @@ def bind(repo_filename,
     :type  ca_path:              basestring
     """
 
+    binding = {
+        'mirror_list_filename': mirror_list_filename,
+        'repo_id': repo_id,
+        'repo_name': repo_name,
+        'url_list': url_list,
+        'gpg_keys': gpg_keys,
+        'clientcert': clientcert,
+        'enabled': enabled,
+    }
+    bind_all(repo_filename, keys_root_dir, cert_root_dir, [binding], lock=lock,
+             verify_ssl=verify_ssl, ca_path=ca_path)
+
+
+def bind_all(repo_filename,
+             keys_root_dir,
+             cert_root_dir,
+             bindings,
+             lock=None,
+             verify_ssl=True,
+             ca_path=DEFAULT_CA_PATH):
+    """
+    Binds any number of repos to a repo file at once. The repo file is loaded and
+    written once for all of them, under a single acquisition of the lock.
+
+    Each binding is a dict with the keys "mirror_list_filename", "repo_id",
+    "repo_name", "url_list", "gpg_keys", "clientcert" and "enabled", which have the
+    meaning of the bind() arguments of the same names.
+
+    :param repo_filename:        full path to the location of the repo file in which
+                                 the repos will be bound; this file does not need to
+                                 exist prior to this call
+    :type  repo_filename:        string
+    :param keys_root_dir:        absolute path to the root directory in which the keys for
+                                 all repos will be stored
+    :type  keys_root_dir:        string
+    :param cert_root_dir:        absolute path to the root directory in which the certs for
+                                 all repos will be stored
+    :type  cert_root_dir:        string
+    :param bindings:             the repos to bind
+    :type  bindings:             list of dict
+    :param lock:                 if the default lock is unacceptble, it may be overridden in this
+                                 variable
+    :type  lock:                 L{Lock}
+    :param verify_ssl:           Whether the repo file should be configured to validate CA trust.
+                                 Defaults to True.
+    :type  verify_ssl:           bool
+    :param ca_path:              Absolute path to a directory that contains trusted CA certificates.
+                                 Defaults to pulp.bindings.server.DEFAULT_CA_PATH.
+    :type  ca_path:              basestring
+    """
+
     if not lock:
         lock = Lock(LOCK_FILE)
 
     lock.acquire()
     try:
-        log.info('Binding repo [%s]' % repo_id)
-
         repo_file = RepoFile(repo_filename)
         repo_file.load()
 
-        # In the case of an update, only the changed values will have been sent.
-        # Therefore, any of the major data components (repo data, url list, keys)
-        # may be None.
+        for binding in bindings:
+            _bind_repo(repo_file, keys_root_dir, cert_root_dir, verify_ssl, ca_path, **binding)
 
-        repo = repo_file.get_repo(repo_id)
-        if not repo:
-            # if no repo name is provided for a new repo, use the id for the name
-            repo = Repo(repo_id)
-            if repo_name is None:
-                repo['name'] = repo_id
-            else:
-                repo['name'] = repo_name
+        repo_file.save()
+    finally:
+        lock.release()
 
-        repo['enabled'] = str(int(enabled))
 
-        if repo_name:
+def _bind_repo(repo_file, keys_root_dir, cert_root_dir, verify_ssl, ca_path,
+               mirror_list_filename, repo_id, repo_name, url_list, gpg_keys, clientcert,
+               enabled):
+    """
+    Binds one repo to a loaded repo file, writing its mirror list, keys and cert.
+    The repo file itself is not saved.
+    """
+    log.info('Binding repo [%s]' % repo_id)
+
+    # In the case of an update, only the changed values will have been sent.
+    # Therefore, any of the major data components (repo data, url list, keys)
+    # may be None.
+
+    repo = repo_file.get_repo(repo_id)
+    if not repo:
+        # if no repo name is provided for a new repo, use the id for the name
+        repo = Repo(repo_id)
+        if repo_name is None:
+            repo['name'] = repo_id
+        else:
             repo['name'] = repo_name
 
-        if gpg_keys is not None:
-            _handle_gpg_keys(repo, gpg_keys, keys_root_dir)
+    repo['enabled'] = str(int(enabled))
 
-        _handle_client_cert(repo, cert_root_dir, clientcert)
+    if repo_name:
+        repo['name'] = repo_name
 
-        if verify_ssl:
-            repo['sslverify'] = '1'
-            repo['sslcacert'] = ca_path
-        else:
-            repo['sslverify'] = '0'
+    if gpg_keys is not None:
+        _handle_gpg_keys(repo, gpg_keys, keys_root_dir)
 
-        if url_list is not None:
-            _handle_host_urls(repo, url_list, mirror_list_filename)
+    _handle_client_cert(repo, cert_root_dir, clientcert)
 
-        if repo_file.get_repo(repo.id):
-            log.info('Updating existing repo [%s]' % repo.id)
-            repo_file.update_repo(repo)
-        else:
-            log.info('Adding new repo [%s]' % repo.id)
-            repo_file.add_repo(repo)
+    if verify_ssl:
+        repo['sslverify'] = '1'
+        repo['sslcacert'] = ca_path
+    else:
+        repo['sslverify'] = '0'
 
-        repo_file.save()
-    finally:
-        lock.release()
+    if url_list is not None:
+        _handle_host_urls(repo, url_list, mirror_list_filename)
+
+    if repo_file.get_repo(repo.id):
+        log.info('Updating existing repo [%s]' % repo.id)
+        repo_file.update_repo(repo)
+    else:
+        log.info('Adding new repo [%s]' % repo.id)
+        repo_file.add_repo(repo)
 
 
 def unbind(repo_filename, mirror_list_filename, keys_root_dir, cert_root_dir, repo_id, lock=None):
@@ -174,33 +236,73 @@ def unbind(repo_filename, mirror_list_filename, keys_root_dir, cert_root_dir, re
     @type  lock: L{Lock}
     """
 
+    unbinding = {
+        'mirror_list_filename': mirror_list_filename,
+        'repo_id': repo_id,
+    }
+    unbind_all(repo_filename, keys_root_dir, cert_root_dir, [unbinding], lock=lock)
+
+
+def unbind_all(repo_filename, keys_root_dir, cert_root_dir, unbindings, lock=None):
+    """
+    Removes any number of repos from the given repo file at once. The repo file is
+    loaded and written once for all of them, under a single acquisition of the lock.
+    Repos that are not bound are ignored.
+
+    Each unbinding is a dict with the keys "mirror_list_filename" and "repo_id",
+    which have the meaning of the unbind() arguments of the same names.
+
+    @param repo_filename: full path to the location of the repo file in which
+                          the repos will be removed; if this file does not exist
+                          this call has no effect
+    @type  repo_filename: string
+
+    @param keys_root_dir: absolute path to the root directory in which the keys for
+                          all repos will be stored
+    @type  keys_root_dir: string
+
+    @param cert_root_dir: absolute path to the root directory in which the certs for
+                          all repos will be stored
+    @type  cert_root_dir: string
+
+    @param unbindings: the repos to unbind
+    @type  unbindings: list of dict
+
+    @param lock: if the default lock is unacceptable, it may be overridden in this variable
+    @type  lock: L{Lock}
+    """
+
     if not lock:
         lock = Lock(LOCK_FILE)
 
     lock.acquire()
     try:
-        log.info('Unbinding repo [%s]' % repo_id)
-
         if not os.path.exists(repo_filename):
             return
 
         # Repo file changes
         repo_file = RepoFile(repo_filename)
         repo_file.load()
-        repo_file.remove_repo_by_name(repo_id)  # will not throw an error if repo doesn't exist
+        for unbinding in unbindings:
+            log.info('Unbinding repo [%s]' % unbinding['repo_id'])
+            # will not throw an error if repo doesn't exist
+            repo_file.remove_repo_by_name(unbinding['repo_id'])
         repo_file.save()
 
-        # Mirror list removal
-        if os.path.exists(mirror_list_filename):
-            os.remove(mirror_list_filename)
+        for unbinding in unbindings:
+            repo_id = unbinding['repo_id']
+
+            # Mirror list removal
+            if os.path.exists(unbinding['mirror_list_filename']):
+                os.remove(unbinding['mirror_list_filename'])
 
-        # Keys removal
-        repo_keys = RepoKeyFiles(keys_root_dir, repo_id)
-        repo_keys.update_filesystem()
+            # Keys removal
+            repo_keys = RepoKeyFiles(keys_root_dir, repo_id)
+            repo_keys.update_filesystem()
 
-        # cert removal
-        certificates = CertFiles(cert_root_dir, repo_id)
-        certificates.apply()
+            # cert removal
+            certificates = CertFiles(cert_root_dir, repo_id)
+            certificates.apply()
 
     finally:
         lock.release()
@@ -1,12 +1,13 @@
 # -*- coding: utf-8 -*-
 
 from logging import getLogger
+from threading import Lock
 
 from rhsm.profile import get_profile
 from pulp.agent.lib.handler import ContentHandler
 from pulp.agent.lib.report import ProfileReport, ContentReport
 
-from pulp_rpm.handlers.rpmtools import Package, PackageGroup, ProgressReport
+from pulp_rpm.handlers.rpmtools import Package, PackageGroup, ProgressReport, rpmdb_stamp
 
 log = getLogger(__name__)
 
@@ -37,6 +38,42 @@ class GroupReport(ContentReport):
         ContentReport.set_succeeded(self, details, num_changes)
 
 
+class PackageProfile(object):
+    """
+    The package profile of the consumer.
+    The profile is collected again only when the rpm database has changed
+    since it was last collected.
+    :ivar stamp: The rpmdb stamp the profile was collected at.
+    :type stamp: tuple
+    :ivar details: The collected profile.
+    :type details: list
+    """
+
+    def __init__(self):
+        self.stamp = None
+        self.details = None
+        self.__lock = Lock()
+
+    def collect(self):
+        """
+        Get the package profile.
+        :return: The profile.
+        :rtype: list
+        """
+        stamp = rpmdb_stamp()
+        self.__lock.acquire()
+        try:
+            if stamp is None or stamp != self.stamp:
+                self.details = get_profile('rpm').collect()
+                self.stamp = stamp
+            return self.details
+        finally:
+            self.__lock.release()
+
+
+PROFILE = PackageProfile()
+
+
 class PackageProgress(ProgressReport):
     """
     Provides integration with the handler conduit.
@@ -166,7 +203,7 @@ class PackageHandler(ContentHandler):
         :rtype: ProfileReport
         """
         report = ProfileReport()
-        details = get_profile("rpm").collect()
+        details = PROFILE.collect()
         report.set_succeeded(details)
         return report
 
@@ -7,9 +7,13 @@ collections of classes:
    package and package group operations.
 """
 
+import os
+
 from gettext import gettext as _
 from logging import getLogger, Logger
 from optparse import OptionParser
+from threading import Lock
+from time import time
 
 from yum import YumBase
 from yum.plugins import TYPE_CORE, TYPE_INTERACTIVE
@@ -25,6 +29,57 @@ INSTALLED = _('Installed: %(p)s')
 UPDATED = _('Updated: %(p)s')
 ERASED = _('Erased: %(p)s')
 
+# The rpm database directory, relative to the install root.
+RPMDB_DIR = 'var/lib/rpm'
+
+
+def rpmdb_stamp(installroot='/'):
+    """
+    Get a stamp of the rpm database that changes whenever packages are
+    installed, updated or erased.  Lock files and the files rpm changes
+    when the database is only read are not included.
+    :param installroot: The install root.
+    :type installroot: str
+    :return: The (name, size, mtime) of each database file or None when
+        the database cannot be read.
+    :rtype: tuple
+    """
+    path = os.path.join(installroot, RPMDB_DIR)
+    stamp = []
+    try:
+        for name in sorted(os.listdir(path)):
+            if name.startswith(('.', '__db')) or name.endswith('-shm'):
+                continue
+            st = os.stat(os.path.join(path, name))
+            stamp.append((name, st.st_size, st.st_mtime))
+    except OSError:
+        return None
+    return tuple(stamp)
+
+
+def config_stamp(conf):
+    """
+    Get a stamp of the yum configuration that changes whenever yum.conf or
+    a .repo file is changed, added or removed.
+    :param conf: The yum configuration.
+    :type conf: yum.config.YumConf
+    :return: The (path, mtime) of each configuration file.
+    :rtype: tuple
+    """
+    paths = [conf.config_file_path]
+    for dir_path in conf.reposdir:
+        if not os.path.isdir(dir_path):
+            continue
+        names = sorted(os.listdir(dir_path))
+        paths.extend([os.path.join(dir_path, n) for n in names if n.endswith('.repo')])
+    stamp = []
+    for path in paths:
+        try:
+            stamp.append((path, os.stat(path).st_mtime))
+        except OSError:
+            continue
+    return tuple(stamp)
+
 
 class Package:
     """
@@ -145,7 +200,7 @@ class Package:
             {resolved=[Package,],deps=[Package,], failed=[Package,]}
         :rtype: dict
         """
-        yb = Yum(self.importkeys, self.progress)
+        yb = Yum.get(self.importkeys, self.progress)
         try:
             for pattern in names:
                 try:
@@ -165,7 +220,7 @@ class Package:
             map(yb.logfile.info, [INSTALLED % dict(p=p) for p in affected])
             return details
         finally:
-            yb.close()
+            yb.release()
 
     def uninstall(self, names):
         """
@@ -176,7 +231,7 @@ class Package:
             {resolved=[Package,],deps=[Package,], failed=[Package,]}
         :rtype: dict
         """
-        yb = Yum(progress=self.progress)
+        yb = Yum.get(progress=self.progress)
         try:
             for pattern in names:
                 yb.remove(pattern=pattern)
@@ -191,7 +246,7 @@ class Package:
             map(yb.logfile.info, [ERASED % dict(p=p) for p in affected])
             return details
         finally:
-            yb.close()
+            yb.release()
 
     def update(self, names=()):
         """
@@ -203,7 +258,7 @@ class Package:
             {resolved=[Package,],deps=[Package,], failed=[Package,]}
         :rtype: dict
         """
-        yb = Yum(self.importkeys, self.progress)
+        yb = Yum.get(self.importkeys, self.progress)
         try:
             if names:
                 for pattern in names:
@@ -221,7 +276,7 @@ class Package:
             map(yb.logfile.info, [UPDATED % dict(p=p) for p in affected])
             return details
         finally:
-            yb.close()
+            yb.release()
 
 
 class PackageGroup:
@@ -249,7 +304,7 @@ class PackageGroup:
             {resolved=[Package,],deps=[Package,], failed=[Package,]}
         :rtype: dict
         """
-        yb = Yum(self.importkeys, self.progress)
+        yb = Yum.get(self.importkeys, self.progress)
         try:
             for name in names:
                 yb.selectGroup(name)
@@ -264,7 +319,7 @@ class PackageGroup:
             map(yb.logfile.info, [INSTALLED % dict(p=p) for p in affected])
             return details
         finally:
-            yb.close()
+            yb.release()
 
     def uninstall(self, names):
         """
@@ -275,7 +330,7 @@ class PackageGroup:
             {resolved=[Package,],deps=[Package,], failed=[Package,]}
         :rtype: dict
         """
-        yb = Yum(progress=self.progress)
+        yb = Yum.get(progress=self.progress)
         try:
             for name in names:
                 yb.groupRemove(name)
@@ -290,7 +345,7 @@ class PackageGroup:
             map(yb.logfile.info, [ERASED % dict(p=p) for p in affected])
             return details
         finally:
-            yb.close()
+            yb.release()
 
 
 class ProgressReport:
@@ -519,8 +574,60 @@ class Yum(YumBase):
       - Configuration as control GPG key importing.
       - Hack in callbacks for progress reporting.
       - Fix Logger leaks.
+    Instances are taken with get() and handed back with release() so that
+    the plugins, repository configuration and metadata loaded by one
+    operation are reused by the next.
+    :cvar MAX_AGE: Seconds an instance is reused for.
+    :type MAX_AGE: int
     """
 
+    MAX_AGE = 300
+
+    __idle = None
+    __idle_lock = Lock()
+
+    @classmethod
+    def get(cls, importkeys=False, progress=None):
+        """
+        Get an instance for an operation.
+        The idle instance handed back by the last operation is used when the
+        yum configuration has not changed since it was created, else a new
+        instance is created.
+        :param importkeys: Allow the import of GPG keys.
+        :type importkeys: bool
+        :param progress: A progress reporting object.
+        :type progress: ProgressReport
+        :return: An instance that must be handed back with release().
+        :rtype: Yum
+        """
+        cls.__idle_lock.acquire()
+        try:
+            yb = cls.__idle
+            cls.__idle = None
+        finally:
+            cls.__idle_lock.release()
+        if yb is not None:
+            if yb.expired():
+                yb.close()
+            else:
+                yb.reset(importkeys, progress)
+                return yb
+        return cls(importkeys, progress)
+
+    @classmethod
+    def discard(cls):
+        """
+        Close the idle instance, if any.
+        """
+        cls.__idle_lock.acquire()
+        try:
+            yb = cls.__idle
+            cls.__idle = None
+        finally:
+            cls.__idle_lock.release()
+        if yb is not None:
+            yb.close()
+
     def __init__(self, importkeys=False, progress=None):
         """
         Construct a customized instance of YumBase.
@@ -546,6 +653,53 @@ class Yum(YumBase):
         self.repos.setProgressBar(bar)
         self.progress.push_step('Refresh Repository Metadata')
         self.logfile = getLogger('yum.filelogging')
+        self.created = time()
+        self.config = config_stamp(self.conf)
+
+    def reset(self, importkeys=False, progress=None):
+        """
+        Prepare an idle instance for another operation.
+        :param importkeys: Allow the import of GPG keys.
+        :type importkeys: bool
+        :param progress: A progress reporting object.
+        :type progress: ProgressReport
+        """
+        self.conf.assumeyes = importkeys
+        self.progress = progress or ProgressReport()
+        bar = DownloadCallback(self.progress)
+        self.repos.setProgressBar(bar)
+        self.progress.push_step('Refresh Repository Metadata')
+
+    def expired(self):
+        """
+        Get whether the instance may no longer be reused.
+        It expires MAX_AGE seconds after it was created, and when yum.conf or
+        a .repo file has been changed, added or removed.
+        :return: True if expired.
+        :rtype: bool
+        """
+        if time() - self.created > self.MAX_AGE:
+            return True
+        return config_stamp(self.conf) != self.config
+
+    def release(self):
+        """
+        Hand back the instance after an operation.
+        The rpmdb and the transaction are dropped so the next operation starts
+        with an empty transaction and reads the rpmdb again.  The instance is
+        kept as the idle instance unless it has expired or another instance
+        is idle already, in which case it is closed.
+        """
+        self.closeRpmDB()
+        if not self.expired():
+            Yum.__idle_lock.acquire()
+            try:
+                if Yum.__idle is None:
+                    Yum.__idle = self
+                    return
+            finally:
+                Yum.__idle_lock.release()
+        self.close()
 
     def doPluginSetup(self, *args, **kwargs):
         """
@@ -101,7 +101,7 @@ class YumBase:
     registerCommand = mock.Mock()
     processTransaction = mock.Mock(side_effect=process_transaction)
     close = mock.Mock()
-    closeRpmDB = mock.Mock()
+    rpmdb_closed = mock.Mock()
 
     @classmethod
     def reset(cls):
@@ -109,14 +109,26 @@ class YumBase:
         cls.registerCommand.reset_mock()
         cls.processTransaction = mock.Mock(side_effect=cls.process_transaction)
         cls.close.reset_mock()
-        cls.closeRpmDB.reset_mock()
+        cls.rpmdb_closed.reset_mock()
 
     def __init__(self, *args, **kwargs):
         self.conf = Config()
+        self.conf.config_file_path = '/etc/yum.conf'
+        self.conf.reposdir = []
         self.preconf = Config()
-        self.tsInfo = []
+        self._tsInfo = None
         self.repos = mock.Mock()
 
+    @property
+    def tsInfo(self):
+        if self._tsInfo is None:
+            self._tsInfo = []
+        return self._tsInfo
+
+    def closeRpmDB(self):
+        self._tsInfo = None
+        YumBase.rpmdb_closed()
+
     def install(self, pattern):
         if YumBase.UNKNOWN_PKG in pattern:
             name = u'D' + unichr(246) + 'g'
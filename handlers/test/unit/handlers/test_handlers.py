@@ -67,6 +67,8 @@ class HandlerTest(unittest.TestCase):
         os.system = Mock()
 
     def tearDown(self):
+        from pulp_rpm.handlers.rpmtools import Yum
+        Yum.discard()
         self.deployer.uninstall()
         os.system = self.__system
         YumBase.reset()
@@ -342,6 +344,46 @@ class TestPackages(HandlerTest):
         self.assertTrue(YumBase.processTransaction.called)
 
 
+class TestPackageProfile(unittest.TestCase):
+    def setUp(self):
+        mock_yum.install()
+        from pulp_rpm.handlers.rpm import PackageProfile
+        self.profile = PackageProfile()
+
+    @patch('pulp_rpm.handlers.rpm.get_profile')
+    @patch('pulp_rpm.handlers.rpm.rpmdb_stamp')
+    def test_collect(self, rpmdb_stamp, get_profile):
+        rpmdb_stamp.return_value = (('Packages', 10, 20.0),)
+        # Test
+        details = self.profile.collect()
+        cached = self.profile.collect()
+        # Verify
+        self.assertEqual(get_profile.return_value.collect.call_count, 1)
+        self.assertEqual(details, get_profile.return_value.collect.return_value)
+        self.assertTrue(cached is details)
+
+    @patch('pulp_rpm.handlers.rpm.get_profile')
+    @patch('pulp_rpm.handlers.rpm.rpmdb_stamp')
+    def test_collect_rpmdb_changed(self, rpmdb_stamp, get_profile):
+        rpmdb_stamp.return_value = (('Packages', 10, 20.0),)
+        self.profile.collect()
+        rpmdb_stamp.return_value = (('Packages', 12, 30.0),)
+        # Test
+        self.profile.collect()
+        # Verify
+        self.assertEqual(get_profile.return_value.collect.call_count, 2)
+
+    @patch('pulp_rpm.handlers.rpm.get_profile')
+    @patch('pulp_rpm.handlers.rpm.rpmdb_stamp')
+    def test_collect_no_rpmdb(self, rpmdb_stamp, get_profile):
+        rpmdb_stamp.return_value = None
+        # Test
+        self.profile.collect()
+        self.profile.collect()
+        # Verify
+        self.assertEqual(get_profile.return_value.collect.call_count, 2)
+
+
 class TestGroups(HandlerTest):
     TYPE_ID = 'package_group'
 
@@ -3,6 +3,7 @@ import shutil
 import tempfile
 import unittest
 
+import mock
 from pulp.common.constants import DEFAULT_CA_PATH
 from pulp.common.lock import Lock
 
@@ -590,6 +591,81 @@ class TestRepolib(unittest.TestCase):
         self.assertEqual(2, len(loaded['gpgkey'].split('\n')))
         self.assertEqual(2, len(os.listdir(os.path.join(self.TEST_KEYS_DIR, REPO_ID))))
 
+    def test_bind_all(self):
+        """
+        Tests binding many repos with one load and save of the repo file.
+        """
+        bindings = []
+        for i in range(3):
+            bindings.append({
+                'mirror_list_filename': os.path.join(self.working_dir, 'repo-%d.mirrorlist' % i),
+                'repo_id': 'repo-%d' % i,
+                'repo_name': 'Repository %d' % i,
+                'url_list': ['http://pulp/%d' % i],
+                'gpg_keys': {'key1': 'KEY%d' % i},
+                'clientcert': CLIENTCERT,
+                'enabled': ENABLED,
+            })
+
+        with mock.patch.object(RepoFile, 'save', autospec=True,
+                               side_effect=RepoFile.save.im_func) as mock_save:
+            repolib.bind_all(self.TEST_REPO_FILENAME, self.TEST_KEYS_DIR, self.TEST_CERT_DIR,
+                             bindings, self.LOCK)
+
+        self.assertEqual(mock_save.call_count, 1)
+        repo_file = RepoFile(self.TEST_REPO_FILENAME)
+        repo_file.load()
+        self.assertEqual(3, len(repo_file.all_repos()))
+        for i in range(3):
+            loaded = repo_file.get_repo('repo-%d' % i)
+            self.assertEqual(loaded['name'], 'Repository %d' % i)
+            self.assertEqual(loaded['baseurl'], 'http://pulp/%d' % i)
+            self.assertEqual(loaded['gpgcheck'], '1')
+            self.assertTrue(os.path.exists(loaded['sslclientcert']))
+
+    def test_bind_unchanged_files_not_rewritten(self):
+        """
+        Tests that binding a repo again leaves its unchanged key and cert files alone.
+        """
+        keys = {'key1': 'KEY1'}
+        repolib.bind(self.TEST_REPO_FILENAME, self.TEST_MIRROR_LIST_FILENAME, self.TEST_KEYS_DIR,
+                     self.TEST_CERT_DIR,
+                     REPO_ID, REPO_NAME, ['http://pulp'], keys, CLIENTCERT, ENABLED, self.LOCK)
+        key_path = os.path.join(self.TEST_KEYS_DIR, REPO_ID, 'key1')
+        cert_path = os.path.join(self.TEST_CERT_DIR, REPO_ID, 'client.crt')
+        for path in (key_path, cert_path):
+            os.utime(path, (0, 0))
+
+        repolib.bind(self.TEST_REPO_FILENAME, self.TEST_MIRROR_LIST_FILENAME, self.TEST_KEYS_DIR,
+                     self.TEST_CERT_DIR,
+                     REPO_ID, REPO_NAME, ['http://pulp'], keys, CLIENTCERT, ENABLED, self.LOCK)
+
+        for path in (key_path, cert_path):
+            self.assertEqual(os.stat(path).st_mtime, 0)
+
+    def test_unbind_all(self):
+        """
+        Tests unbinding many repos with one load and save of the repo file.
+        """
+        for repo_id in ('repo-1', 'repo-2', 'repo-3'):
+            repolib.bind(self.TEST_REPO_FILENAME, self.TEST_MIRROR_LIST_FILENAME,
+                         self.TEST_KEYS_DIR, self.TEST_CERT_DIR,
+                         repo_id, None, ['http://pulp'], {'key': 'KEY'}, None, ENABLED, self.LOCK)
+        unbindings = [{'repo_id': repo_id, 'mirror_list_filename': self.TEST_MIRROR_LIST_FILENAME}
+                      for repo_id in ('repo-1', 'repo-2')]
+
+        with mock.patch.object(RepoFile, 'save', autospec=True,
+                               side_effect=RepoFile.save.im_func) as mock_save:
+            repolib.unbind_all(self.TEST_REPO_FILENAME, self.TEST_KEYS_DIR, self.TEST_CERT_DIR,
+                               unbindings, self.LOCK)
+
+        self.assertEqual(mock_save.call_count, 1)
+        repo_file = RepoFile(self.TEST_REPO_FILENAME)
+        repo_file.load()
+        self.assertEqual(['repo-3'], [repo.id for repo in repo_file.all_repos()])
+        self.assertFalse(os.path.exists(os.path.join(self.TEST_KEYS_DIR, 'repo-1')))
+        self.assertTrue(os.path.exists(os.path.join(self.TEST_KEYS_DIR, 'repo-3')))
+
     def test_unbind_repo_exists(self):
         """
         Tests the normal case of unbinding a repo that exists in the repo file.
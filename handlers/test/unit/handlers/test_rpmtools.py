@@ -12,12 +12,14 @@ from mock_yum import YumBase
 class ToolTest(unittest.TestCase):
     def setUp(self):
         mock_yum.install()
-        from pulp_rpm.handlers.rpmtools import Package, PackageGroup
+        from pulp_rpm.handlers.rpmtools import Package, PackageGroup, Yum
 
         self.Package = Package
         self.PackageGroup = PackageGroup
+        self.Yum = Yum
 
     def tearDown(self):
+        self.Yum.discard()
         YumBase.reset()
 
 
@@ -125,7 +127,7 @@ class TestPackages(ToolTest):
         # Verify
         self.verify(report, installed=packages)
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_install_failed(self):
         # Setup
@@ -142,7 +144,7 @@ class TestPackages(ToolTest):
         # Verify
         self.verify(report, installed=packages, failed=[YumBase.FAILED_PKG])
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_install_noapply(self):
         # Setup
@@ -158,7 +160,7 @@ class TestPackages(ToolTest):
         # Verify
         self.verify(report, installed=packages)
         self.assertFalse(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_install_importkeys(self):
         # Setup
@@ -174,7 +176,7 @@ class TestPackages(ToolTest):
         # Verify
         self.verify(report, installed=packages)
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_install_not_found(self):
         # Setup
@@ -189,7 +191,7 @@ class TestPackages(ToolTest):
         package = self.Package()
         self.assertRaises(InstallError, package.install, packages)
         self.assertFalse(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_update(self):
         # Setup
@@ -205,7 +207,7 @@ class TestPackages(ToolTest):
         # Verify
         self.verify(report, updated=packages)
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_update_all(self):
         # Setup
@@ -216,7 +218,7 @@ class TestPackages(ToolTest):
         # Verify
         self.verify(report, updated=[p.name for p in YumBase.NEED_UPDATE])
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_update_failed(self):
         # Setup
@@ -233,7 +235,7 @@ class TestPackages(ToolTest):
         # Verify
         self.verify(report, updated=packages, failed=[YumBase.FAILED_PKG])
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_update_noapply(self):
         # Setup
@@ -249,7 +251,7 @@ class TestPackages(ToolTest):
         # Verify
         self.verify(report, updated=packages)
         self.assertFalse(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_update_importkeys(self):
         # Setup
@@ -265,7 +267,7 @@ class TestPackages(ToolTest):
         # Verify
         self.verify(report, updated=packages)
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_update_notfound(self):
         # Setup
@@ -281,7 +283,7 @@ class TestPackages(ToolTest):
         report = package.update(packages)
         self.verify(report, updated=packages[:-1])
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_uninstall(self):
         # Setup
@@ -295,7 +297,7 @@ class TestPackages(ToolTest):
         # Verify
         self.verify(report, removed=packages)
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_uninstall_failed(self):
         # Setup
@@ -310,7 +312,7 @@ class TestPackages(ToolTest):
         # Verify
         self.verify(report, removed=packages, failed=[YumBase.FAILED_PKG])
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_uninstall_noapply(self):
         # Setup
@@ -324,7 +326,7 @@ class TestPackages(ToolTest):
         # Verify
         self.verify(report, removed=packages)
         self.assertFalse(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_uninstall_notfound(self):
         # Setup
@@ -339,7 +341,7 @@ class TestPackages(ToolTest):
         # Verify
         self.verify(report, removed=packages[:-1])
         self.assertFalse(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
 
 class TestGroups(ToolTest):
@@ -365,7 +367,7 @@ class TestGroups(ToolTest):
         # Verify
         self.verify(report, installed=groups)
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_install_failed(self):
         # Setup
@@ -376,7 +378,7 @@ class TestGroups(ToolTest):
         # Verify
         self.verify(report, installed=groups, failed=[YumBase.FAILED_PKG])
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_install_importkeys(self):
         # Setup
@@ -387,7 +389,7 @@ class TestGroups(ToolTest):
         # Verify
         self.verify(report, installed=groups)
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_install_noapply(self):
         # Setup
@@ -398,7 +400,7 @@ class TestGroups(ToolTest):
         # Verify
         self.verify(report, installed=groups)
         self.assertFalse(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_install_notfound(self):
         # Setup
@@ -407,7 +409,7 @@ class TestGroups(ToolTest):
         group = self.PackageGroup()
         self.assertRaises(GroupsError, group.install, groups)
         self.assertFalse(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_uninstall(self):
         # Setup
@@ -418,7 +420,7 @@ class TestGroups(ToolTest):
         # Verify
         self.verify(report, removed=groups)
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_uninstall_failed(self):
         # Setup
@@ -429,7 +431,7 @@ class TestGroups(ToolTest):
         # Verify
         self.verify(report, removed=groups, failed=[YumBase.FAILED_PKG])
         self.assertTrue(YumBase.processTransaction.called)
-        self.assertTrue(YumBase.close.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
 
     def test_uninstall_noapply(self):
         # Setup
@@ -440,8 +442,89 @@ class TestGroups(ToolTest):
         # Verify
         self.verify(report, removed=groups)
         self.assertFalse(YumBase.processTransaction.called)
+        self.assertTrue(YumBase.rpmdb_closed.called)
+
+
+class TestYum(ToolTest):
+    def test_reused(self):
+        package = self.Package()
+        package.install(['zsh'])
+        report = package.install(['ksh'])
+        # Verify
+        self.assertEqual([p['name'] for p in report['resolved']], ['ksh'])
+        self.assertFalse(YumBase.close.called)
+        self.assertEqual(YumBase.rpmdb_closed.call_count, 2)
+
+    def test_get_idle(self):
+        progress = Mock()
+        yb = self.Yum.get()
+        yb.release()
+        # Test
+        reused = self.Yum.get(importkeys=True, progress=progress)
+        # Verify
+        self.assertTrue(reused is yb)
+        self.assertTrue(reused.conf.assumeyes)
+        self.assertEqual(reused.progress, progress)
+        progress.push_step.assert_called_with('Refresh Repository Metadata')
+        self.assertTrue(self.Yum.get() is not yb)
+
+    @patch('pulp_rpm.handlers.rpmtools.config_stamp')
+    def test_get_config_changed(self, config_stamp):
+        config_stamp.return_value = (('/etc/yum.conf', 1.0),)
+        yb = self.Yum.get()
+        yb.release()
+        config_stamp.return_value = (('/etc/yum.conf', 2.0),)
+        # Test
+        new = self.Yum.get()
+        # Verify
+        self.assertTrue(new is not yb)
+        self.assertTrue(YumBase.close.called)
+
+    @patch('pulp_rpm.handlers.rpmtools.time')
+    def test_get_too_old(self, time):
+        time.return_value = 1000.0
+        yb = self.Yum.get()
+        yb.release()
+        time.return_value += self.Yum.MAX_AGE + 1
+        # Test
+        new = self.Yum.get()
+        # Verify
+        self.assertTrue(new is not yb)
         self.assertTrue(YumBase.close.called)
 
+    def test_release_other_idle(self):
+        yb = self.Yum.get()
+        other = self.Yum.get()
+        yb.release()
+        # Test
+        other.release()
+        # Verify
+        self.assertEqual(YumBase.close.call_count, 1)
+        self.assertTrue(self.Yum.get() is yb)
+
+
+class TestRpmdbStamp(unittest.TestCase):
+    def setUp(self):
+        mock_yum.install()
+        from pulp_rpm.handlers.rpmtools import rpmdb_stamp
+        self.rpmdb_stamp = rpmdb_stamp
+
+    @patch('os.stat')
+    @patch('os.listdir')
+    def test_stamp(self, listdir, stat):
+        listdir.return_value = ['Packages', '__db.001', '.rpm.lock', 'Name']
+        stat.return_value = Mock(st_size=10, st_mtime=20.0)
+        # Test
+        stamp = self.rpmdb_stamp('/root')
+        # Verify
+        listdir.assert_called_with('/root/var/lib/rpm')
+        self.assertEqual(stamp, (('Name', 10, 20.0), ('Packages', 10, 20.0)))
+
+    @patch('os.listdir')
+    def test_no_rpmdb(self, listdir):
+        listdir.side_effect = OSError()
+        self.assertEqual(self.rpmdb_stamp('/root'), None)
+
 
 class TestProgressReport(unittest.TestCase):
     def setUp(self):
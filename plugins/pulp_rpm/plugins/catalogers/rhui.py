@@ -2,6 +2,8 @@ from logging import getLogger
 from urllib2 import urlopen
 from base64 import urlsafe_b64encode
 from contextlib import closing
+from threading import Lock
+from time import time
 
 from pulp_rpm.common import ids
 from pulp_rpm.plugins.catalogers.yum import YumCataloger
@@ -16,6 +18,52 @@ ID_SIG_HEADER = 'X-RHUI-SIGNATURE'
 ID_DOC_URL = 'http://169.254.169.254/latest/dynamic/instance-identity/document'
 ID_SIG_URL = 'http://169.254.169.254/latest/dynamic/instance-identity/signature'
 
+# The instance identity does not change while the instance runs, but it is fetched again after
+# this many seconds in case the instance was stopped and started with a new identity.
+ID_VALID_SECONDS = 3600
+
+
+class IdentityCache(object):
+    """
+    The instance identity document and signature, fetched from the metadata service at most
+    once per validity period.
+    """
+
+    def __init__(self, valid_seconds=ID_VALID_SECONDS):
+        """
+        :param valid_seconds: number of seconds a fetched identity is used for
+        :type  valid_seconds: int
+        """
+        self.valid_seconds = valid_seconds
+        self._lock = Lock()
+        self._identity = None
+        self._expiration = 0
+
+    def get(self):
+        """
+        :return: the instance identity document and its signature
+        :rtype:  tuple
+        """
+        with self._lock:
+            if self._identity is None or time() >= self._expiration:
+                with closing(urlopen(ID_DOC_URL)) as fp:
+                    amazon_id = fp.read()
+                with closing(urlopen(ID_SIG_URL)) as fp:
+                    amazon_signature = fp.read()
+                self._identity = (amazon_id, amazon_signature)
+                self._expiration = time() + self.valid_seconds
+            return self._identity
+
+    def clear(self):
+        """
+        Forget the fetched identity, so that it is fetched again when next needed.
+        """
+        with self._lock:
+            self._identity = None
+
+
+identity_cache = IdentityCache()
+
 
 def entry_point():
     """
@@ -44,10 +92,7 @@ class RHUICataloger(YumCataloger):
         :rtype: nectar.config.DownloaderConfig
         """
         nectar_config = super(RHUICataloger, self).nectar_config(config)
-        with closing(urlopen(ID_DOC_URL)) as fp:
-            amazon_id = fp.read()
-        with closing(urlopen(ID_SIG_URL)) as fp:
-            amazon_signature = fp.read()
+        amazon_id, amazon_signature = identity_cache.get()
         headers = nectar_config.headers or {}
         headers[ID_DOC_HEADER] = urlsafe_b64encode(amazon_id)
         headers[ID_SIG_HEADER] = urlsafe_b64encode(amazon_signature)
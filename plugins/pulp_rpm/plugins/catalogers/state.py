@@ -0,0 +1,108 @@
+"""
+Storage for what the yum cataloger added to the content catalog for each content source URL.
+
+The state of a URL is stored in one gzipped JSON file, addressed by the content source ID and
+the URL, and holds the checksum of the repomd.xml the entries were added from, the time at which
+the oldest of the entries expire, and the URL of each entry keyed by its serialized unit key.
+"""
+import hashlib
+import os
+import shutil
+
+from pulp.common.compat import json
+from pulp.common.util import encode_unicode
+from pulp.server.config import config as pulp_config
+
+from pulp_rpm.common import file_utils
+
+
+STATE_DIR_NAME = 'rpm_catalog'
+STATE_FILE_SUFFIX = '.json.gz'
+
+
+def get_state_dir():
+    """
+    :return:    root directory of the stored states
+    :rtype:     str
+    """
+    storage_dir = pulp_config.get('server', 'storage_dir')
+    return os.path.join(storage_dir, STATE_DIR_NAME)
+
+
+def get_path(source_id, url):
+    """
+    :param source_id:   ID of the content source
+    :type  source_id:   str
+    :param url:         URL of the content source
+    :type  url:         str
+
+    :return:    path to the file holding the state of the URL
+    :rtype:     str
+    """
+    return os.path.join(get_state_dir(), source_id,
+                        hashlib.sha256(encode_unicode(url)).hexdigest() + STATE_FILE_SUFFIX)
+
+
+def entry_key(unit_key):
+    """
+    :param unit_key:    the unit key of a catalog entry
+    :type  unit_key:    dict
+
+    :return:    the key the entry is stored under
+    :rtype:     str
+    """
+    return json.dumps(unit_key, sort_keys=True)
+
+
+def write(source_id, url, state):
+    """
+    Store the state of a URL, replacing any state stored for it before. The file is written
+    under a temporary name and renamed into place, so readers never see a partial file.
+
+    :param source_id:   ID of the content source
+    :type  source_id:   str
+    :param url:         URL of the content source
+    :type  url:         str
+    :param state:       dictionary with the keys "repomd_checksum", "expiration" and "entries"
+    :type  state:       dict
+    """
+    file_utils.write_gzipped_json(get_path(source_id, url), state)
+
+
+def read(source_id, url):
+    """
+    :param source_id:   ID of the content source
+    :type  source_id:   str
+    :param url:         URL of the content source
+    :type  url:         str
+
+    :return:    the stored state of the URL, or None if no state is stored for it
+    :rtype:     dict or None
+    """
+    path = get_path(source_id, url)
+    if not os.path.isfile(path):
+        return None
+    return file_utils.read_gzipped_json(path)
+
+
+def purge(source_urls):
+    """
+    Delete the stored states of content sources and URLs that are no longer defined.
+
+    :param source_urls: the URLs of each defined content source, keyed by content source ID
+    :type  source_urls: dict
+    """
+    state_dir = get_state_dir()
+    if not os.path.isdir(state_dir):
+        return
+    for source_id in os.listdir(state_dir):
+        source_dir = os.path.join(state_dir, source_id)
+        if source_id not in source_urls:
+            shutil.rmtree(source_dir)
+            continue
+        file_names = set(os.path.basename(get_path(source_id, url))
+                         for url in source_urls[source_id])
+        for file_name in os.listdir(source_dir):
+            # temporary files of states being written are left alone
+            if file_name.endswith(STATE_FILE_SUFFIX) and file_name not in file_names:
+                os.remove(os.path.join(source_dir, file_name))
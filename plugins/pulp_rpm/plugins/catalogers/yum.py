@@ -1,17 +1,25 @@
+import os
 import shutil
+import time
+from logging import getLogger
 from tempfile import mkdtemp
 from urlparse import urljoin
 
+from pulp.common.compat import json
 from pulp.plugins.cataloger import Cataloger
 from pulp.server.content.sources import descriptor
+from pulp.server.content.sources.model import ContentSource
 
-from pulp_rpm.common import ids
+from pulp_rpm.common import file_utils, ids
+from pulp_rpm.plugins.catalogers import state
 from pulp_rpm.plugins.db import models
-from pulp_rpm.plugins.importers.yum.repomd.metadata import MetadataFiles
+from pulp_rpm.plugins.importers.yum.repomd.metadata import MetadataFiles, REPOMD_FILE_NAME
 from pulp_rpm.plugins.importers.yum.repomd import primary, nectar_factory
 from pulp_rpm.plugins.importers.yum.repomd import packages
 
 
+log = getLogger(__name__)
+
 TYPE_ID = 'yum'
 
 
@@ -34,16 +42,25 @@ class YumCataloger(Cataloger):
         }
 
     @staticmethod
-    def _add_packages(conduit, base_url, md_files):
+    def _add_packages(conduit, base_url, md_files, previous_entries=None):
         """
-        Add package (rpm) entries to the catalog.
+        Add package (rpm) entries to the catalog. Entries that were added before with the same
+        URL are not added again, and entries that were added before for packages that are no
+        longer in the metadata are deleted.
         :param conduit: Access to pulp platform API.
         :type conduit: pulp.server.plugins.conduits.cataloger.CatalogerConduit
         :param base_url: The base download URL.
         :type base_url: str
         :param md_files: The metadata files object.
         :type md_files: pulp_rpm.plugins.importers.yum.repomd.metadata.MetadataFiles
+        :param previous_entries: The URL of each entry added before, keyed by state.entry_key
+        :type previous_entries: dict
+        :return: The URL of each entry now in the catalog, keyed by state.entry_key
+        :rtype: dict
         """
+        previous_entries = dict(previous_entries or {})
+        entries = {}
+        type_id = models.RPM._content_type_id.default
         fp = md_files.get_metadata_file_handle(primary.METADATA_FILE_NAME)
         try:
             _packages = packages.package_list_generator(
@@ -51,9 +68,19 @@ class YumCataloger(Cataloger):
             for model in _packages:
                 unit_key = model.unit_key
                 url = urljoin(base_url, model.download_path)
-                conduit.add_entry(models.RPM._content_type_id, unit_key, url)
+                key = state.entry_key(unit_key)
+                entries[key] = url
+                previous_url = previous_entries.pop(key, None)
+                if previous_url == url:
+                    continue
+                if previous_url is not None:
+                    conduit.delete_entry(type_id, unit_key)
+                conduit.add_entry(type_id, unit_key, url)
         finally:
             fp.close()
+        for key in previous_entries:
+            conduit.delete_entry(type_id, json.loads(key))
+        return entries
 
     def get_downloader(self, conduit, config, url):
         """
@@ -73,6 +100,12 @@ class YumCataloger(Cataloger):
     def refresh(self, conduit, config, url):
         """
         Refresh the content catalog.
+
+        The checksum of the repomd.xml is remembered for each content source URL. The URL is
+        skipped while the repomd.xml is unchanged and the entries added from it have not expired.
+        Otherwise, only entries that changed since the last refresh are added and deleted, until
+        the oldest of the entries expire and they are all added again. The remembered states of
+        content sources and URLs that are no longer defined are deleted.
         :param conduit: Access to pulp platform API.
         :type conduit: pulp.server.plugins.conduits.cataloger.CatalogerConduit
         :param config: The content source configuration.
@@ -80,16 +113,50 @@ class YumCataloger(Cataloger):
         :param url: The URL for the content source.
         :type url: str
         """
+        self._purge_states(conduit.source_id, url)
         dst_dir = mkdtemp()
         try:
             md_files = MetadataFiles(url, dst_dir, self.nectar_config(config))
             md_files.download_repomd()
+            with open(os.path.join(dst_dir, REPOMD_FILE_NAME), 'rb') as fp:
+                repomd_checksum = file_utils.calculate_checksum(fp)
+
+            previous_state = state.read(conduit.source_id, url)
+            if previous_state and previous_state['expiration'] > time.time():
+                if previous_state['repomd_checksum'] == repomd_checksum:
+                    log.info('%s has not changed since the last refresh. Skipping.' % url)
+                    return
+                previous_entries = previous_state['entries']
+                expiration = previous_state['expiration']
+            else:
+                previous_entries = {}
+                expiration = int(time.time()) + conduit.expires
+
             md_files.parse_repomd()
             md_files.download_metadata_files()
-            self._add_packages(conduit, url, md_files)
+            entries = self._add_packages(conduit, url, md_files, previous_entries)
+            state.write(conduit.source_id, url, {'repomd_checksum': repomd_checksum,
+                                                 'expiration': expiration,
+                                                 'entries': entries})
         finally:
             shutil.rmtree(dst_dir)
 
+    @staticmethod
+    def _purge_states(source_id, url):
+        """
+        Delete the remembered states of content sources and URLs that are no longer defined.
+        :param source_id: The ID of the content source being refreshed.
+        :type source_id: str
+        :param url: The URL being refreshed.
+        :type url: str
+        """
+        source_urls = {}
+        for source in ContentSource.load_all().values():
+            source_urls[source.id] = list(source.urls)
+        # the URL being refreshed is defined, even if its content source could not be loaded
+        source_urls.setdefault(source_id, []).append(url)
+        state.purge(source_urls)
+
     def nectar_config(self, config):
         """
         Get a nectar configuration using the specified content source configuration.
@@ -0,0 +1,155 @@
+"""
+Bulk writes of content units and their repository associations.
+
+Saving and associating units one at a time costs a round trip to the database for each unit,
+which dominates the time taken to sync or copy repositories with a very large number of small
+units. The functions here write a whole page of units with a single request.
+"""
+import operator
+
+import mongoengine
+from pulp.common import dateutils
+from pulp.server.db import model
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+# mongo's error code for a write that violates a unique index
+DUPLICATE_KEY_ERROR = 11000
+
+
+def insert_units(model_class, units):
+    """
+    Save new units with a single insert. Units that are already saved, for example by a
+    concurrent sync, are replaced in the returned list by the saved unit with the same unit key.
+
+    :param model_class: the model of the units
+    :type  model_class: subclass of pulp.server.db.model.ContentUnit
+    :param units:       unsaved units
+    :type  units:       list
+
+    :return:    the saved units, in the order they were given
+    :rtype:     list
+
+    :raise pymongo.errors.BulkWriteError: if a unit could not be saved for any reason other than
+                                          already existing
+    """
+    units = list(units)
+    if not units:
+        return units
+
+    documents = []
+    for unit in units:
+        # the signal handlers are not called for bulk inserts, but they set fields a saved unit
+        # has and write data kept outside the database
+        model_class.pre_save_signal(model_class, unit)
+        unit.validate()
+        documents.append(unit.to_mongo())
+
+    try:
+        model_class._get_collection().insert_many(documents, ordered=False)
+    except BulkWriteError, e:
+        duplicate_indexes = []
+        for error in e.details['writeErrors']:
+            if error['code'] != DUPLICATE_KEY_ERROR:
+                raise
+            duplicate_indexes.append(error['index'])
+        for index in duplicate_indexes:
+            units[index] = model_class.objects.filter(**units[index].unit_key).first()
+    _post_save(model_class, units)
+    return units
+
+
+def upsert_units(model_class, units):
+    """
+    Save units with a single request. A unit that has the same unit key as a saved unit replaces
+    the saved unit's fields, and takes its ID, so existing associations of the saved unit remain
+    valid.
+
+    :param model_class: the model of the units
+    :type  model_class: subclass of pulp.server.db.model.ContentUnit
+    :param units:       unsaved units
+    :type  units:       list
+
+    :return:    the saved units, in the order they were given, with their ID set
+    :rtype:     list
+    """
+    units = list(units)
+    if not units:
+        return units
+
+    key_db_fields = [model_class._fields[name].db_field for name in model_class.unit_key_fields]
+    requests = []
+    for unit in units:
+        model_class.pre_save_signal(model_class, unit)
+        unit.validate()
+        document = unit.to_mongo()
+        unit_id = document.pop('_id')
+        update = {'$set': document, '$setOnInsert': {'_id': unit_id}}
+        # fields that are not set on the unit are removed from a saved unit, as save() would
+        unset_fields = dict((field.db_field, '') for field in model_class._fields.itervalues()
+                            if field.db_field not in document and field.db_field != '_id')
+        if unset_fields:
+            update['$unset'] = unset_fields
+        unit_filter = dict((db_field, document.get(db_field)) for db_field in key_db_fields)
+        requests.append(UpdateOne(unit_filter, update, upsert=True))
+    model_class._get_collection().bulk_write(requests, ordered=False)
+
+    # units that were already saved kept their ID
+    saved_ids = {}
+    unit_q = reduce(operator.or_, (mongoengine.Q(**unit.unit_key) for unit in units))
+    for saved_unit in model_class.objects(unit_q).only('id', *model_class.unit_key_fields):
+        saved_ids[_key_tuple(saved_unit)] = saved_unit.id
+    for unit in units:
+        unit.id = saved_ids.get(_key_tuple(unit), unit.id)
+    _post_save(model_class, units)
+    return units
+
+
+def _post_save(model_class, units):
+    """
+    Call the post-save signal handler of the model, if it has one, for units saved in bulk.
+
+    :param model_class: the model of the units
+    :type  model_class: subclass of pulp.server.db.model.ContentUnit
+    :param units:       saved units
+    :type  units:       list
+    """
+    post_save_signal = getattr(model_class, 'post_save_signal', None)
+    if post_save_signal is not None:
+        for unit in units:
+            post_save_signal(model_class, unit)
+
+
+def _key_tuple(unit):
+    """
+    :param unit:    a content unit
+    :type  unit:    pulp.server.db.model.ContentUnit
+
+    :return:    the values of the unit key fields of the unit
+    :rtype:     tuple
+    """
+    return tuple(getattr(unit, name) for name in unit.unit_key_fields)
+
+
+def associate_units(repo, units):
+    """
+    Associate units with a repository with a single request. Units that are already associated
+    have the updated timestamp of their association refreshed, as associate_single_unit does.
+
+    :param repo:    the repository to associate the units with
+    :type  repo:    pulp.server.db.model.Repository
+    :param units:   saved units
+    :type  units:   iterable of pulp.server.db.model.ContentUnit
+    """
+    formatted_datetime = dateutils.format_iso8601_utc_timestamp(dateutils.now_utc_timestamp())
+    requests = []
+    for unit in units:
+        unit_filter = {'repo_id': repo.repo_id, 'unit_id': unit.id,
+                       'unit_type_id': unit._content_type_id}
+        requests.append(UpdateOne(unit_filter,
+                                  {'$setOnInsert': {'created': formatted_datetime},
+                                   '$set': {'updated': formatted_datetime}},
+                                  upsert=True))
+    if requests:
+        model.RepositoryContentUnit._get_collection().bulk_write(requests, ordered=False)
@@ -0,0 +1,121 @@
+"""
+Batched writes to the deferred downloading (lazy) catalog.
+
+Entries are collected a page at a time. Each page is compared with the entries the importer
+already has for the same paths, and only the entries that are new or changed are written, with
+a single insert for the new revisions and a single delete for the revisions they replace.
+"""
+from pulp.server.db.model import LazyCatalogEntry
+from pymongo.errors import BulkWriteError
+
+from pulp_rpm.plugins.db.bulk import DUPLICATE_KEY_ERROR
+
+
+# The number of entries that are collected before they are written
+PAGE_SIZE = 1000
+
+
+class CatalogWriter(object):
+    """
+    Writes the lazy catalog entries of an importer in pages. flush() must be called after the
+    last entry is added.
+    """
+
+    def __init__(self, importer_id, page_size=PAGE_SIZE):
+        """
+        :param importer_id: ID of the importer the entries belong to
+        :type  importer_id: str
+        :param page_size:   number of entries collected before they are written
+        :type  page_size:   int
+        """
+        self.importer_id = importer_id
+        self.page_size = page_size
+        # path to the entry that should be in the catalog for it
+        self._entries = {}
+
+    def add(self, path, url, unit):
+        """
+        Add the entry for a path, replacing any entry the importer has for it if it differs.
+
+        :param path:    the path the unit's file is stored at
+        :type  path:    str
+        :param url:     the URL the file can be downloaded from
+        :type  url:     str
+        :param unit:    the unit the file belongs to
+        :type  unit:    pulp.server.db.model.ContentUnit
+        """
+        entry = LazyCatalogEntry()
+        entry.path = path
+        entry.importer_id = self.importer_id
+        entry.unit_id = unit.id
+        entry.unit_type_id = unit.type_id
+        entry.url = url
+        self._entries[path] = entry
+        if len(self._entries) >= self.page_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the entries added since the last flush.
+        """
+        entries = self._entries
+        self._entries = {}
+        if not entries:
+            return
+
+        existing_entries = LazyCatalogEntry.objects.filter(
+            importer_id=self.importer_id, path__in=entries.keys()).only(
+            'id', 'path', 'unit_id', 'unit_type_id', 'url', 'revision')
+        revisions_by_path = {}
+        for existing_entry in existing_entries:
+            revisions_by_path.setdefault(existing_entry.path, []).append(existing_entry)
+
+        new_entries = []
+        replaced_ids = []
+        for path, entry in entries.iteritems():
+            revisions = revisions_by_path.get(path, [])
+            if len(revisions) == 1 and self._unchanged(revisions[0], entry):
+                continue
+            # the same revision numbering as LazyCatalogEntry.save_revision()
+            entry.revision = max([0] + [revision.revision for revision in revisions]) + 1
+            new_entries.append(entry)
+            replaced_ids.extend(revision.id for revision in revisions)
+
+        self._insert(new_entries)
+        if replaced_ids:
+            LazyCatalogEntry.objects.filter(id__in=replaced_ids).delete()
+
+    @staticmethod
+    def _unchanged(existing_entry, entry):
+        """
+        :param existing_entry:  an entry in the catalog
+        :type  existing_entry:  pulp.server.db.model.LazyCatalogEntry
+        :param entry:           the entry that should be in the catalog for the same path
+        :type  entry:           pulp.server.db.model.LazyCatalogEntry
+
+        :return:    True if the entry in the catalog does not need to be replaced
+        :rtype:     bool
+        """
+        return (existing_entry.unit_id == entry.unit_id and
+                existing_entry.unit_type_id == entry.unit_type_id and
+                existing_entry.url == entry.url)
+
+    @staticmethod
+    def _insert(entries):
+        """
+        Insert new entries. Entries whose revision was taken by a concurrent write are saved with
+        the next revision instead.
+
+        :param entries: the entries to insert
+        :type  entries: list
+        """
+        if not entries:
+            return
+        documents = [entry.to_mongo() for entry in entries]
+        try:
+            LazyCatalogEntry._get_collection().insert_many(documents, ordered=False)
+        except BulkWriteError, e:
+            for error in e.details['writeErrors']:
+                if error['code'] != DUPLICATE_KEY_ERROR:
+                    raise
+                entries[error['index']].save_revision()
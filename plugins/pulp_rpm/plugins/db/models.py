@@ -1,16 +1,20 @@
 import csv
+import hashlib
 import logging
 import os
+import uuid
 from gettext import gettext as _
 from urlparse import urljoin
 
 import mongoengine
+from mongoengine import signals
 from pulp.plugins.util import verification
 from pulp.server.db.model import ContentUnit, FileContentUnit
 
 from pulp_rpm.common import version_utils
 from pulp_rpm.common import file_utils
 from pulp_rpm.plugins import serializers
+from pulp_rpm.plugins.db import repodata_store
 from pulp_rpm.plugins.db.fields import ChecksumTypeStringField
 
 
@@ -333,6 +337,7 @@ class RpmBase(NonMetadataPackage):
 
     provides = mongoengine.ListField()
     files = mongoengine.DictField()
+    # XML snippets that have not been moved to the repodata store yet; use get_repodata()
     repodata = mongoengine.DictField(default={})
     description = mongoengine.StringField()
     header_range = mongoengine.DictField()
@@ -349,7 +354,8 @@ class RpmBase(NonMetadataPackage):
     meta = {'indexes': [
         "name", "epoch", "version", "release", "arch", "filename", "checksum",
         "checksumtype", "version_sort_index",
-        ("version_sort_index", "release_sort_index")],
+        ("version_sort_index", "release_sort_index"),
+        ("name", "arch", "epoch", "version", "release")],
         'abstract': True}
 
     SERIALIZER = serializers.RpmBase
@@ -358,6 +364,94 @@ class RpmBase(NonMetadataPackage):
         super(RpmBase, self).__init__(*args, **kwargs)
         # raw_xml is only used during the initial sync
         self.raw_xml = ''
+        # snippets read from or written to the repodata store
+        self._stored_repodata = None
+        # snippets moved out of the document that are written to the store once it is saved
+        self._pending_repodata = None
+
+    @classmethod
+    def attach_signals(cls):
+        """
+        Attach the signals to this class, including the handlers that write and delete the
+        snippets in the repodata store once the document is saved or deleted.
+        """
+        super(RpmBase, cls).attach_signals()
+        signals.post_save.connect(cls.post_save_signal, sender=cls)
+        signals.post_delete.connect(cls.post_delete_signal, sender=cls)
+
+    @classmethod
+    def pre_save_signal(cls, sender, document, **kwargs):
+        """
+        Move the XML snippets out of the document before saving. They are written to the
+        repodata store by post_save_signal() once the document has been saved.
+
+        :param sender: sender class
+        :type sender: object
+        :param document: Document that sent the signal
+        :type document: pulp_rpm.plugins.db.models.RpmBase
+        """
+        super(RpmBase, cls).pre_save_signal(sender, document, **kwargs)
+        if document.repodata:
+            document._pending_repodata = document.repodata
+            document._stored_repodata = document.repodata
+            document.repodata = {}
+
+    @classmethod
+    def post_save_signal(cls, sender, document, **kwargs):
+        """
+        Write the XML snippets moved out of the document to the repodata store. If they can't be
+        written, they are put back into the saved document so they are not lost.
+
+        :param sender: sender class
+        :type sender: object
+        :param document: Document that sent the signal
+        :type document: pulp_rpm.plugins.db.models.RpmBase
+        """
+        repodata = document._pending_repodata
+        if not repodata:
+            return
+        try:
+            repodata_store.write(document.checksumtype, document.checksum, repodata)
+        except Exception:
+            sender.objects(id=document.id).update_one(set__repodata=repodata)
+            document.repodata = repodata
+            raise
+        finally:
+            document._pending_repodata = None
+
+    @classmethod
+    def post_delete_signal(cls, sender, document, **kwargs):
+        """
+        Delete the XML snippets of a deleted document from the repodata store, unless another
+        RPM or SRPM with the same checksum still uses them.
+
+        :param sender: sender class
+        :type sender: object
+        :param document: Document that sent the signal
+        :type document: pulp_rpm.plugins.db.models.RpmBase
+        """
+        for model_class in (RPM, SRPM):
+            if model_class.objects(checksumtype=document.checksumtype,
+                                   checksum=document.checksum).count():
+                return
+        repodata_store.delete(document.checksumtype, document.checksum)
+
+    def get_repodata(self, metadata_type):
+        """
+        Get one of the package's XML snippets, reading it from the repodata store if the snippets
+        have been moved out of the document.
+
+        :param metadata_type: type of the snippet, such as "primary"
+        :type  metadata_type: str
+
+        :return: the XML snippet
+        :rtype:  basestring
+        """
+        if self.repodata:
+            return self.repodata[metadata_type]
+        if self._stored_repodata is None:
+            self._stored_repodata = repodata_store.read(self.checksumtype, self.checksum)
+        return self._stored_repodata[metadata_type]
 
     @property
     def relative_path(self):  # TODO: what is this used for?
@@ -425,6 +519,10 @@ class Errata(UnitMixin, ContentUnit):
     solution = mongoengine.StringField()
     summary = mongoengine.StringField()
 
+    # Rendered updateinfo.xml snippet, cached by the yum distributor. The revision changes each
+    # time the erratum is saved, which invalidates the snippet.
+    _updateinfo_xml = mongoengine.DictField(default={})
+
     # For backward compatibility
     _ns = mongoengine.StringField(default='units_erratum')
     _content_type_id = mongoengine.StringField(required=True, default='erratum')
@@ -439,6 +537,19 @@ class Errata(UnitMixin, ContentUnit):
 
     SERIALIZER = serializers.Errata
 
+    @classmethod
+    def pre_save_signal(cls, sender, document, **kwargs):
+        """
+        Invalidate the cached updateinfo.xml snippet before saving
+
+        :param sender: sender class
+        :type sender: object
+        :param document: Document that sent the signal
+        :type document: pulp_rpm.plugins.db.models.Errata
+        """
+        super(Errata, cls).pre_save_signal(sender, document, **kwargs)
+        document._updateinfo_xml = {'revision': uuid.uuid4().hex}
+
     @property
     def rpm_search_dicts(self):
         ret = []
@@ -687,40 +798,80 @@ class ISOManifest(object):
     This class provides an API that is a handy way to interact with a PULP_MANIFEST file. It
     automatically
     instantiates ISOs out of the items found in the manifest.
+
+    The ISOs are instantiated as the manifest is iterated over rather than all at once, so the
+    manifest file must remain open for as long as the ISOManifest is used.
     """
     # This is the filename that the manifest is published to
     FILENAME = 'PULP_MANIFEST'
 
     def __init__(self, manifest_file, repo_url):
         """
-        Instantiate a new ISOManifest from the open manifest_file.
+        Instantiate a new ISOManifest from the open manifest_file. The file is read once to
+        validate it, count its ISOs and calculate its checksum.
 
         :param manifest_file: An open file-like handle to a PULP_MANIFEST file
         :type  manifest_file: An open file-like object
         :param repo_url:      The URL to the repository that this manifest came from. This is used
                               to determine a url attribute for each ISO in the manifest.
         :type  repo_url:      str
+
+        :raise ValueError: if the manifest is not in the expected format
+        """
+        self._manifest_file = manifest_file
+        self._repo_url = repo_url
+        self._length = 0
+        hasher = hashlib.sha256()
+        for name, checksum, size in self._read_rows(hasher):
+            int(size)
+            self._length += 1
+        # The sha256 checksum of the manifest file, which changes whenever its content does
+        self.checksum = hasher.hexdigest()
+
+    def _read_rows(self, hasher=None):
+        """
+        Read the rows of the manifest from the beginning of the file.
+
+        :param hasher: optional hash object that is updated with each line that is read
+        :type  hasher: _hashlib.HASH
+
+        :return: generator of the rows of the manifest, as lists of strings
+        :rtype:  generator
         """
         # Make sure we are reading from the beginning of the file
-        manifest_file.seek(0)
-        # Now let's process the manifest and return a list of resources that we'd like to download
-        manifest_csv = csv.reader(manifest_file)
-        self._isos = []
-        for unit in manifest_csv:
-            name, checksum, size = unit
-            iso = ISO(name=name, size=int(size), checksum=checksum)
-            # Take a URL onto the ISO so we know where we can get it
-            iso.url = urljoin(repo_url, name)
-            self._isos.append(iso)
+        self._manifest_file.seek(0)
+        lines = self._manifest_file
+        if hasher is not None:
+            lines = self._hash_lines(lines, hasher)
+        return csv.reader(lines)
+
+    @staticmethod
+    def _hash_lines(lines, hasher):
+        """
+        :param lines:  lines of the manifest file
+        :type  lines:  iterable
+        :param hasher: hash object to update with each line
+        :type  hasher: _hashlib.HASH
+
+        :return: generator of the same lines
+        :rtype:  generator
+        """
+        for line in lines:
+            hasher.update(line)
+            yield line
 
     def __iter__(self):
         """
         Return an iterator for the ISOs in the manifest.
         """
-        return iter(self._isos)
+        for name, checksum, size in self._read_rows():
+            iso = ISO(name=name, size=int(size), checksum=checksum)
+            # Take a URL onto the ISO so we know where we can get it
+            iso.url = urljoin(self._repo_url, name)
+            yield iso
 
     def __len__(self):
         """
         Return the number of ISOs in the manifest.
         """
-        return len(self._isos)
+        return self._length
@@ -0,0 +1,86 @@
+"""
+Storage for the primary, filelists and other XML snippets of RPMs and SRPMs outside their
+database documents.
+
+The snippets of a package are stored together in one gzipped JSON file, addressed by the
+package's checksum. Packages with the same checksum share the same file.
+"""
+import errno
+import os
+
+from pulp.server.config import config as pulp_config
+
+from pulp_rpm.common import file_utils
+
+
+REPODATA_DIR_NAME = 'rpm_repodata'
+REPODATA_FILE_SUFFIX = '.json.gz'
+
+
+def get_store_dir():
+    """
+    :return:    root directory of the repodata store
+    :rtype:     str
+    """
+    storage_dir = pulp_config.get('server', 'storage_dir')
+    return os.path.join(storage_dir, 'content', 'units', REPODATA_DIR_NAME)
+
+
+def get_path(checksumtype, checksum):
+    """
+    :param checksumtype:    type of the package's checksum
+    :type  checksumtype:    str
+    :param checksum:        the package's checksum
+    :type  checksum:        str
+
+    :return:    path to the file holding the snippets of the package
+    :rtype:     str
+    """
+    return os.path.join(get_store_dir(), checksumtype, checksum[:2],
+                        checksum[2:] + REPODATA_FILE_SUFFIX)
+
+
+def write(checksumtype, checksum, repodata):
+    """
+    Store the snippets of a package, replacing any snippets stored for it before. The file is
+    written under a temporary name and renamed into place, so readers never see a partial file.
+
+    :param checksumtype:    type of the package's checksum
+    :type  checksumtype:    str
+    :param checksum:        the package's checksum
+    :type  checksum:        str
+    :param repodata:        dictionary of metadata type, such as "primary", to XML snippet
+    :type  repodata:        dict
+    """
+    file_utils.write_gzipped_json(get_path(checksumtype, checksum), repodata)
+
+
+def read(checksumtype, checksum):
+    """
+    :param checksumtype:    type of the package's checksum
+    :type  checksumtype:    str
+    :param checksum:        the package's checksum
+    :type  checksum:        str
+
+    :return:    dictionary of metadata type, such as "primary", to XML snippet
+    :rtype:     dict
+
+    :raise IOError: if no snippets are stored for the package
+    """
+    return file_utils.read_gzipped_json(get_path(checksumtype, checksum))
+
+
+def delete(checksumtype, checksum):
+    """
+    Delete the snippets stored for a package, if there are any.
+
+    :param checksumtype:    type of the package's checksum
+    :type  checksumtype:    str
+    :param checksum:        the package's checksum
+    :type  checksum:        str
+    """
+    try:
+        os.remove(get_path(checksumtype, checksum))
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
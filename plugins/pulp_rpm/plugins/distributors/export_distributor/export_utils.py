@@ -7,6 +7,7 @@ import mongoengine
 from pulp.common import dateutils
 
 from pulp_rpm.common import constants
+from pulp_rpm.plugins.distributors.export_distributor import generate_iso
 from pulp_rpm.yum_plugin import util as yum_utils
 
 
@@ -94,6 +95,21 @@ def validate_export_config(config):
                 msg = _('iso_size is not a positive integer')
                 _logger.error(msg)
                 return False, msg
+        if key in (constants.ISO_WORKERS_KEYWORD, constants.EXPORT_WORKERS_KEYWORD):
+            try:
+                positive = int(value) > 0
+            except (TypeError, ValueError):
+                positive = False
+            if not positive:
+                msg = _('%(key)s is not a positive integer') % {'key': key}
+                _logger.error(msg)
+                return False, msg
+        if key == constants.ISO_PACKING_KEYWORD:
+            if value not in generate_iso.PACKING_MODES:
+                msg = _('iso_packing must be one of %(modes)s') % {
+                    'modes': ', '.join(generate_iso.PACKING_MODES)}
+                _logger.error(msg)
+                return False, msg
         if key == constants.START_DATE_KEYWORD:
             try:
                 dateutils.parse_iso8601_datetime(str(value))
@@ -3,7 +3,9 @@
 import os
 import commands
 import datetime
+import Queue
 import tempfile
+import threading
 from stat import ST_SIZE
 
 from pulp_rpm.yum_plugin.util import getLogger
@@ -14,12 +16,37 @@ log = getLogger(__name__)
 # Define the size (in megabytes) of a DVD sized ISO
 DVD_ISO_SIZE = 4380
 
+# Building images is bound by the disk rather than the CPU, so they are built one at a time unless
+# more workers are configured
+DEFAULT_ISO_WORKERS = 1
+
 MKISOFS_COMMAND_TEMPLATE = "mkisofs -r -D -graft-points -path-list %s -o %s"
 
+# Ways of distributing files between images
+PACKING_SEQUENTIAL = 'sequential'
+PACKING_FIRST_FIT_DECREASING = 'first_fit_decreasing'
+PACKING_MODES = (PACKING_SEQUENTIAL, PACKING_FIRST_FIT_DECREASING)
+
+# Keys and values passed to the progress callback
+PROGRESS_FILL_RATIO = 'fill_ratio'
+PROGRESS_IMAGE_COUNT = 'image_count'
+ISO_STATE_RUNNING = 'running'
+ISO_STATE_COMPLETE = 'complete'
+ISO_STATE_FAILED = 'failed'
 
-def create_iso(target_dir, output_dir, prefix, image_size=DVD_ISO_SIZE, progress_callback=None):
+
+def create_iso(target_dir, output_dir, prefix, image_size=DVD_ISO_SIZE, progress_callback=None,
+               max_workers=None, packing=PACKING_SEQUENTIAL):
     """
-    Run the export process.
+    Run the export process. Images are built concurrently, each by its own mkisofs process, with
+    at most max_workers of them running at a time.
+
+    Once the files are distributed between the images, the progress callback is called with
+    PROGRESS_FILL_RATIO and the fraction of the total image capacity that is used, and then with
+    PROGRESS_IMAGE_COUNT and the number of images to build. After that it is called with the file
+    name of an image and one of ISO_STATE_RUNNING, ISO_STATE_COMPLETE or ISO_STATE_FAILED each
+    time the state of that image changes. It is always called from the thread that called this
+    function.
 
     :param target_dir:          The directory to be written to ISO images
     :type  target_dir:          str
@@ -35,9 +62,18 @@ def create_iso(target_dir, output_dir, prefix, image_size=DVD_ISO_SIZE, progress
                                 take the following parameters: a string to use as the key in a
                                 dictionary, and the second parameter is assigned to it.
     :type  progress_callback:   function
+    :param max_workers:         maximum number of images to build at the same time; defaults to
+                                DEFAULT_ISO_WORKERS
+    :type  max_workers:         int
+    :param packing:             one of PACKING_MODES; see _compute_image_files
+    :type  packing:             str
+
+    :return: file names of the images that could not be built
+    :rtype:  list of str
     """
     # Validate the configuration
     image_size = _parse_image_size(image_size)
+    max_workers = _parse_max_workers(max_workers)
 
     # record start time
     start_time = datetime.datetime.now()
@@ -46,12 +82,73 @@ def create_iso(target_dir, output_dir, prefix, image_size=DVD_ISO_SIZE, progress
     file_list, total_dir_size = _get_dir_file_list_and_size(target_dir)
 
     # image_list is a list of the images to write. Each item in the list is a list of file paths.
-    image_list = _compute_image_files(file_list, image_size)
+    image_list = _compute_image_files(file_list, image_size, packing)
     image_count = len(image_list)
-
+    fill_ratio = _get_fill_ratio(total_dir_size, image_count, image_size)
+    log.info('Writing %d bytes to %d ISO images, %.1f%% full' %
+             (total_dir_size, image_count, fill_ratio * 100))
+    if progress_callback is not None:
+        progress_callback(PROGRESS_FILL_RATIO, fill_ratio)
+        progress_callback(PROGRESS_IMAGE_COUNT, image_count)
+
+    images = Queue.Queue()
     for i in range(image_count):
         name = "%s-%s-%02d.iso" % (prefix, start_time.strftime("%Y-%m-%dT%H.%M"), i + 1)
-        _make_iso(image_list[i], target_dir, output_dir, name)
+        images.put((image_list[i], name))
+
+    # The workers report state changes through this queue so the progress callback, which
+    # usually writes to the database, is only called from this thread.
+    states = Queue.Queue()
+    workers = [threading.Thread(target=_iso_worker, args=(images, states, target_dir, output_dir))
+               for i in range(min(max_workers, image_count))]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    failed = []
+    finished = 0
+    while finished < image_count:
+        name, state = states.get()
+        if state != ISO_STATE_RUNNING:
+            finished += 1
+        if state == ISO_STATE_FAILED:
+            failed.append(name)
+        if progress_callback is not None:
+            progress_callback(name, state)
+
+    for worker in workers:
+        worker.join()
+
+    return sorted(failed)
+
+
+def _iso_worker(images, states, target_dir, output_dir):
+    """
+    Build images taken from a queue until it is empty, reporting the state of each image on
+    another queue.
+
+    :param images:      queue of (file_list, filename) tuples describing the images to build
+    :type  images:      Queue.Queue
+    :param states:      queue on which (filename, state) tuples are put
+    :type  states:      Queue.Queue
+    :param target_dir:  The full path to the root directory tree to be wrapped in an ISO
+    :type  target_dir:  str
+    :param output_dir:  The full path to the output directory for the ISO images
+    :type  output_dir:  str
+    """
+    while True:
+        try:
+            file_list, filename = images.get_nowait()
+        except Queue.Empty:
+            return
+
+        states.put((filename, ISO_STATE_RUNNING))
+        try:
+            success = _make_iso(file_list, target_dir, output_dir, filename)
+        except Exception:
+            log.exception('Error creating iso %s' % filename)
+            success = False
+        states.put((filename, ISO_STATE_COMPLETE if success else ISO_STATE_FAILED))
 
 
 def _make_iso(file_list, target_dir, output_dir, filename):
@@ -70,12 +167,19 @@ def _make_iso(file_list, target_dir, output_dir, filename):
     :param filename:    The filename to use for the ISO image. This should be relative to the output
                         directory.
     :type  filename:    str
+
+    :return: True if the image was created; False otherwise
+    :rtype:  bool
     """
     file_path = os.path.join(output_dir, filename)
 
-    # If the output directory doesn't exist, make it
+    # If the output directory doesn't exist, make it. Another worker may be making it too.
     if not os.path.isdir(output_dir):
-        os.makedirs(output_dir)
+        try:
+            os.makedirs(output_dir)
+        except OSError:
+            if not os.path.isdir(output_dir):
+                raise
 
     # Create a pathspec file using the files in this image.
     pathspec_file = _get_pathspec_file(file_list, target_dir)
@@ -86,8 +190,10 @@ def _make_iso(file_list, target_dir, output_dir, filename):
 
     if status != 0:
         log.error("Error creating iso %s; status code: %d; output: %s" % (file_path, status, out))
-    else:
-        log.info('Successfully created iso %s' % file_path)
+        return False
+
+    log.info('Successfully created iso %s' % file_path)
+    return True
 
 
 def _parse_image_size(image_size):
@@ -111,16 +217,72 @@ def _parse_image_size(image_size):
     return image_size * 1024 * 1024
 
 
-def _compute_image_files(file_list, max_image_size):
+def _parse_max_workers(max_workers):
     """
-    Compute file lists to be written to each media image by shoving files into an image until
-    image_size is exceeded.
+    Parses the max_workers value and raises the appropriate exception if necessary
+
+    :param max_workers: The maximum number of images to build at the same time
+    :type  max_workers: int or str
+
+    :return: The maximum number of images to build at the same time
+    :rtype:  int
+
+    :raise: ValueError if max_workers cast to an int is smaller than or equal to 0
+    """
+    if max_workers is None:
+        return DEFAULT_ISO_WORKERS
+
+    max_workers = int(max_workers)
+    if 0 >= max_workers:
+        raise ValueError('The number of ISO workers must be an integer greater than 0')
+    return max_workers
+
+
+def _compute_image_files(file_list, max_image_size, packing=PACKING_SEQUENTIAL):
+    """
+    Compute file lists to be written to each media image.
+
+    In the sequential mode, files are shoved into an image in the order they are listed until the
+    next file does not fit, and then a new image is started.
+
+    In the first fit decreasing mode, the files of each directory are kept together as a group,
+    so a repository's metadata ends up on the same image. Groups are placed largest first in the
+    first image they fit in, which uses fewer images when file sizes vary. A group that does not
+    fit in an image by itself is split into its files, which are placed the same way. Files keep
+    the order they are listed in within each image.
 
     :param file_list:       A list of tuples, where each tuple is (file_path, file_size),
     usually the
                             output of get_dir_file_list_and_size
-    :type  file_list:       [(str, int)]class TestEntryPoint(unittest.TestCase):
+    :type  file_list:       [(str, int)]
+    :param max_image_size:  The maximum size of image in bytes
+    :type  max_image_size:  int
+    :param packing:         one of PACKING_MODES
+    :type  packing:         str
 
+    :return: list of images, which are themselves a list of file paths
+    :rtype: list of list of str
+
+    :raise: ValueError if a file is larger than max_image_size or packing is not valid
+    """
+    for file_path, file_size in file_list:
+        # An edge case, but if the file is too big to fit on a single ISO, we should stop
+        if file_size > max_image_size:
+            raise ValueError('The maximum ISO size is not large enough to contain %s' % file_path)
+
+    if packing == PACKING_SEQUENTIAL:
+        return _pack_sequential(file_list, max_image_size)
+    if packing == PACKING_FIRST_FIT_DECREASING:
+        return _pack_first_fit_decreasing(file_list, max_image_size)
+    raise ValueError('ISO packing must be one of %s' % ', '.join(PACKING_MODES))
+
+
+def _pack_sequential(file_list, max_image_size):
+    """
+    Distribute files between images in the order they are listed.
+
+    :param file_list:       A list of tuples, where each tuple is (file_path, file_size)
+    :type  file_list:       [(str, int)]
     :param max_image_size:  The maximum size of image in bytes
     :type  max_image_size:  int
 
@@ -128,34 +290,82 @@ def _compute_image_files(file_list, max_image_size):
     :rtype: list of list of str
     """
     images = []
+    image = []
+    image_size = 0
+    for file_path, file_size in file_list:
+        if image and image_size + file_size > max_image_size:
+            # If adding this file exceeds image size, start a new image
+            images.append(image)
+            image = []
+            image_size = 0
+        image.append(file_path)
+        image_size += file_size
+    if image:
+        images.append(image)
+    return images
+
+
+def _pack_first_fit_decreasing(file_list, max_image_size):
+    """
+    Distribute groups of files in the same directory between images, largest group first, each
+    in the first image with room for it.
 
-    # While we have files in the list, create images
-    while len(file_list) > 0:
-        image = []
-        image_size = 0
-        # Keep track of the last file written so we can trim the list
-        last_file_written = None
-
-        for file_path, file_size in file_list:
-            # An edge case, but if the file is too big to fit on a single ISO, we should stop
-            if file_size > max_image_size:
-                raise ValueError(
-                    'The maximum ISO size is not large enough to contain %s' % file_path)
-
-            if image_size + file_size > max_image_size:
-                # If adding this file exceeds image size, break out of the for loop
+    :param file_list:       A list of tuples, where each tuple is (file_path, file_size)
+    :type  file_list:       [(str, int)]
+    :param max_image_size:  The maximum size of image in bytes
+    :type  max_image_size:  int
+
+    :return: list of images, which are themselves a list of file paths
+    :rtype: list of list of str
+    """
+    # Group the indexes of the files by directory, so each image can be listed in the original
+    # order at the end
+    groups = {}
+    for index, (file_path, file_size) in enumerate(file_list):
+        group = groups.setdefault(os.path.dirname(file_path), [0, []])
+        group[0] += file_size
+        group[1].append(index)
+
+    items = []
+    for group_size, indexes in groups.itervalues():
+        if group_size <= max_image_size:
+            items.append((group_size, indexes))
+        else:
+            items.extend((file_list[index][1], [index]) for index in indexes)
+    # Sort by size, largest first; the first index keeps the order stable for equal sizes
+    items.sort(key=lambda item: (-item[0], item[1][0]))
+
+    image_sizes = []
+    image_indexes = []
+    for item_size, indexes in items:
+        for image_number, image_size in enumerate(image_sizes):
+            if image_size + item_size <= max_image_size:
                 break
+        else:
+            image_number = len(image_sizes)
+            image_sizes.append(0)
+            image_indexes.append([])
+        image_sizes[image_number] += item_size
+        image_indexes[image_number].extend(indexes)
 
-            # Append the file path to the image and update the size of this image
-            image.append(file_path)
-            image_size += file_size
-            last_file_written = (file_path, file_size)
+    return [[file_list[index][0] for index in sorted(indexes)] for indexes in image_indexes]
 
-        # Trim the list to the last item written plus 1, then add the image and start again
-        file_list = file_list[file_list.index(last_file_written) + 1:]
-        images.append(image)
 
-    return images
+def _get_fill_ratio(total_size, image_count, max_image_size):
+    """
+    :param total_size:      total size of the files written to the images, in bytes
+    :type  total_size:      int
+    :param image_count:     number of images
+    :type  image_count:     int
+    :param max_image_size:  The maximum size of image in bytes
+    :type  max_image_size:  int
+
+    :return: fraction of the capacity of the images that is used
+    :rtype:  float
+    """
+    if image_count == 0:
+        return 0.0
+    return float(total_size) / (image_count * max_image_size)
 
 
 def _get_grafts(img_file_paths, target_dir):
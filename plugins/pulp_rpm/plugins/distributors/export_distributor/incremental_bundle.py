@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+The format of incremental exports.
+
+The metadata of the exported units is written to a small number of gzipped bundle files, one JSON
+document per line, each with the keys "unit_key" and "unit_metadata". Each bundle holds units of
+a single type. An index file lists the bundles along with their unit type, unit count and sha256
+checksum. The bundles and the index are written to the BUNDLE_DIR_NAME directory inside the
+exported repository, next to the package files.
+"""
+import gzip
+import os
+
+from pulp.common.compat import json
+
+from pulp_rpm.common import file_utils
+
+
+BUNDLE_DIR_NAME = 'pulp_incremental'
+INDEX_FILE_NAME = 'index.json'
+BUNDLE_FILE_TEMPLATE = '%(type_id)s-%(number)04d.json.gz'
+
+# The version of the format, which is recorded in the index
+FORMAT_VERSION = 1
+
+# The number of units written to a bundle before another one is started
+UNITS_PER_BUNDLE = 5000
+
+
+class BundleWriter(object):
+    """
+    Writes the metadata of units to bundle files and finally writes the index.
+    """
+
+    def __init__(self, working_dir, units_per_bundle=UNITS_PER_BUNDLE):
+        """
+        :param working_dir:         directory of the exported repository
+        :type  working_dir:         str
+        :param units_per_bundle:    number of units written to a bundle before another one is
+                                    started
+        :type  units_per_bundle:    int
+        """
+        self.directory = os.path.join(working_dir, BUNDLE_DIR_NAME)
+        self.units_per_bundle = units_per_bundle
+        # index entries of the bundles, in the order they were started
+        self.bundles = []
+        # type id to a tuple of the index entry and the open file of the bundle being written
+        self._open_bundles = {}
+
+    def initialize(self):
+        """
+        Create the bundle directory.
+        """
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def add_unit(self, type_id, unit_key, unit_metadata):
+        """
+        Write the metadata of a unit to the current bundle for its type.
+
+        :param type_id:         type of the unit
+        :type  type_id:         str
+        :param unit_key:        the unit's key
+        :type  unit_key:        dict
+        :param unit_metadata:   the rest of the unit's fields
+        :type  unit_metadata:   dict
+        """
+        if type_id not in self._open_bundles:
+            self._start_bundle(type_id)
+        entry, bundle_file = self._open_bundles[type_id]
+
+        bundle_file.write(json.dumps({'unit_key': unit_key, 'unit_metadata': unit_metadata}))
+        bundle_file.write('\n')
+        entry['units'] += 1
+
+        if entry['units'] >= self.units_per_bundle:
+            self._close_bundle(type_id)
+
+    def finalize(self):
+        """
+        Close the bundles still being written and write the index.
+        """
+        for type_id in self._open_bundles.keys():
+            self._close_bundle(type_id)
+
+        index = {'version': FORMAT_VERSION, 'bundles': self.bundles}
+        # the bundles are only read once they are listed in a complete index
+        with file_utils.atomic_write(os.path.join(self.directory, INDEX_FILE_NAME)) as index_file:
+            json.dump(index, index_file)
+
+    def _start_bundle(self, type_id):
+        """
+        :param type_id: type of the units the bundle holds
+        :type  type_id: str
+        """
+        number = len([entry for entry in self.bundles if entry['type_id'] == type_id]) + 1
+        entry = {
+            'file': BUNDLE_FILE_TEMPLATE % {'type_id': type_id, 'number': number},
+            'type_id': type_id,
+            'units': 0,
+            'checksum': None,
+        }
+        self.bundles.append(entry)
+        bundle_file = gzip.open(os.path.join(self.directory, entry['file']), 'wb')
+        self._open_bundles[type_id] = (entry, bundle_file)
+
+    def _close_bundle(self, type_id):
+        """
+        :param type_id: type of the units the bundle holds
+        :type  type_id: str
+        """
+        entry, bundle_file = self._open_bundles.pop(type_id)
+        bundle_file.close()
+        with open(os.path.join(self.directory, entry['file']), 'rb') as bundle_file:
+            entry['checksum'] = file_utils.calculate_checksum(bundle_file)
+
+
+def read_index(repo_dir):
+    """
+    :param repo_dir:    directory of an exported repository
+    :type  repo_dir:    str
+
+    :return:    the index of the incremental export in the directory, or None if the directory
+                does not hold one
+    :rtype:     dict or None
+
+    :raise ValueError: if the index was written in a format this module does not support
+    """
+    index_path = os.path.join(repo_dir, BUNDLE_DIR_NAME, INDEX_FILE_NAME)
+    if not os.path.isfile(index_path):
+        return None
+    with open(index_path) as index_file:
+        index = json.load(index_file)
+    if index.get('version') != FORMAT_VERSION:
+        raise ValueError('Unsupported incremental export version: %s' % index.get('version'))
+    return index
+
+
+def iter_units(repo_dir, entry):
+    """
+    Read the units in a bundle after verifying its checksum.
+
+    :param repo_dir:    directory of an exported repository
+    :type  repo_dir:    str
+    :param entry:       the index entry of the bundle
+    :type  entry:       dict
+
+    :return:    generator of (unit_key, unit_metadata) tuples
+    :rtype:     generator
+
+    :raise ValueError: if the bundle does not match the checksum in the index
+    """
+    bundle_path = os.path.join(repo_dir, BUNDLE_DIR_NAME, entry['file'])
+    with open(bundle_path, 'rb') as bundle_file:
+        checksum = file_utils.calculate_checksum(bundle_file)
+    if checksum != entry['checksum']:
+        raise ValueError('Checksum of %s does not match the index' % bundle_path)
+
+    for document in file_utils.iter_gzipped_json_lines(bundle_path):
+        yield document['unit_key'], document['unit_metadata']
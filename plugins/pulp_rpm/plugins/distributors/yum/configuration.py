@@ -9,7 +9,7 @@ from pulp.server.exceptions import MissingResource
 
 from pulp_rpm.common.constants import SCRATCHPAD_DEFAULT_METADATA_CHECKSUM, \
     CONFIG_DEFAULT_CHECKSUM, CONFIG_KEY_CHECKSUM_TYPE, REPO_AUTH_CONFIG_FILE, \
-    PUBLISH_HTTP_KEYWORD, PUBLISH_HTTPS_KEYWORD, RELATIVE_URL_KEYWORD
+    PUBLISH_HTTP_KEYWORD, PUBLISH_HTTPS_KEYWORD, RELATIVE_URL_KEYWORD, LINK_TYPES
 from pulp_rpm.common.ids import TYPE_ID_DISTRIBUTOR_YUM
 from pulp.repoauth import protected_repo_utils, repo_cert_utils
 from pulp_rpm.yum_plugin import util
@@ -21,7 +21,7 @@ REQUIRED_CONFIG_KEYS = ('relative_url', 'http', 'https')
 
 OPTIONAL_CONFIG_KEYS = ('gpgkey', 'auth_ca', 'auth_cert', 'https_ca', 'checksum_type',
                         'http_publish_dir', 'https_publish_dir', 'protected',
-                        'skip', 'skip_pkg_tags', 'generate_sqlite')
+                        'skip', 'skip_pkg_tags', 'generate_sqlite', 'link_type')
 
 ROOT_PUBLISH_DIR = '/var/lib/pulp/published/yum'
 MASTER_PUBLISH_DIR = os.path.join(ROOT_PUBLISH_DIR, 'master')
@@ -107,6 +107,7 @@ def validate_config(repo, config, config_conduit):
         'https_ca': partial(_validate_certificate, 'https_ca'),
         'http_publish_dir': _validate_http_publish_dir,
         'https_publish_dir': _validate_https_publish_dir,
+        'link_type': _validate_link_type,
         'protected': _validate_protected,
         'skip': _validate_skip,
         'skip_pkg_tags': _validate_skip_pkg_tags,
@@ -423,6 +424,14 @@ def _validate_https_publish_dir(https_publish_dir, error_messages):
     _validate_usable_directory('https_publish_dir', https_publish_dir, error_messages)
 
 
+def _validate_link_type(link_type, error_messages):
+    if link_type is None or link_type in LINK_TYPES:
+        return
+
+    msg = _('Configuration value for [link_type] must be one of %(t)s, but is: %(l)s')
+    error_messages.append(msg % {'t': ', '.join(LINK_TYPES), 'l': str(link_type)})
+
+
 def _validate_protected(protected, error_messages):
     _validate_boolean('protected', protected, error_messages, False)
 
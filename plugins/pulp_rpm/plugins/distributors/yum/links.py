@@ -0,0 +1,255 @@
+import errno
+import fcntl
+import os
+import shutil
+import stat
+from gettext import gettext as _
+
+from pulp_rpm.common import constants
+from pulp_rpm.yum_plugin import util
+
+
+_LOG = util.getLogger(__name__)
+
+# number of links collected before they are written to disk
+DEFAULT_BATCH_SIZE = 1000
+
+# ioctl request number to clone a file's extents, from linux/fs.h
+FICLONE = 0x40049409
+
+# errors that mean a hard link or reflink can't be made between the two paths
+_UNSUPPORTED_LINK_ERRORS = (errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.EINVAL,
+                            errno.ENOTTY, errno.EMLINK)
+
+
+class LinkBatch(object):
+    """
+    Collects the links to be created in a publish tree and creates them in batches.
+
+    Each parent directory is checked and created once, rather than once per link. A path that
+    already holds the requested link, such as one copied from the previous publish, is left
+    untouched; a path holding a different file or link is replaced.
+
+    Hard links and reflinks fall back to symlinks when the content storage and the publish tree
+    can't share data, for example when they are on different filesystems.
+    """
+
+    def __init__(self, link_type=constants.LINK_TYPE_SYMLINK, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param link_type:   one of constants.LINK_TYPES
+        :type  link_type:   str
+        :param batch_size:  number of links to collect before writing them to disk
+        :type  batch_size:  int
+        """
+        self.link_type = link_type
+        self.batch_size = batch_size
+        self._links = []
+        self._known_dirs = set()
+
+    def add(self, source_path, link_path):
+        """
+        Queue a link to be created. The link is created no later than the next call to flush().
+
+        :param source_path: path to the file the link should point to
+        :type  source_path: str
+        :param link_path:   path at which the link should be created
+        :type  link_path:   str
+        """
+        self._links.append((source_path, link_path.rstrip('/')))
+        if len(self._links) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Create all queued links.
+        """
+        # sorting by link path groups links in the same directory together
+        links = sorted(self._links, key=lambda link: link[1])
+        self._links = []
+        for source_path, link_path in links:
+            self.ensure_dir(os.path.dirname(link_path))
+            self._link(source_path, link_path)
+
+    def ensure_dir(self, path):
+        """
+        Create the directory if it does not already exist.
+
+        :param path: path to the directory
+        :type  path: str
+        """
+        if path in self._known_dirs:
+            return
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._known_dirs.add(path)
+
+    def _link(self, source_path, link_path):
+        """
+        Create a single link, replacing anything else found at link_path.
+
+        :param source_path: path to the file the link should point to
+        :type  source_path: str
+        :param link_path:   path at which the link should be created
+        :type  link_path:   str
+        """
+        try:
+            link_stat = os.lstat(link_path)
+        except OSError, e:
+            if e.errno != errno.ENOENT:
+                raise
+        else:
+            if self._is_current(source_path, link_path, link_stat):
+                return
+            if stat.S_ISDIR(link_stat.st_mode):
+                raise OSError(errno.EEXIST, _('A directory exists at the link path'), link_path)
+            os.unlink(link_path)
+
+        if self.link_type == constants.LINK_TYPE_SYMLINK:
+            os.symlink(source_path, link_path)
+            return
+
+        try:
+            if self.link_type == constants.LINK_TYPE_HARDLINK:
+                os.link(source_path, link_path)
+            else:
+                reflink(source_path, link_path)
+        except (IOError, OSError), e:
+            if e.errno not in _UNSUPPORTED_LINK_ERRORS:
+                raise
+            msg = _('Unable to create a %(t)s from [%(s)s]; using symlinks instead: %(e)s')
+            _LOG.warning(msg % {'t': self.link_type, 's': source_path, 'e': e})
+            self.link_type = constants.LINK_TYPE_SYMLINK
+            os.symlink(source_path, link_path)
+
+    @staticmethod
+    def _is_current(source_path, link_path, link_stat):
+        """
+        Determine whether the file at link_path already provides the content at source_path.
+
+        :param source_path: path to the file the link should point to
+        :type  source_path: str
+        :param link_path:   path at which the link should be created
+        :type  link_path:   str
+        :param link_stat:   result of os.lstat() on link_path
+        :type  link_stat:   posix.stat_result
+
+        :return:    True if the link does not need to be created again
+        :rtype:     bool
+        """
+        if stat.S_ISLNK(link_stat.st_mode):
+            return os.readlink(link_path) == source_path
+        if not stat.S_ISREG(link_stat.st_mode):
+            return False
+
+        source_stat = os.stat(source_path)
+        if (source_stat.st_dev, source_stat.st_ino) == (link_stat.st_dev, link_stat.st_ino):
+            # a hard link to the source
+            return True
+        # a reflink is a separate inode, so it is identified by its size and the mtime copied
+        # from the source when it was created
+        return (source_stat.st_size, source_stat.st_mtime) == \
+            (link_stat.st_size, link_stat.st_mtime)
+
+
+def reflink(source_path, link_path):
+    """
+    Create a copy of source_path at link_path that shares its data on disk. This is only
+    supported by some filesystems, such as btrfs and xfs.
+
+    :param source_path: path to the file to be cloned
+    :type  source_path: str
+    :param link_path:   path at which the clone should be created
+    :type  link_path:   str
+
+    :raise IOError: if the filesystem does not support cloning between the two paths
+    """
+    with open(source_path, 'rb') as source_file:
+        try:
+            with open(link_path, 'wb') as link_file:
+                fcntl.ioctl(link_file.fileno(), FICLONE, source_file.fileno())
+        except (IOError, OSError):
+            if os.path.exists(link_path):
+                os.unlink(link_path)
+            raise
+    source_stat = os.stat(source_path)
+    os.utime(link_path, (source_stat.st_atime, source_stat.st_mtime))
+
+
+def copy_tree(source_dir, target_dir):
+    """
+    Copy a published repository without copying the content it links to.
+
+    Symlinks are recreated. Regular files that share their data with another path, such as
+    packages hard linked from content storage, are hard linked; all other regular files are
+    reflinked where the filesystem supports it. Neither lets a later write to the copy modify the
+    previous publish: files written by a publish are only ever replaced, never rewritten in place,
+    and a reflink is copy-on-write. Files that can't be linked are copied.
+
+    :param source_dir: root directory of the published repository
+    :type  source_dir: str
+    :param target_dir: directory to copy the repository to
+    :type  target_dir: str
+    """
+    for dir_path, dir_names, file_names in os.walk(source_dir):
+        target_path = os.path.normpath(
+            os.path.join(target_dir, os.path.relpath(dir_path, source_dir)))
+        if not os.path.isdir(target_path):
+            os.makedirs(target_path)
+
+        # os.walk lists symlinks to directories as directories, but doesn't follow them
+        for name in dir_names + file_names:
+            source_path = os.path.join(dir_path, name)
+            link_path = os.path.join(target_path, name)
+            source_stat = os.lstat(source_path)
+            if stat.S_ISLNK(source_stat.st_mode):
+                os.symlink(os.readlink(source_path), link_path)
+            elif stat.S_ISREG(source_stat.st_mode):
+                try:
+                    if source_stat.st_nlink > 1:
+                        os.link(source_path, link_path)
+                    else:
+                        reflink(source_path, link_path)
+                except (IOError, OSError), e:
+                    if e.errno not in _UNSUPPORTED_LINK_ERRORS:
+                        raise
+                    shutil.copy2(source_path, link_path)
+
+
+def realize_tree(source_dir, target_dir):
+    """
+    Build a tree of real files from a published tree of symlinks, without copying file data
+    where the filesystem allows it.
+
+    Symlinks to files are replaced by hard links to the files they point to, and regular files
+    are hard linked. Files that can't be hard linked, for example because they are on another
+    filesystem, are copied. Symlinks to directories are recreated.
+
+    The realized tree shares its files with content storage, so it must only be read.
+
+    :param source_dir: root directory of the published tree
+    :type  source_dir: str
+    :param target_dir: directory to build the tree of real files in
+    :type  target_dir: str
+    """
+    for dir_path, dir_names, file_names in os.walk(source_dir):
+        target_path = os.path.normpath(
+            os.path.join(target_dir, os.path.relpath(dir_path, source_dir)))
+        if not os.path.isdir(target_path):
+            os.makedirs(target_path)
+
+        for name in dir_names + file_names:
+            source_path = os.path.join(dir_path, name)
+            link_path = os.path.join(target_path, name)
+            if os.path.isdir(source_path):
+                # os.walk lists symlinks to directories as directories, but doesn't follow them
+                if os.path.islink(source_path):
+                    os.symlink(os.readlink(source_path), link_path)
+                continue
+
+            real_path = os.path.realpath(source_path)
+            try:
+                os.link(real_path, link_path)
+            except OSError, e:
+                if e.errno not in _UNSUPPORTED_LINK_ERRORS:
+                    raise
+                shutil.copy2(real_path, link_path)
@@ -39,7 +39,7 @@ class FilelistsXMLFileContext(FastForwardXmlFileContext):
         :param unit: unit whose metadata is to be written
         :type  unit: pulp_rpm.plugins.db.models.RpmBase
         """
-        metadata = unit.repodata['filelists']
+        metadata = unit.get_repodata('filelists')
         if isinstance(metadata, unicode):
             metadata = metadata.encode('utf-8')
         self.metadata_file_handle.write(metadata)
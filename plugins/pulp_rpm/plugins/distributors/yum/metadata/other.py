@@ -39,7 +39,7 @@ class OtherXMLFileContext(FastForwardXmlFileContext):
         :param unit: unit whose metadata is to be written
         :type  unit: pulp_rpm.plugins.db.models.RpmBase
         """
-        metadata = unit.repodata['other']
+        metadata = unit.get_repodata('other')
         if isinstance(metadata, unicode):
             metadata = metadata.encode('utf-8')
         self.metadata_file_handle.write(metadata)
@@ -0,0 +1,173 @@
+import gzip
+import os
+from gettext import gettext as _
+
+from pulp_rpm.common import file_utils
+from pulp_rpm.plugins.distributors.yum.metadata.metadata import REPO_DATA_DIR_NAME
+from pulp_rpm.yum_plugin import util
+
+
+_LOG = util.getLogger(__name__)
+
+PACKAGE_INDEX_FILE_NAME = '.package_index.json.gz'
+
+
+class PackageMetadataIndex(object):
+    """
+    Sidecar index of the per-package metadata written to primary.xml.gz, filelists.xml.gz and
+    other.xml.gz.
+
+    For each metadata file, the index records the offset and length of every package's snippet
+    in the uncompressed stream. A later publish can use it to copy the snippets of packages that
+    are still in the repository without regenerating them, dropping the snippets of packages
+    that were removed.
+    """
+
+    def __init__(self, working_dir):
+        """
+        :param working_dir: root directory of the published repository
+        :type  working_dir: str
+        """
+        self.working_dir = working_dir
+        # keys are package ids, values are the published file names
+        self.packages = {}
+        # keys are metadata types, values are the base names of the metadata files
+        self.files = {}
+        # keys are metadata types, values are lists of [package id, offset, length]
+        self.snippets = {}
+        # keys are unit type IDs, values are the IDs of the units besides packages whose files
+        # were published
+        self.units = {}
+
+    @property
+    def index_file_path(self):
+        """
+        :return:    full path to the index file
+        :rtype:     str
+        """
+        return os.path.join(self.working_dir, PACKAGE_INDEX_FILE_NAME)
+
+    @classmethod
+    def load(cls, working_dir):
+        """
+        Load the index that was written to a previously published repository.
+
+        :param working_dir: root directory of the published repository
+        :type  working_dir: str
+
+        :return:    the loaded index, or None if there is no usable index in the directory
+        :rtype:     PackageMetadataIndex or None
+        """
+        index = cls(working_dir)
+        if not os.path.exists(index.index_file_path):
+            return None
+
+        try:
+            data = file_utils.read_gzipped_json(index.index_file_path)
+        except (IOError, ValueError):
+            _LOG.warning(_('Ignoring unreadable package index [%(p)s]') %
+                         {'p': index.index_file_path})
+            return None
+
+        try:
+            index.packages = data['packages']
+            index.files = data['files']
+            index.snippets = data['snippets']
+            index.units = data['units']
+        except KeyError:
+            _LOG.warning(_('Ignoring incomplete package index [%(p)s]') %
+                         {'p': index.index_file_path})
+            return None
+
+        # the metadata files may have been regenerated by another tool since the index was written
+        for metadata_type in index.files:
+            if not os.path.exists(index.metadata_file_path(metadata_type)):
+                return None
+
+        return index
+
+    def metadata_file_path(self, metadata_type):
+        """
+        :param metadata_type: type of the metadata file, such as "primary"
+        :type  metadata_type: str
+
+        :return:    full path to the metadata file of the given type
+        :rtype:     str
+        """
+        return os.path.join(self.working_dir, REPO_DATA_DIR_NAME, self.files[metadata_type])
+
+    def add_package(self, pkgid, filename):
+        """
+        :param pkgid:       package id, as used by the "pkgid" attribute in the metadata
+        :type  pkgid:       str
+        :param filename:    name of the package file in the published repository
+        :type  filename:    str
+        """
+        self.packages[pkgid] = filename
+
+    def add_snippet(self, metadata_type, pkgid, offset, length):
+        """
+        :param metadata_type:   type of the metadata file, such as "primary"
+        :type  metadata_type:   str
+        :param pkgid:           package id of the package the snippet describes
+        :type  pkgid:           str
+        :param offset:          offset of the snippet in the uncompressed metadata file
+        :type  offset:          int
+        :param length:          length of the snippet in bytes
+        :type  length:          int
+        """
+        self.snippets.setdefault(metadata_type, []).append([pkgid, offset, length])
+
+    def set_metadata_file(self, metadata_type, metadata_file_path):
+        """
+        :param metadata_type:       type of the metadata file, such as "primary"
+        :type  metadata_type:       str
+        :param metadata_file_path:  path to the finalized metadata file
+        :type  metadata_file_path:  str
+        """
+        self.files[metadata_type] = os.path.basename(metadata_file_path)
+
+    def set_units(self, type_id, unit_ids):
+        """
+        :param type_id:     type of the units
+        :type  type_id:     str
+        :param unit_ids:    IDs of the units of the type whose files were published
+        :type  unit_ids:    iterable
+        """
+        self.units[type_id] = sorted(unit_ids)
+
+    def read_snippets(self, metadata_type, pkgids, metadata_file_path=None):
+        """
+        Read the snippets of the given packages from the metadata file, in a single sequential
+        pass over the file.
+
+        :param metadata_type:       type of the metadata file, such as "primary"
+        :type  metadata_type:       str
+        :param pkgids:              ids of the packages whose snippets should be read
+        :type  pkgids:              set
+        :param metadata_file_path:  path to the metadata file, if it has been moved since the
+                                    index was loaded
+        :type  metadata_file_path:  str
+
+        :return:    generator of (package id, snippet) tuples
+        :rtype:     generator
+        """
+        metadata_file_path = metadata_file_path or self.metadata_file_path(metadata_type)
+        entries = sorted((entry for entry in self.snippets.get(metadata_type, [])
+                          if entry[0] in pkgids), key=lambda entry: entry[1])
+
+        metadata_file = gzip.open(metadata_file_path)
+        try:
+            for pkgid, offset, length in entries:
+                metadata_file.seek(offset)
+                yield pkgid, metadata_file.read(length)
+        finally:
+            metadata_file.close()
+
+    def write(self):
+        """
+        Write the index to the root of the published repository.
+        """
+        data = {'packages': self.packages, 'files': self.files, 'snippets': self.snippets,
+                'units': self.units}
+        file_utils.write_gzipped_json(self.index_file_path, data)
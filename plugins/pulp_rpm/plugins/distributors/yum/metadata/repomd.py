@@ -1,3 +1,4 @@
+import bz2
 import gzip
 import os
 import time
@@ -15,6 +16,9 @@ _LOG = util.getLogger(__name__)
 REPO_XML_NAME_SPACE = 'http://linux.duke.edu/metadata/repo'
 RPM_XML_NAME_SPACE = 'http://linux.duke.edu/metadata/rpm'
 
+# size of the chunks read from metadata files while they are checksummed
+READ_CHUNK_SIZE = 1024 * 1024
+
 
 class RepomdXMLFileContext(MetadataFileContext):
     def __init__(self, working_dir, checksum_type=CONFIG_DEFAULT_CHECKSUM):
@@ -59,7 +63,23 @@ class RepomdXMLFileContext(MetadataFileContext):
 
         self._write_root_tag_close = _write_root_tag_close_closure
 
-    def add_metadata_file_metadata(self, data_type, file_path, precalculated_checksum=None):
+    def _checksum_and_size(self, file_handle):
+        """
+        :param file_handle: open file to read to its end
+        :type  file_handle: file
+
+        :return:    checksum and size of the file's contents, which are read in chunks
+        :rtype:     tuple
+        """
+        checksum = self.checksum_constructor()
+        size = 0
+        for chunk in iter(lambda: file_handle.read(READ_CHUNK_SIZE), ''):
+            checksum.update(chunk)
+            size += len(chunk)
+        return checksum.hexdigest(), size
+
+    def add_metadata_file_metadata(self, data_type, file_path, precalculated_checksum=None,
+                                   database_version=None, open_checksum=None, open_size=None):
 
         file_name = os.path.basename(file_path)
 
@@ -89,12 +109,11 @@ class RepomdXMLFileContext(MetadataFileContext):
         # calculating it again.
         if precalculated_checksum is None:
             with open(file_path, 'rb') as file_handle:
-                content = file_handle.read()
-                checksum_element.text = self.checksum_constructor(content).hexdigest()
+                checksum_element.text, _size = self._checksum_and_size(file_handle)
         else:
             checksum_element.text = precalculated_checksum
 
-        if file_path.endswith('.gz'):
+        if file_path.endswith('.gz') or file_path.endswith('.bz2'):
 
             open_size_element = ElementTree.SubElement(data_element, 'open-size')
 
@@ -102,22 +121,25 @@ class RepomdXMLFileContext(MetadataFileContext):
             open_checksum_element = ElementTree.SubElement(data_element, 'open-checksum',
                                                            open_checksum_attributes)
 
-            try:
-                file_handle = gzip.open(file_path, 'r')
-
-            except:
-                # cannot have an else clause to the try without an except clause
-                raise
-
-            else:
+            # the writer of a compressed file may have taken the checksum and size of its
+            # contents already
+            if open_checksum is None or open_size is None:
+                if file_path.endswith('.gz'):
+                    file_handle = gzip.open(file_path, 'r')
+                else:
+                    file_handle = bz2.BZ2File(file_path, 'r')
                 try:
-                    content = file_handle.read()
-                    open_size_element.text = str(len(content))
-                    open_checksum_element.text = self.checksum_constructor(content).hexdigest()
-
+                    open_checksum, open_size = self._checksum_and_size(file_handle)
                 finally:
                     file_handle.close()
 
+            open_size_element.text = str(open_size)
+            open_checksum_element.text = open_checksum
+
+        if database_version is not None:
+            database_version_element = ElementTree.SubElement(data_element, 'database_version')
+            database_version_element.text = str(database_version)
+
         # Write the metadata out as a utf-8 string
 
         data_element_string = ElementTree.tostring(data_element, 'utf-8')
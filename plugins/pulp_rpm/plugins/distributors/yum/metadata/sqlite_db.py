@@ -0,0 +1,539 @@
+import bz2
+import glob
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+from xml.etree import cElementTree
+
+from pulp_rpm.plugins.distributors.yum.metadata.metadata import REPO_DATA_DIR_NAME
+from pulp_rpm.plugins.distributors.yum.metadata.primary import COMMON_NAMESPACE, RPM_NAMESPACE
+from pulp_rpm.yum_plugin import util
+
+
+_LOG = util.getLogger(__name__)
+
+# version of the database schema, as understood by yum and dnf
+DATABASE_VERSION = 10
+
+SQLITE_FILE_NAME = '%s.sqlite'
+
+COMPRESSED_SUFFIX = '.bz2'
+
+# number of packages whose rows are collected before they are inserted
+DEFAULT_BATCH_SIZE = 500
+
+# size of the chunks read from a database while it is compressed
+COMPRESSION_CHUNK_SIZE = 1024 * 1024
+
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+
+# package snippets are stored without namespace declarations
+SNIPPET_XML = '<metadata xmlns="%(common)s" xmlns:rpm="%(rpm)s">%%s</metadata>' % \
+    {'common': COMMON_NAMESPACE, 'rpm': RPM_NAMESPACE}
+
+DEPENDENCY_TYPES = ('provides', 'requires', 'conflicts', 'obsoletes', 'suggests', 'enhances',
+                    'recommends', 'supplements')
+
+FILE_TYPES = {'file': 'f', 'dir': 'd', 'ghost': 'g'}
+
+PRIMARY_TABLES = [
+    'CREATE TABLE db_info (dbversion INTEGER, checksum TEXT)',
+    'CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, pkgId TEXT, name TEXT, arch TEXT, '
+    'version TEXT, epoch TEXT, release TEXT, summary TEXT, description TEXT, url TEXT, '
+    'time_file INTEGER, time_build INTEGER, rpm_license TEXT, rpm_vendor TEXT, rpm_group TEXT, '
+    'rpm_buildhost TEXT, rpm_sourcerpm TEXT, rpm_header_start INTEGER, rpm_header_end INTEGER, '
+    'rpm_packager TEXT, size_package INTEGER, size_installed INTEGER, size_archive INTEGER, '
+    'location_href TEXT, location_base TEXT, checksum_type TEXT)',
+    'CREATE TABLE files (name TEXT, type TEXT, pkgKey INTEGER)',
+    'CREATE TABLE requires (name TEXT, flags TEXT, epoch TEXT, version TEXT, release TEXT, '
+    'pkgKey INTEGER, pre BOOLEAN DEFAULT FALSE)',
+] + ['CREATE TABLE %s (name TEXT, flags TEXT, epoch TEXT, version TEXT, release TEXT, '
+     'pkgKey INTEGER)' % dependency_type
+     for dependency_type in DEPENDENCY_TYPES if dependency_type != 'requires']
+
+PRIMARY_INDEXES = [
+    'CREATE INDEX packagename ON packages (name)',
+    'CREATE INDEX packageId ON packages (pkgId)',
+    'CREATE INDEX filenames ON files (name)',
+    'CREATE INDEX pkgfiles ON files (pkgKey)',
+    'CREATE INDEX requiresname ON requires (name)',
+    'CREATE INDEX providesname ON provides (name)',
+] + ['CREATE INDEX pkg%(t)s ON %(t)s (pkgKey)' % {'t': dependency_type}
+     for dependency_type in DEPENDENCY_TYPES] + [
+    'CREATE TRIGGER removals AFTER DELETE ON packages BEGIN '
+    'DELETE FROM files WHERE pkgKey = old.pkgKey; ' +
+    ' '.join('DELETE FROM %s WHERE pkgKey = old.pkgKey;' % dependency_type
+             for dependency_type in DEPENDENCY_TYPES) +
+    ' END',
+]
+
+FILELISTS_TABLES = [
+    'CREATE TABLE db_info (dbversion INTEGER, checksum TEXT)',
+    'CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, pkgId TEXT)',
+    'CREATE TABLE filelist (pkgKey INTEGER, dirname TEXT, filenames TEXT, filetypes TEXT)',
+]
+
+FILELISTS_INDEXES = [
+    'CREATE INDEX keyfile ON filelist (pkgKey)',
+    'CREATE INDEX pkgId ON packages (pkgId)',
+    'CREATE INDEX dirnames ON filelist (dirname)',
+    'CREATE TRIGGER remove_filelist AFTER DELETE ON packages BEGIN '
+    'DELETE FROM filelist WHERE pkgKey = old.pkgKey; END',
+]
+
+OTHER_TABLES = [
+    'CREATE TABLE db_info (dbversion INTEGER, checksum TEXT)',
+    'CREATE TABLE packages (pkgKey INTEGER PRIMARY KEY, pkgId TEXT)',
+    'CREATE TABLE changelog (pkgKey INTEGER, author TEXT, date INTEGER, changelog TEXT)',
+]
+
+OTHER_INDEXES = [
+    'CREATE INDEX keychange ON changelog (pkgKey)',
+    'CREATE INDEX pkgId ON packages (pkgId)',
+    'CREATE TRIGGER remove_changelogs AFTER DELETE ON packages BEGIN '
+    'DELETE FROM changelog WHERE pkgKey = old.pkgKey; END',
+]
+
+
+def _local_name(tag):
+    """
+    :param tag: tag of an element, which may include a namespace
+    :type  tag: str
+
+    :return:    the tag without its namespace
+    :rtype:     str
+    """
+    return tag.rsplit('}', 1)[-1]
+
+
+def _children(element):
+    """
+    :param element: element whose children should be returned
+    :type  element: xml.etree.ElementTree.Element
+
+    :return:    dictionary of each child's tag, without its namespace, to the first child with
+                that tag
+    :rtype:     dict
+    """
+    children = {}
+    for child in element:
+        children.setdefault(_local_name(child.tag), child)
+    return children
+
+
+def _int(value):
+    """
+    :param value: text of an integer attribute, which may be missing
+    :type  value: str or None
+
+    :return:    the integer value, or None
+    :rtype:     int or None
+    """
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+class _Database(object):
+    """
+    A single sqlite database whose rows are inserted in batches.
+    """
+
+    def __init__(self, path, tables, indexes):
+        """
+        :param path:    path to the database file
+        :type  path:    str
+        :param tables:  statements that create the database's tables
+        :type  tables:  list of str
+        :param indexes: statements that create the database's indexes and triggers, which are
+                        run once all rows have been inserted
+        :type  indexes: list of str
+        """
+        self.path = path
+        self.indexes = indexes
+        self.next_pkg_key = 1
+        # keys are insert statements, values are lists of rows waiting to be inserted
+        self.rows = {}
+
+        if os.path.exists(path):
+            os.remove(path)
+        self.connection = sqlite3.connect(path)
+        # the database is rebuilt from scratch if the publish fails, so it doesn't need to be
+        # recoverable
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        for statement in tables:
+            self.connection.execute(statement)
+
+    def add_package(self):
+        """
+        :return:    key of a new package in this database
+        :rtype:     int
+        """
+        pkg_key = self.next_pkg_key
+        self.next_pkg_key += 1
+        return pkg_key
+
+    def add_row(self, statement, row):
+        """
+        :param statement:   insert statement for the row
+        :type  statement:   str
+        :param row:         values to insert
+        :type  row:         tuple
+        """
+        self.rows.setdefault(statement, []).append(row)
+
+    def flush(self):
+        """
+        Insert all waiting rows.
+        """
+        for statement, rows in self.rows.iteritems():
+            self.connection.executemany(statement, rows)
+        self.rows = {}
+
+    def close(self, checksum):
+        """
+        Insert all waiting rows, create the indexes and close the database.
+
+        :param checksum:    checksum of the XML file the database was generated from
+        :type  checksum:    str
+        """
+        self.flush()
+        for statement in self.indexes:
+            self.connection.execute(statement)
+        self.connection.execute('INSERT INTO db_info (dbversion, checksum) VALUES (?, ?)',
+                                (DATABASE_VERSION, checksum))
+        self.connection.commit()
+        self.connection.close()
+
+
+def _file_checksum(path, checksum_type):
+    """
+    :param path:            path to the file
+    :type  path:            str
+    :param checksum_type:   name of the hashlib algorithm
+    :type  checksum_type:   str
+
+    :return:    hex digest of the file, read in chunks
+    :rtype:     str
+    """
+    checksum = getattr(hashlib, checksum_type)()
+    with open(path, 'rb') as checksum_file:
+        for chunk in iter(lambda: checksum_file.read(COMPRESSION_CHUNK_SIZE), ''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def _compress(path, checksum_type, results, errors):
+    """
+    Compress a file with bzip2 and remove the uncompressed file. The checksum and size of the
+    uncompressed file are taken while it is read. If a checksum type is given, the compressed
+    file is named after its checksum like the XML metadata files, as "<checksum>-<name>.bz2".
+
+    :param path:            path to the file to compress
+    :type  path:            str
+    :param checksum_type:   name of the hashlib algorithm, or None
+    :type  checksum_type:   str or None
+    :param results:         dictionary to which the path to the uncompressed file is added as a
+                            key, with a dictionary of the "path", "checksum", "open_checksum" and
+                            "open_size" of the compressed file as its value
+    :type  results:         dict
+    :param errors:          list to which any exception raised is appended
+    :type  errors:          list
+    """
+    try:
+        open_checksum = getattr(hashlib, checksum_type)() if checksum_type else None
+        open_size = 0
+        compressed_path = path + COMPRESSED_SUFFIX
+        source_file = open(path, 'rb')
+        try:
+            compressed_file = bz2.BZ2File(compressed_path, 'wb')
+            try:
+                for chunk in iter(lambda: source_file.read(COMPRESSION_CHUNK_SIZE), ''):
+                    compressed_file.write(chunk)
+                    open_size += len(chunk)
+                    if open_checksum:
+                        open_checksum.update(chunk)
+            finally:
+                compressed_file.close()
+        finally:
+            source_file.close()
+        os.remove(path)
+
+        result = {'path': compressed_path, 'checksum': None, 'open_checksum': None,
+                  'open_size': open_size}
+        if checksum_type:
+            result['checksum'] = _file_checksum(compressed_path, checksum_type)
+            result['open_checksum'] = open_checksum.hexdigest()
+            result['path'] = os.path.join(
+                os.path.dirname(compressed_path),
+                '%s-%s' % (result['checksum'], os.path.basename(compressed_path)))
+            os.rename(compressed_path, result['path'])
+        results[path] = result
+    except Exception, e:
+        errors.append(e)
+
+
+class SqliteRepodataWriter(object):
+    """
+    Generates the primary_db, filelists_db and other_db sqlite databases from the same package
+    metadata that is written to primary.xml.gz, filelists.xml.gz and other.xml.gz.
+
+    Package metadata can be added as each package is published, or afterwards from the finished
+    XML files.
+    """
+
+    def __init__(self, working_dir, checksum_type=None, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param working_dir:     root directory of the repository being published
+        :type  working_dir:     str
+        :param checksum_type:   checksum type used for the repodata, and to name the compressed
+                                databases; if None, the databases are not named after their
+                                checksums
+        :type  checksum_type:   str or None
+        :param batch_size:      number of packages whose rows are collected before they are
+                                inserted
+        :type  batch_size:      int
+        """
+        self.working_dir = working_dir
+        self.checksum_type = checksum_type
+        self.batch_size = batch_size
+        self.databases = {}
+        self.pending_packages = 0
+
+    def database_path(self, metadata_type):
+        """
+        :param metadata_type: type of the metadata, such as "primary"
+        :type  metadata_type: str
+
+        :return:    path to the uncompressed database for the metadata type
+        :rtype:     str
+        """
+        return os.path.join(self.working_dir, REPO_DATA_DIR_NAME,
+                            SQLITE_FILE_NAME % metadata_type)
+
+    def initialize(self):
+        """
+        Remove the databases of a previous publish and create the empty databases.
+        """
+        for metadata_type in ('primary', 'filelists', 'other'):
+            file_name = SQLITE_FILE_NAME % metadata_type + COMPRESSED_SUFFIX
+            pattern = os.path.join(self.working_dir, REPO_DATA_DIR_NAME, '*' + file_name)
+            for path in glob.glob(pattern):
+                os.remove(path)
+
+        for metadata_type, tables, indexes in (('primary', PRIMARY_TABLES, PRIMARY_INDEXES),
+                                               ('filelists', FILELISTS_TABLES, FILELISTS_INDEXES),
+                                               ('other', OTHER_TABLES, OTHER_INDEXES)):
+            self.databases[metadata_type] = _Database(self.database_path(metadata_type), tables,
+                                                      indexes)
+
+    def add_package_metadata(self, metadata_type, metadata):
+        """
+        Add a package's XML snippet, as stored in a unit's repodata, to the database.
+
+        :param metadata_type:   type of the metadata, such as "primary"
+        :type  metadata_type:   str
+        :param metadata:        XML snippet describing a single package
+        :type  metadata:        str or unicode
+        """
+        if isinstance(metadata, unicode):
+            metadata = metadata.encode('utf-8')
+        root = cElementTree.fromstring(SNIPPET_XML % metadata)
+        for element in root:
+            self._add_package_element(metadata_type, element)
+
+    def add_metadata_file(self, metadata_type, metadata_file_path):
+        """
+        Add every package in a finished XML metadata file to the database.
+
+        :param metadata_type:       type of the metadata, such as "primary"
+        :type  metadata_type:       str
+        :param metadata_file_path:  path to the gzipped XML file
+        :type  metadata_file_path:  str
+        """
+        metadata_file = gzip.open(metadata_file_path)
+        try:
+            root = None
+            for event, element in cElementTree.iterparse(metadata_file, ('start', 'end')):
+                if root is None:
+                    root = element
+                elif event == 'end' and _local_name(element.tag) == 'package':
+                    self._add_package_element(metadata_type, element)
+                    # package elements are only needed once, so free their memory
+                    root.clear()
+        finally:
+            metadata_file.close()
+
+    def _add_package_element(self, metadata_type, element):
+        """
+        :param metadata_type:   type of the metadata, such as "primary"
+        :type  metadata_type:   str
+        :param element:         package element
+        :type  element:         xml.etree.ElementTree.Element
+        """
+        database = self.databases[metadata_type]
+        pkg_key = database.add_package()
+        if metadata_type == 'primary':
+            self._add_primary_rows(database, pkg_key, element)
+        else:
+            database.add_row('INSERT INTO packages (pkgKey, pkgId) VALUES (?, ?)',
+                             (pkg_key, element.get('pkgid')))
+            if metadata_type == 'filelists':
+                self._add_filelists_rows(database, pkg_key, element)
+            else:
+                self._add_other_rows(database, pkg_key, element)
+
+        # each package is added to all three databases, so count the packages in one of them
+        if metadata_type == 'primary':
+            self.pending_packages += 1
+            if self.pending_packages >= self.batch_size:
+                self.flush()
+
+    @staticmethod
+    def _add_primary_rows(database, pkg_key, element):
+        """
+        :param database:    the primary database
+        :type  database:    _Database
+        :param pkg_key:     key of the package in the database
+        :type  pkg_key:     int
+        :param element:     package element from primary.xml
+        :type  element:     xml.etree.ElementTree.Element
+        """
+        children = _children(element)
+        empty = cElementTree.Element('empty')
+
+        def text(name, parent=children):
+            child = parent.get(name)
+            return child.text if child is not None else None
+
+        version = children.get('version', empty)
+        time = children.get('time', empty)
+        size = children.get('size', empty)
+        location = children.get('location', empty)
+        checksum = children.get('checksum', empty)
+        format_element = children.get('format', empty)
+        format_children = _children(format_element)
+        header_range = format_children.get('header-range', empty)
+
+        database.add_row(
+            'INSERT INTO packages VALUES '
+            '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (pkg_key, checksum.text, text('name'), text('arch'), version.get('ver'),
+             version.get('epoch'), version.get('rel'), text('summary'), text('description'),
+             text('url'), _int(time.get('file')), _int(time.get('build')),
+             text('license', format_children), text('vendor', format_children),
+             text('group', format_children), text('buildhost', format_children),
+             text('sourcerpm', format_children), _int(header_range.get('start')),
+             _int(header_range.get('end')), text('packager'), _int(size.get('package')),
+             _int(size.get('installed')), _int(size.get('archive')), location.get('href'),
+             location.get('{%s}base' % XML_NAMESPACE), checksum.get('type')))
+
+        for child in format_element:
+            name = _local_name(child.tag)
+            if name == 'file':
+                database.add_row('INSERT INTO files (name, type, pkgKey) VALUES (?, ?, ?)',
+                                 (child.text, child.get('type', 'file'), pkg_key))
+            elif name == 'requires':
+                for entry in child:
+                    database.add_row(
+                        'INSERT INTO requires (name, flags, epoch, version, release, pkgKey, pre) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (entry.get('name'), entry.get('flags'), entry.get('epoch'),
+                         entry.get('ver'), entry.get('rel'), pkg_key,
+                         entry.get('pre') in ('1', 'true', 'TRUE')))
+            elif name in DEPENDENCY_TYPES:
+                for entry in child:
+                    database.add_row(
+                        'INSERT INTO %s (name, flags, epoch, version, release, pkgKey) '
+                        'VALUES (?, ?, ?, ?, ?, ?)' % name,
+                        (entry.get('name'), entry.get('flags'), entry.get('epoch'),
+                         entry.get('ver'), entry.get('rel'), pkg_key))
+
+    @staticmethod
+    def _add_filelists_rows(database, pkg_key, element):
+        """
+        :param database:    the filelists database
+        :type  database:    _Database
+        :param pkg_key:     key of the package in the database
+        :type  pkg_key:     int
+        :param element:     package element from filelists.xml
+        :type  element:     xml.etree.ElementTree.Element
+        """
+        # files are stored one row per directory, in the order the directories are first seen
+        directories = []
+        files_by_directory = {}
+        for child in element:
+            if _local_name(child.tag) != 'file' or not child.text:
+                continue
+            dirname, basename = os.path.split(child.text)
+            if dirname not in files_by_directory:
+                directories.append(dirname)
+                files_by_directory[dirname] = ([], [])
+            names, types = files_by_directory[dirname]
+            names.append(basename)
+            types.append(FILE_TYPES.get(child.get('type', 'file'), 'f'))
+
+        for dirname in directories:
+            names, types = files_by_directory[dirname]
+            database.add_row(
+                'INSERT INTO filelist (pkgKey, dirname, filenames, filetypes) VALUES (?, ?, ?, ?)',
+                (pkg_key, dirname, '/'.join(names), ''.join(types)))
+
+    @staticmethod
+    def _add_other_rows(database, pkg_key, element):
+        """
+        :param database:    the other database
+        :type  database:    _Database
+        :param pkg_key:     key of the package in the database
+        :type  pkg_key:     int
+        :param element:     package element from other.xml
+        :type  element:     xml.etree.ElementTree.Element
+        """
+        for child in element:
+            if _local_name(child.tag) != 'changelog':
+                continue
+            database.add_row(
+                'INSERT INTO changelog (pkgKey, author, date, changelog) VALUES (?, ?, ?, ?)',
+                (pkg_key, child.get('author'), _int(child.get('date')), child.text))
+
+    def flush(self):
+        """
+        Insert the rows of all packages added since the last flush.
+        """
+        for database in self.databases.values():
+            database.flush()
+        self.pending_packages = 0
+
+    def finalize(self, checksums):
+        """
+        Close the databases and compress them. The databases are compressed in parallel, since
+        bzip2 releases the GIL while it compresses.
+
+        :param checksums:   dictionary of metadata type to the checksum of the XML file its
+                            database was generated from
+        :type  checksums:   dict
+
+        :return:    dictionary of metadata type to a dictionary of the "path", "checksum",
+                    "open_checksum" and "open_size" of its compressed database
+        :rtype:     dict
+        """
+        for metadata_type, database in self.databases.items():
+            database.close(checksums.get(metadata_type))
+
+        results = {}
+        errors = []
+        threads = [threading.Thread(target=_compress,
+                                    args=(database.path, self.checksum_type, results, errors))
+                   for database in self.databases.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+        return dict((metadata_type, results[database.path])
+                    for metadata_type, database in self.databases.items())
@@ -3,6 +3,7 @@ from xml.etree import ElementTree
 
 from pulp.plugins.util.metadata_writer import XmlFileContext
 
+from pulp_rpm.plugins.db import models
 from pulp_rpm.plugins.distributors.yum.metadata.metadata import REPO_DATA_DIR_NAME
 from pulp_rpm.yum_plugin import util
 
@@ -11,6 +12,10 @@ _logger = util.getLogger(__name__)
 
 UPDATE_INFO_XML_FILE_NAME = 'updateinfo.xml.gz'
 
+# Version of the update elements rendered by render_update_element(). Increase it whenever the
+# rendering changes, so that snippets cached by an earlier version are rendered again.
+UPDATEINFO_XML_VERSION = 1
+
 
 class UpdateinfoXMLFileContext(XmlFileContext):
     def __init__(self, working_dir, checksum_type=None):
@@ -27,101 +32,138 @@ class UpdateinfoXMLFileContext(XmlFileContext):
         :param item: The erratum unit that should be written to updateinfo.xml.
         :type  item: pulp_rpm.plugins.db.models.Errata
         """
-        erratum_unit = item
-        update_attributes = {'status': erratum_unit.status,
-                             'type': erratum_unit.type,
-                             'version': erratum_unit.version,
-                             'from': erratum_unit.errata_from or ''}
-        update_element = ElementTree.Element('update', update_attributes)
+        update_element_string = get_update_element_string(item)
+        self.metadata_file_handle.write(update_element_string + '\n')
 
-        id_element = ElementTree.SubElement(update_element, 'id')
-        id_element.text = erratum_unit.errata_id
 
-        issued_attributes = {'date': erratum_unit.issued}
-        ElementTree.SubElement(update_element, 'issued', issued_attributes)
+def get_update_element_string(erratum_unit):
+    """
+    Get the update element for an erratum, using the snippet cached on the erratum if it was
+    rendered by the current version of render_update_element() since the erratum was last saved.
+    Otherwise the element is rendered and cached.
 
-        reboot_element = ElementTree.SubElement(update_element, 'reboot_suggested')
-        reboot_element.text = str(erratum_unit.reboot_suggested)
+    :param erratum_unit: The erratum unit whose update element should be returned
+    :type  erratum_unit: pulp_rpm.plugins.db.models.Errata
 
-        # these elements are optional
-        for key in ('title', 'release', 'rights', 'solution',
-                    'severity', 'summary', 'pushcount'):
+    :return: The utf-8 encoded update element
+    :rtype:  str
+    """
+    cache = erratum_unit._updateinfo_xml or {}
+    if cache.get('version') == UPDATEINFO_XML_VERSION and cache.get('xml') is not None:
+        return cache['xml'].encode('utf-8')
 
-            value = getattr(erratum_unit, key)
+    update_element_string = render_update_element(erratum_unit)
+    _logger.debug('Rendered updateinfo unit metadata:\n%s', update_element_string)
 
-            if not value:
-                continue
+    if erratum_unit.id is not None:
+        revision = cache.get('revision')
+        # the update only matches if the erratum has not been saved since it was loaded
+        models.Errata.objects(id=erratum_unit.id, _updateinfo_xml__revision=revision).update_one(
+            set___updateinfo_xml={'revision': revision, 'version': UPDATEINFO_XML_VERSION,
+                                  'xml': update_element_string.decode('utf-8')})
 
-            sub_element = ElementTree.SubElement(update_element, key)
-            sub_element.text = unicode(value)
+    return update_element_string
 
-        # these elements must be present even if text is empty
-        for key in ('description',):
 
-            value = getattr(erratum_unit, key)
-            if value is None:
-                value = ''
+def render_update_element(erratum_unit):
+    """
+    Render the update element for an erratum.
 
-            sub_element = ElementTree.SubElement(update_element, key)
-            sub_element.text = unicode(value)
+    :param erratum_unit: The erratum unit whose update element should be rendered
+    :type  erratum_unit: pulp_rpm.plugins.db.models.Errata
 
-        updated = erratum_unit.updated
+    :return: The utf-8 encoded update element
+    :rtype:  str
+    """
+    update_attributes = {'status': erratum_unit.status,
+                         'type': erratum_unit.type,
+                         'version': erratum_unit.version,
+                         'from': erratum_unit.errata_from or ''}
+    update_element = ElementTree.Element('update', update_attributes)
 
-        if updated:
-            updated_attributes = {'date': updated}
-            ElementTree.SubElement(update_element, 'updated', updated_attributes)
+    id_element = ElementTree.SubElement(update_element, 'id')
+    id_element.text = erratum_unit.errata_id
 
-        references_element = ElementTree.SubElement(update_element, 'references')
+    issued_attributes = {'date': erratum_unit.issued}
+    ElementTree.SubElement(update_element, 'issued', issued_attributes)
 
-        for reference in erratum_unit.references:
-            reference_attributes = {'id': reference['id'] or '',
-                                    'title': reference['title'] or '',
-                                    'type': reference['type'],
-                                    'href': reference['href']}
-            ElementTree.SubElement(references_element, 'reference', reference_attributes)
+    reboot_element = ElementTree.SubElement(update_element, 'reboot_suggested')
+    reboot_element.text = str(erratum_unit.reboot_suggested)
 
-        for pkglist in erratum_unit.pkglist:
+    # these elements are optional
+    for key in ('title', 'release', 'rights', 'solution',
+                'severity', 'summary', 'pushcount'):
 
-            pkglist_element = ElementTree.SubElement(update_element, 'pkglist')
+        value = getattr(erratum_unit, key)
 
-            collection_attributes = {}
-            short = pkglist.get('short')
-            if short is not None:
-                collection_attributes['short'] = short
-            collection_element = ElementTree.SubElement(pkglist_element, 'collection',
-                                                        collection_attributes)
+        if not value:
+            continue
 
-            name_element = ElementTree.SubElement(collection_element, 'name')
-            name_element.text = pkglist['name']
+        sub_element = ElementTree.SubElement(update_element, key)
+        sub_element.text = unicode(value)
 
-            for package in pkglist['packages']:
+    # these elements must be present even if text is empty
+    for key in ('description',):
 
-                package_attributes = {'name': package['name'],
-                                      'version': package['version'],
-                                      'release': package['release'],
-                                      'epoch': package['epoch'] or '0',
-                                      'arch': package['arch'],
-                                      'src': package.get('src', '') or ''}
-                package_element = ElementTree.SubElement(collection_element, 'package',
-                                                         package_attributes)
+        value = getattr(erratum_unit, key)
+        if value is None:
+            value = ''
 
-                filename_element = ElementTree.SubElement(package_element, 'filename')
-                filename_element.text = package['filename']
+        sub_element = ElementTree.SubElement(update_element, key)
+        sub_element.text = unicode(value)
 
-                checksum_tuple = package.get('sum', None)
+    updated = erratum_unit.updated
 
-                if checksum_tuple is not None:
-                    checksum_type, checksum_value = checksum_tuple
-                    sum_attributes = {'type': checksum_type}
-                    sum_element = ElementTree.SubElement(package_element, 'sum', sum_attributes)
-                    sum_element.text = checksum_value
+    if updated:
+        updated_attributes = {'date': updated}
+        ElementTree.SubElement(update_element, 'updated', updated_attributes)
 
-                reboot_element = ElementTree.SubElement(package_element, 'reboot_suggested')
-                reboot_element.text = str(package.get('reboot_suggested', False))
+    references_element = ElementTree.SubElement(update_element, 'references')
 
-        # write the top-level XML element out to the file
-        update_element_string = ElementTree.tostring(update_element, 'utf-8')
+    for reference in erratum_unit.references:
+        reference_attributes = {'id': reference['id'] or '',
+                                'title': reference['title'] or '',
+                                'type': reference['type'],
+                                'href': reference['href']}
+        ElementTree.SubElement(references_element, 'reference', reference_attributes)
 
-        _logger.debug('Writing updateinfo unit metadata:\n' + update_element_string)
+    for pkglist in erratum_unit.pkglist:
 
-        self.metadata_file_handle.write(update_element_string + '\n')
+        pkglist_element = ElementTree.SubElement(update_element, 'pkglist')
+
+        collection_attributes = {}
+        short = pkglist.get('short')
+        if short is not None:
+            collection_attributes['short'] = short
+        collection_element = ElementTree.SubElement(pkglist_element, 'collection',
+                                                    collection_attributes)
+
+        name_element = ElementTree.SubElement(collection_element, 'name')
+        name_element.text = pkglist['name']
+
+        for package in pkglist['packages']:
+
+            package_attributes = {'name': package['name'],
+                                  'version': package['version'],
+                                  'release': package['release'],
+                                  'epoch': package['epoch'] or '0',
+                                  'arch': package['arch'],
+                                  'src': package.get('src', '') or ''}
+            package_element = ElementTree.SubElement(collection_element, 'package',
+                                                     package_attributes)
+
+            filename_element = ElementTree.SubElement(package_element, 'filename')
+            filename_element.text = package['filename']
+
+            checksum_tuple = package.get('sum', None)
+
+            if checksum_tuple is not None:
+                checksum_type, checksum_value = checksum_tuple
+                sum_attributes = {'type': checksum_type}
+                sum_element = ElementTree.SubElement(package_element, 'sum', sum_attributes)
+                sum_element.text = checksum_value
+
+            reboot_element = ElementTree.SubElement(package_element, 'reboot_suggested')
+            reboot_element.text = str(package.get('reboot_suggested', False))
+
+    return ElementTree.tostring(update_element, 'utf-8')
@@ -1,37 +1,63 @@
 import copy
 from gettext import gettext as _
 import os
-import subprocess
+import Queue
+import shutil
+import tempfile
+import threading
 
 import mongoengine
 from pulp.common import dateutils
-from pulp.common.compat import json
+from pulp.common.plugins import reporting_constants
 from pulp.plugins.config import PluginCallConfiguration
 from pulp.plugins.conduits.repo_publish import RepoPublishConduit
 from pulp.plugins.util import misc as plugin_misc
 from pulp.plugins.util import publish_step as platform_steps
+from pulp.server.controllers import repository as repo_controller
 from pulp.server.db import model
-from pulp.server.exceptions import InvalidValue, PulpCodedException
+from pulp.server.exceptions import InvalidValue
 
 from pulp_rpm.common import constants, ids
 from pulp_rpm.yum_plugin import util
 from pulp_rpm.plugins.db import models
 from pulp_rpm.plugins.distributors.export_distributor import export_utils
-from pulp_rpm.plugins.distributors.export_distributor import generate_iso
+from pulp_rpm.plugins.distributors.export_distributor import generate_iso, incremental_bundle
 from pulp_rpm.plugins.importers.yum.parse.treeinfo import KEY_PACKAGEDIR
-from . import configuration
+from . import configuration, links
 from .metadata.filelists import FilelistsXMLFileContext
 from .metadata.metadata import REPO_DATA_DIR_NAME
 from .metadata.other import OtherXMLFileContext
+from .metadata.package_index import PackageMetadataIndex
 from .metadata.prestodelta import PrestodeltaXMLFileContext
 from .metadata.primary import PrimaryXMLFileContext
 from .metadata.repomd import RepomdXMLFileContext
+from .metadata.sqlite_db import DATABASE_VERSION, SqliteRepodataWriter
 from .metadata.updateinfo import UpdateinfoXMLFileContext
 from .metadata.package import PackageXMLFileContext
 
 
 logger = util.getLogger(__name__)
 
+# Types of the units besides packages whose files are published. An incremental publish can't
+# prune their files, so it is only done while all of the units of these types that the previous
+# publish recorded in its package index are still in the repository.
+INDEXED_UNIT_TYPE_IDS = (ids.TYPE_ID_DRPM, ids.TYPE_ID_DISTRO)
+
+
+def find_indexed_unit_ids(repo):
+    """
+    :param repo: the repository
+    :type  repo: pulp.server.db.model.Repository
+
+    :return:    IDs of the repository's units of each of INDEXED_UNIT_TYPE_IDS
+    :rtype:     dict
+    """
+    unit_ids = dict((type_id, set()) for type_id in INDEXED_UNIT_TYPE_IDS)
+    type_q = mongoengine.Q(unit_type_id__in=list(INDEXED_UNIT_TYPE_IDS))
+    for association in repo_controller.find_repo_content_units(repo, repo_content_unit_q=type_q):
+        unit_ids[association.unit_type_id].add(association.unit_id)
+    return unit_ids
+
 
 class BaseYumRepoPublisher(platform_steps.PluginStep):
     """
@@ -72,8 +98,8 @@ class BaseYumRepoPublisher(platform_steps.PluginStep):
         self.add_child(PublishErrataStep())
         self.add_child(PublishCompsStep())
         self.add_child(PublishMetadataStep())
+        self.add_child(GenerateSqliteForRepoStep(self.rpm_step))
         self.add_child(CloseRepoMetadataStep())
-        self.add_child(GenerateSqliteForRepoStep(self.get_working_dir()))
 
     def get_checksum_type(self):
         if not self.checksum_type:
@@ -92,7 +118,8 @@ class ExportRepoPublisher(BaseYumRepoPublisher):
     of a yum repository over HTTP and/or HTTPS.
     """
 
-    def __init__(self, repo, publish_conduit, config, distributor_type, **kwargs):
+    def __init__(self, repo, publish_conduit, config, distributor_type, realize_export_dir=False,
+                 **kwargs):
         """
         :param repo: Pulp managed Yum repository
         :type  repo: pulp.plugins.model.Repository
@@ -102,9 +129,15 @@ class ExportRepoPublisher(BaseYumRepoPublisher):
         :type  config: pulp.plugins.config.PluginCallConfiguration
         :param distributor_type: The type of the distributor that is being published
         :type distributor_type: str
+        :param realize_export_dir: if True, the repository is hard linked into the export
+                                   directory instead of copied; only for export directories
+                                   that are only read, such as one an ISO is built from
+        :type realize_export_dir: bool
         """
         super(ExportRepoPublisher, self).__init__(repo, publish_conduit, config, distributor_type,
                                                   **kwargs)
+        # exports are never published to incrementally, so they don't carry a package index
+        self.rpm_step.write_package_index = False
 
         date_q = export_utils.create_date_range_filter(config)
         if date_q:
@@ -112,15 +145,24 @@ class ExportRepoPublisher(BaseYumRepoPublisher):
             # we have to clear out the previously added steps
             # we only need special version s of the rpm, drpm, and errata steps
             self.clear_children()
+            self.bundle_writer = None
+            self.add_child(InitIncrementalExportStep())
             self.add_child(PublishRpmAndDrpmStepIncremental(repo_content_unit_q=date_q))
             self.add_child(PublishErrataStepIncremental(repo_content_unit_q=date_q))
+            self.add_child(CloseIncrementalExportStep())
 
         working_directory = self.get_working_dir()
         export_dir = config.get(constants.EXPORT_DIRECTORY_KEYWORD)
+        self.export_dir = export_dir
+        self.export_target_dir = None
         if export_dir:
             target_dir = os.path.join(export_dir,
                                       configuration.get_repo_relative_path(repo.repo_obj, config))
-            self.add_child(platform_steps.CopyDirectoryStep(working_directory, target_dir))
+            self.export_target_dir = target_dir
+            if realize_export_dir:
+                self.add_child(RealizeTreeStep(working_directory, target_dir))
+            else:
+                self.add_child(platform_steps.CopyDirectoryStep(working_directory, target_dir))
             self.add_child(GenerateListingFileStep(export_dir, target_dir))
         else:
             # Reset the steps to use an internal scratch directory other than the base working dir
@@ -129,13 +171,11 @@ class ExportRepoPublisher(BaseYumRepoPublisher):
                 step.working_dir = content_dir
             self.working_dir = content_dir
 
-            # Set up step to copy all the files to a realized directory with no symlinks
-            # This could be optimized with a pathspec so that we don't create all the files
-            # separately
+            # Set up step to hard link all the files into a realized directory with no symlinks
             realized_dir = os.path.join(working_directory, 'realized')
             copy_target = os.path.join(realized_dir,
                                        configuration.get_repo_relative_path(repo.repo_obj, config))
-            self.add_child(platform_steps.CopyDirectoryStep(content_dir, copy_target))
+            self.add_child(RealizeTreeStep(content_dir, copy_target))
             self.add_child(GenerateListingFileStep(realized_dir, copy_target))
 
             # Create the steps to generate the ISO and publish them to their final location
@@ -186,6 +226,7 @@ class ExportRepoGroupPublisher(platform_steps.PluginStep):
                                                                 realized_dir})
 
         repo_objs = model.Repository.objects(repo_id__in=repo_group.repo_ids)
+        repo_publishers = []
         empty_repos = True
         for repo_obj in repo_objs:
             empty_repos = False
@@ -215,9 +256,23 @@ class ExportRepoGroupPublisher(platform_steps.PluginStep):
             repo_working_dir = os.path.join(scratch_dir, repo.id)
             repo_conduit = RepoPublishConduit(repo.id, distributor_type)
             publisher = ExportRepoPublisher(repo, repo_conduit, repo_config_copy,
-                                            distributor_type, working_dir=repo_working_dir)
+                                            distributor_type, working_dir=repo_working_dir,
+                                            realize_export_dir=not export_dir)
             publisher.description = _("Exporting Repo: %s") % repo.id
-            self.add_child(publisher)
+            repo_publishers.append(publisher)
+
+        max_workers = int(config.get(constants.EXPORT_WORKERS_KEYWORD) or 1)
+        if max_workers > 1 and len(repo_publishers) > 1:
+            self.add_child(ConcurrentRepoExportStep(repo_publishers, max_workers))
+            # The listing files written while the repositories were exported at the same time
+            # may be missing the directories of other repositories, so they are written again.
+            for publisher in repo_publishers:
+                self.add_child(GenerateListingFileStep(publisher.export_dir,
+                                                       publisher.export_target_dir))
+        else:
+            for publisher in repo_publishers:
+                self.add_child(publisher)
+
         if empty_repos:
             os.makedirs(realized_dir)
             self.add_child(GenerateListingFileStep(realized_dir, realized_dir))
@@ -241,6 +296,95 @@ class ExportRepoGroupPublisher(platform_steps.PluginStep):
                                                                      master_dir))
 
 
+class ConcurrentRepoExportStep(platform_steps.PluginStep):
+    """
+    Export the repositories of a group at the same time, each in its own thread.
+
+    Each repository is exported by an ExportRepoPublisher that writes to the group's export
+    directory. Most of the time is spent waiting for the database and the disk, which is time the
+    other threads can use.
+    """
+
+    def __init__(self, repo_publishers, max_workers):
+        """
+        :param repo_publishers: the publishers of the repositories in the group
+        :type  repo_publishers: list of ExportRepoPublisher
+        :param max_workers:     maximum number of repositories exported at the same time
+        :type  max_workers:     int
+        """
+        super(ConcurrentRepoExportStep, self).__init__(constants.PUBLISH_STEP_CONCURRENT_EXPORT)
+        self.description = _('Exporting repositories')
+        self.max_workers = max_workers
+        self._report_lock = threading.RLock()
+        for publisher in repo_publishers:
+            self.add_child(publisher)
+
+    def report_progress(self, force=False):
+        """
+        Report progress, one thread at a time.
+
+        :param force: Whether or not to force the progress report to be sent
+        :type  force: bool
+        """
+        with self._report_lock:
+            super(ConcurrentRepoExportStep, self).report_progress(force)
+
+    def process(self):
+        """
+        Process the repository publishers with a bounded pool of threads. If a repository fails,
+        no more repositories are started, and the first error is raised once the running ones are
+        done.
+        """
+        self.state = reporting_constants.STATE_RUNNING
+        self.report_progress(force=True)
+
+        # Publishers share the parent directories of their target directories, so these are
+        # created up front instead of by several threads at once.
+        for publisher in self.children:
+            parent_dir = os.path.dirname(publisher.export_target_dir.rstrip('/'))
+            if not os.path.isdir(parent_dir):
+                os.makedirs(parent_dir)
+
+        pending = Queue.Queue()
+        for publisher in self.children:
+            pending.put(publisher)
+        errors = []
+        threads = [threading.Thread(target=self._export_repos, args=(pending, errors))
+                   for i in range(min(self.max_workers, len(self.children)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            self.state = reporting_constants.STATE_FAILED
+            self.report_progress(force=True)
+            raise errors[0]
+        self.state = reporting_constants.STATE_COMPLETE
+        self.report_progress(force=True)
+
+    def _export_repos(self, pending, errors):
+        """
+        Process publishers taken from a queue until it is empty or an export failed.
+
+        :param pending: queue of the publishers not started yet
+        :type  pending: Queue.Queue
+        :param errors:  list the errors raised by the publishers are appended to
+        :type  errors:  list
+        """
+        while not (errors or self.canceled):
+            try:
+                publisher = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                publisher.process()
+            except Exception, e:
+                logger.exception(_('Error exporting repository %(repo)s') %
+                                 {'repo': publisher.get_repo().id})
+                errors.append(e)
+
+
 class Publisher(BaseYumRepoPublisher):
     """
     Yum HTTP/HTTPS publisher class that is responsible for the actual publishing
@@ -265,9 +409,9 @@ class Publisher(BaseYumRepoPublisher):
         last_published = publish_conduit.last_publish()
         last_deleted = repo.last_unit_removed
         date_filter = None
+        previous_index = None
 
-        if last_published and \
-                ((last_deleted and last_published > last_deleted) or not last_deleted):
+        if last_published:
             # Add the step to copy the current published directory into place
             specific_master = None
             if config.get(constants.PUBLISH_HTTPS_KEYWORD):
@@ -280,19 +424,28 @@ class Publisher(BaseYumRepoPublisher):
                 specific_master = os.path.realpath(repo_publish_dir)
 
             # Only do an incremental publish if the previous publish can be found
-            if os.path.exists(specific_master):
-                # Pass something useful to the super so that it knows the publish info
-                string_date = dateutils.format_iso8601_datetime(last_published)
-                date_filter = mongoengine.Q(created__gte=string_date)
+            if specific_master and os.path.exists(specific_master):
+                # With an index of the previous package metadata, packages removed since the
+                # last publish can be dropped from the copied metadata instead of regenerating it
+                previous_index = PackageMetadataIndex.load(specific_master)
+                # the index only prunes packages, so other units with published files must not
+                # have been removed since the last publish
+                if previous_index and last_deleted and last_deleted >= last_published and \
+                        not self._indexed_units_kept(repo, previous_index):
+                    previous_index = None
+                if previous_index or not last_deleted or last_published > last_deleted:
+                    # Pass something useful to the super so that it knows the publish info
+                    string_date = dateutils.format_iso8601_datetime(last_published)
+                    date_filter = mongoengine.Q(created__gte=string_date)
 
         super(Publisher, self).__init__(transfer_repo, publish_conduit, config, distributor_type,
                                         association_filters=date_filter, **kwargs)
 
         if date_filter:
-            insert_step = platform_steps.CopyDirectoryStep(
-                specific_master, self.get_working_dir(), preserve_symlinks=True)
+            insert_step = CopyPublishedTreeStep(specific_master, self.get_working_dir())
             self.insert_child(0, insert_step)
             self.rpm_step.fast_forward = True
+            self.rpm_step.previous_index = previous_index
 
         # Add the web specific directory publishing processing steps
         target_directories = []
@@ -323,6 +476,28 @@ class Publisher(BaseYumRepoPublisher):
         for step in listing_steps:
             self.add_child(step)
 
+    @staticmethod
+    def _indexed_units_kept(repo, previous_index):
+        """
+        Determine whether the units besides packages that the previous publish published files
+        for are all still in the repository.
+
+        :param repo: the repository being published
+        :type  repo: pulp.server.db.model.Repository
+        :param previous_index: index of the previous publish
+        :type  previous_index: PackageMetadataIndex
+
+        :return:    True if none of them were removed
+        :rtype:     bool
+        """
+        current_ids = find_indexed_unit_ids(repo)
+        for type_id, unit_ids in previous_index.units.iteritems():
+            if not set(unit_ids) <= current_ids.get(type_id, set()):
+                logger.debug(_('Units of type %(t)s were removed; publishing all metadata') %
+                             {'t': type_id})
+                return False
+        return True
+
 
 class GenerateListingFileStep(platform_steps.PluginStep):
     def __init__(self, root_dir, target_dir, step=constants.PUBLISH_GENERATE_LISTING_FILE_STEP):
@@ -338,6 +513,56 @@ class GenerateListingFileStep(platform_steps.PluginStep):
         util.generate_listing_files(self.root_dir, self.target_dir)
 
 
+class CopyPublishedTreeStep(platform_steps.PluginStep):
+    """
+    Copy the previously published repository into the working directory for an incremental
+    publish. Links to content are recreated rather than copied.
+    """
+
+    def __init__(self, source_dir, target_dir):
+        """
+        :param source_dir: root directory of the previously published repository
+        :type  source_dir: str
+        :param target_dir: directory to copy the repository to
+        :type  target_dir: str
+        """
+        super(CopyPublishedTreeStep, self).__init__(constants.PUBLISH_COPY_PUBLISHED_TREE_STEP)
+        self.description = _('Copying previously published files')
+        self.source_dir = source_dir
+        self.target_dir = target_dir
+
+    def process_main(self, item=None):
+        """
+        Copy the published tree into place.
+        """
+        links.copy_tree(self.source_dir, self.target_dir)
+
+
+class RealizeTreeStep(platform_steps.PluginStep):
+    """
+    Build a tree of real files from a published tree of symlinks, hard linking the files rather
+    than copying them where possible
+    """
+
+    def __init__(self, source_dir, target_dir, step=constants.PUBLISH_REALIZE_TREE_STEP):
+        """
+        :param source_dir: root directory of the published tree
+        :type  source_dir: str
+        :param target_dir: directory to build the tree of real files in
+        :type  target_dir: str
+        """
+        super(RealizeTreeStep, self).__init__(step)
+        self.description = _('Linking files')
+        self.source_dir = source_dir
+        self.target_dir = target_dir
+
+    def process_main(self, item=None):
+        """
+        Link the files of the source directory into the target directory
+        """
+        links.realize_tree(self.source_dir, self.target_dir)
+
+
 class InitRepoMetadataStep(platform_steps.PluginStep):
 
     def __init__(self, step=constants.PUBLISH_INIT_REPOMD_STEP):
@@ -379,14 +604,65 @@ class PublishRpmStep(platform_steps.UnitModelPluginStep):
         self.file_lists_context = None
         self.other_context = None
         self.primary_context = None
+        self.package_index = None
+        self.link_batch = None
+        self.sqlite_writer = None
         self.dist_step = dist_step
         self.fast_forward = False
+        # index of the previous publish, if it was copied into the working directory and its
+        # package metadata is merged with the units processed by this step
+        self.previous_index = None
+        # False for publishes that are never published to incrementally, such as exports
+        self.write_package_index = True
+
+    @property
+    def incremental(self):
+        """
+        :return:    True if the package metadata of the previous publish is merged with the units
+                    processed by this step
+        :rtype:     bool
+        """
+        return self.previous_index is not None
+
+    @property
+    def metadata_contexts(self):
+        """
+        :return:    tuple of (metadata type, context) tuples for the per-package metadata files
+        :rtype:     tuple
+        """
+        return (('filelists', self.file_lists_context), ('other', self.other_context),
+                ('primary', self.primary_context))
 
     def initialize(self):
         """
         Create each of the three metadata contexts required for publishing RPM & SRPM
+
+        For an incremental publish, the metadata of packages that are still in the repository is
+        copied from the previous publish before any new units are processed.
         """
         total = self.get_total()
+        self.link_batch = links.LinkBatch(
+            self.get_config().get(constants.LINK_TYPE_KEYWORD, constants.LINK_TYPE_SYMLINK))
+        if self.get_config().get(constants.GENERATE_SQLITE_KEYWORD, False):
+            self.sqlite_writer = SqliteRepodataWriter(self.get_working_dir(),
+                                                      self.parent.get_checksum_type())
+            self.sqlite_writer.initialize()
+
+        previous_index = self.previous_index
+        if previous_index:
+            # the index was loaded from the previous publish, which was copied into place since
+            previous_index.working_dir = self.get_working_dir()
+            kept_pkgids = self._unpublish_removed_packages(previous_index)
+            total += len(kept_pkgids)
+
+            # move the previous metadata files out of the way so the new contexts don't
+            # fast forward through them
+            previous_dir = tempfile.mkdtemp(dir=self.get_working_dir())
+            previous_paths = {}
+            for metadata_type, _context in self.metadata_contexts:
+                previous_paths[metadata_type] = os.path.join(previous_dir, metadata_type)
+                os.rename(previous_index.metadata_file_path(metadata_type),
+                          previous_paths[metadata_type])
 
         checksum_type = self.parent.get_checksum_type()
         self.file_lists_context = FilelistsXMLFileContext(self.get_working_dir(), total,
@@ -395,11 +671,101 @@ class PublishRpmStep(platform_steps.UnitModelPluginStep):
         self.primary_context = PrimaryXMLFileContext(self.get_working_dir(), total, checksum_type)
         for context in (self.file_lists_context, self.other_context, self.primary_context):
             context.initialize()
+        self.package_index = PackageMetadataIndex(self.get_working_dir())
+
+        if previous_index:
+            try:
+                for metadata_type, context in self.metadata_contexts:
+                    snippets = previous_index.read_snippets(metadata_type, kept_pkgids,
+                                                            previous_paths[metadata_type])
+                    for pkgid, snippet in snippets:
+                        self._write_indexed_metadata(metadata_type, context, pkgid, snippet)
+                for pkgid in kept_pkgids:
+                    self.package_index.add_package(pkgid, previous_index.packages[pkgid])
+            finally:
+                shutil.rmtree(previous_dir, ignore_errors=True)
+
+    def _unpublish_removed_packages(self, previous_index):
+        """
+        Remove the links to packages that were published previously but are no longer in the
+        repository, and determine which packages' metadata can be copied from the previous publish.
+
+        :param previous_index: index of the previous publish
+        :type  previous_index: PackageMetadataIndex
+
+        :return:    ids of the packages whose previous metadata should be kept
+        :rtype:     set
+        """
+        type_q = mongoengine.Q(unit_type_id__in=[ids.TYPE_ID_RPM, ids.TYPE_ID_SRPM])
+        current_pkgids = set(unit.checksum for unit in repo_controller.find_repo_content_units(
+            self.get_repo().repo_obj, repo_content_unit_q=type_q, unit_fields=['checksum'],
+            yield_content_unit=True))
+        # units processed by this step will have their metadata written again
+        added_pkgids = set(unit.checksum for queryset in self.unit_querysets
+                           for unit in queryset.only('checksum'))
+
+        previous_pkgids = set(previous_index.packages)
+        kept_pkgids = (previous_pkgids & current_pkgids) - added_pkgids
+        kept_filenames = set(previous_index.packages[pkgid] for pkgid in kept_pkgids)
+
+        for pkgid in previous_pkgids - current_pkgids:
+            filename = previous_index.packages[pkgid]
+            if filename in kept_filenames:
+                continue
+            for directory in [self.get_working_dir()] + self.dist_step.package_dirs:
+                path = os.path.join(directory, filename)
+                # packages are published as symlinks, hard links or reflinks
+                if os.path.lexists(path) and not os.path.isdir(path):
+                    os.unlink(path)
+
+        return kept_pkgids
+
+    def _write_indexed_metadata(self, metadata_type, context, pkgid, metadata=None, unit=None):
+        """
+        Write a package's metadata to a context and record its position in the package index.
+
+        :param metadata_type:   type of the metadata file, such as "primary"
+        :type  metadata_type:   str
+        :param context:         context to write the metadata to
+        :type  context:         pulp.plugins.util.metadata_writer.FastForwardXmlFileContext
+        :param pkgid:           id of the package the metadata describes
+        :type  pkgid:           str
+        :param metadata:        pre-rendered metadata to write
+        :type  metadata:        str
+        :param unit:            unit whose metadata should be added by the context, if metadata
+                                is not given
+        :type  unit:            pulp_rpm.plugins.db.models.RpmBase
+        """
+        offset = context.metadata_file_handle.tell()
+        if unit is None:
+            context.metadata_file_handle.write(metadata)
+        else:
+            context.add_unit_metadata(unit)
+        length = context.metadata_file_handle.tell() - offset
+        self.package_index.add_snippet(metadata_type, pkgid, offset, length)
+
+        if self.streams_sqlite:
+            if unit is not None:
+                metadata = unit.get_repodata(metadata_type)
+            self.sqlite_writer.add_package_metadata(metadata_type, metadata)
+
+    @property
+    def streams_sqlite(self):
+        """
+        :return:    True if the sqlite databases are generated from the metadata written by this
+                    step; False if they must be generated from the finished XML files, because
+                    a fast forward publish copies package metadata this step never sees
+        :rtype:     bool
+        """
+        return self.sqlite_writer is not None and (self.incremental or not self.fast_forward)
 
     def finalize(self):
         """
         Close each context and write it to the repomd file
         """
+        if self.link_batch:
+            self.link_batch.flush()
+
         repomd = self.parent.repomd_file_context
 
         if self.file_lists_context:
@@ -417,6 +783,16 @@ class PublishRpmStep(platform_steps.UnitModelPluginStep):
             repomd.add_metadata_file_metadata('primary', self.primary_context.metadata_file_path,
                                               self.primary_context.checksum)
 
+        # a fast forward publish copies metadata whose positions are unknown, so it can't be
+        # indexed
+        if self.write_package_index and self.package_index and \
+                (self.incremental or not self.fast_forward):
+            for metadata_type, context in self.metadata_contexts:
+                self.package_index.set_metadata_file(metadata_type, context.metadata_file_path)
+            for type_id, unit_ids in find_indexed_unit_ids(self.get_repo().repo_obj).iteritems():
+                self.package_index.set_units(type_id, unit_ids)
+            self.package_index.write()
+
     def process_main(self, item=None):
         """
         Link the unit to the content directory and the package_dir
@@ -427,13 +803,14 @@ class PublishRpmStep(platform_steps.UnitModelPluginStep):
         unit = item
         source_path = unit._storage_path
         destination_path = os.path.join(self.get_working_dir(), unit.filename)
-        plugin_misc.create_symlink(source_path, destination_path)
+        self.link_batch.add(source_path, destination_path)
         for package_dir in self.dist_step.package_dirs:
             destination_path = os.path.join(package_dir, unit.filename)
-            plugin_misc.create_symlink(source_path, destination_path)
+            self.link_batch.add(source_path, destination_path)
 
-        for context in (self.file_lists_context, self.other_context, self.primary_context):
-            context.add_unit_metadata(unit)
+        for metadata_type, context in self.metadata_contexts:
+            self._write_indexed_metadata(metadata_type, context, unit.checksum, unit=unit)
+        self.package_index.add_package(unit.checksum, unit.filename)
 
 
 class PublishMetadataStep(platform_steps.UnitModelPluginStep):
@@ -477,6 +854,7 @@ class PublishDrpmStep(platform_steps.UnitModelPluginStep):
                                               **kwargs)
         self.description = _('Publishing Delta RPMs')
         self.context = None
+        self.link_batch = None
         self.dist_step = dist_step
 
     def initialize(self):
@@ -486,6 +864,8 @@ class PublishDrpmStep(platform_steps.UnitModelPluginStep):
         checksum_type = self.parent.get_checksum_type()
         self.context = PrestodeltaXMLFileContext(self.get_working_dir(), checksum_type)
         self.context.initialize()
+        self.link_batch = links.LinkBatch(
+            self.get_config().get(constants.LINK_TYPE_KEYWORD, constants.LINK_TYPE_SYMLINK))
 
     def is_skipped(self):
         """
@@ -513,16 +893,18 @@ class PublishDrpmStep(platform_steps.UnitModelPluginStep):
         unit_filename = os.path.basename(unit.filename)
         relative_path = os.path.join('drpms', unit_filename)
         destination_path = os.path.join(self.get_working_dir(), relative_path)
-        plugin_misc.create_symlink(source_path, destination_path)
+        self.link_batch.add(source_path, destination_path)
         for package_dir in self.dist_step.package_dirs:
             destination_path = os.path.join(package_dir, relative_path)
-            plugin_misc.create_symlink(source_path, destination_path)
+            self.link_batch.add(source_path, destination_path)
         self.context.add_unit_metadata(unit)
 
     def finalize(self):
         """
         Close & finalize each of the metadata files
         """
+        if self.link_batch:
+            self.link_batch.flush()
         if self.context:
             self.context.finalize()
             self.parent.repomd_file_context.\
@@ -564,6 +946,34 @@ class PublishErrataStep(platform_steps.UnitModelPluginStep):
                                            self.context.checksum)
 
 
+class InitIncrementalExportStep(platform_steps.PluginStep):
+
+    def __init__(self, step=constants.PUBLISH_INIT_INCREMENTAL_STEP):
+        """
+        Initialize and set the ID of the step
+        """
+        super(InitIncrementalExportStep, self).__init__(step)
+        self.description = _("Initializing incremental export")
+
+    def initialize(self):
+        self.parent.bundle_writer = incremental_bundle.BundleWriter(self.get_working_dir())
+        self.parent.bundle_writer.initialize()
+
+
+class CloseIncrementalExportStep(platform_steps.PluginStep):
+
+    def __init__(self, step=constants.PUBLISH_CLOSE_INCREMENTAL_STEP):
+        """
+        Initialize and set the ID of the step
+        """
+        super(CloseIncrementalExportStep, self).__init__(step)
+        self.description = _("Closing incremental export")
+
+    def finalize(self):
+        if self.parent.bundle_writer:
+            self.parent.bundle_writer.finalize()
+
+
 class PublishRpmAndDrpmStepIncremental(platform_steps.UnitModelPluginStep):
     """
     Publish all incremental rpms and drpms
@@ -574,30 +984,9 @@ class PublishRpmAndDrpmStepIncremental(platform_steps.UnitModelPluginStep):
                                                                 models.DRPM], **kwargs)
         self.description = _('Publishing RPM, SRPM, and DRPM')
 
-    def initialize(self):
-        """
-        In case there are no units that get processed, nothing else would create this directory.
-        Its existence is required by the CopyDirectoryStep.
-        """
-        super(PublishRpmAndDrpmStepIncremental, self).initialize()
-        if not os.path.exists(self.get_working_dir()):
-            os.makedirs(self.get_working_dir())
-
-    @property
-    def unit_querysets(self):
-        """
-        Limits the queryset's fields
-
-        :return:    generator of mongoengine.QuerySet objects that have fields limited
-        :rtype:     generator
-        """
-        querysets = super(PublishRpmAndDrpmStepIncremental, self).unit_querysets
-        # The repodata field can be huge, and we don't need it right now.
-        return (qs.exclude('repodata') for qs in querysets)
-
     def process_main(self, item=None):
         """
-        Link the unit to the content directory and the package_dir
+        Link the unit to the content directory and add its metadata to the incremental export
 
         :param unit: The unit to process
         :type unit: pulp.server.db.model.NonMetadataPackage
@@ -608,16 +997,14 @@ class PublishRpmAndDrpmStepIncremental(platform_steps.UnitModelPluginStep):
         destination_path = os.path.join(self.get_working_dir(), relative_path)
         plugin_misc.create_symlink(source_path, destination_path)
 
-        filename = unit.name + '-' + unit.version + '-' + unit.release + '.' + unit.arch + '.json'
-        path = os.path.join(self.get_working_dir(), filename)
-
         metadata_dict = unit.create_legacy_metadata_dict()
-        # The repodata is large, and can get re-generated during upload, so we leave it out here.
-        metadata_dict.pop('repodata', None)
-        dict_to_write = {'unit_key': unit.unit_key, 'unit_metadata': metadata_dict}
-
-        with open(path, 'w') as f:
-            json.dump(dict_to_write, f)
+        if isinstance(unit, models.RpmBase):
+            # Export the snippets with the unit so the importing server does not have to
+            # generate them from the package again.
+            metadata_dict['repodata'] = dict(
+                (metadata_type, unit.get_repodata(metadata_type))
+                for metadata_type in ('primary', 'filelists', 'other'))
+        self.parent.bundle_writer.add_unit(unit._content_type_id, unit.unit_key, metadata_dict)
 
 
 class PublishErrataStepIncremental(platform_steps.UnitModelPluginStep):
@@ -635,14 +1022,8 @@ class PublishErrataStepIncremental(platform_steps.UnitModelPluginStep):
         :type item: pulp_rpm.plugins.db.models.Errata
         """
         unit = item
-        errata_dict = {
-            'unit_key': unit.unit_key,
-            'unit_metadata': unit.create_legacy_metadata_dict()
-        }
-
-        json_file_path = os.path.join(self.get_working_dir(), unit.errata_id + '.json')
-        with open(json_file_path, 'w') as f:
-            json.dump(errata_dict, f)
+        self.parent.bundle_writer.add_unit(unit._content_type_id, unit.unit_key,
+                                           unit.create_legacy_metadata_dict())
 
 
 class PublishCompsStep(platform_steps.UnitModelPluginStep):
@@ -835,31 +1216,75 @@ class CreateIsoStep(platform_steps.PluginStep):
         self.description = _('Exporting ISO')
         self.content_dir = content_dir
         self.output_dir = output_dir
+        self.fill_ratio = 0.0
+        self.image_count = 0
+        self.images_created = 0
+        self.images_failed = 0
 
     def process_main(self, item=None):
         """
         Publish a directory from to a tar file
+
+        :raise Exception: if any of the ISO images could not be created
         """
         image_size = self.get_config().get(constants.ISO_SIZE_KEYWORD)
         image_prefix = self.get_config().get(constants.ISO_PREFIX_KEYWORD) or self.get_repo().id
-        generate_iso.create_iso(self.content_dir, self.output_dir, image_prefix, image_size)
+        max_workers = self.get_config().get(constants.ISO_WORKERS_KEYWORD)
+        packing = self.get_config().get(constants.ISO_PACKING_KEYWORD,
+                                        generate_iso.PACKING_SEQUENTIAL)
+        failed_images = generate_iso.create_iso(self.content_dir, self.output_dir, image_prefix,
+                                                image_size,
+                                                progress_callback=self._report_iso_progress,
+                                                max_workers=max_workers, packing=packing)
+        if failed_images:
+            msg = _('Error creating ISO images: %(images)s') % {
+                'images': ', '.join(failed_images)}
+            logger.error(msg)
+            raise Exception(msg)
+
+    def _report_iso_progress(self, key, value):
+        """
+        Progress callback for generate_iso.create_iso that reports how many of the images have
+        been built in the progress details of the step.
+
+        :param key:     generate_iso.PROGRESS_FILL_RATIO, generate_iso.PROGRESS_IMAGE_COUNT or
+                        the file name of an image
+        :type  key:     str
+        :param value:   fill ratio of the images, number of images, or the new state of the image
+        :type  value:   float or int or str
+        """
+        if key == generate_iso.PROGRESS_FILL_RATIO:
+            self.fill_ratio = value
+            return
+        if key == generate_iso.PROGRESS_IMAGE_COUNT:
+            self.image_count = value
+        elif value == generate_iso.ISO_STATE_COMPLETE:
+            self.images_created += 1
+        elif value == generate_iso.ISO_STATE_FAILED:
+            self.images_failed += 1
+            self.error_details.append(_('Error creating iso %(name)s') % {'name': key})
+        self.progress_details = _('%(created)d of %(count)d ISO images created, %(failed)d '
+                                  'failed; images are %(fill).1f%% full') % {
+            'created': self.images_created, 'count': self.image_count,
+            'failed': self.images_failed, 'fill': self.fill_ratio * 100}
+        self.report_progress()
 
 
 class GenerateSqliteForRepoStep(platform_steps.PluginStep):
     """
-    Generate the Sqlite files for a given repository using the createrepo command
+    Finish the sqlite databases generated alongside the package metadata and add them to the
+    repomd file
     """
-    def __init__(self, content_dir):
+    def __init__(self, rpm_step):
         """
         Initialize the step for creating sqlite files
 
-        :param content_dir: The base directory of the repository.  This directory should contain
-                            the repodata directory
-        :type content_dir: str
+        :param rpm_step: The step that publishes the package metadata
+        :type rpm_step: PublishRpmStep
         """
         super(GenerateSqliteForRepoStep, self).__init__(constants.PUBLISH_GENERATE_SQLITE_FILE_STEP)
         self.description = _('Generating sqlite files')
-        self.content_dir = content_dir
+        self.rpm_step = rpm_step
 
     def is_skipped(self):
         """
@@ -873,16 +1298,22 @@ class GenerateSqliteForRepoStep(platform_steps.PluginStep):
 
     def process_main(self, item=None):
         """
-        Call out to createrepo command line in order to process the files.
+        Close and compress the sqlite databases and add them to the repomd file.
         """
-        checksum_type = self.parent.get_checksum_type()
-        pipe = subprocess.Popen('createrepo_c -d --update --keep-all-metadata '
-                                '--local-sqlite '
-                                '-s %(checksum_type)s --skip-stat %(content_dir)s' %
-                                {'checksum_type': checksum_type, 'content_dir': self.content_dir},
-                                shell=True, stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
-        stdout, stderr = pipe.communicate()
-        if pipe.returncode != 0:
-            result_string = '%s\n::\n%s' % (stdout, stderr)
-            raise PulpCodedException(message=result_string)
+        writer = self.rpm_step.sqlite_writer
+        if writer is None:
+            # the package metadata was not published
+            return
+
+        checksums = {}
+        for metadata_type, context in self.rpm_step.metadata_contexts:
+            if not self.rpm_step.streams_sqlite:
+                writer.add_metadata_file(metadata_type, context.metadata_file_path)
+            checksums[metadata_type] = context.checksum
+
+        databases = writer.finalize(checksums)
+        for metadata_type, database in sorted(databases.items()):
+            self.parent.repomd_file_context.add_metadata_file_metadata(
+                '%s_db' % metadata_type, database['path'], database['checksum'],
+                database_version=DATABASE_VERSION, open_checksum=database['open_checksum'],
+                open_size=database['open_size'])
@@ -1,4 +1,3 @@
-from cStringIO import StringIO
 from gettext import gettext as _
 from urlparse import urljoin
 import logging
@@ -12,19 +11,25 @@ from nectar.config import DownloaderConfig
 from nectar.downloaders.threaded import HTTPThreadedDownloader
 from nectar.downloaders.local import LocalFileDownloader
 
+from pulp.common import dateutils
 from pulp.common.plugins import importer_constants
 from pulp.common.util import encode_unicode
+from pulp.plugins.util.misc import paginate
 from pulp.server.controllers import repository as repo_controller
-from pulp.server.db.model import LazyCatalogEntry
+from pulp.server.db.model import RepositoryContentUnit
 from pulp.server.managers.repo import _common as common_utils
 
 from pulp_rpm.common import constants
 from pulp_rpm.common.progress import SyncProgressReport
-from pulp_rpm.plugins.db import models
+from pulp_rpm.plugins.db import bulk, lazy_catalog, models
 
 
 _logger = logging.getLogger(__name__)
 
+# The number of ISOs in the manifest that are compared with the units in Pulp, and saved and
+# associated, at a time
+MANIFEST_PAGE_SIZE = 1000
+
 
 class ISOSyncRun(listener.DownloadEventListener):
     """
@@ -184,15 +189,11 @@ class ISOSyncRun(listener.DownloadEventListener):
         :param units: A list of: pulp_rpm.plugins.db.models.ISO.
         :type units: list
         """
+        writer = lazy_catalog.CatalogWriter(str(self.sync_conduit.importer_object_id))
         for unit in units:
             unit.set_storage_path(unit.name)
-            entry = LazyCatalogEntry()
-            entry.path = unit.storage_path
-            entry.importer_id = str(self.sync_conduit.importer_object_id)
-            entry.unit_id = unit.id
-            entry.unit_type_id = unit.type_id
-            entry.url = unit.url
-            entry.save_revision()
+            writer.add(unit.storage_path, unit.url, unit)
+        writer.flush()
 
     def perform_sync(self):
         """
@@ -204,64 +205,184 @@ class ISOSyncRun(listener.DownloadEventListener):
         """
         # Get the manifest and download the ISOs that we are missing
         self.progress_report.state = self.progress_report.STATE_MANIFEST_IN_PROGRESS
+        # The manifest is kept on disk, as it can list a very large number of ISOs
+        manifest_file = tempfile.TemporaryFile(dir=common_utils.get_working_directory())
         try:
-            manifest = self._download_manifest()
-        except (IOError, ValueError):
-            # The IOError will happen if the file can't be retrieved at all, and the ValueError will
-            # happen if the PULP_MANIFEST file isn't in the expected format.
-            return self.progress_report.build_final_report()
-
-        # Discover what files we need to download and what we already have
-        filtered_isos = self._filter_missing_isos(manifest)
-        local_missing_isos, local_available_isos, remote_missing_isos = filtered_isos
-
-        # Associate units that are already in Pulp
-        if local_available_isos:
-            search_dicts = [unit.unit_key for unit in local_available_isos]
-            self.sync_conduit.associate_existing(models.ISO._content_type_id.default, search_dicts)
-
-        # Deferred downloading (Lazy) entries.
-        self.add_catalog_entries(local_missing_isos)
-
-        self.progress_report.state = self.progress_report.STATE_ISOS_IN_PROGRESS
-
-        # Download files and add units.
-        if self.download_deferred:
-            for iso in local_missing_isos:
-                iso.downloaded = False
-                try:
-                    iso.save()
-                except NotUniqueError:
-                    iso = iso.__class__.objects.filter(**iso.unit_key).first()
-                repo_controller.associate_single_unit(self.sync_conduit.repo, iso)
-        else:
-            self._download_isos(local_missing_isos)
-
-        # Remove unwanted iso units
-        if self._remove_missing_units:
-            repo_controller.disassociate_units(self.sync_conduit.repo, remote_missing_isos)
+            try:
+                manifest = self._download_manifest(manifest_file)
+            except (IOError, ValueError):
+                # The IOError will happen if the file can't be retrieved at all, and the
+                # ValueError will happen if the PULP_MANIFEST file isn't in the expected format.
+                return self.progress_report.build_final_report()
+
+            self.progress_report.state = self.progress_report.STATE_ISOS_IN_PROGRESS
+
+            if self._manifest_unchanged(manifest):
+                _logger.info(_('The PULP_MANIFEST has not changed since the last sync. '
+                               'Skipping.'))
+            else:
+                # Discover what files we need to download and what we already have. Units that
+                # are already in Pulp are associated, and units are saved and associated if
+                # downloading is deferred, as the manifest is read.
+                isos_to_download, remote_missing_unit_ids = self._sync_manifest(manifest)
+
+                if not self.download_deferred:
+                    self._download_isos(isos_to_download)
+
+                # Remove unwanted iso units
+                if self._remove_missing_units:
+                    repo_controller.disassociate_units(
+                        self.sync_conduit.repo, self._get_units_by_id(remote_missing_unit_ids))
+        finally:
+            manifest_file.close()
 
         # Report that we are finished. Note that setting the
         # state to STATE_ISOS_COMPLETE will automatically set the state to STATE_ISOS_FAILED if the
         # progress report has collected any errors. See the progress_report's _set_state() method
         # for the implementation of this logic.
         self.progress_report.state = self.progress_report.STATE_COMPLETE
+        if self.progress_report.state == self.progress_report.STATE_COMPLETE:
+            self._save_manifest_state(manifest)
         report = self.progress_report.build_final_report()
         return report
 
-    def _download_isos(self, manifest):
+    def _get_manifest_state(self, manifest):
+        """
+        :param manifest: the manifest being synced
+        :type  manifest: pulp_rpm.plugins.db.models.ISOManifest
+
+        :return: the checksum of the manifest and the settings that affect the result of a sync
+        :rtype:  dict
+        """
+        return {
+            'checksum': manifest.checksum,
+            'feed': self._repo_url,
+            'download_policy': self.config.get(importer_constants.DOWNLOAD_POLICY,
+                                               importer_constants.DOWNLOAD_IMMEDIATE),
+            'remove_missing': self._remove_missing_units,
+        }
+
+    def _manifest_unchanged(self, manifest):
+        """
+        Determine whether the repository is already in sync with the manifest. That is the case
+        when the last successful sync saw the same manifest with the same settings, and no units
+        have been added to or removed from the repository since.
+
+        :param manifest: the manifest being synced
+        :type  manifest: pulp_rpm.plugins.db.models.ISOManifest
+
+        :return: True if the sync can be skipped
+        :rtype:  bool
+        """
+        scratchpad = self.sync_conduit.get_scratchpad() or {}
+        previous_state = scratchpad.get(constants.PREVIOUS_ISO_MANIFEST)
+        if not previous_state:
+            return False
+
+        previous_state = dict(previous_state)
+        last_sync = dateutils.parse_iso8601_datetime(previous_state.pop('timestamp'))
+        if previous_state != self._get_manifest_state(manifest):
+            return False
+
+        repo = self.sync_conduit.repo
+        for last_change in (repo.last_unit_added, repo.last_unit_removed):
+            if last_change is not None and last_change >= last_sync:
+                return False
+        return True
+
+    def _save_manifest_state(self, manifest):
+        """
+        Save the checksum of the manifest and the settings of this sync to the scratchpad, so
+        that the next sync can be skipped if nothing has changed.
+
+        :param manifest: the manifest that was synced
+        :type  manifest: pulp_rpm.plugins.db.models.ISOManifest
+        """
+        state = self._get_manifest_state(manifest)
+        state['timestamp'] = dateutils.format_iso8601_datetime(
+            dateutils.now_utc_datetime_with_tzinfo())
+        scratchpad = self.sync_conduit.get_scratchpad() or {}
+        scratchpad[constants.PREVIOUS_ISO_MANIFEST] = state
+        self.sync_conduit.set_scratchpad(scratchpad)
+
+    def _sync_manifest(self, manifest):
         """
-        Makes the calls to retrieve the ISOs from the manifest, storing them on disk and
-        recording them in the Pulp database.
+        Compare the ISOs in the manifest with the units in Pulp a page at a time, acting on each
+        page before reading the next one. ISOs that are already in Pulp are associated with the
+        repository. Catalog entries are added for the ISOs that are not, and if downloading is
+        deferred, units are saved and associated for them.
 
-        :param manifest: The manifest containing a list of ISOs we want to download.
+        :param manifest: the manifest being synced
         :type  manifest: pulp_rpm.plugins.db.models.ISOManifest
+
+        :return: A 2-tuple. The first element is a list of ISOs that should be downloaded, which
+                 is empty if downloading is deferred. The second element is a set of the IDs of
+                 units that are in the repository but not in the manifest.
+        :rtype:  tuple
+        """
+        repo = self.sync_conduit.repo
+        repo_unit_ids = self._get_repo_unit_ids()
+        remote_missing_unit_ids = set(repo_unit_ids)
+        isos_to_download = []
+
+        for page in paginate(manifest, MANIFEST_PAGE_SIZE):
+            local_missing_isos, local_available_units = self._filter_missing_isos(page)
+            remote_missing_unit_ids.difference_update(unit.id for unit in local_available_units)
+
+            # Associate units that are already in Pulp
+            bulk.associate_units(repo, [unit for unit in local_available_units
+                                        if unit.id not in repo_unit_ids])
+
+            if self.download_deferred:
+                for iso in local_missing_isos:
+                    iso.downloaded = False
+                    iso.set_storage_path(iso.name)
+                local_missing_isos = bulk.insert_units(models.ISO, local_missing_isos)
+                bulk.associate_units(repo, local_missing_isos)
+            else:
+                isos_to_download.extend(local_missing_isos)
+
+            # Deferred downloading (Lazy) entries.
+            self.add_catalog_entries(local_missing_isos)
+
+        return isos_to_download, remote_missing_unit_ids
+
+    def _get_repo_unit_ids(self):
+        """
+        :return: the IDs of the ISO units in the repository
+        :rtype:  set
+        """
+        associations = RepositoryContentUnit.objects(
+            repo_id=self.sync_conduit.repo.repo_id,
+            unit_type_id=models.ISO._content_type_id.default)
+        return set(associations.scalar('unit_id'))
+
+    @staticmethod
+    def _get_units_by_id(unit_ids):
+        """
+        :param unit_ids: IDs of ISO units
+        :type  unit_ids: iterable
+
+        :return: generator of the units, with only their IDs loaded
+        :rtype:  generator
+        """
+        for page in paginate(unit_ids, MANIFEST_PAGE_SIZE):
+            for unit in models.ISO.objects.filter(id__in=page).only('id'):
+                yield unit
+
+    def _download_isos(self, isos):
+        """
+        Makes the calls to retrieve the ISOs, storing them on disk and recording them in the Pulp
+        database.
+
+        :param isos: The ISOs we want to download.
+        :type  isos: list
         """
         self.progress_report.total_bytes = 0
-        self.progress_report.num_isos = len(manifest)
-        # For each ISO in the manifest, we need to determine a relative path where we want
+        self.progress_report.num_isos = len(isos)
+        # For each ISO, we need to determine a relative path where we want
         # it to be stored, and initialize the Unit that will represent it
-        for iso in manifest:
+        for iso in isos:
             iso.bytes_downloaded = 0
             # Set the total bytes onto the report
             self.progress_report.total_bytes += iso.size
@@ -269,30 +390,31 @@ class ISOSyncRun(listener.DownloadEventListener):
         # We need to build a list of DownloadRequests
         download_directory = common_utils.get_working_directory()
         download_requests = []
-        for iso in manifest:
+        for iso in isos:
             iso_tmp_dir = tempfile.mkdtemp(dir=download_directory)
             iso_name = os.path.basename(iso.url)
             iso_download_path = os.path.join(iso_tmp_dir, iso_name)
             download_requests.append(request.DownloadRequest(iso.url, iso_download_path, iso))
         self.downloader.download(download_requests)
 
-    def _download_manifest(self):
+    def _download_manifest(self, manifest_destiny):
         """
         Download the manifest file, and process it to return an ISOManifest.
 
+        :param manifest_destiny: open file the manifest is written to, which must stay open for
+                                 as long as the returned manifest is used
+        :type  manifest_destiny: file
+
         :return: manifest of available ISOs
         :rtype:  pulp_rpm.plugins.db.models.ISOManifest
         """
         manifest_url = urljoin(self._repo_url, models.ISOManifest.FILENAME)
-        # I probably should have called this manifest destination, but I couldn't help myself
-        manifest_destiny = StringIO()
         manifest_request = request.DownloadRequest(manifest_url, manifest_destiny)
         self.downloader.download([manifest_request])
         # We can inspect the report status to see if we had an error when retrieving the manifest.
         if self.progress_report.state == self.progress_report.STATE_MANIFEST_FAILED:
             raise IOError(_("Could not retrieve %(url)s") % {'url': manifest_url})
 
-        manifest_destiny.seek(0)
         try:
             manifest = models.ISOManifest(manifest_destiny, self._repo_url)
         except ValueError:
@@ -303,56 +425,38 @@ class ISOSyncRun(listener.DownloadEventListener):
 
         return manifest
 
-    def _filter_missing_isos(self, manifest):
+    def _filter_missing_isos(self, isos):
         """
-        Use the sync_conduit and the manifest to determine which ISOs are at the feed_url
-        that are not in our local store, as well as which ISOs are in our local store that are not
-        available at the feed_url.
-
-        :param manifest: An ISOManifest describing the ISOs that are available at the
-                         feed_url that we are synchronizing with
-        :type  manifest: pulp_rpm.plugins.db.models.ISOManifest
-        :return:         A 3-tuple. The first element of the tuple is a list of ISOs that we should
-                         retrieve from the feed_url. The second element of the tuple is a list of
-                         Units that are available locally already, but are not currently associated
-                         with the repository. The third element of the tuple is a list of Units that
-                         represent the ISOs that we have in our local repo that were not found in
-                         the remote repo.
-        :rtype:          tuple
-        """
-        # A list of all the ISOs we have in Pulp
-        existing_units = models.ISO.objects()
-        existing_units_by_key = dict([(unit.unit_key_str, unit)
-                                      for unit in existing_units])
-        existing_units.rewind()
-        existing_unit_keys = set([unit.unit_key_str
-                                  for unit in existing_units])
-
-        # A list of units currently associated with the repository
-        existing_repo_units = repo_controller.find_repo_content_units(
-            self.sync_conduit.repo, yield_content_unit=True)
-        existing_repo_units = list(existing_repo_units)
-        existing_repo_units_by_key = dict([(unit.unit_key_str, unit)
-                                           for unit in existing_repo_units])
-        existing_repo_unit_keys = set([unit.unit_key_str
-                                       for unit in existing_repo_units])
-
-        # A list of the ISOs in the remote repository
-        available_isos_by_key = dict([(iso.unit_key_str, iso) for iso in manifest])
-        available_iso_keys = set([iso.unit_key_str for iso in manifest])
-
-        # Content that is available locally and just needs to be associated with the repository
-        local_available_iso_keys = set([iso for iso in available_iso_keys
-                                        if iso in existing_unit_keys])
-        local_available_iso_keys = local_available_iso_keys - existing_repo_unit_keys
-        local_available_units = [existing_units_by_key[k] for k in local_available_iso_keys]
-
-        # Content that is missing locally and must be downloaded
-        local_missing_iso_keys = list(available_iso_keys - existing_unit_keys)
-        local_missing_isos = [available_isos_by_key[k] for k in local_missing_iso_keys]
-
-        # Content that is missing from the remote repository that is present locally
-        remote_missing_unit_keys = list(existing_repo_unit_keys - available_iso_keys)
-        remote_missing_units = [existing_repo_units_by_key[k] for k in remote_missing_unit_keys]
-
-        return local_missing_isos, local_available_units, remote_missing_units
+        Determine which of the given ISOs from the manifest are not in our local store, and
+        find the units of those that are.
+
+        :param isos: ISOs from an ISOManifest describing the ISOs that are available at the
+                     feed_url that we are synchronizing with
+        :type  isos: list
+        :return:     A 2-tuple. The first element of the tuple is a list of ISOs that we should
+                     retrieve from the feed_url. The second element of the tuple is a list of
+                     Units that are available locally already, with only their unit key fields
+                     and IDs loaded.
+        :rtype:      tuple
+        """
+        # Only the units that could match the ISOs are loaded, with only the fields needed to
+        # compare them
+        names = list(set(iso.name for iso in isos))
+        existing_units = models.ISO.objects.filter(name__in=names).only(
+            'id', *models.ISO.unit_key_fields)
+        existing_units_by_key = dict((unit.unit_key_str, unit) for unit in existing_units)
+
+        local_missing_isos = []
+        local_available_units = []
+        seen_keys = set()
+        for iso in isos:
+            key = iso.unit_key_str
+            if key in seen_keys:
+                continue
+            seen_keys.add(key)
+            if key in existing_units_by_key:
+                local_available_units.append(existing_units_by_key[key])
+            else:
+                local_missing_isos.append(iso)
+
+        return local_missing_isos, local_available_units
@@ -1,19 +1,34 @@
-from gettext import gettext as _
 import logging
 
 import mongoengine
 import os
+from pulp.plugins.loader import api as plugin_api
 from pulp.plugins.util.misc import paginate
 from pulp.server.controllers import repository as repo_controller
+from pulp.server.db.model import RepositoryContentUnit
 
 from pulp_rpm.common import constants, ids
-from pulp_rpm.plugins.db import models
+from pulp_rpm.plugins.db import bulk, models
 from pulp_rpm.plugins.importers.yum import depsolve
 from pulp_rpm.plugins.importers.yum import existing
 
 
 _LOGGER = logging.getLogger(__name__)
 
+# Units of these types have the repo ID in their unit key, so a copy of each is saved for the
+# destination repository. All other units are associated as they are.
+COPIED_TYPES = (models.PackageGroup, models.PackageCategory, models.PackageEnvironment,
+                models.YumMetadataFile)
+
+# The fields that reference child units, for each type of unit that can have children
+CHILD_FIELDS = {
+    models.PackageCategory: ('packagegroupids',),
+    models.PackageEnvironment: ('group_ids', 'optional_group_ids'),
+    models.PackageGroup: ('mandatory_package_names', 'default_package_names',
+                          'optional_package_names'),
+    models.Errata: ('pkglist',),
+}
+
 
 def associate(source_repo, dest_repo, import_conduit, config, units=None):
     """
@@ -35,34 +50,54 @@ def associate(source_repo, dest_repo, import_conduit, config, units=None):
     :param config:          config object for the distributor
     :type  config:          pulp.plugins.config.PluginCallConfiguration
 
-    :param units:           iterable of ContentUnit objects to copy
+    :param units:           iterable of ContentUnit objects to copy. If None, all units in the
+                            source repo are copied.
     :type  units:           iterable
 
     :return:                List of associated units.
     """
     if units is None:
-        # this might use a lot of RAM since RPMs tend to have lots of metadata
-        # TODO: so we should probably do something about that
-        units = repo_controller.find_repo_content_units(source_repo, yield_content_unit=True)
+        units = find_source_units(source_repo)
 
     # get config items that we care about
     recursive = config.get(constants.CONFIG_RECURSIVE)
     if recursive is None:
         recursive = False
 
-    associated_units = set([_associate_unit(dest_repo, unit) for unit in units])
+    solver = None
+    if recursive:
+        # shared by each copy of RPMs below, so the packages of the source repo are only loaded
+        # and examined once
+        solver = depsolve.Solver(source_repo)
+
+    associated_units = set()
+    for page in paginate(units):
+        to_copy = []
+        to_associate = []
+        for unit in page:
+            if isinstance(unit, COPIED_TYPES):
+                to_copy.append(unit)
+            elif isinstance(unit, models.RPM):
+                # RPMs are copied together below, for the purpose of dependency resolution
+                associated_units.add(unit)
+            else:
+                to_associate.append(unit)
+        associated_units.update(associate_copies_for_repo(to_copy, dest_repo))
+        bulk.associate_units(dest_repo, to_associate)
+        associated_units.update(to_associate)
     # allow garbage collection
     units = None
 
     associated_units |= copy_rpms(
         (unit for unit in associated_units if isinstance(unit, models.RPM)),
-        source_repo, dest_repo, import_conduit, recursive)
+        source_repo, dest_repo, import_conduit, recursive, solver)
 
     # return here if we shouldn't get child units
     if not recursive:
         return list(associated_units)
 
-    group_ids, rpm_names, rpm_search_dicts = identify_children_to_copy(associated_units)
+    group_ids, rpm_names, rpm_search_dicts = identify_children_to_copy(
+        find_parent_units(associated_units))
 
     # ------ get group children of the categories ------
     for page in paginate(group_ids):
@@ -73,20 +108,68 @@ def associate(source_repo, dest_repo, import_conduit, config, units=None):
                 associate(source_repo, dest_repo, import_conduit, config, group_units))
 
     # ------ get RPM children of errata ------
-    wanted_rpms = get_rpms_to_copy_by_key(rpm_search_dicts, import_conduit, source_repo)
+    wanted_rpms = get_rpms_to_copy_by_key(rpm_search_dicts, import_conduit, dest_repo)
     rpm_search_dicts = None
     rpms_to_copy = filter_available_rpms(wanted_rpms, import_conduit, source_repo)
-    associated_units |= copy_rpms(rpms_to_copy, source_repo, dest_repo, import_conduit, recursive)
+    associated_units |= copy_rpms(rpms_to_copy, source_repo, dest_repo, import_conduit, recursive,
+                                  solver)
     rpms_to_copy = None
 
     # ------ get RPM children of groups ------
     names_to_copy = get_rpms_to_copy_by_name(rpm_names, import_conduit, dest_repo)
     associated_units |= copy_rpms_by_name(names_to_copy, source_repo, dest_repo,
-                                          import_conduit, recursive)
+                                          import_conduit, recursive, solver)
 
     return list(associated_units)
 
 
+def find_source_units(source_repo):
+    """
+    Find all units in the source repository. Units that are copied for the destination repository
+    are loaded whole; all others only have their ID and unit key fields loaded, which is all that
+    is needed to associate them.
+
+    :param source_repo: repository to find units in
+    :type  source_repo: pulp.server.db.model.Repository
+
+    :return:    generator of units
+    :rtype:     generator of pulp.server.db.model.ContentUnit
+    """
+    type_ids = RepositoryContentUnit.objects(repo_id=source_repo.repo_id).distinct('unit_type_id')
+    for type_id in type_ids:
+        model_class = plugin_api.get_unit_model_by_id(type_id)
+        if issubclass(model_class, COPIED_TYPES):
+            unit_fields = None
+        else:
+            unit_fields = ('id',) + tuple(model_class.unit_key_fields)
+        for unit in repo_controller.find_repo_content_units(
+                source_repo, repo_content_unit_q=mongoengine.Q(unit_type_id=type_id),
+                unit_fields=unit_fields, yield_content_unit=True):
+            yield unit
+
+
+def find_parent_units(units):
+    """
+    Load the units that can have child units by their IDs, with only the fields that reference
+    the children.
+
+    :param units:   iterable of units, of any type
+    :type  units:   iterable of pulp.server.db.model.ContentUnit
+
+    :return:    generator of the units that can have children
+    :rtype:     generator of pulp.server.db.model.ContentUnit
+    """
+    ids_by_model = {}
+    for unit in units:
+        if unit.__class__ in CHILD_FIELDS:
+            ids_by_model.setdefault(unit.__class__, set()).add(unit.id)
+
+    for model_class, unit_ids in ids_by_model.iteritems():
+        for page in paginate(unit_ids):
+            for unit in model_class.objects.filter(id__in=page).only(*CHILD_FIELDS[model_class]):
+                yield unit
+
+
 def get_rpms_to_copy_by_key(rpm_search_dicts, import_conduit, repo):
     """
     Errata specify NEVRA for the RPMs they reference. This method is useful for
@@ -98,7 +181,8 @@ def get_rpms_to_copy_by_key(rpm_search_dicts, import_conduit, repo):
     :type  rpm_search_dicts:    iterable
     :param import_conduit:      import conduit passed to the Importer
     :type  import_conduit:      pulp.plugins.conduits.unit_import.ImportUnitConduit
-    :param repo:                repository from which to get RPMs
+    :param repo:                destination repository, in which RPMs that already
+                                exist are not needed
     :type  repo:                pulp.server.db.model.Repository
 
     :return: set of namedtuples needed by the dest repo
@@ -113,7 +197,7 @@ def get_rpms_to_copy_by_key(rpm_search_dicts, import_conduit, repo):
         named_tuples.add(models.RPM.NAMED_TUPLE(**key))
 
     # identify which of those RPMs already exist
-    existing_units = existing.get_existing_units(rpm_search_dicts, models.RPM, repo)
+    existing_units = existing.find_rpms_by_nevra(rpm_search_dicts, repo)
     # remove units that already exist in the destination from the set of units
     # we want to copy
     for unit in existing_units:
@@ -163,14 +247,14 @@ def filter_available_rpms(rpms, import_conduit, repo):
     :return:    iterable of Units that should be copied
     :return:    iterable of pulp_rpm.plugins.db.models.RPM
     """
-    return existing.get_existing_units((_no_checksum_clean_unit_key(unit) for unit in rpms),
-                                       models.RPM, repo)
+    return existing.find_rpms_by_nevra((_no_checksum_clean_unit_key(unit) for unit in rpms), repo)
 
 
 def copy_rpms(units, source_repo, dest_repo, import_conduit, copy_deps, solver=None):
     """
     Copy RPMs from the source repo to the destination repo, and optionally copy
-    dependencies as well. Dependencies are resolved recursively.
+    dependencies as well. Dependencies are resolved recursively, and those that
+    are not already in the destination repo are copied.
 
     :param units:           iterable of Units
     :type  units:           iterable of pulp_rpm.plugins.db.models.RPM
@@ -196,19 +280,26 @@ def copy_rpms(units, source_repo, dest_repo, import_conduit, copy_deps, solver=N
     """
     unit_set = set()
 
-    for unit in units:
+    for page in paginate(units):
         # we are passing in units that may have flattened "provides" metadata.
-        # This flattened field is not used by associate_single_unit().
-        repo_controller.associate_single_unit(dest_repo, unit)
-        unit_set.add(unit)
+        # Only the ID and type of each unit are used to associate it.
+        bulk.associate_units(dest_repo, page)
+        unit_set.update(page)
 
     if copy_deps and unit_set:
         if solver is None:
             solver = depsolve.Solver(source_repo)
 
-        # This returns units that have a flattened 'provides' metadata field
-        # for memory purposes (RHBZ #1185868)
-        deps = solver.find_dependent_rpms(unit_set)
+        # Dependencies are found a level at a time, for all units of the level together. Units
+        # that have been examined already are not examined again.
+        visited = set(unit_set)
+        level = set(unit_set)
+        while level:
+            # This returns units that have a flattened 'provides' metadata field
+            # for memory purposes (RHBZ #1185868)
+            level = solver.find_dependent_rpms(level) - visited
+            visited |= level
+        deps = visited - unit_set
 
         # remove rpms already in the destination repo
         existing_units = set(existing.get_existing_units([dep.unit_key for dep in deps],
@@ -219,9 +310,9 @@ def copy_rpms(units, source_repo, dest_repo, import_conduit, copy_deps, solver=N
         to_copy = deps - existing_units
 
         _LOGGER.debug('Copying deps: %s' % str(sorted([x.name for x in to_copy])))
-        if to_copy:
-            unit_set |= copy_rpms(to_copy, source_repo, dest_repo, import_conduit, copy_deps,
-                                  solver)
+        for page in paginate(to_copy):
+            bulk.associate_units(dest_repo, page)
+        unit_set |= to_copy
 
     return unit_set
 
@@ -251,7 +342,7 @@ def _no_checksum_clean_unit_key(unit_tuple):
     return ret
 
 
-def copy_rpms_by_name(names, source_repo, dest_repo, import_conduit, copy_deps):
+def copy_rpms_by_name(names, source_repo, dest_repo, import_conduit, copy_deps, solver=None):
     """
     Copy RPMs from source repo to destination repo by name
 
@@ -263,6 +354,10 @@ def copy_rpms_by_name(names, source_repo, dest_repo, import_conduit, copy_deps):
     :type dest_repo: pulp.server.db.model.Repository
     :param import_conduit:  import conduit passed to the Importer
     :type  import_conduit:  pulp.plugins.conduits.unit_import.ImportUnitConduit
+    :param copy_deps:       if True, copies dependencies of the RPMs
+    :type  copy_deps:       bool
+    :param solver:          an object that can be used for dependency solving
+    :type  solver:          pulp_rpm.plugins.importers.yum.depsolve.Solver
 
     :return:    set of pulp.plugins.model.Unit that were copied
     :rtype:     set
@@ -274,7 +369,7 @@ def copy_rpms_by_name(names, source_repo, dest_repo, import_conduit, copy_deps):
                                                     unit_fields=models.RPM.unit_key_fields,
                                                     yield_content_unit=True)
 
-    return copy_rpms(units, source_repo, dest_repo, import_conduit, copy_deps)
+    return copy_rpms(units, source_repo, dest_repo, import_conduit, copy_deps, solver)
 
 
 def identify_children_to_copy(units):
@@ -303,70 +398,37 @@ def identify_children_to_copy(units):
     return groups, rpm_names, rpm_search_dicts
 
 
-def _associate_unit(dest_repo, unit):
-    """
-    Associate one particular unit with the destination repository. There are
-    behavioral exceptions based on type:
-
-    Group, Category, Environment and Yum Metadata File units need to have their "repo_id"
-    attribute set.
-
-    RPMs are convenient to do all as one block, for the purpose of dependency
-    resolution. So this method skips RPMs and lets them be done together by
-    other means
-
-    :param dest_repo:       destination repo
-    :type  dest_repo:       pulp.server.db.model.Repository
-
-    :param unit:            Unit to be copied
-    :type  unit:            pulp.server.db.model.ContentUnit
-
-    :return:                copied unit
-    :rtype:                 pulp.server.db.model.ContentUnit
-    """
-    if isinstance(unit, (models.PackageGroup, models.PackageCategory, models.PackageEnvironment)):
-        return associate_copy_for_repo(unit, dest_repo)
-    elif isinstance(unit, models.RPM):
-        # copy will happen in one batch
-        return unit
-    elif isinstance(unit, models.YumMetadataFile):
-        return associate_copy_for_repo(unit, dest_repo, True)
-    else:
-        repo_controller.associate_single_unit(repository=dest_repo, unit=unit)
-        return unit
-
-
-def associate_copy_for_repo(unit, dest_repo, set_content=False):
+def associate_copies_for_repo(units, dest_repo):
     """
-    Associate a unit where it is required to make a copy of the unit first, and where the unit key
-    includes the repo ID.
+    Associate units where it is required to make a copy of each unit first, and where the unit
+    key includes the repo ID. The copies of each type are saved with a single request, replacing
+    any copies that already exist, for example as orphans or from an earlier copy into the same
+    repository, and are then associated with a single request.
 
-    :param unit:            Unit to be copied
-    :type  unit:            pulp_rpm.plugins.db.models.Package
+    :param units:           Units to be copied
+    :type  units:           iterable of pulp_rpm.plugins.db.models.Package
     :param dest_repo:       destination repo
     :type  dest_repo:       pulp.server.db.model.Repository
-    :param set_content:     if True, the set_unit() method will be called on the new unit. Default
-                            is False.
-    :type  set_content:     bool
 
-    :return:    new unit that was saved and associated
-    :rtype:     pulp_rpm.plugins.db.models.Package
+    :return:    new units that were saved and associated
+    :rtype:     list of pulp_rpm.plugins.db.models.Package
     """
-    new_unit = unit.clone()
-    new_unit.repo_id = dest_repo.repo_id
-
-    try:
-        new_unit.save()
-    except mongoengine.NotUniqueError:
-        # It is possible that a previous copy exists as an orphan, in which case it can safely
-        # be deleted and replaced with this new version.
-        _LOGGER.debug(_('replacing pre-existing copy of %(u)s' % {'u': new_unit}))
-        new_unit.__class__.objects.filter(**new_unit.unit_key).delete()
-        new_unit.save()
-
-    if set_content:
-        new_unit.set_storage_path(os.path.basename(unit._storage_path))
-        new_unit.safe_import_content(unit._storage_path)
-
-    repo_controller.associate_single_unit(repository=dest_repo, unit=new_unit)
-    return new_unit
+    copies_by_model = {}
+    content_sources = []
+    for unit in units:
+        new_unit = unit.clone()
+        new_unit.repo_id = dest_repo.repo_id
+        if isinstance(unit, models.YumMetadataFile):
+            new_unit.set_storage_path(os.path.basename(unit._storage_path))
+            content_sources.append((new_unit, unit._storage_path))
+        copies_by_model.setdefault(new_unit.__class__, []).append(new_unit)
+
+    new_units = []
+    for model_class, copies in copies_by_model.iteritems():
+        new_units.extend(bulk.upsert_units(model_class, copies))
+
+    for new_unit, source_path in content_sources:
+        new_unit.safe_import_content(source_path)
+
+    bulk.associate_units(dest_repo, new_units)
+    return new_units
@@ -205,6 +205,8 @@ class Solver(object):
         self._cached_source_with_provides = None
         self._cached_provides_tree = None
         self._cached_packages_tree = None
+        # unit ID to the list of Requirement instances for that unit
+        self._cached_requirements = {}
 
     def find_dependent_rpms(self, units):
         """
@@ -411,7 +413,8 @@ class Solver(object):
     def get_requirements(self, units):
         """
         For an iterable of RPM Units, return a generator of Require() instances that
-        represent the requirements for those RPMs.
+        represent the requirements for those RPMs. The requirements are cached by unit
+        ID, so the Requires entries of each unit are only queried once.
 
         :param units:   iterable of RPMs for which a query should be performed to
                         retrieve their Requires entries.
@@ -420,9 +423,26 @@ class Solver(object):
         :return:    generator of Require() instances
         :rtype:     generator
         """
-        for segment in paginate(units):
-            unit_ids = [unit.id for unit in segment]
+        unit_ids = set(unit.id for unit in units)
+        self._cache_requirements(unit_ids)
+        for unit_id in unit_ids:
+            for requirement in self._cached_requirements[unit_id]:
+                yield requirement
+
+    def _cache_requirements(self, unit_ids):
+        """
+        Query the Requires entries of the units whose requirements are not cached yet, and cache
+        them as Requirement instances.
+
+        :param unit_ids:    IDs of RPMs
+        :type  unit_ids:    iterable of basestring
+        """
+        missing_ids = [unit_id for unit_id in unit_ids if unit_id not in self._cached_requirements]
+        for segment in paginate(missing_ids):
             fields = ['requires', 'id']
-            for result in models.RPM.objects.filter(id__in=unit_ids).only(*fields):
-                for require in result.requires or []:
-                    yield Requirement(**require)
+            for result in models.RPM.objects.filter(id__in=segment).only(*fields):
+                self._cached_requirements[result.id] = [Requirement(**require)
+                                                        for require in result.requires or []]
+            # units that were not found have no requirements
+            for unit_id in segment:
+                self._cached_requirements.setdefault(unit_id, [])
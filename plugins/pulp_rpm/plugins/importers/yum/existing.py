@@ -6,12 +6,17 @@ from pulp.plugins.loader import api as plugin_api
 from pulp.plugins.util.misc import paginate
 from pulp.server.controllers import repository as repo_controller
 from pulp.server.controllers import units as units_controller
+from pulp.server.db.model import RepositoryContentUnit
 
 from pulp_rpm.common import ids
+from pulp_rpm.plugins.db import models
 
 
 _LOGGER = logging.getLogger(__name__)
 
+# The fields that identify an RPM when its checksum is not known
+NEVRA_FIELDS = ('name', 'epoch', 'version', 'release', 'arch')
+
 
 def check_repo(wanted):
     """
@@ -89,6 +94,65 @@ def get_existing_units(search_dicts, unit_class, repo):
             yield result
 
 
+def find_rpms_by_nevra(search_dicts, repo):
+    """
+    Get RPMs from the given repository by name, epoch, version, release and arch. Checksums in
+    the search dicts are ignored, and a field whose value is None, or which is missing, matches
+    any value.
+
+    For each page of search dicts, the candidate RPMs are found with a single query on their
+    name and arch, which the compound NEVRA index serves, and their versions are compared with
+    the search dicts in memory. A second query keeps the candidates that are in the repository.
+
+    :param search_dicts:    iterable of dictionaries with a subset of the RPM unit key fields
+    :type  search_dicts:    iterable
+    :param repo:            repository to search in
+    :type  repo:            pulp.server.db.model.Repository
+
+    :return:    generator of RPMs with only their ID and unit key fields populated
+    :rtype:     generator of pulp_rpm.plugins.db.models.RPM
+    """
+    fields = ('id',) + tuple(models.RPM.unit_key_fields)
+    for page in paginate(search_dicts):
+        wanted = {}
+        for search_dict in page:
+            wanted.setdefault(search_dict['name'], []).append(search_dict)
+        query = {'name__in': wanted.keys()}
+        arches = set(search_dict.get('arch') for search_dict in page)
+        if None not in arches:
+            query['arch__in'] = list(arches)
+
+        candidates = {}
+        for unit in models.RPM.objects.filter(**query).only(*fields):
+            if any(_matches_nevra(unit, search_dict) for search_dict in wanted[unit.name]):
+                candidates[unit.id] = unit
+        if not candidates:
+            continue
+
+        unit_ids = RepositoryContentUnit.objects(repo_id=repo.repo_id,
+                                                 unit_type_id=ids.TYPE_ID_RPM,
+                                                 unit_id__in=candidates.keys()).scalar('unit_id')
+        for unit_id in unit_ids:
+            yield candidates[unit_id]
+
+
+def _matches_nevra(unit, search_dict):
+    """
+    :param unit:        an RPM
+    :type  unit:        pulp_rpm.plugins.db.models.RPM
+    :param search_dict: a subset of the RPM unit key fields
+    :type  search_dict: dict
+
+    :return:    True if every NEVRA field that the search dict specifies has the unit's value
+    :rtype:     bool
+    """
+    for field in NEVRA_FIELDS:
+        value = search_dict.get(field)
+        if value is not None and value != getattr(unit, field):
+            return False
+    return True
+
+
 def check_all_and_associate(wanted, conduit, download_deferred):
     """
     Given a set of unit keys as namedtuples, this function checks if a unit
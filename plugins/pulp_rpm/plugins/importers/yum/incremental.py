@@ -0,0 +1,142 @@
+"""
+Import of the incremental exports written by the export distributors.
+
+The units are read from the bundles listed in the export's index and saved as they are, without
+parsing the package files or any repository metadata. The package files are expected next to the
+bundle directory, at the same relative paths as in the exported repository.
+"""
+import logging
+import os
+
+from pulp.plugins.loader import api as plugin_api
+from pulp.plugins.util import verification
+from pulp.plugins.util.misc import paginate
+
+from pulp_rpm.plugins.db import bulk, models
+from pulp_rpm.plugins.distributors.export_distributor import incremental_bundle
+from pulp_rpm.plugins.importers.yum.upload import update_fields_inbound
+
+
+_logger = logging.getLogger(__name__)
+
+# number of units saved and associated with a single request
+PAGE_SIZE = 500
+
+
+def import_units(repo, repo_dir, index, validate=False, progress_callback=None):
+    """
+    Save the units of an incremental export and associate them with a repository. The units of
+    each bundle are saved and associated a page at a time.
+
+    :param repo:                the repository to import the units into
+    :type  repo:                pulp.server.db.model.Repository
+    :param repo_dir:            directory of the exported repository
+    :type  repo_dir:            str
+    :param index:               the export's index, as returned by incremental_bundle.read_index
+    :type  index:               dict
+    :param validate:            if True, the checksum of each package file is verified before it
+                                is imported
+    :type  validate:            bool
+    :param progress_callback:   optional function called with each page of units after they are
+                                associated. It may raise an exception, such as the sync's
+                                CancelException, to stop the import between pages.
+    :type  progress_callback:   function
+
+    :raise ValueError: if a bundle does not match the checksum in the index
+    :raise verification.VerificationException: if validate is True and a package file does not
+                                               match its checksum
+    """
+    for entry in index['bundles']:
+        model_class = plugin_api.get_unit_model_by_id(entry['type_id'])
+        _logger.debug('Importing %(units)d units from %(file)s' % entry)
+        units = (_build_unit(model_class, unit_key, unit_metadata)
+                 for unit_key, unit_metadata in incremental_bundle.iter_units(repo_dir, entry))
+        for page in paginate(units, PAGE_SIZE):
+            if issubclass(model_class, models.NonMetadataPackage):
+                page = _save_packages(model_class, page, repo_dir, validate)
+            elif issubclass(model_class, models.Errata):
+                page = _save_errata(page)
+            else:
+                page = bulk.insert_units(model_class, page)
+            bulk.associate_units(repo, page)
+            if progress_callback is not None:
+                progress_callback(page)
+
+
+def _build_unit(model_class, unit_key, unit_metadata):
+    """
+    :param model_class: the model of the unit
+    :type  model_class: subclass of pulp.server.db.model.ContentUnit
+    :param unit_key:    the unit key as exported
+    :type  unit_key:    dict
+    :param unit_metadata: the rest of the unit's fields as exported
+    :type  unit_metadata: dict
+
+    :return: the unsaved unit
+    :rtype:  pulp.server.db.model.ContentUnit
+    """
+    update_fields_inbound(model_class, unit_key)
+    update_fields_inbound(model_class, unit_metadata)
+
+    # fields the exporting server knew of but this one does not are left out
+    unit_data = dict((key, value) for key, value in unit_metadata.iteritems()
+                     if key in model_class._fields)
+    unit_data.update(unit_key)
+    return model_class(**unit_data)
+
+
+def _save_packages(model_class, units, repo_dir, validate):
+    """
+    Save packages and import their files. Packages that are already saved are replaced by the
+    saved packages, whose files are not imported again.
+
+    :param model_class: the model of the packages
+    :type  model_class: subclass of pulp_rpm.plugins.db.models.NonMetadataPackage
+    :param units:       the unsaved packages
+    :type  units:       list
+    :param repo_dir:    directory of the exported repository
+    :type  repo_dir:    str
+    :param validate:    if True, the checksums of the package files are verified first
+    :type  validate:    bool
+
+    :return: the saved packages, in the order they were given
+    :rtype:  list
+    """
+    file_paths = []
+    for unit in units:
+        file_path = os.path.join(repo_dir, unit.filename)
+        if validate:
+            with open(file_path) as fp:
+                verification.verify_checksum(fp, unit.checksumtype, unit.checksum)
+        unit.set_storage_path(unit.filename)
+        file_paths.append(file_path)
+
+    saved_units = bulk.insert_units(model_class, units)
+    for unit, saved_unit, file_path in zip(units, saved_units, file_paths):
+        if saved_unit is unit:
+            unit.safe_import_content(file_path)
+    return saved_units
+
+
+def _save_errata(units):
+    """
+    Save errata. Errata that are already saved are replaced by the saved errata, and package lists
+    they do not have yet are added to them.
+
+    :param units:   the unsaved errata
+    :type  units:   list
+
+    :return: the saved errata, in the order they were given
+    :rtype:  list
+    """
+    saved_units = bulk.insert_units(models.Errata, units)
+    for unit, saved_unit in zip(units, saved_units):
+        if saved_unit is unit:
+            continue
+        # package lists are keyed by name, as they are when errata are synced
+        existing_names = [p['name'] for p in saved_unit.pkglist]
+        new_pkglists = [p for p in unit.pkglist if p['name'] not in existing_names]
+        if new_pkglists:
+            saved_unit.pkglist += new_pkglists
+            saved_unit.save()
+    return saved_units
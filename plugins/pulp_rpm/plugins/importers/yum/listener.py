@@ -78,6 +78,8 @@ class PackageListener(DownloadEventListener):
         :type  report: nectar.report.DownloadReport
         """
         unit = report.data
+        self.sync.concurrency.succeeded(report.url, unit.size)
+        self.sync.progress_report['content'].download_stats(self.sync.concurrency)
         self._verify_size(unit, report)
         self._verify_checksum(unit, report)
 
@@ -90,6 +92,8 @@ class PackageListener(DownloadEventListener):
         """
         unit = report.data
         report.error_report['url'] = report.url
+        self.sync.concurrency.failed(report.url, report.error_report)
+        self.sync.progress_report['content'].download_stats(self.sync.concurrency)
         self.sync.progress_report['content'].failure(unit, report.error_report)
         self.sync.set_progress()
 
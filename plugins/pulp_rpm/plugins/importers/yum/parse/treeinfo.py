@@ -14,15 +14,15 @@ from nectar.listener import AggregatingEventListener
 from nectar.request import DownloadRequest
 
 from pulp.plugins.util import verification
-from pulp.server.db.model import LazyCatalogEntry, RepositoryContentUnit
+from pulp.server.db.model import RepositoryContentUnit
 from pulp.server.exceptions import PulpCodedValidationException
 from pulp.server.controllers import repository as repo_controller
 
 from pulp_rpm.common import constants, ids
+from pulp_rpm.plugins.db import lazy_catalog
 from pulp_rpm.plugins.db.models import Distribution
 from pulp_rpm.plugins import error_codes
 from pulp_rpm.plugins.importers.yum.listener import DistFileListener
-from pulp_rpm.plugins.importers.yum.repomd import nectar_factory
 
 
 SECTION_GENERAL = 'general'
@@ -34,6 +34,7 @@ KEY_DISTRIBUTION_CONTEXT = 'distribution_context'
 RELATIVE_PATH = 'relativepath'
 CHECKSUM = 'checksum'
 CHECKSUM_TYPE = 'checksumtype'
+COPY_SUFFIX = '.pulp-copy'
 
 _logger = logging.getLogger(__name__)
 
@@ -70,6 +71,16 @@ class DistSync(object):
         """
         return self.parent.nectar_config
 
+    @property
+    def downloaders(self):
+        """
+        The downloaders shared by the whole sync.
+
+        :return: The shared downloaders.
+        :rtype: pulp_rpm.plugins.importers.yum.repomd.nectar_factory.SharedDownloaders
+        """
+        return self.parent.downloaders
+
     @property
     def working_dir(self):
         """
@@ -162,12 +173,26 @@ class DistSync(object):
         dist_files = self.process_distribution(tmp_dir)
         files.extend(dist_files)
 
+        # The files of the distributions already stored, before the unit's list is replaced
+        stored_files = self.get_stored_files([unit] + existing_units)
+
         self.update_unit_files(unit, files)
 
         # Download distribution files
+        reused = []
         if not self.download_deferred:
+            # Files that are stored already with the same checksum are not downloaded again
+            to_download = []
+            for _file in files:
+                stored_path = stored_files.get((_file[CHECKSUM_TYPE], _file[CHECKSUM]))
+                if stored_path:
+                    reused.append((stored_path, _file[RELATIVE_PATH]))
+                else:
+                    to_download.append(_file)
+            _logger.debug(_('reusing {r} stored distribution files; downloading {d}').format(
+                r=len(reused), d=len(to_download)))
             try:
-                downloaded = self.download_files(tmp_dir, files)
+                downloaded = self.download_files(tmp_dir, to_download)
             except DownloadFailed:
                 # All files must be downloaded to continue.
                 return
@@ -185,9 +210,13 @@ class DistSync(object):
         # # storage regardless of the download policy
         unit.safe_import_content(treeinfo_path, os.path.basename(treeinfo_path))
 
+        # The reused files are copied from where they are stored already, before any download
+        # replaces a file they are copied from.
+        self.import_stored_files(unit, reused)
+
         # The downloaded files are imported into platform storage.
         for destination, location in downloaded:
-            unit.safe_import_content(destination, location)
+            self.import_downloaded_file(unit, destination, location)
 
         # Associate the unit.
         repo_controller.associate_single_unit(self.repo, unit)
@@ -212,15 +241,88 @@ class DistSync(object):
         :param files: List of distribution files.
         :type files: list
         """
+        writer = lazy_catalog.CatalogWriter(str(self.parent.conduit.importer_object_id))
+        root = unit.storage_path
         for _file in files:
-            root = unit.storage_path
-            entry = LazyCatalogEntry()
-            entry.path = os.path.join(root, _file[RELATIVE_PATH])
-            entry.url = urljoin(self.feed, _file[RELATIVE_PATH])
-            entry.unit_id = unit.id
-            entry.unit_type_id = unit.type_id
-            entry.importer_id = str(self.parent.conduit.importer_object_id)
-            entry.save_revision()
+            writer.add(os.path.join(root, _file[RELATIVE_PATH]),
+                       urljoin(self.feed, _file[RELATIVE_PATH]), unit)
+        writer.flush()
+
+    @staticmethod
+    def get_stored_files(units):
+        """
+        Find the files of distributions that are in content storage, by checksum. Files without a
+        checksum, and files of units that are not stored, are left out.
+
+        :param units: Distribution model objects.
+        :type units: list of pulp_rpm.plugins.db.models.Distribution
+        :return: dict of (checksum type, checksum) to the absolute path of the stored file
+        :rtype: dict
+        """
+        stored_files = {}
+        for unit in units:
+            if not unit.storage_path:
+                continue
+            for _file in unit.files or []:
+                if not _file.get(CHECKSUM) or not _file.get(CHECKSUM_TYPE):
+                    continue
+                path = os.path.join(unit.storage_path, _file[RELATIVE_PATH])
+                if os.path.isfile(path):
+                    checksum_type = verification.sanitize_checksum_type(_file[CHECKSUM_TYPE])
+                    stored_files[(checksum_type, _file[CHECKSUM])] = path
+        return stored_files
+
+    @staticmethod
+    def import_stored_files(unit, reused):
+        """
+        Add files that are in content storage already to a distribution. Each file is copied, so
+        no two distributions share a file on disk. All files are copied next to their destination
+        before any of them is moved into place, so a file that is copied from the distribution's
+        own storage is read before its path is replaced by another file.
+
+        :param unit: A saved distribution model object.
+        :type unit: pulp_rpm.plugins.db.models.Distribution
+        :param reused: (absolute path to the stored file, path relative to the distribution's
+                       storage path) for each file
+        :type reused: list of tuple
+        """
+        staged = []
+        try:
+            for stored_path, location in reused:
+                destination = os.path.join(unit.storage_path, location)
+                if os.path.realpath(stored_path) == os.path.realpath(destination):
+                    continue
+                if not os.path.isdir(os.path.dirname(destination)):
+                    os.makedirs(os.path.dirname(destination))
+                temp_path = destination + COPY_SUFFIX
+                shutil.copyfile(stored_path, temp_path)
+                staged.append((temp_path, destination))
+            # renaming replaces the destination's directory entry, rather than writing into a file
+            # that another path may share
+            for temp_path, destination in staged:
+                os.rename(temp_path, destination)
+        finally:
+            for temp_path, destination in staged:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+
+    @staticmethod
+    def import_downloaded_file(unit, path, location):
+        """
+        Import a downloaded file into a distribution's storage. The file stored at the location
+        before is removed first, as the platform writes into an existing file in place.
+
+        :param unit: A saved distribution model object.
+        :type unit: pulp_rpm.plugins.db.models.Distribution
+        :param path: The absolute path to the downloaded file.
+        :type path: str
+        :param location: The path of the file relative to the distribution's storage path.
+        :type location: str
+        """
+        destination = os.path.join(unit.storage_path, location)
+        if os.path.lexists(destination):
+            os.unlink(destination)
+        unit.safe_import_content(path, location)
 
     @staticmethod
     def update_unit_files(unit, files):
@@ -260,7 +362,7 @@ class DistSync(object):
         """
         listener = DistFileListener(self)
         self.progress_report.set_initial_values(len(files))
-        downloader = nectar_factory.create_downloader(self.feed, self.nectar_config, listener)
+        downloader = self.downloaders.get(self.feed, listener)
         requests = (self.file_to_download_request(f, tmp_dir) for f in files)
         downloader.download(requests)
         if len(listener.failed_reports):
@@ -379,7 +481,7 @@ class DistSync(object):
             url = os.path.join(self.feed, filename)
             request = DownloadRequest(url, path)
             listener = AggregatingEventListener()
-            downloader = nectar_factory.create_downloader(self.feed, self.nectar_config, listener)
+            downloader = self.downloaders.get(self.feed, listener)
             downloader.download([request])
             if len(listener.succeeded_reports) == 1:
                 # bz 1095829
@@ -450,7 +552,7 @@ class DistSync(object):
         url = os.path.join(self.feed, filename)
         request = DownloadRequest(url, path)
         listener = AggregatingEventListener()
-        downloader = nectar_factory.create_downloader(self.feed, self.nectar_config, listener)
+        downloader = self.downloaders.get(self.feed, listener)
         downloader.download([request])
         if len(listener.succeeded_reports) == 1:
             return path
@@ -2,15 +2,16 @@ import functools
 import logging
 import operator
 from gettext import gettext as _
-from itertools import repeat
 
 from mongoengine import Q
 from pulp.common.plugins import importer_constants
+from pulp.plugins.util.misc import paginate
 from pulp.server.db import model
 from pulp.server.db.model.criteria import UnitAssociationCriteria
 from pulp.server.controllers import repository as repo_controller
 from pymongo.errors import OperationFailure
 
+from pulp_rpm.common import version_utils
 from pulp_rpm.plugins.db import models
 from pulp_rpm.plugins.importers.yum.repomd import packages, primary, presto, updateinfo, group
 
@@ -53,10 +54,13 @@ def purge_unwanted_units(metadata_files, conduit, config):
 
 def remove_old_versions(num_to_keep, conduit):
     """
-    For RPMs, and then separately DRPMs, this loads the unit key of each unit
-    in the repo and organizes them by the non-version unique identifiers. For
-    each, it removes old versions as necessary to stay within the number of
-    versions we want to keep.
+    For RPMs, SRPMs and DRPMs, this groups the units in the repo by their
+    non-version unique identifiers and removes old versions as necessary to stay
+    within the number of versions we want to keep.
+
+    The grouping is done by mongo using the stored version and release sort
+    indexes, and only groups that exceed the limit are returned, so memory use
+    does not grow with the size of the repository.
 
     :param num_to_keep: For each package, how many versions should be kept
     :type  num_to_keep: int
@@ -65,18 +69,142 @@ def remove_old_versions(num_to_keep, conduit):
     :type  conduit:     pulp.plugins.conduits.repo_sync.RepoSyncConduit
     """
     for unit_type in (models.RPM, models.SRPM, models.DRPM):
-        units = {}
-        for unit in get_existing_units(unit_type, conduit.get_units):
-            model_instance = unit_type(**unit.unit_key)
-            key = model_instance.key_string_without_version
-            serialized_version = model_instance.complete_version_serialized
-            versions = units.setdefault(key, {})
-            versions[serialized_version] = unit
+        try:
+            groups = _old_version_groups(unit_type, conduit.repo_id, num_to_keep)
+        except OperationFailure:
+            # mongodb doesn't support $lookup, use the slower in-memory method
+            _logger.info(_('Removing old versions can take significantly longer in versions of '
+                           'mongodb lower than 3.2. Consider upgrading mongodb if removing old '
+                           'packages takes an unreasonably long time.'))
+            _remove_old_versions_in_memory(unit_type, num_to_keep, conduit)
+            continue
+
+        for page in paginate(_old_version_id_generator(groups, num_to_keep)):
+            repo_controller.disassociate_units(conduit.repo,
+                                               (unit_type(id=unit_id) for unit_id in page))
+
+
+def _old_version_groups(unit_type, repo_id, num_to_keep):
+    """
+    Group the units of a repository by package, returning only the groups that have more than
+    num_to_keep versions.
+
+    A single aggregation joins the repository's content units with the unit collection, projects
+    only the grouping fields and the stored sort indexes, and groups them by package. Groups that
+    do not exceed num_to_keep are discarded by mongo.
+
+    :param unit_type:   subclass of pulp_rpm.plugins.db.models.NonMetadataPackage
+    :type  unit_type:   type
+    :param repo_id:     ID of the repo whose units should be examined
+    :type  repo_id:     basestring
+    :param num_to_keep: For each package, how many versions should be kept
+    :type  num_to_keep: int
+
+    :return:    cursor over dicts with a "versions" key, whose value is a list of dicts
+                containing _id, epoch, version_sort_index and release_sort_index
+    :rtype:     pymongo.command_cursor.CommandCursor
+    :raise pymongo.errors.OperationFailure: if mongodb does not support the pipeline
+    """
+    group_fields = _version_group_fields(unit_type)
+    version_fields = ('_id', 'epoch', 'version_sort_index', 'release_sort_index')
+
+    pipeline = [
+        {'$match': {'repo_id': repo_id, 'unit_type_id': unit_type._content_type_id.default}},
+        {'$project': {'unit_id': 1}},
+        {'$lookup': {'from': unit_type._get_collection_name(), 'localField': 'unit_id',
+                     'foreignField': '_id', 'as': 'unit'}},
+        {'$unwind': '$unit'},
+        {'$project': dict(('unit.%s' % field, 1) for field in group_fields + version_fields)},
+        {'$group': {
+            '_id': dict((field, '$unit.%s' % field) for field in group_fields),
+            'versions': {'$push': dict((field, '$unit.%s' % field) for field in version_fields)},
+            'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': num_to_keep}}},
+        {'$project': {'versions': 1}},
+    ]
+    return model.RepositoryContentUnit.objects.aggregate(*pipeline, allowDiskUse=True)
+
+
+def _old_version_id_generator(groups, num_to_keep):
+    """
+    Generate the IDs of units that are older than the newest num_to_keep versions of their
+    package. Epoch has no stored sort index, so the versions within each group are ordered here.
+    Units that share a version are kept or removed together.
+
+    :param groups:      iterable of groups as returned by _old_version_groups
+    :type  groups:      iterable
+    :param num_to_keep: For each package, how many versions should be kept
+    :type  num_to_keep: int
+
+    :return:    generator of unit IDs that should be removed from the repo
+    :rtype:     generator
+    """
+    for package_versions in groups:
+        kept_versions = set()
+        for version in sorted(package_versions['versions'], key=_sort_index_version, reverse=True):
+            serialized_version = _sort_index_version(version)
+            if serialized_version in kept_versions or len(kept_versions) < num_to_keep:
+                kept_versions.add(serialized_version)
+            else:
+                yield version['_id']
+
+
+def _sort_index_version(version):
+    """
+    Build a comparable version from an aggregated unit document, equivalent to
+    the unit's complete_version_serialized property.
+
+    :param version: dict containing epoch, version_sort_index and release_sort_index
+    :type  version: dict
+
+    :return:    tuple of encoded epoch, version and release
+    :rtype:     tuple
+    """
+    return (version_utils.encode(version['epoch']), version['version_sort_index'],
+            version['release_sort_index'])
+
+
+def _version_group_fields(unit_type):
+    """
+    Get the unit key fields that identify a package independent of its version,
+    matching the fields used by NonMetadataPackage.key_string_without_version.
+
+    :param unit_type:   subclass of pulp_rpm.plugins.db.models.NonMetadataPackage
+    :type  unit_type:   type
+
+    :return:    tuple of field names
+    :rtype:     tuple
+    """
+    return tuple(field for field in unit_type.unit_key_fields
+                 if field not in ('epoch', 'version', 'release', 'checksum', 'checksumtype'))
+
 
-            # if we are over the limit, evict the oldest
-            if len(versions) > num_to_keep:
-                oldest_version = min(versions)
-                conduit.remove_unit(versions.pop(oldest_version))
+def _remove_old_versions_in_memory(unit_type, num_to_keep, conduit):
+    """
+    Fallback for remove_old_versions on mongodb versions that do not support $lookup. This loads
+    the unit key of each unit of the given type in the repo and organizes them by the non-version
+    unique identifiers.
+
+    :param unit_type:   subclass of pulp_rpm.plugins.db.models.NonMetadataPackage
+    :type  unit_type:   type
+    :param num_to_keep: For each package, how many versions should be kept
+    :type  num_to_keep: int
+    :param conduit:     a conduit from the platform containing the get_units
+                        and remove_unit methods.
+    :type  conduit:     pulp.plugins.conduits.repo_sync.RepoSyncConduit
+    """
+    units = {}
+    for unit in get_existing_units(unit_type, conduit.get_units):
+        model_instance = unit_type(**unit.unit_key)
+        key = model_instance.key_string_without_version
+        serialized_version = model_instance.complete_version_serialized
+        versions = units.setdefault(key, {})
+        versions[serialized_version] = unit
+
+        # if we are over the limit, evict the oldest
+        if len(versions) > num_to_keep:
+            oldest_version = min(versions)
+            conduit.remove_unit(versions.pop(oldest_version))
 
 
 def remove_missing_rpms(metadata_files, conduit):
@@ -300,23 +428,19 @@ def remove_repo_duplicate_nevra(repo_id):
     :param repo_id: ID of the repo from which units with duplicate nevra will be unassociated
     :type repo_id: str
     """
+    repo = model.Repository.objects.get(repo_id=repo_id)
     for unit_type in (models.RPM, models.SRPM, models.DRPM):
-        for unit_ids in _duplicate_key_id_generator(unit_type):
-            # q objects don't deal with order_by, so they can't be used with repo_controller funcs
-            # disassociate_units only uses the unit_id, so limit the resultset to only that field
-            rcus = model.RepositoryContentUnit.objects.filter(
-                repo_id=repo_id, unit_id__in=unit_ids).order_by('-updated').only('unit_id')
-
-            # 0 or 1 packages from the duplicate nevra search match this repo means no duplicates
-            if rcus.count() < 2:
-                continue
-
-            repo = model.Repository.objects.get(repo_id=repo_id)
+        try:
+            groups = _duplicate_nevra_groups(unit_type, repo_id)
+        except OperationFailure:
+            # mongodb doesn't support $lookup, use the slower in-memory method
+            _logger.info(_('Purging duplicate NEVRA can take significantly longer in versions of '
+                           'mongodb lower than 3.2. Consider upgrading mongodb if cleaning '
+                           'duplicate packages takes an unreasonably long time.'))
+            groups = _duplicate_nevra_groups_in_memory(unit_type, repo_id)
 
-            # Since the repo_units queryset is ordered by the updated field (descending), the
-            # first repo content unit is the latest. All other RCUs should be disassociated
-            duplicate_units = (unit_type(id=rcu.unit_id) for rcu in rcus[1:])
-            repo_controller.disassociate_units(repo, duplicate_units)
+        for page in paginate(_duplicate_nevra_id_generator(groups)):
+            repo_controller.disassociate_units(repo, (unit_type(id=unit_id) for unit_id in page))
 
 
 def _duplicate_key_nevra_fields(unit):
@@ -333,164 +457,92 @@ def _duplicate_key_nevra_fields(unit):
     return fields
 
 
-def _duplicate_key_id_generator(unit):
-    """duplicate NEVRA unit ID generator
-
-    :param unit: The unit whose NEVRA should be removed
-    :type unit: ContentUnit
+def _duplicate_nevra_groups(unit_type, repo_id):
+    """
+    Find groups of units in a repository that share the same NEVRA.
+
+    A single aggregation joins the repository's content units with the unit collection, projects
+    only the NEVRA fields, and groups the associations by NEVRA. Only groups with more than one
+    unit are returned.
+
+    :param unit_type:   subclass of pulp_rpm.plugins.db.models.NonMetadataPackage
+    :type  unit_type:   type
+    :param repo_id:     ID of the repo whose units should be examined
+    :type  repo_id:     basestring
+
+    :return:    cursor over dicts with a "units" key, whose value is a list of dicts containing
+                the unit_id and the "updated" timestamp of each association
+    :rtype:     pymongo.command_cursor.CommandCursor
+    :raise pymongo.errors.OperationFailure: if mongodb does not support the pipeline
+    """
+    fields = _duplicate_key_nevra_fields(unit_type)
+
+    projection = dict(('unit.%s' % field, 1) for field in fields)
+    projection.update({'unit_id': 1, 'updated': 1})
+    pipeline = [
+        {'$match': {'repo_id': repo_id, 'unit_type_id': unit_type._content_type_id.default}},
+        {'$project': {'unit_id': 1, 'updated': 1}},
+        {'$lookup': {'from': unit_type._get_collection_name(), 'localField': 'unit_id',
+                     'foreignField': '_id', 'as': 'unit'}},
+        {'$unwind': '$unit'},
+        {'$project': projection},
+        {'$group': {
+            '_id': dict((field, '$unit.%s' % field) for field in fields),
+            'units': {'$push': {'unit_id': '$unit_id', 'updated': '$updated'}},
+            'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+        {'$project': {'units': 1}},
+    ]
+    # When aggregating over hundreds of thousands of packages, mongo can overflow
+    # To prevent this, mongo needs to be allowed to temporarily use the disk for this transaction
+    return model.RepositoryContentUnit.objects.aggregate(*pipeline, allowDiskUse=True)
 
-    find all duplicate NEVRAs, regardless of repository, for a given content unit type
 
-    This is a memory-efficient pre-filter, which finds all possible duplicate NEVRAs in the
-    collection of a content unit that supports the NEVRA fields. This iterator can then be
-    cross-referenced with a repository to remove duplicate repository content unit
-    links for a given NEVRA.
+def _duplicate_nevra_groups_in_memory(unit_type, repo_id):
     """
-    fields = _duplicate_key_nevra_fields(unit)
+    Find groups of units in a repository that share the same NEVRA, for mongodb versions that
+    do not support $lookup. This produces the same results as _duplicate_nevra_groups, but holds
+    the NEVRA of every unit of the given type in the repository in memory.
 
-    try:
-        # this test aggregation is needed because the aggregation generator body
-        # won't raise OperationFailure until its first iteration, at which point it's too late to
-        # switch to the mapreduce generator. this also ensures that if OperationFailure is raised
-        # at this point, it's specifically because an unsupported aggregation feature was requested
-        unit.objects.aggregate({'$limit': 1})
-        return _duplicate_key_id_generator_aggregation(unit, fields)
-    except OperationFailure:
-        # mongodb doesn't support aggregation cursors, use the slower mapreduce method
-        _logger.info('Purging duplicate NEVRA can take significantly longer in versions of '
-                     'mongodb lower than 2.6. Consider upgrading mongodb if cleaning duplicate '
-                     'packages takes an unreasonably long time.')
-        return _duplicate_key_id_generator_mapreduce(unit, fields)
-
-
-def _duplicate_key_id_generator_aggregation(unit, fields):
-    """Superior Aggregation version of duplicate nevra unit ID generator for mongo 2.6+
-
-    In order to find potential duplicate nevras, a mongo aggregation pipeline is employed
-    to sort a unit's entire collection based on non-checksum unit key fields. Doing the sorting
-    purely as a normal QuerySet overflow's mongo's sort stage bugger, and doing it purely with
-    python uses too much memory. Running things through the aggregation pipelines results in
-    an iterable that makes it relatively simple to spit out potential duplicate unit IDs without
-    breaking either mongo or python. Because the resulting dataset can be rather large, it is
-    important to be able to use a mongo db cursor to iterate over the results, which is sadly
-    unsupported in 2.4. In that case, the mapreduce method below must be used.
+    :param unit_type:   subclass of pulp_rpm.plugins.db.models.NonMetadataPackage
+    :type  unit_type:   type
+    :param repo_id:     ID of the repo whose units should be examined
+    :type  repo_id:     basestring
 
-    :param unit: The unit whose NEVRA should be removed
-    :type unit: ContentUnit
-    :param fields: list of fields that define a given unit type's NEVRA fields
-    :type fields: list
+    :return:    list of dicts with a "units" key, whose value is a list of dicts containing
+                the unit_id and the "updated" timestamp of each association
+    :rtype:     list
     """
+    fields = _duplicate_key_nevra_fields(unit_type)
 
-    # create the aggregation params by zipping the fields with 1
-    # It is a happy coincidence that the two dicts are the same values
-    pipeline_opts = dict(zip(fields, repeat(1)))
+    rcus = model.RepositoryContentUnit.objects.filter(
+        repo_id=repo_id, unit_type_id=unit_type._content_type_id.default)
+    updated = dict((rcu['unit_id'], rcu['updated'])
+                   for rcu in rcus.only('unit_id', 'updated').as_pymongo())
 
-    # for $sort, this indicates ascending sort for nevra fields
-    sort = {'$sort': pipeline_opts}
+    units_by_nevra = {}
+    for page in paginate(updated.keys()):
+        for unit in unit_type.objects.filter(id__in=page).only(*fields).as_pymongo():
+            nevra = tuple(unit[field] for field in fields)
+            units_by_nevra.setdefault(nevra, []).append(
+                {'unit_id': unit['_id'], 'updated': updated[unit['_id']]})
 
-    # for $project, this indicates what fields to include in the result
-    project = {'$project': pipeline_opts}
+    return [{'units': units} for units in units_by_nevra.itervalues() if len(units) > 1]
 
-    # When aggregating over hundreds of thousands of packages, mongo can overflow
-    # To prevent this, mongo needs to be allowed to temporarily use the disk for this transaction
-    aggregation = unit.objects.aggregate(sort, project, allowDiskUse=True)
-
-    # loop state tracking vars
-    previous_nevra = None
-    previous_pkg_id = None
-    yielding_ids = None
-
-    for pkg in aggregation:
-        # strip the checksums and mongo metadata so they don't get used in equality checks
-        current_nevra = tuple(pkg[field] for field in fields)
-        # current nevra matches previous: this is a duplicate nevra
-        if current_nevra == previous_nevra:
-            if yielding_ids is None:
-                # The current nevra is a duplicate but yielding_ids is None, which means
-                # this iteration is the first to detect a duplicate for this nevra.
-                # Initialize the list of ids to yield with the *previous* id,
-                # since it was the first unit seen with the current nevra
-                yielding_ids = [previous_pkg_id]
-
-            # After yielding_ids is initialized with the first unit,
-            # append the current package id for each duplicate nevra seen
-            yielding_ids.append(pkg['_id'])
-
-        # current nevra doesn't match previous: this is a new nevra
-        else:
-            # if the duplicate detection populated yielding_ids, yield it now
-            # and reset yielding ids for the next potential duplicate
-            if yielding_ids:
-                yield yielding_ids
-                yielding_ids = None
-
-        # stash the current state for comparison in the next iteration
-        previous_nevra = current_nevra
-        previous_pkg_id = pkg['_id']
-
-    # after the pkg loop, if the last pkg was a duplicate, the yielding else clause won't run
-    # in that case, do one final yield to make sure all potential duplicates are yielded
-    if yielding_ids:
-        yield yielding_ids
-
-
-def _duplicate_key_id_generator_mapreduce(unit, fields):
-    """Inferior MapReduce version of duplicate nevra unit ID generator for mongo 2.4
-
-    In order to find potential duplicate nevras, a mongo mapReduce is employed to sift units
-    with duplicate nevra in a unit's entire collection based on non-checksum unit key fields.
-    This produces the same results as the aggregation mechanism above, but is far slower. Its
-    one redeemind quality, relatively speaking, is that it works in mongo 2.4.
 
-    :param unit: The unit whose NEVRA should be removed
-    :type unit: ContentUnit
-    :param fields: list of fields that define a given unit type's NEVRA fields
-    :type fields: list
-    """
-
-    if unit is models.DRPM:
-        name_field = 'filename'
-    else:
-        name_field = 'name'
-
-    # going with % interpolation here because all the {}'s make .format no fun for JS...
-    # map all units in the collect into key value pairs, where the key is the unit
-    # key fields joined by '-', and the value is the unit id
-    map_f = """
-    function () {
-        var key_fields = [this.%s, this.epoch, this.version, this.release, this.arch]
-        emit(key_fields.join('-'), {ids: [this._id]});
-    }
-    """ % name_field
-
-    # reduce keys with multiple values down by collecting ids into a single return object
-    reduce_f = """
-    function (key, values) {
-      // collect mapped values into the first value to build the list of ids for this key/nevra
-      var collector = values[0]
-      // since collector is values[0] start this loop at index 1
-      // reduce isn't called if map only emits one result for key,
-      // so there is at least one value to collect
-      for (var i = 1; i < values.length; i++) {
-        collector.ids = collector.ids.concat(values[i].ids)
-      }
-      return collector
-    }
-    """
-
-    # to save time and memory, only return id lists with multiple values, undefing the singles
-    finalize_f = """
-    function (key, reduced) {
-        if (reduced.ids.length > 1) {
-            return reduced;
-        }
-        // if there's only one value after reduction, this key is useless
-        // undefined is implicitly returned here, which saves space
-    }
-    """
-
-    reduced_units = unit.objects.map_reduce(map_f, reduce_f, 'inline', finalize_f)
-    for reduced in reduced_units:
-        # filter out the undefined (now None) values created in the finalize step
-        if reduced.value:
-            yield reduced.value['ids']
+def _duplicate_nevra_id_generator(groups):
+    """
+    Generate the IDs of units that should be removed from a repository because a more recently
+    associated unit has the same NEVRA.
+
+    :param groups:  iterable of groups as returned by _duplicate_nevra_groups
+    :type  groups:  iterable
+
+    :return:    generator of unit IDs
+    :rtype:     generator
+    """
+    for duplicates in groups:
+        # the most recently updated association is kept, all others are removed
+        units = sorted(duplicates['units'], key=operator.itemgetter('updated'), reverse=True)
+        for unit in units[1:]:
+            yield unit['unit_id']
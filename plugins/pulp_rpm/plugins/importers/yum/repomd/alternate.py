@@ -36,9 +36,12 @@ class Packages(object):
     :type container: ContentContainer
     :ivar url_modify: Optional URL modifier.
     :type url_modify: pulp_rpm.plugins.importers.yum.utils.RepoURLModifier
+    :ivar concurrency: Optional limit of concurrent downloads per host.
+    :type concurrency: pulp_rpm.plugins.importers.yum.repomd.concurrency.AdaptiveConcurrency
     """
 
-    def __init__(self, base_url, nectar_conf, units, dst_dir, listener, url_modify=None):
+    def __init__(self, base_url, nectar_conf, units, dst_dir, listener, url_modify=None,
+                 downloaders=None, concurrency=None):
         """
         :param base_url: The repository base url.
         :type base_url: str
@@ -50,14 +53,22 @@ class Packages(object):
         :type listener: nectar.listener.DownloadListener
         :param url_modify: Optional URL modifier
         :type url_modify: pulp_rpm.plugins.importers.yum.utils.RepoURLModifier
+        :param downloaders: Optional downloaders shared with the rest of the sync
+        :type downloaders: pulp_rpm.plugins.importers.yum.repomd.nectar_factory.SharedDownloaders
+        :param concurrency: Optional limit of concurrent downloads per host
+        :type concurrency: pulp_rpm.plugins.importers.yum.repomd.concurrency.AdaptiveConcurrency
         """
         self.base_url = base_url
         self.units = units
         self.dst_dir = dst_dir
         self.listener = ContainerListener(listener)
-        self.primary = create_downloader(base_url, nectar_conf)
+        if downloaders is not None:
+            self.primary = downloaders.get(base_url)
+        else:
+            self.primary = create_downloader(base_url, nectar_conf)
         self.container = ContentContainer()
         self.url_modify = url_modify or RepoURLModifier()
+        self.concurrency = concurrency
 
     @property
     def downloader(self):
@@ -90,7 +101,10 @@ class Packages(object):
         """
         Download packages using alternate content source container.
         """
-        report = self.container.download(self.primary, self.get_requests(), self.listener)
+        requests = self.get_requests()
+        if self.concurrency is not None:
+            requests = self.concurrency.throttle(requests)
+        report = self.container.download(self.primary, requests, self.listener)
         _log.info(CONTAINER_REPORT, dict(r=report.dict(), u=self.base_url))
 
 
@@ -0,0 +1,244 @@
+"""
+Adaptive concurrency for package downloads.
+
+Each host the packages are downloaded from gets its own limit on concurrent downloads. The
+limit starts at the number of download threads and is adjusted as downloads finish: it is halved
+when a download fails in a way that suggests the host is overloaded, or when a download is much
+slower than the recent downloads from the host, and it grows by one each time as many downloads
+as the limit succeed in a row. The number of download threads is never exceeded.
+"""
+import logging
+import threading
+import time
+import urlparse
+
+
+_logger = logging.getLogger(__name__)
+
+# HTTP response codes with which servers signal that they are overloaded
+THROTTLE_RESPONSE_CODES = frozenset([429, 500, 502, 503, 504])
+
+# a download whose rate is this many times lower than the host's average rate is a latency spike
+LATENCY_SPIKE_FACTOR = 4
+
+# downloads that take less time than this, in seconds, are never latency spikes
+LATENCY_SPIKE_MIN_SECONDS = 5
+
+# weight of the latest download in the moving average of a host's download rate
+RATE_WEIGHT = 0.2
+
+# seconds between checks for cancellation while waiting for a host to have a free slot
+WAIT_SECONDS = 1
+
+
+class HostLimit(object):
+    """
+    The concurrency state of one host.
+
+    :ivar limit:        number of downloads that may run at the same time
+    :type limit:        int
+    :ivar in_flight:    number of downloads that are running
+    :type in_flight:    int
+    :ivar successes:    downloads that succeeded since the limit last changed
+    :type successes:    int
+    :ivar rate:         moving average of the download rate in bytes per second
+    :type rate:         float
+    :ivar backoff_seq:  sequence number of the last download started before the last back off
+    :type backoff_seq:  int
+    """
+
+    def __init__(self, limit):
+        """
+        :param limit:   initial number of downloads that may run at the same time
+        :type  limit:   int
+        """
+        self.limit = limit
+        self.in_flight = 0
+        self.successes = 0
+        self.rate = None
+        self.backoff_seq = 0
+
+
+class AdaptiveConcurrency(object):
+    """
+    Limits the number of concurrent downloads from each host. Requests are passed through
+    throttle() before they reach the downloader, and the event listener reports every finished
+    download with succeeded() or failed().
+    """
+
+    def __init__(self, max_concurrent):
+        """
+        :param max_concurrent:  number of download threads, which no limit exceeds
+        :type  max_concurrent:  int
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.hosts = {}
+        self.bytes_downloaded = 0
+        self.start_time = None
+        # URL of each running download to its host, start time and sequence number
+        self._started = {}
+        self._seq = 0
+        self._cancelled = False
+        self._condition = threading.Condition()
+
+    def throttle(self, requests):
+        """
+        Yields each request once its host has fewer downloads running than its limit.
+
+        :param requests:    download requests, each with a "url" attribute
+        :type  requests:    iterable
+
+        :return:    the same requests
+        :rtype:     generator
+        """
+        for request in requests:
+            if not self.acquire(request.url):
+                return
+            yield request
+
+    def acquire(self, url):
+        """
+        Waits until the host of the URL has fewer downloads running than its limit, and counts
+        the download of the URL as running.
+
+        :param url: URL that is about to be downloaded
+        :type  url: str
+
+        :return:    False if the downloads were cancelled while waiting, else True
+        :rtype:     bool
+        """
+        host = urlparse.urlparse(url).netloc
+        with self._condition:
+            state = self.hosts.get(host)
+            if state is None:
+                state = self.hosts[host] = HostLimit(self.max_concurrent)
+            while state.in_flight >= state.limit and not self._cancelled:
+                self._condition.wait(WAIT_SECONDS)
+            if self._cancelled:
+                return False
+            state.in_flight += 1
+            self._seq += 1
+            now = time.time()
+            self._started[url] = (host, now, self._seq)
+            if self.start_time is None:
+                self.start_time = now
+            return True
+
+    def succeeded(self, url, size):
+        """
+        Records a successful download, and raises the host's limit once as many downloads as
+        the limit have succeeded, or halves it if the download was a latency spike.
+
+        :param url:     URL that was downloaded
+        :type  url:     str
+        :param size:    size of the downloaded file in bytes
+        :type  size:    int
+        """
+        with self._condition:
+            started = self._release(url)
+            if started is None:
+                return
+            host, start_time, seq = started
+            state = self.hosts[host]
+            size = size or 0
+            self.bytes_downloaded += size
+            duration = time.time() - start_time
+            rate = size / max(duration, 0.001)
+
+            if state.rate is not None and duration >= LATENCY_SPIKE_MIN_SECONDS and \
+                    rate * LATENCY_SPIKE_FACTOR < state.rate:
+                self._back_off(host, state, seq)
+            else:
+                state.successes += 1
+                if state.successes >= state.limit and state.limit < self.max_concurrent:
+                    state.limit += 1
+                    state.successes = 0
+
+            if state.rate is None:
+                state.rate = rate
+            else:
+                state.rate += RATE_WEIGHT * (rate - state.rate)
+
+    def failed(self, url, error_report):
+        """
+        Records a failed download, and halves the host's limit if the failure suggests that the
+        host is overloaded: the server responded with one of THROTTLE_RESPONSE_CODES, or the
+        download failed without an HTTP response, for example on a timeout.
+
+        :param url:             URL that failed to download
+        :type  url:             str
+        :param error_report:    error report of the download
+        :type  error_report:    dict
+        """
+        with self._condition:
+            started = self._release(url)
+            if started is None:
+                return
+            host, start_time, seq = started
+            response_code = (error_report or {}).get('response_code')
+            if response_code is None or response_code in THROTTLE_RESPONSE_CODES:
+                self._back_off(host, self.hosts[host], seq)
+
+    def cancel(self):
+        """
+        Stops throttle() from yielding further requests, including the ones waiting for a slot.
+        """
+        with self._condition:
+            self._cancelled = True
+            self._condition.notify_all()
+
+    @property
+    def throughput(self):
+        """
+        :return:    bytes downloaded per second since the first download started
+        :rtype:     int
+        """
+        if self.start_time is None:
+            return 0
+        return int(self.bytes_downloaded / max(time.time() - self.start_time, 0.001))
+
+    @property
+    def limits(self):
+        """
+        :return:    the current limit of each host
+        :rtype:     dict
+        """
+        return dict((host, state.limit) for host, state in self.hosts.iteritems())
+
+    def _release(self, url):
+        """
+        Counts the download of the URL as no longer running. Must be called with the condition
+        held.
+
+        :param url: URL that finished downloading
+        :type  url: str
+
+        :return:    the host, start time and sequence number of the download, or None if it was
+                    not started through acquire()
+        :rtype:     tuple
+        """
+        started = self._started.pop(url, None)
+        if started is not None:
+            self.hosts[started[0]].in_flight -= 1
+            self._condition.notify_all()
+        return started
+
+    def _back_off(self, host, state, seq):
+        """
+        Halves the limit of a host. Downloads that started before the last back off of the host
+        were running at the old limit, so they do not make it back off again.
+
+        :param host:    the host
+        :type  host:    str
+        :param state:   the concurrency state of the host
+        :type  state:   HostLimit
+        :param seq:     sequence number of the download that caused the back off
+        :type  seq:     int
+        """
+        if seq <= state.backoff_seq:
+            return
+        state.limit = max(1, state.limit / 2)
+        state.successes = 0
+        state.backoff_seq = self._seq
+        _logger.debug('Lowered concurrent downloads from %(h)s to %(n)d' %
+                      {'h': host, 'n': state.limit})
@@ -103,7 +103,7 @@ class MetadataFiles(object):
                        'prestodelta',
                        'updateinfo', 'updateinfo_db'])
 
-    def __init__(self, repo_url, dst_dir, nectar_config, url_modify=None):
+    def __init__(self, repo_url, dst_dir, nectar_config, url_modify=None, downloaders=None):
         """
         :param repo_url:        URL for the base of a yum repository
         :type  repo_url:        basestring
@@ -114,6 +114,8 @@ class MetadataFiles(object):
         :type  nectar_config:   nectar.config.DownloaderConfig
         :param url_modify:      Optional URL modifier
         :type  url_modify:      pulp_rpm.plugins.importers.yum.utils.RepoURLModifier
+        :param downloaders:     Optional downloaders shared with the rest of the sync
+        :type  downloaders:     nectar_factory.SharedDownloaders
         """
         super(MetadataFiles, self).__init__()
 
@@ -122,8 +124,11 @@ class MetadataFiles(object):
         self.dst_dir = dst_dir
         self.event_listener = AggregatingEventListener()
 
-        self.downloader = nectar_factory.create_downloader(self.repo_url, nectar_config,
-                                                           self.event_listener)
+        if downloaders is not None:
+            self.downloader = downloaders.get(self.repo_url, self.event_listener)
+        else:
+            self.downloader = nectar_factory.create_downloader(self.repo_url, nectar_config,
+                                                               self.event_listener)
 
         self.revision = None
         self.metadata = {}
@@ -8,6 +8,7 @@ import urlparse
 
 from nectar.downloaders.local import LocalFileDownloader
 from nectar.downloaders.threaded import HTTPThreadedDownloader
+from nectar.listener import DownloadEventListener
 
 
 # Mapping from scheme string to downloader class to instantiate
@@ -41,3 +42,51 @@ def create_downloader(repo_url, nectar_config, event_listener=None):
         raise ValueError('Unsupported scheme: %s' % parsed.scheme)
 
     return SCHEME_DOWNLOADERS[parsed.scheme](nectar_config, event_listener=event_listener)
+
+
+class SharedDownloaders(object):
+    """
+    Hands out one downloader per downloader class to every phase of a sync, instead of a new
+    downloader per phase. The phases then share the HTTP session of the downloader, so
+    connections and TLS sessions to the feed's host are reused rather than established again for
+    the metadata, the packages and the distribution files.
+
+    The phases of a sync run one after another, so each phase sets its own event listener on the
+    downloader when it gets it.
+    """
+
+    def __init__(self, nectar_config):
+        """
+        :param nectar_config:   download config to be used by nectar
+        :type  nectar_config:   nectar.config.DownloaderConfig
+        """
+        self.nectar_config = nectar_config
+        self._downloaders = {}
+
+    def get(self, repo_url, event_listener=None):
+        """
+        Returns the downloader for the given location, creating it the first time one is needed.
+
+        :param repo_url:        where the files will be downloaded from
+        :type  repo_url:        str
+        :param event_listener:  listener that will receive reports of download completion
+        :type  event_listener:  nectar.listener.DownloadEventListener
+
+        :return:    a nectar downloader instance
+        :rtype:     nectar.downloaders.base.Downloader
+        """
+        downloader_class = SCHEME_DOWNLOADERS.get(urlparse.urlparse(repo_url).scheme)
+        downloader = self._downloaders.get(downloader_class)
+        if downloader is None:
+            # this raises ValueError if the scheme is not supported
+            downloader = create_downloader(repo_url, self.nectar_config)
+            self._downloaders[downloader_class] = downloader
+        downloader.event_listener = event_listener or DownloadEventListener()
+        return downloader
+
+    def cancel(self):
+        """
+        Cancel the downloads of every downloader that has been handed out.
+        """
+        for downloader in self._downloaders.itervalues():
+            downloader.cancel()
@@ -78,23 +78,31 @@ class Packages(object):
     :ivar dst_dir: Directory to store downloaded packages in
     :ivar event_listener: nectar.listener.DownloadEventListener instance
     :ivar downloader: nectar.downloaders.base.Downloader instance
+    :ivar concurrency: optional AdaptiveConcurrency that limits concurrent downloads per host
     """
 
     def __init__(self, repo_url, nectar_config, package_model_iterator, dst_dir,
-                 event_listener=None, url_modify=None):
+                 event_listener=None, url_modify=None, downloaders=None, concurrency=None):
         self.repo_url = repo_url
         self.package_model_iterator = package_model_iterator
         self.dst_dir = dst_dir
 
-        self.downloader = nectar_factory.create_downloader(repo_url, nectar_config,
-                                                           event_listener)
+        if downloaders is not None:
+            self.downloader = downloaders.get(repo_url, event_listener)
+        else:
+            self.downloader = nectar_factory.create_downloader(repo_url, nectar_config,
+                                                               event_listener)
         self._url_modify = url_modify or RepoURLModifier()
+        self.concurrency = concurrency
 
     def download_packages(self):
         """
         Download the repository's packages to the destination directory.
         """
-        self.downloader.download(self._request_generator())
+        requests = self._request_generator()
+        if self.concurrency is not None:
+            requests = self.concurrency.throttle(requests)
+        self.downloader.download(requests)
 
     def _request_generator(self):
         """
@@ -38,6 +38,9 @@ class ContentReport(dict):
         self['items_left'] = 0
         self['size_total'] = 0
         self['size_left'] = 0
+        # bytes downloaded per second, and the number of concurrent downloads from each host
+        self['throughput'] = 0
+        self['concurrency'] = {}
         self['state'] = constants.STATE_NOT_STARTED
         self['details'] = {
             'rpm_done': 0,
@@ -70,3 +73,14 @@ class ContentReport(dict):
         self['details'][done_attribute] += 1
         self['error_details'].append(error_report)
         return self
+
+    def download_stats(self, concurrency):
+        """
+        Reports the achieved throughput and the current concurrency of the package downloads.
+
+        :param concurrency: the concurrency limits of the package downloads
+        :type  concurrency: pulp_rpm.plugins.importers.yum.repomd.concurrency.AdaptiveConcurrency
+        """
+        self['throughput'] = concurrency.throughput
+        self['concurrency'] = concurrency.limits
+        return self
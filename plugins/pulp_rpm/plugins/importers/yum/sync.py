@@ -1,5 +1,6 @@
 import contextlib
 import functools
+import heapq
 import logging
 import os
 import random
@@ -10,13 +11,12 @@ import traceback
 
 from gettext import gettext as _
 from cStringIO import StringIO
-from urlparse import urljoin
+from urlparse import urljoin, urlparse
 
 from mongoengine import NotUniqueError
 from nectar.request import DownloadRequest
 
 from pulp.common.plugins import importer_constants
-from pulp.server.db.model import LazyCatalogEntry
 from pulp.plugins.util import nectar_config as nectar_utils, verification
 from pulp.server.exceptions import PulpCodedException
 from pulp.server.managers.repo import _common as common_utils
@@ -24,18 +24,23 @@ from pulp.server.controllers import repository as repo_controller
 
 from pulp_rpm.common import constants, ids
 from pulp_rpm.plugins import error_codes
-from pulp_rpm.plugins.db import models
-from pulp_rpm.plugins.importers.yum import existing, purge
+from pulp_rpm.plugins.db import lazy_catalog, models
+from pulp_rpm.plugins.distributors.export_distributor import incremental_bundle
+from pulp_rpm.plugins.importers.yum import existing, incremental, purge
 from pulp_rpm.plugins.importers.yum.listener import RPMListener, DRPMListener
 from pulp_rpm.plugins.importers.yum.parse.treeinfo import DistSync
 from pulp_rpm.plugins.importers.yum.repomd import (
-    alternate, group, metadata, nectar_factory, packages, presto, primary, updateinfo)
+    alternate, concurrency, group, metadata, nectar_factory, packages, presto, primary,
+    updateinfo)
 from pulp_rpm.plugins.importers.yum.report import ContentReport, DistributionReport
 from pulp_rpm.plugins.importers.yum.utils import RepoURLModifier
 
 
 _logger = logging.getLogger(__name__)
 
+# the number of the largest packages that are downloaded before the others
+LARGEST_FIRST_COUNT = 100
+
 
 class CancelException(Exception):
     pass
@@ -69,6 +74,15 @@ class RepoSync(object):
         self.repo = repo
         self.config = config
         self.nectar_config = nectar_utils.importer_config_to_nectar_config(config.flatten())
+        # every download of the sync shares these, so connections to the feed are reused
+        self.downloaders = nectar_factory.SharedDownloaders(self.nectar_config)
+        # package downloads are limited per host, within the number of download threads
+        max_downloads = config.get(importer_constants.KEY_MAX_DOWNLOADS)
+        if max_downloads is not None:
+            max_downloads = int(max_downloads)
+        else:
+            max_downloads = constants.CONFIG_MAX_DOWNLOADS_DEFAULT
+        self.concurrency = concurrency.AdaptiveConcurrency(max_downloads)
         self.skip_repomd_steps = False
         self.current_revision = 0
         self.downloader = None
@@ -144,7 +158,7 @@ class RepoSync(object):
         :rtype:     list
         """
         url_file = StringIO()
-        downloader = nectar_factory.create_downloader(feed, self.nectar_config)
+        downloader = self.downloaders.get(feed)
         request = DownloadRequest(feed, url_file)
         downloader.download_one(request)
         url_file.seek(0)
@@ -202,6 +216,11 @@ class RepoSync(object):
         :return:    A SyncReport detailing how the sync went
         :rtype:     pulp.plugins.model.SyncReport
         """
+        # An incremental export is imported directly rather than synced from repo metadata
+        incremental_export = self._get_incremental_export()
+        if incremental_export is not None:
+            return self.import_incremental_export(*incremental_export)
+
         # Empty list could be returned in case _parse_as_mirrorlist()
         # was not able to find any valid url
         if not self.sync_feed:
@@ -290,6 +309,71 @@ class RepoSync(object):
             return self.conduit.build_success_report(self._progress_summary,
                                                      self.progress_report)
 
+    def _get_incremental_export(self):
+        """
+        :return:    tuple of the directory and index of the incremental export the feed points
+                    to, or None if the feed is not a local incremental export
+        :rtype:     tuple or None
+        """
+        feed = self.config.get(importer_constants.KEY_FEED)
+        if not feed or urlparse(feed).scheme != 'file':
+            return None
+        repo_dir = urlparse(feed).path
+        index = incremental_bundle.read_index(repo_dir)
+        if index is None:
+            return None
+        return repo_dir, index
+
+    def import_incremental_export(self, repo_dir, index):
+        """
+        Import the units of an incremental export written by the export distributors. Only the
+        content step runs; the steps that need repo metadata are skipped.
+
+        :param repo_dir:    directory of the exported repository
+        :type  repo_dir:    str
+        :param index:       the export's index
+        :type  index:       dict
+
+        :return:    A SyncReport detailing how the import went
+        :rtype:     pulp.plugins.model.SyncReport
+        """
+        _logger.info(_('Importing incremental export from %(dir)s.') % {'dir': repo_dir})
+        for step in ('metadata', 'distribution', 'errata', 'comps', 'purge_duplicates'):
+            self.progress_report[step][constants.PROGRESS_STATE_KEY] = constants.STATE_SKIPPED
+
+        unit_count = sum(entry['units'] for entry in index['bundles'])
+        self.content_report['items_total'] = unit_count
+        self.content_report['items_left'] = unit_count
+        try:
+            with self.update_state(self.content_report):
+                incremental.import_units(self.conduit.repo, repo_dir, index,
+                                         validate=self.config.get(importer_constants.KEY_VALIDATE),
+                                         progress_callback=self._incremental_units_imported)
+        except CancelException:
+            report = self.conduit.build_cancel_report(self._progress_summary,
+                                                      self.progress_report)
+            report.canceled_flag = True
+            return report
+        except Exception, e:
+            _logger.exception(e)
+            self._set_failed_state(e)
+            return self.conduit.build_failure_report(self._progress_summary,
+                                                     self.progress_report)
+
+        _logger.info(_('Import complete.'))
+        return self.conduit.build_success_report(self._progress_summary, self.progress_report)
+
+    def _incremental_units_imported(self, units):
+        """
+        Report progress after a page of units of an incremental export is imported. This raises
+        CancelException if the sync has been cancelled, which stops the import between pages.
+
+        :param units:   the units that were imported
+        :type  units:   list of pulp.server.db.model.ContentUnit
+        """
+        self.content_report['items_left'] -= len(units)
+        self.set_progress()
+
     def _set_failed_state(self, exception):
         """
         Sets failed state of the task and caught error in the progress status.
@@ -328,7 +412,7 @@ class RepoSync(object):
         """
         _logger.info(_('Downloading metadata from %(feed)s.') % {'feed': url})
         metadata_files = metadata.MetadataFiles(url, self.tmp_dir, self.nectar_config,
-                                                self._url_modify)
+                                                self._url_modify, self.downloaders)
         try:
             metadata_files.download_repomd()
         except IOError, e:
@@ -572,7 +656,8 @@ class RepoSync(object):
     def catalog_generator(self, base_url, units):
         """
         Provides a wrapper around the *units* generator.
-        As the generator is iterated, the deferred downloading (lazy) catalog entry is added.
+        As the generator is iterated, the deferred downloading (lazy) catalog entries are added
+        in pages.
 
         :param base_url: The base download URL.
         :type base_url: str
@@ -580,16 +665,16 @@ class RepoSync(object):
         :return: A generator of units.
         :rtype: generator
         """
-        for unit in units:
-            unit.set_storage_path(unit.filename)
-            entry = LazyCatalogEntry()
-            entry.path = unit.storage_path
-            entry.importer_id = str(self.conduit.importer_object_id)
-            entry.unit_id = unit.id
-            entry.unit_type_id = unit.type_id
-            entry.url = urljoin(base_url, unit.download_path)
-            entry.save_revision()
-            yield unit
+        writer = lazy_catalog.CatalogWriter(str(self.conduit.importer_object_id))
+        try:
+            for unit in units:
+                unit.set_storage_path(unit.filename)
+                writer.add(unit.storage_path, urljoin(base_url, unit.download_path), unit)
+                yield unit
+        finally:
+            # entries are written in pages, so the last page is written once the units run out
+            # or the generator is closed early
+            writer.flush()
 
     def add_rpm_unit(self, metadata_files, unit):
         """
@@ -639,6 +724,10 @@ class RepoSync(object):
 
             units_to_download = self._filtered_unit_generator(package_model_generator,
                                                               rpms_to_download)
+            if not self.download_deferred:
+                units_to_download = self._largest_first(units_to_download, functools.partial(
+                    self._metadata_unit_generator, metadata_files, primary.METADATA_FILE_NAME,
+                    primary.PACKAGE_TAG, primary.process_package_element, rpms_to_download))
 
             # Wrapped in a generator that adds entries to
             # the deferred (Lazy) catalog.
@@ -656,7 +745,9 @@ class RepoSync(object):
                 units_to_download,
                 self.tmp_dir,
                 event_listener,
-                self._url_modify)
+                self._url_modify,
+                self.downloaders,
+                self.concurrency)
 
             # allow the downloader to be accessed by the cancel method if necessary
             self.downloader = download_wrapper.downloader
@@ -697,6 +788,12 @@ class RepoSync(object):
 
                     units_to_download = self._filtered_unit_generator(package_model_generator,
                                                                       drpms_to_download)
+                    if not self.download_deferred:
+                        units_to_download = self._largest_first(
+                            units_to_download, functools.partial(
+                                self._metadata_unit_generator, metadata_files, presto_file_name,
+                                presto.PACKAGE_TAG, presto.process_package_element,
+                                drpms_to_download))
 
                     # Wrapped in a generator that adds entries to
                     # the deferred (Lazy) catalog.
@@ -714,7 +811,9 @@ class RepoSync(object):
                         units_to_download,
                         self.tmp_dir,
                         event_listener,
-                        self._url_modify)
+                        self._url_modify,
+                        self.downloaders,
+                        self.concurrency)
 
                     # allow the downloader to be accessed by the cancel method if necessary
                     self.downloader = download_wrapper.downloader
@@ -738,6 +837,9 @@ class RepoSync(object):
         except AttributeError:
             # there might not be a downloader to cancel right now.
             _logger.debug('could not cancel downloader')
+        # so that no later step of the sync starts downloading
+        self.downloaders.cancel()
+        self.concurrency.cancel()
         try:
             self.set_progress()
         # this exception is only raised for the benefit of the run() method so
@@ -912,26 +1014,29 @@ class RepoSync(object):
         # values are dicts where keys are serialized versions, and values are
         # a tuple of (model as named tuple, size in bytes)
         wanted = {}
+        # keys are the same as in "wanted", values are min-heaps of the serialized
+        # versions being kept, so the oldest kept version is always at index 0
+        heaps = {}
 
         number_old_versions_to_keep = \
             self.config.get(importer_constants.KEY_UNITS_RETAIN_OLD_COUNT)
         for model in package_info_generator:
-            versions = wanted.setdefault(model.key_string_without_version, {})
+            key = model.key_string_without_version
+            versions = wanted.setdefault(key, {})
             serialized_version = model.complete_version_serialized
-            size = model.size
+            value = (model.unit_key_as_named_tuple, model.size)
 
             # if we are limited on the number of old versions we can have,
-            if number_old_versions_to_keep is not None:
+            if number_old_versions_to_keep is not None and serialized_version not in versions:
                 number_to_keep = number_old_versions_to_keep + 1
-                if len(versions) < number_to_keep:
-                    versions[serialized_version] = (model.unit_key_as_named_tuple, size)
+                version_heap = heaps.setdefault(key, [])
+                if len(version_heap) < number_to_keep:
+                    heapq.heappush(version_heap, serialized_version)
+                elif serialized_version > version_heap[0]:
+                    del versions[heapq.heapreplace(version_heap, serialized_version)]
                 else:
-                    smallest_version = sorted(versions.keys(), reverse=True)[:number_to_keep][-1]
-                    if serialized_version > smallest_version:
-                        del versions[smallest_version]
-                        versions[serialized_version] = (model.unit_key_as_named_tuple, size)
-            else:
-                versions[serialized_version] = (model.unit_key_as_named_tuple, size)
+                    continue
+            versions[serialized_version] = value
         ret = {}
         for units in wanted.itervalues():
             for unit, size in units.itervalues():
@@ -939,6 +1044,76 @@ class RepoSync(object):
 
         return ret
 
+    def _metadata_unit_generator(self, metadata_files, file_name, package_tag, process_func,
+                                 to_download):
+        """
+        Parses a metadata file and yields the units in it that should be downloaded. The file is
+        closed once the units run out or the generator is closed.
+
+        :param metadata_files:  populated instance of MetadataFiles
+        :type  metadata_files:  pulp_rpm.plugins.importers.yum.repomd.metadata.MetadataFiles
+        :param file_name:       name of the metadata file
+        :type  file_name:       str
+        :param package_tag:     XML tag of the packages in the file
+        :type  package_tag:     str
+        :param process_func:    function that turns a package element into a unit
+        :type  process_func:    function
+        :param to_download:     collection of Packages as named tuples that we want to download
+        :type  to_download:     set
+
+        :return:    generator of pulp_rpm.plugins.db.models.Package instances
+        :rtype:     generator
+        """
+        file_handle = metadata_files.get_metadata_file_handle(file_name)
+        try:
+            package_model_generator = packages.package_list_generator(
+                file_handle, package_tag, process_func)
+            for unit in self._filtered_unit_generator(package_model_generator, to_download):
+                yield unit
+        finally:
+            file_handle.close()
+
+    @staticmethod
+    def _largest_first(units, reopen_units):
+        """
+        Orders units for download so the largest ones start first. Otherwise a few very large
+        packages late in the metadata are the last downloads running, while the other download
+        threads are idle.
+
+        The LARGEST_FIRST_COUNT largest units are collected in one pass over the units and
+        yielded largest first. If there are more units, the rest follow in a second pass, in
+        the order of the metadata, so no more than LARGEST_FIRST_COUNT units are held in memory.
+
+        :param units:           iterator of the units to download
+        :type  units:           iterator
+        :param reopen_units:    callable that returns a new iterator of the same units
+        :type  reopen_units:    callable
+
+        :return:    generator of the same units
+        :rtype:     generator
+        """
+        largest = []
+        count = 0
+        for unit in units:
+            # the negative index keeps units of the same size in the order of the metadata
+            item = (unit.size or 0, -count, unit)
+            if len(largest) < LARGEST_FIRST_COUNT:
+                heapq.heappush(largest, item)
+            else:
+                heapq.heappushpop(largest, item)
+            count += 1
+
+        largest.sort(reverse=True)
+        for size, index, unit in largest:
+            yield unit
+
+        if count > len(largest):
+            yielded = set(unit.unit_key_as_named_tuple for size, index, unit in largest)
+            del largest
+            for unit in reopen_units():
+                if unit.unit_key_as_named_tuple not in yielded:
+                    yield unit
+
     def _filtered_unit_generator(self, units, to_download=None):
         """
         Given an iterator of Package instances and a collection (preferably a
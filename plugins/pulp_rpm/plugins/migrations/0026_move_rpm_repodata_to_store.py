@@ -0,0 +1,76 @@
+"""
+Migration to move the primary, filelists and other XML snippets of RPMs and SRPMs out of their
+documents and into the repodata store.
+
+The snippets are also stored structurally in other fields of the documents, and storing them
+inline made the documents of large packages several megabytes in size. Stored snippets that no
+RPM or SRPM uses anymore, for example because the package was purged as an orphan, are removed.
+"""
+import os
+
+from pulp.server.db import connection
+
+from pulp_rpm.plugins.db import repodata_store
+
+
+# number of documents read from the database at a time
+BATCH_SIZE = 100
+
+COLLECTION_NAMES = ('units_rpm', 'units_srpm')
+
+
+def _move_repodata(collection):
+    """
+    Move the snippets of every document in the collection to the repodata store.
+
+    :param collection: collection of RPM or SRPM documents
+    :type  collection: pymongo.collection.Collection
+    """
+    units = collection.find({'repodata': {'$nin': [{}, None]}},
+                            ['checksumtype', 'checksum', 'repodata']).batch_size(BATCH_SIZE)
+    for unit in units:
+        repodata_store.write(unit['checksumtype'], unit['checksum'], unit['repodata'])
+        collection.update_one({'_id': unit['_id']}, {'$set': {'repodata': {}}})
+
+
+def _remove_orphaned_repodata(db):
+    """
+    Delete the stored snippets of packages that have no RPM or SRPM document.
+
+    :param db: the database
+    :type  db: pymongo.database.Database
+    """
+    store_dir = repodata_store.get_store_dir()
+    if not os.path.isdir(store_dir):
+        return
+    suffix_length = len(repodata_store.REPODATA_FILE_SUFFIX)
+    for checksumtype in os.listdir(store_dir):
+        type_dir = os.path.join(store_dir, checksumtype)
+        for prefix in os.listdir(type_dir):
+            checksums = [prefix + name[:-suffix_length]
+                         for name in os.listdir(os.path.join(type_dir, prefix))
+                         if name.endswith(repodata_store.REPODATA_FILE_SUFFIX)]
+            for start in xrange(0, len(checksums), BATCH_SIZE):
+                batch = checksums[start:start + BATCH_SIZE]
+                used_checksums = set()
+                for collection_name in COLLECTION_NAMES:
+                    used_checksums.update(db[collection_name].distinct(
+                        'checksum', {'checksumtype': checksumtype, 'checksum': {'$in': batch}}))
+                for checksum in batch:
+                    if checksum not in used_checksums:
+                        repodata_store.delete(checksumtype, checksum)
+
+
+def migrate(*args, **kwargs):
+    """
+    Perform the migration as described in this module's docblock.
+
+    :param args:   unused
+    :type  args:   list
+    :param kwargs: unused
+    :type  kwargs: dict
+    """
+    db = connection.get_database()
+    for collection_name in COLLECTION_NAMES:
+        _move_repodata(db[collection_name])
+    _remove_orphaned_repodata(db)
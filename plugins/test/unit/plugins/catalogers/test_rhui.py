@@ -6,7 +6,8 @@ from mock import patch, Mock
 from nectar.config import DownloaderConfig
 
 from pulp_rpm.plugins.catalogers.rhui import (
-    TYPE_ID, RHUICataloger, entry_point, ID_DOC_URL, ID_SIG_URL, ID_DOC_HEADER, ID_SIG_HEADER)
+    TYPE_ID, RHUICataloger, entry_point, identity_cache, ID_DOC_URL, ID_SIG_URL, ID_DOC_HEADER,
+    ID_SIG_HEADER)
 from pulp_rpm.plugins.db.models import RPM
 
 
@@ -15,6 +16,11 @@ SIGNATURE = 'test-signature'
 
 
 class TestCataloger(TestCase):
+    def setUp(self):
+        TestCase.setUp(self)
+        identity_cache.clear()
+        self.addCleanup(identity_cache.clear)
+
     def test_entry_point(self):
         plugin, config = entry_point()
         self.assertEqual(plugin, RHUICataloger)
@@ -53,6 +59,40 @@ class TestCataloger(TestCase):
             nectar_config.headers,
             {ID_DOC_HEADER: urlsafe_b64encode(ID), ID_SIG_HEADER: urlsafe_b64encode(SIGNATURE)})
 
+    @patch('__builtin__.super')
+    @patch('pulp_rpm.plugins.catalogers.rhui.urlopen')
+    def test_nectar_config_cached(self, fake_urlopen, fake_super):
+        fake_fp = Mock()
+        fake_fp.read.side_effect = [ID, SIGNATURE]
+        fake_urlopen.return_value = fake_fp
+        fake_super().nectar_config.side_effect = lambda config: DownloaderConfig()
+
+        cataloger = RHUICataloger()
+        cataloger.nectar_config(Mock())
+        nectar_config = cataloger.nectar_config(Mock())
+
+        # the identity is only fetched once
+        self.assertEqual(fake_urlopen.call_count, 2)
+        self.assertEqual(
+            nectar_config.headers,
+            {ID_DOC_HEADER: urlsafe_b64encode(ID), ID_SIG_HEADER: urlsafe_b64encode(SIGNATURE)})
+
+    @patch('pulp_rpm.plugins.catalogers.rhui.time')
+    @patch('__builtin__.super')
+    @patch('pulp_rpm.plugins.catalogers.rhui.urlopen')
+    def test_nectar_config_cache_expired(self, fake_urlopen, fake_super, fake_time):
+        fake_fp = Mock()
+        fake_fp.read.side_effect = [ID, SIGNATURE, ID, SIGNATURE]
+        fake_urlopen.return_value = fake_fp
+        fake_super().nectar_config.side_effect = lambda config: DownloaderConfig()
+        fake_time.side_effect = [1000, 1000 + identity_cache.valid_seconds, 5000]
+
+        cataloger = RHUICataloger()
+        cataloger.nectar_config(Mock())
+        cataloger.nectar_config(Mock())
+
+        self.assertEqual(fake_urlopen.call_count, 4)
+
     @patch('__builtin__.super')
     @patch('pulp_rpm.plugins.catalogers.rhui.urlopen')
     def test_nectar_config_raised_getting_id(self, fake_urlopen, fake_super):
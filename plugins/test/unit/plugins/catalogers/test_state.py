@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from pulp_rpm.plugins.catalogers import state
+
+
+class StateTests(unittest.TestCase):
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        patcher = mock.patch.object(state, 'get_state_dir', return_value=self.state_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+    def test_get_path(self):
+        path = state.get_path('source', 'http://example.com/repo/')
+
+        self.assertEqual(os.path.dirname(path), os.path.join(self.state_dir, 'source'))
+        self.assertNotEqual(path, state.get_path('source', 'http://example.com/other/'))
+
+    def test_entry_key(self):
+        self.assertEqual(state.entry_key({'name': 'foo', 'arch': 'noarch'}),
+                         state.entry_key({'arch': 'noarch', 'name': 'foo'}))
+
+    def test_write_and_read(self):
+        url_state = {'repomd_checksum': 'abc', 'expiration': 100,
+                     'entries': {state.entry_key({'name': 'foo'}): 'http://example.com/foo.rpm'}}
+
+        state.write('source', 'http://example.com/repo/', url_state)
+
+        self.assertEqual(state.read('source', 'http://example.com/repo/'), url_state)
+        self.assertEqual(os.listdir(os.path.join(self.state_dir, 'source')),
+                         [os.path.basename(state.get_path('source', 'http://example.com/repo/'))])
+
+    def test_read_missing(self):
+        self.assertEqual(state.read('source', 'http://example.com/repo/'), None)
+
+    def test_purge(self):
+        for source_id, url in (('source', 'http://example.com/repo/'),
+                               ('source', 'http://example.com/other/'),
+                               ('removed', 'http://example.com/repo/')):
+            state.write(source_id, url, {})
+        temp_path = os.path.join(self.state_dir, 'source', 'abc.tmp')
+        open(temp_path, 'w').close()
+
+        state.purge({'source': ['http://example.com/repo/'], 'new': ['http://example.com/new/']})
+
+        self.assertEqual(sorted(os.listdir(self.state_dir)), ['source'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.state_dir, 'source'))),
+                         sorted(['abc.tmp', os.path.basename(
+                             state.get_path('source', 'http://example.com/repo/'))]))
+
+    def test_purge_nothing_stored(self):
+        shutil.rmtree(self.state_dir)
+
+        state.purge({})
+
+        os.makedirs(self.state_dir)
@@ -12,6 +12,7 @@ from mock import patch, Mock
 from pulp.server.managers import factory as managers
 from pulp.plugins.conduits.cataloger import CatalogerConduit
 
+from pulp_rpm.plugins.catalogers import state
 from pulp_rpm.plugins.catalogers.yum import TYPE_ID, YumCataloger, entry_point
 from pulp_rpm.plugins.db.models import RPM
 
@@ -38,10 +39,19 @@ class TestCataloger(TestCase):
         self.tmp_dir = mkdtemp()
         with closing(TarFile(TAR_PATH)) as tar:
             tar.extractall(self.tmp_dir)
+        self.state_dir = mkdtemp()
+        patcher = patch.object(state, 'get_state_dir', return_value=self.state_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('pulp_rpm.plugins.catalogers.yum.ContentSource.load_all',
+                        return_value={})
+        self.load_all = patcher.start()
+        self.addCleanup(patcher.stop)
 
     def tearDown(self):
         TestCase.tearDown(self)
         shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        shutil.rmtree(self.state_dir, ignore_errors=True)
 
     def test_entry_point(self):
         plugin, config = entry_point()
@@ -90,6 +100,82 @@ class TestCataloger(TestCase):
                     entry['unit_key'],
                     self._normalized(entry['url'])))
 
+    @patch('pulp.server.managers.content.catalog.ContentCatalogManager.add_entry')
+    def test_refresh_unchanged(self, mock_add):
+        url = 'file://%s/' % self.tmp_dir
+        conduit = CatalogerConduit(SOURCE_ID, EXPIRES)
+        cataloger = YumCataloger()
+        cataloger.refresh(conduit, {}, url)
+        mock_add.reset_mock()
+
+        cataloger.refresh(conduit, {}, url)
+
+        # nothing is added again while the repomd.xml is unchanged
+        self.assertEqual(mock_add.call_count, 0)
+        self.assertTrue(state.read(SOURCE_ID, url)['entries'])
+
+    @patch('pulp.server.managers.content.catalog.ContentCatalogManager.add_entry')
+    def test_refresh_purges_states(self, mock_add):
+        url = 'file://%s/' % self.tmp_dir
+        state.write(SOURCE_ID, 'http://example.com/removed/', {})
+        state.write('removed', url, {})
+        state.write('other', 'http://example.com/other/', {})
+        self.load_all.return_value = {
+            'other': Mock(id='other', urls=['http://example.com/other/'])}
+        conduit = CatalogerConduit(SOURCE_ID, EXPIRES)
+
+        YumCataloger().refresh(conduit, {}, url)
+
+        self.assertEqual(sorted(os.listdir(self.state_dir)), ['other', SOURCE_ID])
+        self.assertEqual(os.listdir(os.path.join(self.state_dir, SOURCE_ID)),
+                         [os.path.basename(state.get_path(SOURCE_ID, url))])
+        self.assertTrue(state.read('other', 'http://example.com/other/') is not None)
+
+    @patch('pulp.server.managers.content.catalog.ContentCatalogManager.add_entry')
+    def test_refresh_expired(self, mock_add):
+        url = 'file://%s/' % self.tmp_dir
+        conduit = CatalogerConduit(SOURCE_ID, EXPIRES)
+        cataloger = YumCataloger()
+        cataloger.refresh(conduit, {}, url)
+        added = mock_add.call_count
+        previous_state = state.read(SOURCE_ID, url)
+        previous_state['expiration'] = 0
+        state.write(SOURCE_ID, url, previous_state)
+
+        cataloger.refresh(conduit, {}, url)
+
+        self.assertEqual(mock_add.call_count, added * 2)
+
+    @patch('pulp_rpm.plugins.catalogers.yum.primary')
+    @patch('pulp_rpm.plugins.catalogers.yum.packages')
+    def test_add_packages_changes(self, mock_packages, mock_primary):
+        unchanged = Mock(unit_key={'name': 'unchanged'}, download_path='unchanged.rpm')
+        moved = Mock(unit_key={'name': 'moved'}, download_path='new/moved.rpm')
+        new = Mock(unit_key={'name': 'new'}, download_path='new.rpm')
+        mock_packages.package_list_generator.return_value = [unchanged, moved, new]
+        previous_entries = {
+            state.entry_key({'name': 'unchanged'}): 'http://test/unchanged.rpm',
+            state.entry_key({'name': 'moved'}): 'http://test/old/moved.rpm',
+            state.entry_key({'name': 'removed'}): 'http://test/removed.rpm',
+        }
+        conduit = Mock()
+
+        entries = YumCataloger._add_packages(conduit, 'http://test/', Mock(), previous_entries)
+
+        self.assertEqual(entries, {
+            state.entry_key({'name': 'unchanged'}): 'http://test/unchanged.rpm',
+            state.entry_key({'name': 'moved'}): 'http://test/new/moved.rpm',
+            state.entry_key({'name': 'new'}): 'http://test/new.rpm',
+        })
+        self.assertEqual(conduit.add_entry.call_count, 2)
+        conduit.add_entry.assert_any_call(RPM._content_type_id.default, {'name': 'moved'},
+                                          'http://test/new/moved.rpm')
+        conduit.add_entry.assert_any_call(RPM._content_type_id.default, {'name': 'new'},
+                                          'http://test/new.rpm')
+        self.assertEqual(conduit.delete_entry.call_count, 2)
+        conduit.delete_entry.assert_any_call(RPM._content_type_id.default, {'name': 'moved'})
+        conduit.delete_entry.assert_any_call(RPM._content_type_id.default, {'name': 'removed'})
+
     @patch('pulp_rpm.plugins.catalogers.yum.descriptor')
     def test_nectar_config(self, fake_descriptor):
         config = Mock()
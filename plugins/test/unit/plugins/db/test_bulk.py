@@ -0,0 +1,125 @@
+import unittest
+
+import mock
+from pymongo.errors import BulkWriteError
+
+from pulp_rpm.plugins.db import bulk, models
+
+
+class InsertUnitsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.units = [models.ISO(name='test%d.iso' % i, checksum='sum%d' % i, size=i)
+                      for i in range(3)]
+
+    @mock.patch.object(models.ISO, '_get_collection')
+    def test_insert(self, mock_get_collection):
+        result = bulk.insert_units(models.ISO, self.units)
+
+        self.assertEqual(result, self.units)
+        documents = mock_get_collection.return_value.insert_many.call_args[0][0]
+        self.assertEqual([document['_id'] for document in documents],
+                         [unit.id for unit in self.units])
+        # the signal handler that save() would call has set the last updated time
+        self.assertTrue(all(document.get('_last_updated') for document in documents))
+
+    @mock.patch.object(models.ISO, 'objects')
+    @mock.patch.object(models.ISO, '_get_collection')
+    def test_insert_existing(self, mock_get_collection, mock_objects):
+        existing_unit = models.ISO(name='test1.iso', checksum='sum1', size=1)
+        mock_objects.filter.return_value.first.return_value = existing_unit
+        mock_get_collection.return_value.insert_many.side_effect = BulkWriteError(
+            {'writeErrors': [{'index': 1, 'code': bulk.DUPLICATE_KEY_ERROR}]})
+
+        result = bulk.insert_units(models.ISO, self.units)
+
+        self.assertEqual(result, [self.units[0], existing_unit, self.units[2]])
+        mock_objects.filter.assert_called_once_with(**self.units[1].unit_key)
+
+    @mock.patch.object(models.RPM, 'post_save_signal')
+    @mock.patch.object(models.RPM, 'pre_save_signal')
+    @mock.patch.object(models.RPM, '_get_collection')
+    def test_insert_calls_post_save(self, mock_get_collection, mock_pre_save, mock_post_save):
+        units = [models.RPM(name='foo', epoch='0', version='1', release='%d' % i, arch='noarch',
+                            checksumtype='sha256', checksum='sum%d' % i) for i in range(2)]
+
+        bulk.insert_units(models.RPM, units)
+
+        # the snippets of the RPMs are only stored once they are inserted
+        self.assertTrue(mock_get_collection.return_value.insert_many.called)
+        self.assertEqual(mock_post_save.call_args_list,
+                         [mock.call(models.RPM, unit) for unit in units])
+
+    @mock.patch.object(models.ISO, '_get_collection')
+    def test_insert_other_error(self, mock_get_collection):
+        mock_get_collection.return_value.insert_many.side_effect = BulkWriteError(
+            {'writeErrors': [{'index': 1, 'code': 2}]})
+
+        self.assertRaises(BulkWriteError, bulk.insert_units, models.ISO, self.units)
+
+    @mock.patch.object(models.ISO, '_get_collection')
+    def test_insert_nothing(self, mock_get_collection):
+        self.assertEqual(bulk.insert_units(models.ISO, []), [])
+
+        self.assertFalse(mock_get_collection.called)
+
+
+class AssociateUnitsTests(unittest.TestCase):
+
+    @mock.patch('pulp_rpm.plugins.db.bulk.UpdateOne')
+    @mock.patch('pulp_rpm.plugins.db.bulk.model.RepositoryContentUnit')
+    def test_associate(self, mock_rcu, mock_update_one):
+        repo = mock.Mock(repo_id='repo1')
+        units = [models.ISO(id='unit%d' % i, name='test%d.iso' % i, checksum='sum', size=i)
+                 for i in range(2)]
+
+        bulk.associate_units(repo, units)
+
+        self.assertEqual(mock_update_one.call_count, 2)
+        unit_filter, update = mock_update_one.call_args_list[0][0]
+        self.assertEqual(unit_filter, {'repo_id': 'repo1', 'unit_id': 'unit0',
+                                       'unit_type_id': 'iso'})
+        self.assertEqual(update['$setOnInsert']['created'], update['$set']['updated'])
+        self.assertEqual(mock_update_one.call_args_list[0][1], {'upsert': True})
+        mock_rcu._get_collection.return_value.bulk_write.assert_called_once_with(
+            [mock_update_one.return_value] * 2, ordered=False)
+
+    @mock.patch('pulp_rpm.plugins.db.bulk.model.RepositoryContentUnit')
+    def test_associate_nothing(self, mock_rcu):
+        bulk.associate_units(mock.Mock(), [])
+
+        self.assertFalse(mock_rcu._get_collection.return_value.bulk_write.called)
+
+
+class UpsertUnitsTests(unittest.TestCase):
+
+    @mock.patch.object(models.PackageGroup, 'objects')
+    @mock.patch('pulp_rpm.plugins.db.bulk.UpdateOne')
+    @mock.patch.object(models.PackageGroup, '_get_collection')
+    def test_upsert(self, mock_get_collection, mock_update_one, mock_objects):
+        units = [models.PackageGroup(package_group_id='group%d' % i, repo_id='repo1')
+                 for i in range(2)]
+        new_id = units[1].id
+        # the first group was saved before, so it keeps the ID it was saved with
+        saved_unit = models.PackageGroup(id='saved', package_group_id='group0', repo_id='repo1')
+        mock_objects.return_value.only.return_value = [saved_unit]
+
+        result = bulk.upsert_units(models.PackageGroup, units)
+
+        self.assertEqual([unit.id for unit in result], ['saved', new_id])
+        unit_filter, update = mock_update_one.call_args_list[1][0]
+        self.assertEqual(unit_filter, {'package_group_id': 'group1', 'repo_id': 'repo1'})
+        self.assertEqual(update['$setOnInsert'], {'_id': new_id})
+        self.assertEqual(update['$set']['package_group_id'], 'group1')
+        self.assertTrue('_id' not in update['$set'])
+        # fields that are not set are removed from the saved unit
+        self.assertTrue('description' in update['$unset'])
+        self.assertEqual(mock_update_one.call_args_list[1][1], {'upsert': True})
+        mock_get_collection.return_value.bulk_write.assert_called_once_with(
+            [mock_update_one.return_value] * 2, ordered=False)
+
+    @mock.patch.object(models.PackageGroup, '_get_collection')
+    def test_upsert_nothing(self, mock_get_collection):
+        self.assertEqual(bulk.upsert_units(models.PackageGroup, []), [])
+
+        self.assertFalse(mock_get_collection.called)
@@ -0,0 +1,90 @@
+import unittest
+
+import mock
+from pymongo.errors import BulkWriteError
+
+from pulp_rpm.plugins.db import lazy_catalog, models
+
+
+MODULE = 'pulp_rpm.plugins.db.lazy_catalog'
+
+
+@mock.patch(MODULE + '.LazyCatalogEntry')
+class CatalogWriterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.unit = models.ISO(id='unit1', name='test.iso', checksum='sum', size=1)
+
+    @staticmethod
+    def _entry(path, url, unit_id='unit1', revision=1, entry_id=None):
+        return mock.Mock(id=entry_id or path, path=path, url=url, unit_id=unit_id,
+                         unit_type_id='iso', revision=revision)
+
+    def test_flush(self, mock_entry_class):
+        existing_entries = [
+            self._entry('/unchanged', 'http://test/unchanged'),
+            self._entry('/changed', 'http://test/old', revision=3, entry_id='old')]
+        mock_entry_class.objects.filter.return_value.only.return_value = existing_entries
+        entries = [mock.Mock(), mock.Mock(), mock.Mock()]
+        mock_entry_class.side_effect = entries
+        writer = lazy_catalog.CatalogWriter('importer')
+
+        writer.add('/unchanged', 'http://test/unchanged', self.unit)
+        writer.add('/changed', 'http://test/changed', self.unit)
+        writer.add('/new', 'http://test/new', self.unit)
+        writer.flush()
+
+        self.assertEqual(sorted(mock_entry_class.objects.filter.call_args_list[0][1]['path__in']),
+                         ['/changed', '/new', '/unchanged'])
+        # only the changed and the new entries are written, with their next revisions
+        documents = mock_entry_class._get_collection.return_value.insert_many.call_args[0][0]
+        self.assertEqual(sorted(documents),
+                         sorted([entries[1].to_mongo.return_value,
+                                 entries[2].to_mongo.return_value]))
+        self.assertEqual(entries[1].revision, 4)
+        self.assertEqual(entries[2].revision, 1)
+        self.assertEqual(entries[2].importer_id, 'importer')
+        self.assertEqual(entries[2].unit_id, 'unit1')
+        self.assertEqual(entries[2].unit_type_id, 'iso')
+        # the revision that was replaced is deleted
+        mock_entry_class.objects.filter.assert_called_with(id__in=['old'])
+        mock_entry_class.objects.filter.return_value.delete.assert_called_once_with()
+
+    def test_add_flushes_full_page(self, mock_entry_class):
+        mock_entry_class.objects.filter.return_value.only.return_value = []
+        writer = lazy_catalog.CatalogWriter('importer', page_size=2)
+
+        writer.add('/a', 'http://test/a', self.unit)
+        self.assertFalse(mock_entry_class._get_collection.called)
+        writer.add('/b', 'http://test/b', self.unit)
+
+        insert_many = mock_entry_class._get_collection.return_value.insert_many
+        self.assertEqual(len(insert_many.call_args[0][0]), 2)
+
+    def test_flush_nothing(self, mock_entry_class):
+        lazy_catalog.CatalogWriter('importer').flush()
+
+        self.assertFalse(mock_entry_class.objects.filter.called)
+
+    def test_flush_unchanged(self, mock_entry_class):
+        mock_entry_class.objects.filter.return_value.only.return_value = [
+            self._entry('/a', 'http://test/a')]
+        writer = lazy_catalog.CatalogWriter('importer')
+
+        writer.add('/a', 'http://test/a', self.unit)
+        writer.flush()
+
+        self.assertFalse(mock_entry_class._get_collection.called)
+
+    def test_flush_concurrent_revision(self, mock_entry_class):
+        mock_entry_class.objects.filter.return_value.only.return_value = []
+        entries = [mock.Mock(), mock.Mock()]
+        mock_entry_class.side_effect = entries
+        mock_entry_class._get_collection.return_value.insert_many.side_effect = BulkWriteError(
+            {'writeErrors': [{'index': 0, 'code': 11000}]})
+        writer = lazy_catalog.CatalogWriter('importer')
+
+        writer.add('/a', 'http://test/a', self.unit)
+        writer.flush()
+
+        entries[0].save_revision.assert_called_once_with()
@@ -93,6 +93,130 @@ class TestErrata(unittest.TestCase):
         self.assertEqual(ret[0]['checksumtype'], 'sha1')
 
 
+class TestRpmBaseRepodata(unittest.TestCase):
+    """
+    Tests for the XML snippets of RPMs kept in the repodata store.
+    """
+
+    @mock.patch('pulp_rpm.plugins.db.models.NonMetadataPackage.pre_save_signal')
+    @mock.patch('pulp_rpm.plugins.db.models.repodata_store')
+    def test_pre_save_signal_moves_repodata(self, mock_store, mock_super_pre_save):
+        rpm = models.RPM(checksumtype='sha256', checksum='abc')
+        rpm.repodata = {'primary': '<package/>'}
+
+        models.RPM.pre_save_signal(models.RPM, rpm)
+
+        # the snippets are only stored once the document is saved
+        self.assertFalse(mock_store.write.called)
+        self.assertEqual(rpm.repodata, {})
+        self.assertEqual(rpm.get_repodata('primary'), '<package/>')
+        self.assertFalse(mock_store.read.called)
+
+    @mock.patch('pulp_rpm.plugins.db.models.NonMetadataPackage.pre_save_signal')
+    @mock.patch('pulp_rpm.plugins.db.models.repodata_store')
+    def test_post_save_signal_writes_repodata(self, mock_store, mock_super_pre_save):
+        rpm = models.RPM(checksumtype='sha256', checksum='abc')
+        rpm.repodata = {'primary': '<package/>'}
+        models.RPM.pre_save_signal(models.RPM, rpm)
+
+        models.RPM.post_save_signal(models.RPM, rpm)
+        models.RPM.post_save_signal(models.RPM, rpm)
+
+        mock_store.write.assert_called_once_with('sha256', 'abc', {'primary': '<package/>'})
+        self.assertEqual(rpm.get_repodata('primary'), '<package/>')
+
+    @mock.patch('pulp_rpm.plugins.db.models.repodata_store')
+    def test_post_save_signal_without_repodata(self, mock_store):
+        rpm = models.RPM(checksumtype='sha256', checksum='abc')
+
+        models.RPM.post_save_signal(models.RPM, rpm)
+
+        self.assertFalse(mock_store.write.called)
+
+    @mock.patch.object(models.RPM, 'objects')
+    @mock.patch('pulp_rpm.plugins.db.models.NonMetadataPackage.pre_save_signal')
+    @mock.patch('pulp_rpm.plugins.db.models.repodata_store')
+    def test_post_save_signal_write_fails(self, mock_store, mock_super_pre_save, mock_objects):
+        mock_store.write.side_effect = IOError()
+        rpm = models.RPM(checksumtype='sha256', checksum='abc')
+        rpm.repodata = {'primary': '<package/>'}
+        models.RPM.pre_save_signal(models.RPM, rpm)
+
+        self.assertRaises(IOError, models.RPM.post_save_signal, models.RPM, rpm)
+
+        # the snippets are kept in the saved document
+        mock_objects.assert_called_once_with(id=rpm.id)
+        mock_objects.return_value.update_one.assert_called_once_with(
+            set__repodata={'primary': '<package/>'})
+        self.assertEqual(rpm.repodata, {'primary': '<package/>'})
+
+    @mock.patch.object(models.SRPM, 'objects')
+    @mock.patch.object(models.RPM, 'objects')
+    @mock.patch('pulp_rpm.plugins.db.models.repodata_store')
+    def test_post_delete_signal(self, mock_store, mock_rpm_objects, mock_srpm_objects):
+        mock_rpm_objects.return_value.count.return_value = 0
+        mock_srpm_objects.return_value.count.return_value = 0
+        rpm = models.RPM(checksumtype='sha256', checksum='abc')
+
+        models.RPM.post_delete_signal(models.RPM, rpm)
+
+        mock_rpm_objects.assert_called_once_with(checksumtype='sha256', checksum='abc')
+        mock_store.delete.assert_called_once_with('sha256', 'abc')
+
+    @mock.patch.object(models.SRPM, 'objects')
+    @mock.patch.object(models.RPM, 'objects')
+    @mock.patch('pulp_rpm.plugins.db.models.repodata_store')
+    def test_post_delete_signal_shared(self, mock_store, mock_rpm_objects, mock_srpm_objects):
+        mock_rpm_objects.return_value.count.return_value = 0
+        mock_srpm_objects.return_value.count.return_value = 1
+        rpm = models.RPM(checksumtype='sha256', checksum='abc')
+
+        models.RPM.post_delete_signal(models.RPM, rpm)
+
+        self.assertFalse(mock_store.delete.called)
+
+    @mock.patch('pulp_rpm.plugins.db.models.NonMetadataPackage.pre_save_signal')
+    @mock.patch('pulp_rpm.plugins.db.models.repodata_store')
+    def test_pre_save_signal_without_repodata(self, mock_store, mock_super_pre_save):
+        rpm = models.RPM(checksumtype='sha256', checksum='abc')
+
+        models.RPM.pre_save_signal(models.RPM, rpm)
+
+        self.assertFalse(mock_store.write.called)
+
+    def test_get_repodata_inline(self):
+        rpm = models.RPM(checksumtype='sha256', checksum='abc')
+        rpm.repodata = {'primary': '<package/>'}
+
+        self.assertEqual(rpm.get_repodata('primary'), '<package/>')
+
+    @mock.patch('pulp_rpm.plugins.db.models.repodata_store')
+    def test_get_repodata_stored(self, mock_store):
+        mock_store.read.return_value = {'primary': '<package/>', 'other': '<other/>'}
+        rpm = models.RPM(checksumtype='sha256', checksum='abc')
+
+        self.assertEqual(rpm.get_repodata('primary'), '<package/>')
+        self.assertEqual(rpm.get_repodata('other'), '<other/>')
+        # the stored snippets are only read once
+        mock_store.read.assert_called_once_with('sha256', 'abc')
+
+
+class TestErrataUpdateinfoCache(unittest.TestCase):
+    """
+    Tests for the updateinfo.xml snippet cached on Errata.
+    """
+
+    @mock.patch('pulp.server.db.model.ContentUnit.pre_save_signal')
+    def test_pre_save_signal_invalidates_cache(self, mock_super_pre_save):
+        erratum = models.Errata(errata_id='RHEA-2010:9999')
+        erratum._updateinfo_xml = {'revision': 'abc', 'version': 1, 'xml': u'<update/>'}
+
+        models.Errata.pre_save_signal(models.Errata, erratum)
+
+        self.assertEqual(erratum._updateinfo_xml.keys(), ['revision'])
+        self.assertNotEqual(erratum._updateinfo_xml['revision'], 'abc')
+
+
 class TestISO(unittest.TestCase):
     """
     Test the ISO class.
@@ -459,14 +583,26 @@ class TestISOManifest(unittest.TestCase):
         manifest = models.ISOManifest(manifest_file, repo_url)
 
         # There should be three ISOs with all the right stuff
-        self.assertEqual(len(manifest._isos), 3)
-        for index, iso in enumerate(manifest._isos):
+        isos = list(manifest)
+        self.assertEqual(len(isos), 3)
+        for index, iso in enumerate(isos):
             self.assertEqual(iso.name, 'test%s.iso' % (index + 1))
             self.assertEqual(iso.size, index + 1)
             self.assertEqual(iso.checksum, 'checksum%s' % (index + 1))
             self.assertEqual(iso.url, urljoin(repo_url, iso.name))
             self.assertEqual(iso._unit, None)
 
+    def test___init___checksum(self):
+        """
+        Assert that the checksum of the manifest file is calculated.
+        """
+        content = 'test1.iso,checksum1,1\ntest2.iso,checksum2,2\n'
+        manifest_file = StringIO(content)
+
+        manifest = models.ISOManifest(manifest_file, 'http://awesomestuff.com/repo/')
+
+        self.assertEqual(manifest.checksum, hashlib.sha256(content).hexdigest())
+
     def test___init___with_malformed_manifest(self):
         """
         Assert good behavior from the __init__() method.
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from pulp_rpm.plugins.db import repodata_store
+
+
+class RepodataStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+        patcher = mock.patch.object(repodata_store, 'get_store_dir',
+                                    return_value=os.path.join(self.storage_dir, 'rpm_repodata'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.storage_dir)
+
+    def test_get_path(self):
+        path = repodata_store.get_path('sha256', 'abcdef')
+
+        self.assertEqual(path, os.path.join(self.storage_dir, 'rpm_repodata', 'sha256', 'ab',
+                                            'cdef.json.gz'))
+
+    def test_write_and_read(self):
+        repodata = {'primary': u'<package>é</package>', 'other': u'<package/>'}
+
+        repodata_store.write('sha256', 'abcdef', repodata)
+
+        self.assertEqual(repodata_store.read('sha256', 'abcdef'), repodata)
+        # only the stored file is left in the directory
+        self.assertEqual(os.listdir(os.path.dirname(repodata_store.get_path('sha256', 'abcdef'))),
+                         ['cdef.json.gz'])
+
+    def test_write_replaces(self):
+        repodata_store.write('sha256', 'abcdef', {'primary': u'<old/>'})
+        repodata_store.write('sha256', 'abcdef', {'primary': u'<new/>'})
+
+        self.assertEqual(repodata_store.read('sha256', 'abcdef'), {'primary': u'<new/>'})
+
+    def test_read_missing(self):
+        self.assertRaises(IOError, repodata_store.read, 'sha256', 'abcdef')
+
+    def test_delete(self):
+        repodata_store.write('sha256', 'abcdef', {'primary': u'<package/>'})
+
+        repodata_store.delete('sha256', 'abcdef')
+
+        self.assertFalse(os.path.exists(repodata_store.get_path('sha256', 'abcdef')))
+
+    def test_delete_missing(self):
+        repodata_store.delete('sha256', 'abcdef')
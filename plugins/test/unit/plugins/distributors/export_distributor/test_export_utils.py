@@ -65,6 +65,9 @@ class TestValidateExportConfig(unittest.TestCase):
         self.repo_config[constants.SKIP_KEYWORD] = []
         self.repo_config[constants.ISO_PREFIX_KEYWORD] = 'prefix'
         self.repo_config[constants.ISO_SIZE_KEYWORD] = 630
+        self.repo_config[constants.ISO_WORKERS_KEYWORD] = 4
+        self.repo_config[constants.EXPORT_WORKERS_KEYWORD] = 2
+        self.repo_config[constants.ISO_PACKING_KEYWORD] = 'first_fit_decreasing'
         self.repo_config[constants.EXPORT_DIRECTORY_KEYWORD] = '/path/to/dir'
         self.repo_config[constants.START_DATE_KEYWORD] = '2013-07-18T11:22:00'
         self.repo_config[constants.END_DATE_KEYWORD] = '2013-07-18T11:23:00'
@@ -99,6 +102,22 @@ class TestValidateExportConfig(unittest.TestCase):
         result = export_utils.validate_export_config(PluginCallConfiguration({}, self.repo_config))
         self.assertFalse(result[0])
 
+    def test_bad_workers_config(self):
+        # Test that a worker count that isn't a positive integer fails validation
+        for key in (constants.ISO_WORKERS_KEYWORD, constants.EXPORT_WORKERS_KEYWORD):
+            for value in (0, 'many'):
+                repo_config = dict(self.repo_config)
+                repo_config[key] = value
+                result = export_utils.validate_export_config(
+                    PluginCallConfiguration({}, repo_config))
+                self.assertFalse(result[0])
+
+    def test_bad_iso_packing_config(self):
+        self.repo_config[constants.ISO_PACKING_KEYWORD] = 'tetris'
+
+        result = export_utils.validate_export_config(PluginCallConfiguration({}, self.repo_config))
+        self.assertFalse(result[0])
+
     def test_bad_start_date(self):
         # Setup
         self.repo_config[constants.START_DATE_KEYWORD] = 'malformed date'
@@ -34,13 +34,51 @@ class TestCreateIso(unittest.TestCase):
         # Assert all the helper methods were called correctly
         generate_iso.create_iso('/target/dir', '/output/dir', 'prefix')
         generate_iso._get_dir_file_list_and_size.assert_called_once_with('/target/dir')
-        generate_iso._compute_image_files.assert_called_once_with(['files'],
-                                                                  generate_iso.DVD_ISO_SIZE *
-                                                                  1024 * 1024)
+        generate_iso._compute_image_files.assert_called_once_with(
+            ['files'], generate_iso.DVD_ISO_SIZE * 1024 * 1024, generate_iso.PACKING_SEQUENTIAL)
         self.assertEqual('list', generate_iso._make_iso.call_args[0][0])
         self.assertEqual('/target/dir', generate_iso._make_iso.call_args[0][1])
         self.assertEqual('/output/dir', generate_iso._make_iso.call_args[0][2])
 
+    def test_create_iso_progress(self):
+        """
+        Test that every image is built and its progress reported from the calling thread
+        """
+        generate_iso._compute_image_files.return_value = [['a'], ['b'], ['c']]
+        generate_iso._make_iso.side_effect = lambda file_list, *args: file_list != ['b']
+        progress_callback = mock.Mock()
+
+        failed = generate_iso.create_iso('/target/dir', '/output/dir', 'prefix',
+                                         progress_callback=progress_callback, max_workers=2)
+
+        built = sorted(c[0][0] for c in generate_iso._make_iso.call_args_list)
+        self.assertEqual(built, [['a'], ['b'], ['c']])
+        names = sorted(c[0][3] for c in generate_iso._make_iso.call_args_list)
+        self.assertEqual(failed, [names[1]])
+        calls = progress_callback.call_args_list
+        self.assertEqual(calls[0], mock.call(generate_iso.PROGRESS_FILL_RATIO,
+                                             55.0 / (3 * generate_iso.DVD_ISO_SIZE * 1024 * 1024)))
+        self.assertEqual(calls[1], mock.call(generate_iso.PROGRESS_IMAGE_COUNT, 3))
+        self.assertEqual(len(calls), 8)
+        for name in names:
+            states = [c[0][1] for c in calls if c[0][0] == name]
+            final = generate_iso.ISO_STATE_FAILED if name == names[1] \
+                else generate_iso.ISO_STATE_COMPLETE
+            self.assertEqual(states, [generate_iso.ISO_STATE_RUNNING, final])
+
+    def test_create_iso_make_iso_error(self):
+        """
+        Test that an image whose build raises an exception is reported as failed
+        """
+        generate_iso._make_iso.side_effect = OSError()
+        progress_callback = mock.Mock()
+
+        failed = generate_iso.create_iso('/target/dir', '/output/dir', 'prefix',
+                                         progress_callback=progress_callback)
+
+        self.assertEqual(len(failed), 1)
+        progress_callback.assert_called_with(failed[0], generate_iso.ISO_STATE_FAILED)
+
 
 class TestMakeIso(unittest.TestCase):
     """
@@ -115,6 +153,21 @@ class TestParseImageSize(unittest.TestCase):
         self.assertEqual(100 * 1024 * 1024, result)
 
 
+class TestParseMaxWorkers(unittest.TestCase):
+    """
+    Test the _parse_max_workers helper method in generate_iso
+    """
+
+    def test_zero(self):
+        self.assertRaises(ValueError, generate_iso._parse_max_workers, 0)
+
+    def test_none(self):
+        self.assertEqual(generate_iso.DEFAULT_ISO_WORKERS, generate_iso._parse_max_workers(None))
+
+    def test_parse_max_workers(self):
+        self.assertEqual(3, generate_iso._parse_max_workers('3'))
+
+
 class TestComputeImageFiles(unittest.TestCase):
     """
     Test the _compute_image_files helper method in generate_iso
@@ -140,6 +193,58 @@ class TestComputeImageFiles(unittest.TestCase):
         self.assertEqual(images[1], [file_list[3][0]])
         self.assertEqual(images[2], [file_list[4][0]])
 
+    def test_large_file_list(self):
+        # Test that planning many files does not rescan the list for every image
+        file_list = [('path%d' % i, 1) for i in range(200000)]
+
+        images = generate_iso._compute_image_files(file_list, 1000)
+        self.assertEqual(200, len(images))
+        self.assertEqual(images[199][-1], 'path199999')
+
+    def test_first_fit_decreasing(self):
+        image_size = 5
+        file_list = [('/a/path1', 1), ('/a/path2', 2), ('/b/path3', 2), ('/c/path4', 4),
+                     ('/d/path5', 3)]
+
+        images = generate_iso._compute_image_files(file_list, image_size,
+                                                   generate_iso.PACKING_FIRST_FIT_DECREASING)
+        self.assertEqual(images, [['/c/path4'], ['/a/path1', '/a/path2', '/b/path3'],
+                                  ['/d/path5']])
+
+    def test_first_fit_decreasing_fills_gaps(self):
+        # Test that small files fill the space left in earlier images
+        image_size = 5
+        file_list = [('/a/path1', 1), ('/b/path2', 4), ('/c/path3', 3), ('/d/path4', 2)]
+
+        images = generate_iso._compute_image_files(file_list, image_size,
+                                                   generate_iso.PACKING_FIRST_FIT_DECREASING)
+        self.assertEqual(images, [['/a/path1', '/b/path2'], ['/c/path3', '/d/path4']])
+
+    def test_first_fit_decreasing_splits_large_group(self):
+        # Test that a directory larger than an image is split into its files
+        image_size = 5
+        file_list = [('/a/path1', 3), ('/a/path2', 3), ('/a/path3', 2), ('/b/path4', 2)]
+
+        images = generate_iso._compute_image_files(file_list, image_size,
+                                                   generate_iso.PACKING_FIRST_FIT_DECREASING)
+        self.assertEqual(images, [['/a/path1', '/a/path3'], ['/a/path2', '/b/path4']])
+
+    def test_invalid_packing(self):
+        self.assertRaises(ValueError, generate_iso._compute_image_files, [('path1', 1)], 5,
+                          'tetris')
+
+
+class TestGetFillRatio(unittest.TestCase):
+    """
+    Test the _get_fill_ratio helper method in generate_iso
+    """
+
+    def test_fill_ratio(self):
+        self.assertEqual(0.75, generate_iso._get_fill_ratio(15, 2, 10))
+
+    def test_no_images(self):
+        self.assertEqual(0.0, generate_iso._get_fill_ratio(0, 0, 10))
+
 
 class TestGetGraft(unittest.TestCase):
     """
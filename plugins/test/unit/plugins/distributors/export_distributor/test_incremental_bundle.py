@@ -0,0 +1,72 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from pulp.common.compat import json
+
+from pulp_rpm.plugins.distributors.export_distributor import incremental_bundle
+
+
+class TestBundleWriter(unittest.TestCase):
+    """
+    Test writing incremental exports and reading them back
+    """
+
+    def setUp(self):
+        self.repo_dir = tempfile.mkdtemp()
+        self.writer = incremental_bundle.BundleWriter(self.repo_dir, units_per_bundle=2)
+        self.writer.initialize()
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir)
+
+    def test_write_and_read(self):
+        for i in range(3):
+            self.writer.add_unit('rpm', {'name': 'foo%d' % i}, {'size': i})
+        self.writer.add_unit('erratum', {'errata_id': 'RHSA-1'}, {'title': u'caf\xe9'})
+        self.writer.finalize()
+
+        index = incremental_bundle.read_index(self.repo_dir)
+        self.assertEqual(index['version'], incremental_bundle.FORMAT_VERSION)
+        self.assertEqual([(e['file'], e['type_id'], e['units']) for e in index['bundles']],
+                         [('rpm-0001.json.gz', 'rpm', 2), ('rpm-0002.json.gz', 'rpm', 1),
+                          ('erratum-0001.json.gz', 'erratum', 1)])
+
+        units = []
+        for entry in index['bundles']:
+            units.extend(incremental_bundle.iter_units(self.repo_dir, entry))
+        self.assertEqual(units, [({'name': 'foo0'}, {'size': 0}), ({'name': 'foo1'}, {'size': 1}),
+                                 ({'name': 'foo2'}, {'size': 2}),
+                                 ({'errata_id': 'RHSA-1'}, {'title': u'caf\xe9'})])
+
+    def test_one_document_per_line(self):
+        self.writer.add_unit('rpm', {'name': 'foo'}, {})
+        self.writer.add_unit('rpm', {'name': 'bar'}, {})
+        self.writer.finalize()
+
+        bundle_file = gzip.open(os.path.join(self.writer.directory, 'rpm-0001.json.gz'))
+        try:
+            lines = bundle_file.readlines()
+        finally:
+            bundle_file.close()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1]), {'unit_key': {'name': 'bar'}, 'unit_metadata': {}})
+
+    def test_checksum_mismatch(self):
+        self.writer.add_unit('rpm', {'name': 'foo'}, {})
+        self.writer.finalize()
+        entry = incremental_bundle.read_index(self.repo_dir)['bundles'][0]
+        entry['checksum'] = 'abc'
+
+        self.assertRaises(ValueError, list, incremental_bundle.iter_units(self.repo_dir, entry))
+
+    def test_read_index_missing(self):
+        self.assertEqual(incremental_bundle.read_index(self.repo_dir), None)
+
+    def test_read_index_unsupported_version(self):
+        with open(os.path.join(self.writer.directory, 'index.json'), 'w') as index_file:
+            json.dump({'version': 99, 'bundles': []}, index_file)
+
+        self.assertRaises(ValueError, incremental_bundle.read_index, self.repo_dir)
@@ -23,7 +23,7 @@ class FilelistsXMLFileContextTests(unittest.TestCase):
         context = FilelistsXMLFileContext(self.working_dir, 3)
         context.metadata_file_handle = mock.Mock()
 
-        context.add_unit_metadata(mock.Mock(repodata={'filelists': 'bar'}))
+        context.add_unit_metadata(mock.Mock(get_repodata={'filelists': 'bar'}.get))
 
         context.metadata_file_handle.write.assert_called_once_with('bar')
 
@@ -36,5 +36,5 @@ class FilelistsXMLFileContextTests(unittest.TestCase):
         expected_call = 'some unicode'
         repodata = {'filelists': unicode(expected_call)}
 
-        context.add_unit_metadata(mock.Mock(repodata=repodata))
+        context.add_unit_metadata(mock.Mock(get_repodata=repodata.get))
         context.metadata_file_handle.write.assert_called_once_with(expected_call)
@@ -1,3 +1,4 @@
+import bz2
 import gzip
 import hashlib
 import os
@@ -11,6 +12,7 @@ from pulp.plugins.model import Unit
 
 from pulp_rpm.common.ids import TYPE_ID_RPM
 from pulp_rpm.devel.skip import skip_broken
+from pulp_rpm.plugins.db import models
 from pulp_rpm.plugins.distributors.yum.metadata.metadata import (
     MetadataFileContext, PreGeneratedMetadataContext, REPO_DATA_DIR_NAME)
 from pulp_rpm.plugins.distributors.yum.metadata.prestodelta import (
@@ -18,7 +20,8 @@ from pulp_rpm.plugins.distributors.yum.metadata.prestodelta import (
 from pulp_rpm.plugins.distributors.yum.metadata.repomd import (
     RepomdXMLFileContext, REPO_XML_NAME_SPACE, RPM_XML_NAME_SPACE, REPOMD_FILE_NAME)
 from pulp_rpm.plugins.distributors.yum.metadata.updateinfo import (
-    UpdateinfoXMLFileContext, UPDATE_INFO_XML_FILE_NAME)
+    UpdateinfoXMLFileContext, UPDATE_INFO_XML_FILE_NAME, UPDATEINFO_XML_VERSION,
+    get_update_element_string)
 from pulp_rpm.plugins.importers.yum.repomd import packages, presto, updateinfo
 
 
@@ -396,6 +399,33 @@ class YumDistributorMetadataTests(unittest.TestCase):
         self.assertEqual(content.count('<package'), 2)
         self.assertEqual(content.count('<sum type="md5">f3c197a29d9b66c5b65c5d62b25db5b4</sum>'), 1)
 
+    @patch('pulp_rpm.plugins.distributors.yum.metadata.updateinfo.render_update_element')
+    def test_updateinfo_cached_unit_metadata(self, mock_render):
+        erratum_unit = models.Errata(errata_id='RHEA-2010:9999')
+        erratum_unit._updateinfo_xml = {'revision': 'abc', 'version': UPDATEINFO_XML_VERSION,
+                                        'xml': u'<update><id>RHEA-2010:9999</id></update>'}
+
+        result = get_update_element_string(erratum_unit)
+
+        self.assertEqual(result, '<update><id>RHEA-2010:9999</id></update>')
+        self.assertFalse(mock_render.called)
+
+    @patch('pulp_rpm.plugins.distributors.yum.metadata.updateinfo.models.Errata.objects')
+    @patch('pulp_rpm.plugins.distributors.yum.metadata.updateinfo.render_update_element')
+    def test_updateinfo_outdated_unit_metadata(self, mock_render, mock_objects):
+        mock_render.return_value = '<update><id>RHEA-2010:9999</id></update>'
+        erratum_unit = models.Errata(errata_id='RHEA-2010:9999', id='1234')
+        erratum_unit._updateinfo_xml = {'revision': 'abc', 'version': UPDATEINFO_XML_VERSION - 1,
+                                        'xml': u'<update/>'}
+
+        result = get_update_element_string(erratum_unit)
+
+        self.assertEqual(result, mock_render.return_value)
+        mock_objects.assert_called_once_with(id='1234', _updateinfo_xml__revision='abc')
+        mock_objects.return_value.update_one.assert_called_once_with(
+            set___updateinfo_xml={'revision': 'abc', 'version': UPDATEINFO_XML_VERSION,
+                                  'xml': u'<update><id>RHEA-2010:9999</id></update>'})
+
     # -- prestodelta.xml testing -----------------------------------------------
 
     @skip_broken
@@ -538,3 +568,67 @@ class YumDistributorMetadataTests(unittest.TestCase):
             self.assertEqual(
                 content.count('<open-size>%s</open-size>' % len(test_metadata_content)), 1)
             self.assertEqual(content.count('<open-checksum type="sha256">'), 1)
+
+    def test_repomd_database_metadata(self):
+
+        path = os.path.join(self.metadata_file_dir,
+                            REPO_DATA_DIR_NAME,
+                            REPOMD_FILE_NAME)
+
+        test_database_file_path = os.path.join(self.metadata_file_dir,
+                                               REPO_DATA_DIR_NAME,
+                                               'primary.sqlite.bz2')
+        test_database_content = 'The quick brown fox jumps over the lazy dog'
+
+        os.makedirs(os.path.dirname(test_database_file_path))
+        test_database_file_handle = bz2.BZ2File(test_database_file_path, 'w')
+        test_database_file_handle.write(test_database_content)
+        test_database_file_handle.close()
+
+        context = RepomdXMLFileContext(self.metadata_file_dir)
+        context._open_metadata_file_handle()
+        context.add_metadata_file_metadata('primary_db', test_database_file_path,
+                                           database_version=10)
+        context._close_metadata_file_handle()
+
+        with open(path, 'r') as repomd_handle:
+            content = repomd_handle.read()
+            self.assertEqual(content.count('<data type="primary_db"'), 1)
+            self.assertEqual(
+                content.count('<open-size>%s</open-size>' % len(test_database_content)), 1)
+            self.assertEqual(content.count(
+                '<open-checksum type="sha256">%s</open-checksum>' %
+                hashlib.sha256(test_database_content).hexdigest()), 1)
+            self.assertEqual(content.count('<database_version>10</database_version>'), 1)
+
+    def test_repomd_precalculated_open_checksum(self):
+
+        path = os.path.join(self.metadata_file_dir,
+                            REPO_DATA_DIR_NAME,
+                            REPOMD_FILE_NAME)
+
+        test_database_file_path = os.path.join(self.metadata_file_dir,
+                                               REPO_DATA_DIR_NAME,
+                                               'abc-primary.sqlite.bz2')
+
+        os.makedirs(os.path.dirname(test_database_file_path))
+        test_database_file_handle = bz2.BZ2File(test_database_file_path, 'w')
+        test_database_file_handle.write('The quick brown fox jumps over the lazy dog')
+        test_database_file_handle.close()
+
+        context = RepomdXMLFileContext(self.metadata_file_dir)
+        context._open_metadata_file_handle()
+        with patch('bz2.BZ2File') as mock_bz2_file:
+            context.add_metadata_file_metadata('primary_db', test_database_file_path, 'abc',
+                                               database_version=10, open_checksum='def',
+                                               open_size=43)
+            # the database is not decompressed again
+            self.assertFalse(mock_bz2_file.called)
+        context._close_metadata_file_handle()
+
+        with open(path, 'r') as repomd_handle:
+            content = repomd_handle.read()
+            self.assertEqual(content.count('<location href="repodata/abc-primary.sqlite.bz2"'), 1)
+            self.assertEqual(content.count('<checksum type="sha256">abc</checksum>'), 1)
+            self.assertEqual(content.count('<open-size>43</open-size>'), 1)
+            self.assertEqual(content.count('<open-checksum type="sha256">def</open-checksum>'), 1)
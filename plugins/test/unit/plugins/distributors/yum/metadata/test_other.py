@@ -21,7 +21,7 @@ class OtherXMLFileContextTests(unittest.TestCase):
 
     def test_add_unit_metadata(self):
         self.context.metadata_file_handle = mock.Mock()
-        self.context.add_unit_metadata(mock.Mock(repodata={'other': 'bar'}))
+        self.context.add_unit_metadata(mock.Mock(get_repodata={'other': 'bar'}.get))
         self.context.metadata_file_handle.write.assert_called_once_with('bar')
 
     def test_add_unit_metadata_unicode(self):
@@ -31,5 +31,5 @@ class OtherXMLFileContextTests(unittest.TestCase):
         self.context.metadata_file_handle = mock.Mock()
         expected_call = 'some unicode'
         repodata = {'other': unicode(expected_call)}
-        self.context.add_unit_metadata(mock.Mock(repodata=repodata))
+        self.context.add_unit_metadata(mock.Mock(get_repodata=repodata.get))
         self.context.metadata_file_handle.write.assert_called_once_with(expected_call)
@@ -0,0 +1,94 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from pulp_rpm.plugins.distributors.yum.metadata.metadata import REPO_DATA_DIR_NAME
+from pulp_rpm.plugins.distributors.yum.metadata.package_index import (
+    PACKAGE_INDEX_FILE_NAME, PackageMetadataIndex)
+
+
+class PackageMetadataIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.working_dir, REPO_DATA_DIR_NAME))
+        self.metadata_file_path = os.path.join(self.working_dir, REPO_DATA_DIR_NAME,
+                                               'abc-primary.xml.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def _write_metadata_file(self, index, snippets):
+        metadata_file = gzip.open(self.metadata_file_path, 'wb')
+        try:
+            metadata_file.write('<metadata>')
+            for pkgid, snippet in snippets:
+                offset = metadata_file.tell()
+                metadata_file.write(snippet)
+                index.add_snippet('primary', pkgid, offset, len(snippet))
+                index.add_package(pkgid, pkgid + '.rpm')
+            metadata_file.write('</metadata>')
+        finally:
+            metadata_file.close()
+        index.set_metadata_file('primary', self.metadata_file_path)
+
+    def test_load_missing(self):
+        self.assertTrue(PackageMetadataIndex.load(self.working_dir) is None)
+
+    def test_load_unreadable(self):
+        with open(os.path.join(self.working_dir, PACKAGE_INDEX_FILE_NAME), 'w') as index_file:
+            index_file.write('not gzip')
+
+        self.assertTrue(PackageMetadataIndex.load(self.working_dir) is None)
+
+    def test_load_missing_metadata_file(self):
+        index = PackageMetadataIndex(self.working_dir)
+        self._write_metadata_file(index, [('a', '<package>a</package>')])
+        index.write()
+        os.remove(self.metadata_file_path)
+
+        self.assertTrue(PackageMetadataIndex.load(self.working_dir) is None)
+
+    def test_load_incomplete(self):
+        # written before the index recorded the units besides packages
+        index_file = gzip.open(os.path.join(self.working_dir, PACKAGE_INDEX_FILE_NAME), 'wb')
+        try:
+            index_file.write('{"packages": {}, "files": {}, "snippets": {}}')
+        finally:
+            index_file.close()
+
+        self.assertTrue(PackageMetadataIndex.load(self.working_dir) is None)
+
+    def test_write_and_load(self):
+        index = PackageMetadataIndex(self.working_dir)
+        self._write_metadata_file(index, [('a', '<package>a</package>')])
+        index.set_units('drpm', set(['d2', 'd1']))
+        index.write()
+
+        loaded = PackageMetadataIndex.load(self.working_dir)
+
+        self.assertEqual(loaded.packages, {'a': 'a.rpm'})
+        self.assertEqual(loaded.metadata_file_path('primary'), self.metadata_file_path)
+        self.assertEqual(loaded.snippets, {'primary': [['a', 10, 20]]})
+        self.assertEqual(loaded.units, {'drpm': ['d1', 'd2']})
+
+    def test_read_snippets(self):
+        index = PackageMetadataIndex(self.working_dir)
+        snippets = [('a', '<package>a</package>'), ('b', '<package>bb</package>'),
+                    ('c', '<package>ccc</package>')]
+        self._write_metadata_file(index, snippets)
+
+        result = list(index.read_snippets('primary', set(['a', 'c'])))
+
+        self.assertEqual(result, [snippets[0], snippets[2]])
+
+    def test_read_snippets_moved_file(self):
+        index = PackageMetadataIndex(self.working_dir)
+        self._write_metadata_file(index, [('a', '<package>a</package>')])
+        moved_path = os.path.join(self.working_dir, 'moved.xml.gz')
+        os.rename(self.metadata_file_path, moved_path)
+
+        result = list(index.read_snippets('primary', set(['a']), moved_path))
+
+        self.assertEqual(result, [('a', '<package>a</package>')])
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import bz2
+import gzip
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from pulp_rpm.plugins.distributors.yum.metadata.metadata import REPO_DATA_DIR_NAME
+from pulp_rpm.plugins.distributors.yum.metadata.sqlite_db import (
+    DATABASE_VERSION, SqliteRepodataWriter)
+
+
+PRIMARY_SNIPPET = '''<package type="rpm">
+  <name>walrus</name>
+  <arch>noarch</arch>
+  <version epoch="0" ver="5.21" rel="1"/>
+  <checksum type="sha256" pkgid="YES">abc</checksum>
+  <summary>A dummy package of walrus</summary>
+  <description>A dummy package of walrus</description>
+  <packager></packager>
+  <url>http://tstrachota.fedorapeople.org</url>
+  <time file="1331832453" build="1331831374"/>
+  <size package="2445" installed="42" archive="296"/>
+  <location href="walrus-5.21-1.noarch.rpm"/>
+  <format>
+    <rpm:license>GPLv2</rpm:license>
+    <rpm:vendor/>
+    <rpm:group>Internet/Applications</rpm:group>
+    <rpm:buildhost>smqe-ws15</rpm:buildhost>
+    <rpm:sourcerpm>walrus-5.21-1.src.rpm</rpm:sourcerpm>
+    <rpm:header-range start="872" end="2293"/>
+    <rpm:provides>
+      <rpm:entry name="walrus" flags="EQ" epoch="0" ver="5.21" rel="1"/>
+    </rpm:provides>
+    <rpm:requires>
+      <rpm:entry name="/bin/sh" pre="1"/>
+      <rpm:entry name="whale"/>
+    </rpm:requires>
+    <file>/usr/bin/walrus</file>
+  </format>
+</package>'''
+
+FILELISTS_SNIPPET = '''<package pkgid="abc" name="walrus" arch="noarch">
+  <version epoch="0" ver="5.21" rel="1"/>
+  <file>/usr/bin/walrus</file>
+  <file type="dir">/usr/share/walrus</file>
+  <file>/usr/share/walrus/README</file>
+  <file type="ghost">/usr/bin/walrus-old</file>
+</package>'''
+
+OTHER_SNIPPET = u'''<package pkgid="abc" name="walrus" arch="noarch">
+  <version epoch="0" ver="5.21" rel="1"/>
+  <changelog author="Tomáš &lt;tom@example.com&gt; 5.21-1" date="1331812800">- Bump</changelog>
+</package>'''
+
+
+class SqliteRepodataWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.working_dir, REPO_DATA_DIR_NAME))
+        self.writer = SqliteRepodataWriter(self.working_dir, 'sha256')
+        self.writer.initialize()
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def _finalize(self):
+        checksums = {'primary': 'p', 'filelists': 'f', 'other': 'o'}
+        databases = self.writer.finalize(checksums)
+        connections = {}
+        for metadata_type, database in databases.items():
+            self.assertFalse(os.path.exists(self.writer.database_path(metadata_type)))
+            with open(database['path'], 'rb') as compressed_file:
+                checksum = hashlib.sha256(compressed_file.read()).hexdigest()
+            # the databases are named after their checksums, like the XML files
+            self.assertEqual(database['checksum'], checksum)
+            self.assertEqual(os.path.basename(database['path']),
+                             '%s-%s.sqlite.bz2' % (checksum, metadata_type))
+            content = bz2.BZ2File(database['path']).read()
+            self.assertEqual(database['open_checksum'], hashlib.sha256(content).hexdigest())
+            self.assertEqual(database['open_size'], len(content))
+            database_path = os.path.join(self.working_dir, metadata_type + '.sqlite')
+            with open(database_path, 'wb') as database_file:
+                database_file.write(content)
+            connections[metadata_type] = sqlite3.connect(database_path)
+        return connections
+
+    def _add_snippets(self):
+        self.writer.add_package_metadata('primary', PRIMARY_SNIPPET)
+        self.writer.add_package_metadata('filelists', FILELISTS_SNIPPET)
+        self.writer.add_package_metadata('other', OTHER_SNIPPET)
+
+    def _assert_databases(self, connections):
+        primary = connections['primary']
+        self.assertEqual(primary.execute('SELECT * FROM db_info').fetchall(),
+                         [(DATABASE_VERSION, 'p')])
+        row = primary.execute('SELECT pkgKey, pkgId, name, epoch, version, release, time_file, '
+                              'rpm_header_end, location_href, checksum_type '
+                              'FROM packages').fetchall()
+        self.assertEqual(row, [(1, 'abc', 'walrus', '0', '5.21', '1', 1331832453, 2293,
+                                'walrus-5.21-1.noarch.rpm', 'sha256')])
+        self.assertEqual(primary.execute('SELECT name, pre FROM requires').fetchall(),
+                         [('/bin/sh', 1), ('whale', 0)])
+        self.assertEqual(primary.execute('SELECT name, flags, version FROM provides').fetchall(),
+                         [('walrus', 'EQ', '5.21')])
+        self.assertEqual(primary.execute('SELECT name, type FROM files').fetchall(),
+                         [('/usr/bin/walrus', 'file')])
+
+        filelists = connections['filelists']
+        self.assertEqual(filelists.execute('SELECT * FROM packages').fetchall(), [(1, 'abc')])
+        self.assertEqual(filelists.execute('SELECT dirname, filenames, filetypes '
+                                           'FROM filelist').fetchall(),
+                         [('/usr/bin', 'walrus/walrus-old', 'fg'),
+                          ('/usr/share', 'walrus', 'd'),
+                          ('/usr/share/walrus', 'README', 'f')])
+
+        other = connections['other']
+        self.assertEqual(other.execute('SELECT author, date FROM changelog').fetchall(),
+                         [(u'Tomáš <tom@example.com> 5.21-1', 1331812800)])
+
+    def test_add_package_metadata(self):
+        self._add_snippets()
+
+        self._assert_databases(self._finalize())
+
+    def test_batches(self):
+        self.writer.batch_size = 1
+        self._add_snippets()
+
+        # the primary row is inserted as soon as the batch is full
+        self.assertEqual(self.writer.databases['primary'].rows, {})
+
+        self._assert_databases(self._finalize())
+
+    def test_add_metadata_file(self):
+        documents = (
+            ('primary', '<metadata xmlns="http://linux.duke.edu/metadata/common" '
+                        'xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="1">%s'
+                        '</metadata>' % PRIMARY_SNIPPET),
+            ('filelists', '<filelists xmlns="http://linux.duke.edu/metadata/filelists" '
+                          'packages="1">%s</filelists>' % FILELISTS_SNIPPET),
+            ('other', u'<otherdata xmlns="http://linux.duke.edu/metadata/other" '
+                      u'packages="1">%s</otherdata>' % OTHER_SNIPPET),
+        )
+        for metadata_type, document in documents:
+            path = os.path.join(self.working_dir, metadata_type + '.xml.gz')
+            metadata_file = gzip.open(path, 'wb')
+            try:
+                metadata_file.write(document.encode('utf-8'))
+            finally:
+                metadata_file.close()
+            self.writer.add_metadata_file(metadata_type, path)
+
+        self._assert_databases(self._finalize())
+
+    def test_initialize_removes_previous_databases(self):
+        repodata_dir = os.path.join(self.working_dir, REPO_DATA_DIR_NAME)
+        for name in ('abc-primary.sqlite.bz2', 'primary.sqlite.bz2', 'abc-primary.xml.gz'):
+            open(os.path.join(repodata_dir, name), 'w').close()
+
+        self.writer.initialize()
+
+        self.assertTrue('abc-primary.xml.gz' in os.listdir(repodata_dir))
+        self.assertFalse('abc-primary.sqlite.bz2' in os.listdir(repodata_dir))
+        self.assertFalse('primary.sqlite.bz2' in os.listdir(repodata_dir))
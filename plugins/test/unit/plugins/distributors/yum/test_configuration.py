@@ -238,6 +238,22 @@ class YumDistributorConfigurationTests(unittest.TestCase):
 
         self.assertEqual(len(error_messages), 1)
 
+    def test_link_types(self):
+
+        for link_type in ('symlink', 'hardlink', 'reflink'):
+            error_messages = []
+
+            configuration._validate_link_type(link_type, error_messages)
+
+            self.assertEqual(len(error_messages), 0)
+
+    def test_link_type_invalid(self):
+        error_messages = []
+
+        configuration._validate_link_type('softlink', error_messages)
+
+        self.assertEqual(len(error_messages), 1)
+
     @mock.patch('pulp_rpm.plugins.distributors.yum.configuration._validate_usable_directory')
     def test_http_publish_dir(self, mock_validate_usable_directory):
         error_messages = []
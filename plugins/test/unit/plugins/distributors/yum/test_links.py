@@ -0,0 +1,180 @@
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from pulp_rpm.common import constants
+from pulp_rpm.plugins.distributors.yum import links
+
+
+class LinkBatchTests(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.source_path = os.path.join(self.working_dir, 'content', 'foo.rpm')
+        os.makedirs(os.path.dirname(self.source_path))
+        with open(self.source_path, 'w') as source_file:
+            source_file.write('foo')
+        self.link_path = os.path.join(self.working_dir, 'publish', 'Packages', 'foo.rpm')
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def test_add_batches(self):
+        batch = links.LinkBatch(batch_size=2)
+
+        batch.add(self.source_path, self.link_path)
+        self.assertFalse(os.path.lexists(self.link_path))
+
+        second_link_path = os.path.join(self.working_dir, 'publish', 'bar.rpm')
+        batch.add(self.source_path, second_link_path)
+        self.assertTrue(os.path.islink(self.link_path))
+        self.assertTrue(os.path.islink(second_link_path))
+
+    def test_symlink(self):
+        batch = links.LinkBatch()
+        batch.add(self.source_path, self.link_path)
+        batch.flush()
+
+        self.assertEqual(os.readlink(self.link_path), self.source_path)
+
+    def test_hardlink(self):
+        batch = links.LinkBatch(constants.LINK_TYPE_HARDLINK)
+        batch.add(self.source_path, self.link_path)
+        batch.flush()
+
+        self.assertFalse(os.path.islink(self.link_path))
+        self.assertEqual(os.stat(self.link_path).st_ino, os.stat(self.source_path).st_ino)
+
+    @mock.patch('pulp_rpm.plugins.distributors.yum.links.os.link')
+    def test_hardlink_falls_back_to_symlink(self, mock_link):
+        mock_link.side_effect = OSError(errno.EXDEV, 'Invalid cross-device link')
+        batch = links.LinkBatch(constants.LINK_TYPE_HARDLINK)
+        batch.add(self.source_path, self.link_path)
+        batch.flush()
+
+        self.assertEqual(os.readlink(self.link_path), self.source_path)
+        self.assertEqual(batch.link_type, constants.LINK_TYPE_SYMLINK)
+
+    @mock.patch('pulp_rpm.plugins.distributors.yum.links.os.link')
+    def test_hardlink_error(self, mock_link):
+        mock_link.side_effect = OSError(errno.EACCES, 'Permission denied')
+        batch = links.LinkBatch(constants.LINK_TYPE_HARDLINK)
+        batch.add(self.source_path, self.link_path)
+
+        self.assertRaises(OSError, batch.flush)
+
+    @mock.patch('pulp_rpm.plugins.distributors.yum.links.fcntl.ioctl')
+    def test_reflink_falls_back_to_symlink(self, mock_ioctl):
+        mock_ioctl.side_effect = IOError(errno.EOPNOTSUPP, 'Operation not supported')
+        batch = links.LinkBatch(constants.LINK_TYPE_REFLINK)
+        batch.add(self.source_path, self.link_path)
+        batch.flush()
+
+        self.assertEqual(os.readlink(self.link_path), self.source_path)
+
+    def test_replaces_different_link(self):
+        os.makedirs(os.path.dirname(self.link_path))
+        os.symlink('/dev/null', self.link_path)
+
+        batch = links.LinkBatch()
+        batch.add(self.source_path, self.link_path)
+        batch.flush()
+
+        self.assertEqual(os.readlink(self.link_path), self.source_path)
+
+    @mock.patch('pulp_rpm.plugins.distributors.yum.links.os.symlink')
+    def test_leaves_current_link(self, mock_symlink):
+        os.makedirs(os.path.dirname(self.link_path))
+        os.link(self.source_path, self.link_path)
+
+        batch = links.LinkBatch(constants.LINK_TYPE_HARDLINK)
+        batch.add(self.source_path, self.link_path)
+        with mock.patch('pulp_rpm.plugins.distributors.yum.links.os.link') as mock_link:
+            batch.flush()
+
+        self.assertFalse(mock_link.called)
+        self.assertFalse(mock_symlink.called)
+
+    def test_directory_at_link_path(self):
+        os.makedirs(self.link_path)
+
+        batch = links.LinkBatch()
+        batch.add(self.source_path, self.link_path)
+
+        self.assertRaises(OSError, batch.flush)
+
+
+class CopyTreeTests(unittest.TestCase):
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.content_path = os.path.join(self.working_dir, 'content', 'foo.rpm')
+        os.makedirs(os.path.dirname(self.content_path))
+        with open(self.content_path, 'w') as content_file:
+            content_file.write('foo')
+
+        self.source_dir = os.path.join(self.working_dir, 'source')
+        os.makedirs(os.path.join(self.source_dir, 'repodata'))
+        os.link(self.content_path, os.path.join(self.source_dir, 'foo.rpm'))
+        os.symlink(self.content_path, os.path.join(self.source_dir, 'bar.rpm'))
+        os.symlink(self.source_dir, os.path.join(self.source_dir, 'Packages'))
+        with open(os.path.join(self.source_dir, 'repodata', 'repomd.xml'), 'w') as repomd:
+            repomd.write('<repomd/>')
+
+        self.target_dir = os.path.join(self.working_dir, 'target')
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def test_copy_tree(self):
+        links.copy_tree(self.source_dir, self.target_dir)
+
+        foo_path = os.path.join(self.target_dir, 'foo.rpm')
+        self.assertFalse(os.path.islink(foo_path))
+        self.assertEqual(os.stat(foo_path).st_ino, os.stat(self.content_path).st_ino)
+        self.assertEqual(os.readlink(os.path.join(self.target_dir, 'bar.rpm')), self.content_path)
+        self.assertEqual(os.readlink(os.path.join(self.target_dir, 'Packages')), self.source_dir)
+
+        source_repomd_path = os.path.join(self.source_dir, 'repodata', 'repomd.xml')
+        repomd_path = os.path.join(self.target_dir, 'repodata', 'repomd.xml')
+        self.assertNotEqual(os.stat(repomd_path).st_ino, os.stat(source_repomd_path).st_ino)
+        with open(repomd_path) as repomd:
+            self.assertEqual(repomd.read(), '<repomd/>')
+
+    @mock.patch('pulp_rpm.plugins.distributors.yum.links.os.link')
+    def test_copy_tree_cross_device(self, mock_link):
+        mock_link.side_effect = OSError(errno.EXDEV, 'Invalid cross-device link')
+
+        links.copy_tree(self.source_dir, self.target_dir)
+
+        foo_path = os.path.join(self.target_dir, 'foo.rpm')
+        self.assertFalse(os.path.islink(foo_path))
+        with open(foo_path) as foo_file:
+            self.assertEqual(foo_file.read(), 'foo')
+
+    def test_realize_tree(self):
+        links.realize_tree(self.source_dir, self.target_dir)
+
+        content_inode = os.stat(self.content_path).st_ino
+        for name in ('foo.rpm', 'bar.rpm'):
+            path = os.path.join(self.target_dir, name)
+            self.assertFalse(os.path.islink(path))
+            self.assertEqual(os.stat(path).st_ino, content_inode)
+        self.assertEqual(os.readlink(os.path.join(self.target_dir, 'Packages')), self.source_dir)
+
+        source_repomd_path = os.path.join(self.source_dir, 'repodata', 'repomd.xml')
+        repomd_path = os.path.join(self.target_dir, 'repodata', 'repomd.xml')
+        self.assertEqual(os.stat(repomd_path).st_ino, os.stat(source_repomd_path).st_ino)
+
+    @mock.patch('pulp_rpm.plugins.distributors.yum.links.os.link')
+    def test_realize_tree_cross_device(self, mock_link):
+        mock_link.side_effect = OSError(errno.EXDEV, 'Invalid cross-device link')
+
+        links.realize_tree(self.source_dir, self.target_dir)
+
+        bar_path = os.path.join(self.target_dir, 'bar.rpm')
+        self.assertFalse(os.path.islink(bar_path))
+        with open(bar_path) as bar_file:
+            self.assertEqual(bar_file.read(), 'foo')
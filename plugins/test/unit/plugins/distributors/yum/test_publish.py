@@ -4,16 +4,14 @@ import shutil
 import tempfile
 import unittest
 
-from pulp.common.compat import json
 from pulp.common.plugins import reporting_constants
-from pulp.devel.unit.util import touch, compare_dict
+from pulp.devel.unit.util import touch
 from pulp.plugins.conduits.repo_publish import RepoPublishConduit
 from pulp.plugins.config import PluginCallConfiguration
 from pulp.plugins.model import Repository, Unit
 from pulp.plugins.util.publish_step import PublishStep, CreatePulpManifestStep
-from pulp.server import constants as server_constants
 from pulp.server.db import model
-from pulp.server.exceptions import InvalidValue, PulpCodedException
+from pulp.server.exceptions import InvalidValue
 import isodate
 import mock
 import pulp.server.managers.factory as manager_factory
@@ -187,13 +185,15 @@ class ExportRepoPublisherTests(BaseYumDistributorPublishStepTests):
                                            self.publisher.get_conduit(),
                                            config,
                                            YUM_DISTRIBUTOR_ID, working_dir=self.working_dir)
-        self.assertTrue(isinstance(step.children[0], publish.PublishRpmAndDrpmStepIncremental))
-        self.assertTrue(isinstance(step.children[1], publish.PublishErrataStepIncremental))
-        self.assertTrue(isinstance(step.children[2], publish.CopyDirectoryStep))
-        self.assertTrue(isinstance(step.children[3], publish.GenerateListingFileStep))
+        self.assertTrue(isinstance(step.children[0], publish.InitIncrementalExportStep))
+        self.assertTrue(isinstance(step.children[1], publish.PublishRpmAndDrpmStepIncremental))
+        self.assertTrue(isinstance(step.children[2], publish.PublishErrataStepIncremental))
+        self.assertTrue(isinstance(step.children[3], publish.CloseIncrementalExportStep))
+        self.assertTrue(isinstance(step.children[4], publish.CopyDirectoryStep))
+        self.assertTrue(isinstance(step.children[5], publish.GenerateListingFileStep))
 
-        self.assertEquals(step.children[0].association_filters, 'foo')
         self.assertEquals(step.children[1].association_filters, 'foo')
+        self.assertEquals(step.children[2].association_filters, 'foo')
 
     @skip_broken
     @mock.patch('pulp_rpm.plugins.distributors.yum.publish.export_utils.create_date_range_filter')
@@ -204,7 +204,7 @@ class ExportRepoPublisherTests(BaseYumDistributorPublishStepTests):
                                            self.publisher.get_conduit(),
                                            config,
                                            YUM_DISTRIBUTOR_ID, working_dir=self.working_dir)
-        self.assertTrue(isinstance(step.children[-4], publish.CopyDirectoryStep))
+        self.assertTrue(isinstance(step.children[-4], publish.RealizeTreeStep))
         self.assertTrue(isinstance(step.children[-3], publish.GenerateListingFileStep))
         self.assertTrue(isinstance(step.children[-2], publish.CreateIsoStep))
         self.assertTrue(isinstance(step.children[-1], publish.AtomicDirectoryPublishStep))
@@ -212,8 +212,8 @@ class ExportRepoPublisherTests(BaseYumDistributorPublishStepTests):
         for child in step.children:
             self.assertFalse(isinstance(child, CreatePulpManifestStep))
 
-        self.assertEquals(step.children[0].association_filters, 'foo')
         self.assertEquals(step.children[1].association_filters, 'foo')
+        self.assertEquals(step.children[2].association_filters, 'foo')
 
     @skip_broken
     @mock.patch('pulp_rpm.plugins.distributors.yum.publish.export_utils.create_date_range_filter')
@@ -228,6 +228,8 @@ class ExportRepoPublisherTests(BaseYumDistributorPublishStepTests):
         )
 
         self.assertTrue(isinstance(step.children[-2], CreatePulpManifestStep))
+        # exports don't carry the package index
+        self.assertFalse(step.rpm_step.write_package_index)
 
 
 class ExportRepoGroupPublisherTests(BaseYumDistributorPublishStepTests):
@@ -258,8 +260,33 @@ class ExportRepoGroupPublisherTests(BaseYumDistributorPublishStepTests):
         self.assertTrue(isinstance(step.children[0], publish.ExportRepoPublisher))
         self.assertEquals(len(step.children), 1)
 
-        self.assertEquals(step.children[0].children[0].association_filters, 'foo')
         self.assertEquals(step.children[0].children[1].association_filters, 'foo')
+        self.assertEquals(step.children[0].children[2].association_filters, 'foo')
+
+    @skip_broken
+    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.BaseYumRepoPublisher.get_working_dir')
+    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.model.Repository.objects')
+    def test_init_concurrent(self, mock_repo_qs, m_wd):
+        export_dir = 'flux'
+        config = PluginCallConfiguration(None, {constants.EXPORT_DIRECTORY_KEYWORD: export_dir,
+                                                constants.EXPORT_WORKERS_KEYWORD: 4})
+        repo_group = mock.Mock(repo_ids=['foo', 'bar'], working_dir=self.working_dir)
+        mock_repo_qs.return_value = [
+            model.Repository(repo_id=repo_id, display_name=repo_id,
+                             notes={'_repo-type': 'rpm-repo'})
+            for repo_id in ('foo', 'bar')]
+
+        step = publish.ExportRepoGroupPublisher(repo_group,
+                                                self.publisher.get_conduit(),
+                                                config,
+                                                EXPORT_DISTRIBUTOR_ID)
+
+        self.assertTrue(isinstance(step.children[0], publish.ConcurrentRepoExportStep))
+        self.assertEquals(step.children[0].max_workers, 4)
+        self.assertEquals(len(step.children[0].children), 2)
+        self.assertTrue(isinstance(step.children[1], publish.GenerateListingFileStep))
+        self.assertTrue(isinstance(step.children[2], publish.GenerateListingFileStep))
+        self.assertEquals(len(step.children), 3)
 
     @skip_broken
     @mock.patch('pulp_rpm.plugins.distributors.yum.publish.model.Repository.objects')
@@ -392,7 +419,7 @@ class PublisherTests(BaseYumDistributorPublishStepTests):
         step = publish.Publisher(self.publisher.get_repo(),
                                  self.publisher.get_conduit(),
                                  config, YUM_DISTRIBUTOR_ID, working_dir=self.working_dir)
-        self.assertTrue(isinstance(step.children[0], publish.CopyDirectoryStep))
+        self.assertTrue(isinstance(step.children[0], publish.CopyPublishedTreeStep))
 
     @skip_broken
     @mock.patch('pulp_rpm.plugins.distributors.yum.publish.configuration.get_https_publish_dir')
@@ -417,7 +444,39 @@ class PublisherTests(BaseYumDistributorPublishStepTests):
         step = publish.Publisher(self.publisher.get_repo(),
                                  self.publisher.get_conduit(),
                                  config, YUM_DISTRIBUTOR_ID, working_dir=self.working_dir)
-        self.assertFalse(isinstance(step.children[0], publish.CopyDirectoryStep))
+        self.assertFalse(isinstance(step.children[0], publish.CopyPublishedTreeStep))
+
+    @skip_broken
+    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.Publisher._indexed_units_kept',
+                return_value=True)
+    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.PackageMetadataIndex.load')
+    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.configuration.get_https_publish_dir')
+    def test_init_incremental_publish_with_index_after_deletion(self, mock_get_https_dir,
+                                                                mock_load, mock_kept):
+        config = PluginCallConfiguration(None, {
+            constants.PUBLISH_HTTPS_KEYWORD: True,
+            constants.PUBLISH_HTTP_KEYWORD: False})
+        # Set the last publish & delete time
+        delete_time = datetime.datetime.now(tz=isodate.UTC)
+        self.publisher.get_repo().last_unit_removed = delete_time
+        last_publish = delete_time + datetime.timedelta(hours=-1)
+        self.publisher.get_conduit().last_publish = \
+            mock.Mock(return_value=last_publish)
+
+        # set up the previous publish directory
+        repo = self.publisher.get_repo()
+        mock_get_https_dir.return_value = self.working_dir
+        specific_master = os.path.join(self.working_dir,
+                                       configuration.get_repo_relative_path(repo, config))
+        os.makedirs(specific_master)
+
+        step = publish.Publisher(self.publisher.get_repo(),
+                                 self.publisher.get_conduit(),
+                                 config, YUM_DISTRIBUTOR_ID, working_dir=self.working_dir)
+        self.assertTrue(isinstance(step.children[0], publish.CopyPublishedTreeStep))
+        self.assertTrue(step.rpm_step.incremental)
+        self.assertEqual(step.rpm_step.previous_index, mock_load.return_value)
+        mock_load.assert_called_once_with(os.path.realpath(specific_master))
 
     @skip_broken
     @mock.patch('pulp_rpm.plugins.distributors.yum.publish.configuration.get_http_publish_dir')
@@ -439,60 +498,112 @@ class PublisherTests(BaseYumDistributorPublishStepTests):
         step = publish.Publisher(self.publisher.get_repo(),
                                  self.publisher.get_conduit(),
                                  config, YUM_DISTRIBUTOR_ID, working_dir=self.working_dir)
-        self.assertTrue(isinstance(step.children[0], publish.CopyDirectoryStep))
+        self.assertTrue(isinstance(step.children[0], publish.CopyPublishedTreeStep))
+
+
+class IndexedUnitsTests(unittest.TestCase):
+
+    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.repo_controller')
+    def test_find_indexed_unit_ids(self, mock_repo_controller):
+        mock_repo_controller.find_repo_content_units.return_value = [
+            mock.Mock(unit_type_id=TYPE_ID_DRPM, unit_id='d1'),
+            mock.Mock(unit_type_id=TYPE_ID_DRPM, unit_id='d2')]
+
+        unit_ids = publish.find_indexed_unit_ids(mock.Mock())
+
+        self.assertEqual(unit_ids, {TYPE_ID_DRPM: set(['d1', 'd2']), TYPE_ID_DISTRO: set()})
+
+    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.find_indexed_unit_ids')
+    def test_units_kept(self, mock_find_ids):
+        mock_find_ids.return_value = {TYPE_ID_DRPM: set(['d1', 'd2']), TYPE_ID_DISTRO: set()}
+        previous_index = mock.Mock(units={TYPE_ID_DRPM: ['d1'], TYPE_ID_DISTRO: []})
+
+        self.assertTrue(publish.Publisher._indexed_units_kept(mock.Mock(), previous_index))
+
+    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.find_indexed_unit_ids')
+    def test_units_removed(self, mock_find_ids):
+        # the files of a removed DRPM or distribution can't be pruned from the previous publish
+        mock_find_ids.return_value = {TYPE_ID_DRPM: set(['d2']), TYPE_ID_DISTRO: set(['ks'])}
+        previous_index = mock.Mock(units={TYPE_ID_DRPM: ['d1'], TYPE_ID_DISTRO: ['ks']})
+
+        self.assertFalse(publish.Publisher._indexed_units_kept(mock.Mock(), previous_index))
+
+
+class IncrementalExportStepTests(BaseYumDistributorPublishStepTests):
+
+    def test_init_and_close(self):
+        init_step = publish.InitIncrementalExportStep()
+        close_step = publish.CloseIncrementalExportStep()
+        self.publisher.add_child(init_step)
+        self.publisher.add_child(close_step)
+
+        init_step.initialize()
+        self.publisher.bundle_writer.add_unit('rpm', {'name': 'foo'}, {})
+        close_step.finalize()
+
+        index = publish.incremental_bundle.read_index(self.working_dir)
+        self.assertEqual(len(index['bundles']), 1)
+        self.assertEqual(index['bundles'][0]['units'], 1)
 
 
 class PublishRpmAndDrpmStepIncrementalTests(BaseYumDistributorPublishStepTests):
 
-    @skip_broken
     def test_process_unit(self):
         step = publish.PublishRpmAndDrpmStepIncremental()
         self.publisher.add_child(step)
-        unit_key = {'name': 'foo', 'version': '1', 'release': '2', 'arch': 'flux'}
-        metadata = {'filename': 'bar.txt', 'repodata': 'baz', '_test': 'hidden'}
+        self.publisher.bundle_writer = mock.Mock()
         storage_path = os.path.join(self.working_dir, 'foo')
         touch(storage_path)
-        test_unit = Unit('foo_type', unit_key, metadata.copy(), storage_path)
+        unit = mock.Mock(spec=publish.models.RPM, _storage_path=storage_path,
+                         filename='foo-1-2.flux.rpm', _content_type_id='rpm',
+                         unit_key={'name': 'foo'})
+        unit.create_legacy_metadata_dict.return_value = {'size': 5}
+        unit.get_repodata.side_effect = lambda metadata_type: '<%s/>' % metadata_type
 
-        step.process_main(test_unit)
-        modified_metadata = metadata.copy()
-        modified_metadata.pop('repodata')
-        modified_metadata.pop('_test')
-        modified_metadata[server_constants.PULP_USER_METADATA_FIELDNAME] = {}
-        unit_file = os.path.join(self.working_dir, 'foo-1-2.flux.json')
-        self.assertTrue(os.path.exists(unit_file))
-        with open(unit_file) as file_handle:
-            loaded = json.load(file_handle)
-            compare_dict(loaded, {
-                'unit_key': unit_key, 'unit_metadata': modified_metadata
-            })
+        step.process_main(unit)
+
+        self.assertTrue(os.path.islink(os.path.join(self.working_dir, 'foo-1-2.flux.rpm')))
+        self.publisher.bundle_writer.add_unit.assert_called_once_with(
+            'rpm', {'name': 'foo'},
+            {'size': 5, 'repodata': {'primary': '<primary/>', 'filelists': '<filelists/>',
+                                     'other': '<other/>'}})
+
+    def test_process_drpm(self):
+        step = publish.PublishRpmAndDrpmStepIncremental()
+        self.publisher.add_child(step)
+        self.publisher.bundle_writer = mock.Mock()
+        storage_path = os.path.join(self.working_dir, 'foo')
+        touch(storage_path)
+        unit = mock.Mock(spec=publish.models.DRPM, _storage_path=storage_path,
+                         filename='drpms/foo.drpm', _content_type_id='drpm',
+                         unit_key={'filename': 'drpms/foo.drpm'})
+        unit.create_legacy_metadata_dict.return_value = {'size': 5}
+
+        step.process_main(unit)
+
+        self.publisher.bundle_writer.add_unit.assert_called_once_with(
+            'drpm', {'filename': 'drpms/foo.drpm'}, {'size': 5})
 
 
 class PublishErrataStepIncrementalTests(BaseYumDistributorPublishStepTests):
 
-    @skip_broken
     def test_process_unit(self):
         step = publish.PublishErrataStepIncremental()
         self.publisher.add_child(step)
-        unit_key = {'id': 'foo'}
-        metadata = {'filename': 'bar.txt', '_test': 'hidden'}
-        test_unit = Unit('foo_type', unit_key, metadata.copy(), '')
+        self.publisher.bundle_writer = mock.Mock()
+        unit = mock.Mock(_content_type_id='erratum', unit_key={'errata_id': 'foo'})
+        unit.create_legacy_metadata_dict.return_value = {'title': 'bar'}
 
-        step.process_main(test_unit)
+        step.process_main(unit)
 
-        modified_metadata = metadata.copy()
-        modified_metadata.pop('_test')
-        modified_metadata[server_constants.PULP_USER_METADATA_FIELDNAME] = {}
-        unit_file = os.path.join(self.working_dir, 'foo.json')
-        self.assertTrue(os.path.exists(unit_file))
-        with open(unit_file) as file_handle:
-            loaded = json.load(file_handle)
-            compare_dict(loaded, {'unit_key': unit_key, 'unit_metadata': modified_metadata})
+        self.publisher.bundle_writer.add_unit.assert_called_once_with(
+            'erratum', {'errata_id': 'foo'}, {'title': 'bar'})
 
 
 class CreateIsoStepTests(BaseYumDistributorPublishStepTests):
 
-    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.generate_iso.create_iso')
+    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.generate_iso.create_iso',
+                return_value=[])
     def test_process_main(self, mock_create):
         step = publish.CreateIsoStep('foo', 'bar')
         step.config = PluginCallConfiguration(None, {
@@ -500,7 +611,72 @@ class CreateIsoStepTests(BaseYumDistributorPublishStepTests):
             constants.ISO_PREFIX_KEYWORD: 'flux'
         })
         step.process_main()
-        mock_create.assert_called_once_with('foo', 'bar', 'flux', 5)
+        mock_create.assert_called_once_with('foo', 'bar', 'flux', 5,
+                                            progress_callback=step._report_iso_progress,
+                                            max_workers=None,
+                                            packing=publish.generate_iso.PACKING_SEQUENTIAL)
+
+    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.generate_iso.create_iso',
+                return_value=['flux-01.iso'])
+    def test_process_main_failed_images(self, mock_create):
+        step = publish.CreateIsoStep('foo', 'bar')
+        step.config = PluginCallConfiguration(None, {constants.ISO_PREFIX_KEYWORD: 'flux'})
+
+        self.assertRaises(Exception, step.process_main)
+
+    def test_report_iso_progress(self):
+        step = publish.CreateIsoStep('foo', 'bar')
+        step.report_progress = mock.Mock()
+
+        step._report_iso_progress(publish.generate_iso.PROGRESS_FILL_RATIO, 0.5)
+        step._report_iso_progress(publish.generate_iso.PROGRESS_IMAGE_COUNT, 2)
+        step._report_iso_progress('a.iso', publish.generate_iso.ISO_STATE_RUNNING)
+        step._report_iso_progress('a.iso', publish.generate_iso.ISO_STATE_COMPLETE)
+        step._report_iso_progress('b.iso', publish.generate_iso.ISO_STATE_FAILED)
+
+        self.assertEqual(step.progress_details,
+                         '1 of 2 ISO images created, 1 failed; images are 50.0% full')
+        self.assertEqual(len(step.error_details), 1)
+        self.assertEqual(step.report_progress.call_count, 4)
+
+
+class ConcurrentRepoExportStepTests(BaseYumDistributorPublishStepTests):
+
+    def _publishers(self, count):
+        publishers = []
+        for i in range(count):
+            publisher = mock.Mock(export_target_dir=os.path.join(self.working_dir, 'export',
+                                                                 'repo%d' % i))
+            publishers.append(publisher)
+        return publishers
+
+    def _step(self, publishers, max_workers):
+        step = publish.ConcurrentRepoExportStep(publishers, max_workers)
+        step.report_progress = mock.Mock()
+        return step
+
+    def test_process(self):
+        publishers = self._publishers(3)
+        step = self._step(publishers, 2)
+
+        step.process()
+
+        for publisher in publishers:
+            publisher.process.assert_called_once_with()
+        self.assertTrue(os.path.isdir(os.path.join(self.working_dir, 'export')))
+        self.assertEqual(step.state, reporting_constants.STATE_COMPLETE)
+
+    def test_process_failure(self):
+        publishers = self._publishers(3)
+        publishers[0].process.side_effect = ValueError()
+        step = self._step(publishers, 1)
+
+        self.assertRaises(ValueError, step.process)
+
+        self.assertEqual(step.state, reporting_constants.STATE_FAILED)
+        # no more repositories are started after a failure
+        self.assertFalse(publishers[1].process.called)
+        self.assertFalse(publishers[2].process.called)
 
 
 class GenerateListingsFilesStep(BaseYumDistributorPublishStepTests):
@@ -512,6 +688,15 @@ class GenerateListingsFilesStep(BaseYumDistributorPublishStepTests):
         mock_generate.assert_called_once_with('foo', 'bar')
 
 
+class RealizeTreeStepTests(BaseYumDistributorPublishStepTests):
+
+    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.links.realize_tree')
+    def test_process_main(self, mock_realize):
+        step = publish.RealizeTreeStep('foo', 'bar')
+        step.process_main()
+        mock_realize.assert_called_once_with('foo', 'bar')
+
+
 class PublishCompsStepTests(BaseYumDistributorPublishStepTests):
 
     @skip_broken
@@ -598,34 +783,36 @@ class PublishDrpmStepTests(BaseYumDistributorPublishStepTests):
         return Unit(TYPE_ID_DRPM, unit_key, unit_metadata, storage_path)
 
     @skip_broken
-    @mock.patch('pulp.plugins.util.publish_step.PublishStep._create_symlink')
-    def test_process_unit(self, mock_symlink):
+    def test_process_unit(self):
         step = publish.PublishDrpmStep(mock.Mock(package_dir=None))
         step.parent = self.publisher
         test_unit = self._generate_drpm('foo.rpm')
         test_unit.storage_path = '/bar'
 
         step.context = mock.Mock()
+        step.link_batch = mock.Mock()
         step.dist_step.package_dirs = []
         step.process_main(test_unit)
 
-        mock_symlink.assert_called_once_with('/bar', os.path.join(self.working_dir, 'drpms',
-                                                                  'foo.rpm'))
+        step.link_batch.add.assert_called_once_with(
+            '/bar', os.path.join(self.working_dir, 'drpms', 'foo.rpm'))
         step.context.add_unit_metadata.assert_called_once_with(test_unit)
 
     @skip_broken
-    @mock.patch('pulp.plugins.util.publish_step.PublishStep._create_symlink')
-    def test_process_unit_links_packages_dir(self, mock_symlink):
+    def test_process_unit_links_packages_dir(self):
         step = publish.PublishDrpmStep(mock.Mock(package_dir='bar'))
         step.parent = self.publisher
 
         test_unit = self._generate_drpm('foo.rpm')
         test_unit.storage_path = '/bar'
         step.context = mock.Mock()
+        step.link_batch = mock.Mock()
         step.dist_step.package_dirs = ['/bar']
         step.process_main(test_unit)
 
-        mock_symlink.assert_any_call('/bar', os.path.join(self.working_dir, 'drpms', 'foo.rpm'))
+        step.link_batch.add.assert_any_call(
+            '/bar', os.path.join(self.working_dir, 'drpms', 'foo.rpm'))
+        step.link_batch.add.assert_any_call('/bar', os.path.join('/bar', 'drpms', 'foo.rpm'))
 
     def test_skip_if_no_units(self):
         step = publish.PublishDrpmStep(mock.Mock(package_dir=None))
@@ -932,6 +1119,72 @@ class PublishRpmStepTests(BaseYumDistributorPublishStepTests):
         unit_path = os.path.join(package_dir, unit.unit_key['name'])
         self.assertTrue(os.path.exists(unit_path))
 
+    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.repo_controller')
+    def test_unpublish_removed_packages(self, mock_repo_controller):
+        package_dir = os.path.join(self.working_dir, 'Packages')
+        os.makedirs(package_dir)
+        for directory in (self.working_dir, package_dir):
+            for filename in ('kept.rpm', 'removed.rpm', 'added.rpm'):
+                os.symlink('/dev/null', os.path.join(directory, filename))
+        previous_index = mock.Mock(packages={'kept': 'kept.rpm', 'removed': 'removed.rpm',
+                                             'added': 'added.rpm'})
+        mock_repo_controller.find_repo_content_units.return_value = [
+            mock.Mock(checksum='kept'), mock.Mock(checksum='added')]
+
+        self.publisher.get_repo().repo_obj = mock.Mock()
+
+        step = publish.PublishRpmStep(mock.Mock(package_dirs=[package_dir]))
+        step.parent = self.publisher
+        added_queryset = mock.Mock()
+        added_queryset.only.return_value = [mock.Mock(checksum='added')]
+        with mock.patch.object(publish.PublishRpmStep, 'unit_querysets', [added_queryset]):
+            kept = step._unpublish_removed_packages(previous_index)
+
+        self.assertEqual(kept, set(['kept']))
+        for directory in (self.working_dir, package_dir):
+            self.assertTrue(os.path.islink(os.path.join(directory, 'kept.rpm')))
+            self.assertTrue(os.path.islink(os.path.join(directory, 'added.rpm')))
+            self.assertFalse(os.path.lexists(os.path.join(directory, 'removed.rpm')))
+
+    def test_write_indexed_metadata(self):
+        step = publish.PublishRpmStep(mock.Mock(package_dirs=[]))
+        step.package_index = mock.Mock()
+        context = mock.Mock()
+        context.metadata_file_handle.tell.side_effect = [10, 25]
+
+        step._write_indexed_metadata('primary', context, 'abc', unit='unit')
+
+        context.add_unit_metadata.assert_called_once_with('unit')
+        step.package_index.add_snippet.assert_called_once_with('primary', 'abc', 10, 15)
+
+    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.find_indexed_unit_ids')
+    def test_finalize_writes_index(self, mock_find_ids):
+        mock_find_ids.return_value = {TYPE_ID_DRPM: set(['d1'])}
+        self.publisher.repomd_file_context = mock.Mock()
+        step = publish.PublishRpmStep(mock.Mock(package_dirs=[]))
+        step.parent = self.publisher
+        step.package_index = mock.Mock()
+        step.file_lists_context = mock.Mock()
+        step.other_context = mock.Mock()
+        step.primary_context = mock.Mock()
+
+        step.finalize()
+
+        step.package_index.set_units.assert_called_once_with(TYPE_ID_DRPM, set(['d1']))
+        step.package_index.write.assert_called_once_with()
+
+    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.find_indexed_unit_ids')
+    def test_finalize_without_index(self, mock_find_ids):
+        self.publisher.repomd_file_context = mock.Mock()
+        step = publish.PublishRpmStep(mock.Mock(package_dirs=[]))
+        step.parent = self.publisher
+        step.package_index = mock.Mock()
+        step.write_package_index = False
+
+        step.finalize()
+
+        self.assertFalse(step.package_index.write.called)
+
     def test_finalize_no_initialization(self):
         """
         Test to ensure that calling finalize before initialize_metadata() doesn't
@@ -1034,31 +1287,51 @@ class PublishMetadataStepTests(BaseYumDistributorPublishStepTests):
 
 class GenerateSqliteForRepoStepTests(BaseYumDistributorPublishStepTests):
 
-    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.subprocess.Popen')
-    def test_process_main(self, Popen):
-        pipe_output = ('some output', None)
-        Popen.return_value = mock.MagicMock()
-        Popen.return_value.returncode = 0
-        Popen.return_value.communicate.return_value = pipe_output
-        step = publish.GenerateSqliteForRepoStep('/foo')
+    def _generate_step(self, streams_sqlite):
+        rpm_step = mock.Mock(streams_sqlite=streams_sqlite)
+        contexts = []
+        for metadata_type in ('filelists', 'other', 'primary'):
+            contexts.append((metadata_type, mock.Mock(metadata_file_path=metadata_type + '.xml.gz',
+                                                      checksum=metadata_type + '-checksum')))
+        rpm_step.metadata_contexts = contexts
+        rpm_step.sqlite_writer.finalize.return_value = {'primary': {
+            'path': '/foo/abc-primary.sqlite.bz2', 'checksum': 'abc', 'open_checksum': 'def',
+            'open_size': 100}}
+        step = publish.GenerateSqliteForRepoStep(rpm_step)
         step.parent = mock.MagicMock()
-        step.parent.get_checksum_type.return_value = 'sha1'
+        return step
+
+    def test_process_main(self):
+        step = self._generate_step(True)
+        writer = step.rpm_step.sqlite_writer
+
         step.process_main()
-        Popen.assert_called_once_with('createrepo_c -d --update --keep-all-metadata '
-                                      '--local-sqlite '
-                                      '-s sha1 '
-                                      '--skip-stat /foo',
-                                      shell=True, stderr=mock.ANY, stdout=mock.ANY)
-
-    @mock.patch('pulp_rpm.plugins.distributors.yum.publish.subprocess.Popen')
-    def test_process_main_with_error(self, Popen):
-        step = publish.GenerateSqliteForRepoStep('/foo')
-        step.parent = mock.MagicMock()
-        pipe_output = ('some output', None)
-        Popen.return_value = mock.MagicMock()
-        Popen.return_value.returncode = 1
-        Popen.return_value.communicate.return_value = pipe_output
-        self.assertRaises(PulpCodedException, step.process_main)
+
+        self.assertFalse(writer.add_metadata_file.called)
+        writer.finalize.assert_called_once_with({'filelists': 'filelists-checksum',
+                                                 'other': 'other-checksum',
+                                                 'primary': 'primary-checksum'})
+        step.parent.repomd_file_context.add_metadata_file_metadata.assert_called_once_with(
+            'primary_db', '/foo/abc-primary.sqlite.bz2', 'abc', database_version=10,
+            open_checksum='def', open_size=100)
+
+    def test_process_main_from_metadata_files(self):
+        step = self._generate_step(False)
+        writer = step.rpm_step.sqlite_writer
+
+        step.process_main()
+
+        writer.add_metadata_file.assert_any_call('primary', 'primary.xml.gz')
+        self.assertEqual(writer.add_metadata_file.call_count, 3)
+        self.assertEqual(writer.finalize.call_count, 1)
+
+    def test_process_main_without_writer(self):
+        step = self._generate_step(True)
+        step.rpm_step.sqlite_writer = None
+
+        step.process_main()
+
+        self.assertFalse(step.parent.repomd_file_context.add_metadata_file_metadata.called)
 
     def test_is_skipped_no_config(self):
         # Generating sqlite files is turned off by default
@@ -1,11 +1,14 @@
 from cStringIO import StringIO
+from datetime import timedelta
 import os
 import shutil
 import tempfile
+import unittest
 
 from mock import MagicMock, patch
 from nectar.downloaders.threaded import HTTPThreadedDownloader
 from nectar.report import DownloadReport
+from pulp.common import dateutils
 from pulp.common.plugins import importer_constants
 from pulp.plugins.model import Repository, Unit
 from pulp.server import constants as server_constants
@@ -592,11 +595,11 @@ class TestISOSyncRun(PulpRPMTests):
         manifest.write(
             'test3.iso,94f7fe923212286855dea858edac1b4a292301045af0ddb275544e5251a50b3c,34')
         manifest.seek(0)
-        manifest = models.ISOManifest(manifest, 'https://fake.com/')
+        manifest = list(models.ISOManifest(manifest, 'https://fake.com/'))
         # Add expected test data to each ISO
-        manifest._isos[0].expected_test_data = 'This is a file.\n'
-        manifest._isos[1].expected_test_data = 'This is another file.\n'
-        manifest._isos[2].expected_test_data = 'Are you starting to get the idea?\n'
+        manifest[0].expected_test_data = 'This is a file.\n'
+        manifest[1].expected_test_data = 'This is another file.\n'
+        manifest[2].expected_test_data = 'Are you starting to get the idea?\n'
 
         self.iso_sync_run._download_isos(manifest)
 
@@ -622,7 +625,7 @@ class TestISOSyncRun(PulpRPMTests):
     def test__download_manifest(self, mock_download):
         mock_download.side_effect = self.fake_download
 
-        manifest = self.iso_sync_run._download_manifest()
+        manifest = self.iso_sync_run._download_manifest(StringIO())
 
         expected_manifest_isos = [
             {'url': 'http://fake.com/iso_feed/test.iso', 'name': 'test.iso', 'size': 16,
@@ -649,7 +652,7 @@ class TestISOSyncRun(PulpRPMTests):
         download_succeeded.side_effect = self.iso_sync_run.download_failed
         self.iso_sync_run.progress_report._state = SyncProgressReport.STATE_MANIFEST_IN_PROGRESS
         try:
-            self.iso_sync_run._download_manifest()
+            self.iso_sync_run._download_manifest(StringIO())
             self.fail('This should have raised an IOError, but it did not.')
         except IOError, e:
             self.assertEqual(str(e), 'Could not retrieve http://fake.com/iso_feed/PULP_MANIFEST')
@@ -670,7 +673,7 @@ class TestISOSyncRun(PulpRPMTests):
 
         try:
             # This should raise a ValueError
-            self.iso_sync_run._download_manifest()
+            self.iso_sync_run._download_manifest(StringIO())
             self.fail('A ValueError should have been raised by the previous line, but was not!')
         except ValueError:
             # Excellent, a ValueError was raised.
@@ -679,58 +682,133 @@ class TestISOSyncRun(PulpRPMTests):
             self.assertEqual(self.iso_sync_run.progress_report.error_message,
                              'The PULP_MANIFEST file was not in the expected format.')
 
-    def test__filter_missing_isos(self):
-        """
-        Make sure this method returns the items from the manifest that weren't in the
-        sync_conduit. By
-        default, remove_missing_units is False, so we will also assert that the return value of
-        this method
-        doesn't suggest removing any ISOs.
-        """
-        # Let's put all three mammajammas in the manifest
-        manifest = ['%s,%s,%s' % (iso.unit_key['name'], iso.unit_key['checksum'],
-                                  iso.unit_key['size'])
-                    for iso in self.existing_units if iso.unit_key['name'] != 'test4.iso']
-        manifest = '\n'.join(manifest)
-        manifest = StringIO(manifest)
-        manifest = models.ISOManifest(manifest, 'http://test.com')
-
-        filtered_isos = self.iso_sync_run._filter_missing_isos(manifest)
-        local_missing_isos, local_available_isos, remote_missing_isos = filtered_isos
-
-        # Only the third item from the manifest should be missing locally
-        self.assertEqual(local_missing_isos, [iso for iso in manifest if iso.name == 'test3.iso'])
-        # The remote repo doesn't have test4.iso, and so this method should tell us
-        self.assertEqual(len(remote_missing_isos), 1)
-        remote_missing_iso = remote_missing_isos[0]
-        self.assertEqual(remote_missing_iso.unit_key,
-                         {'name': 'test4.iso', 'size': 4, 'checksum': 'sum4'})
 
-    def test__filter_missing_isos_available_isos(self):
-        """
-        Test that when there are units in Pulp that match those in the manifest, but that are
-        not currently associated with the repository, they are returned by _filter_missing_isos
-        as the second list in the 3-tuple.
-        """
-        # Let's put all three mammajammas in the manifest
-        manifest = ['%s,%s,%s' % (iso.unit_key['name'], iso.unit_key['checksum'],
-                                  iso.unit_key['size']) for iso in self.existing_units]
-        manifest = '\n'.join(manifest)
-        manifest = StringIO(manifest)
-        manifest = models.ISOManifest(manifest, 'http://test.com')
-
-        # Set up the sync conduit to return all three units as units in Pulp, but only the first
-        # is associated with the repository
-        sync_conduit = importer_mocks.get_sync_conduit(pkg_dir=self.pkg_dir,
-                                                       existing_units=[self.existing_units[0]],
-                                                       pulp_units=self.existing_units)
-        iso_sync_run = ISOSyncRun(sync_conduit, self.config)
-
-        filtered_isos = iso_sync_run._filter_missing_isos(manifest)
-        local_missing_isos, local_available_isos, remote_missing_isos = filtered_isos
-
-        # Everything except the first unit should be in the list of local available isos
-        self.assertEqual(0, len(local_missing_isos))
-        self.assertEqual(2, len(local_available_isos))
-        for expected, actual in zip(sorted(self.existing_units[1:]), sorted(local_available_isos)):
-            self.assertEqual(expected, actual)
+class TestISOSyncRunManifest(unittest.TestCase):
+    """
+    Test how ISOSyncRun compares the manifest with the units in Pulp.
+    """
+
+    def setUp(self):
+        self.config = importer_mocks.get_basic_config(**{
+            importer_constants.KEY_FEED: 'http://fake.com/iso_feed/'})
+        self.sync_conduit = MagicMock()
+        self.sync_conduit.get_scratchpad.return_value = {}
+        self.sync_conduit.repo.last_unit_added = None
+        self.sync_conduit.repo.last_unit_removed = None
+        self.iso_sync_run = ISOSyncRun(self.sync_conduit, self.config)
+        self.manifest = models.ISOManifest(
+            StringIO('test.iso,sum1,1\ntest2.iso,sum2,2\ntest2.iso,sum2,2\n'),
+            'http://fake.com/iso_feed/')
+
+    @patch('pulp_rpm.plugins.importers.iso.sync.models.ISO.objects')
+    def test__filter_missing_isos(self, mock_objects):
+        existing_unit = models.ISO(name='test.iso', checksum='sum1', size=1)
+        mock_objects.filter.return_value.only.return_value = [existing_unit]
+
+        local_missing_isos, local_available_units = self.iso_sync_run._filter_missing_isos(
+            list(self.manifest))
+
+        # test2.iso is listed twice, but is only downloaded once
+        self.assertEqual([iso.name for iso in local_missing_isos], ['test2.iso'])
+        self.assertEqual(local_available_units, [existing_unit])
+        self.assertEqual(sorted(mock_objects.filter.call_args[1]['name__in']),
+                         ['test.iso', 'test2.iso'])
+
+    @patch('pulp_rpm.plugins.importers.iso.sync.ISOSyncRun.add_catalog_entries')
+    @patch('pulp_rpm.plugins.importers.iso.sync.bulk')
+    @patch('pulp_rpm.plugins.importers.iso.sync.ISOSyncRun._filter_missing_isos')
+    @patch('pulp_rpm.plugins.importers.iso.sync.ISOSyncRun._get_repo_unit_ids')
+    def test__sync_manifest(self, mock_get_ids, mock_filter, mock_bulk, mock_add_entries):
+        associated = models.ISO(id='associated', name='test.iso', checksum='sum1', size=1)
+        unassociated = models.ISO(id='unassociated', name='test3.iso', checksum='sum3', size=3)
+        missing = models.ISO(name='test2.iso', checksum='sum2', size=2)
+        mock_get_ids.return_value = set(['associated', 'removed'])
+        mock_filter.return_value = ([missing], [associated, unassociated])
+
+        isos_to_download, remote_missing_ids = self.iso_sync_run._sync_manifest(self.manifest)
+
+        self.assertEqual(isos_to_download, [missing])
+        self.assertEqual(remote_missing_ids, set(['removed']))
+        mock_bulk.associate_units.assert_called_once_with(self.sync_conduit.repo, [unassociated])
+        self.assertFalse(mock_bulk.insert_units.called)
+        mock_add_entries.assert_called_once_with([missing])
+
+    @patch('pulp_rpm.plugins.importers.iso.sync.ISOSyncRun.add_catalog_entries')
+    @patch('pulp_rpm.plugins.importers.iso.sync.bulk')
+    @patch('pulp_rpm.plugins.importers.iso.sync.ISOSyncRun._filter_missing_isos')
+    @patch('pulp_rpm.plugins.importers.iso.sync.ISOSyncRun._get_repo_unit_ids')
+    def test__sync_manifest_deferred(self, mock_get_ids, mock_filter, mock_bulk,
+                                     mock_add_entries):
+        self.config.override_config[importer_constants.DOWNLOAD_POLICY] = \
+            importer_constants.DOWNLOAD_ON_DEMAND
+        missing = models.ISO(name='test2.iso', checksum='sum2', size=2)
+        saved = models.ISO(id='saved', name='test2.iso', checksum='sum2', size=2)
+        mock_get_ids.return_value = set()
+        mock_filter.return_value = ([missing], [])
+        mock_bulk.insert_units.return_value = [saved]
+
+        isos_to_download, remote_missing_ids = self.iso_sync_run._sync_manifest(self.manifest)
+
+        self.assertEqual(isos_to_download, [])
+        self.assertFalse(missing.downloaded)
+        mock_bulk.insert_units.assert_called_once_with(models.ISO, [missing])
+        mock_bulk.associate_units.assert_called_with(self.sync_conduit.repo, [saved])
+        mock_add_entries.assert_called_once_with([saved])
+
+    def test__manifest_unchanged_first_sync(self):
+        self.assertFalse(self.iso_sync_run._manifest_unchanged(self.manifest))
+
+    def test__manifest_unchanged(self):
+        self.iso_sync_run._save_manifest_state(self.manifest)
+        self.sync_conduit.get_scratchpad.return_value = \
+            self.sync_conduit.set_scratchpad.call_args[0][0]
+
+        self.assertTrue(self.iso_sync_run._manifest_unchanged(self.manifest))
+
+    def test__manifest_unchanged_new_checksum(self):
+        self.iso_sync_run._save_manifest_state(self.manifest)
+        self.sync_conduit.get_scratchpad.return_value = \
+            self.sync_conduit.set_scratchpad.call_args[0][0]
+        manifest = models.ISOManifest(StringIO('test.iso,sum1,1\n'), 'http://fake.com/iso_feed/')
+
+        self.assertFalse(self.iso_sync_run._manifest_unchanged(manifest))
+
+    def test__manifest_unchanged_units_removed(self):
+        self.iso_sync_run._save_manifest_state(self.manifest)
+        self.sync_conduit.get_scratchpad.return_value = \
+            self.sync_conduit.set_scratchpad.call_args[0][0]
+        self.sync_conduit.repo.last_unit_removed = \
+            dateutils.now_utc_datetime_with_tzinfo() + timedelta(seconds=1)
+
+        self.assertFalse(self.iso_sync_run._manifest_unchanged(self.manifest))
+
+    def test__manifest_unchanged_units_added(self):
+        self.iso_sync_run._save_manifest_state(self.manifest)
+        self.sync_conduit.get_scratchpad.return_value = \
+            self.sync_conduit.set_scratchpad.call_args[0][0]
+        self.sync_conduit.repo.last_unit_added = \
+            dateutils.now_utc_datetime_with_tzinfo() + timedelta(seconds=1)
+
+        self.assertFalse(self.iso_sync_run._manifest_unchanged(self.manifest))
+
+    def test__manifest_unchanged_units_added_before(self):
+        self.sync_conduit.repo.last_unit_added = \
+            dateutils.now_utc_datetime_with_tzinfo() - timedelta(seconds=1)
+        self.iso_sync_run._save_manifest_state(self.manifest)
+        self.sync_conduit.get_scratchpad.return_value = \
+            self.sync_conduit.set_scratchpad.call_args[0][0]
+
+        self.assertTrue(self.iso_sync_run._manifest_unchanged(self.manifest))
+
+    @patch('pulp_rpm.plugins.importers.iso.sync.lazy_catalog.CatalogWriter')
+    def test_add_catalog_entries(self, mock_writer_class):
+        self.sync_conduit.importer_object_id = 'importer'
+        unit = models.ISO(name='test.iso', checksum='sum1', size=1)
+        unit.url = 'http://fake.com/iso_feed/test.iso'
+
+        self.iso_sync_run.add_catalog_entries([unit])
+
+        mock_writer_class.assert_called_once_with('importer')
+        writer = mock_writer_class.return_value
+        writer.add.assert_called_once_with(unit.storage_path, unit.url, unit)
+        writer.flush.assert_called_once_with()
@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import os
+import shutil
+import tempfile
 import unittest
 
-from mock import patch, MagicMock, Mock
+from mock import call, patch, MagicMock, Mock
 from pulp.server.exceptions import PulpCodedValidationException
 
 from pulp_rpm.common import constants
@@ -135,24 +137,23 @@ class TestProcessDistribution(unittest.TestCase):
 
 
 class TestGetDistributionFile(unittest.TestCase):
-    @patch('pulp_rpm.plugins.importers.yum.parse.treeinfo.nectar_factory.create_downloader')
     @patch('pulp_rpm.plugins.importers.yum.parse.treeinfo.AggregatingEventListener')
-    def test_get_distribution_file_exists(self, mock_listener, mock_create_downloader):
+    def test_get_distribution_file_exists(self, mock_listener):
         mock_listener.return_value.succeeded_reports = ['foo']
         tmp_dir = '/tmp/'
         feed = 'http://www.foo.bar/flux/'
         parent = Mock(feed=feed)
         dist = DistSync(parent, feed)
         file_name = dist.get_distribution_file(tmp_dir)
-        request = mock_create_downloader.return_value.method_calls[0][1][0][0]
+        parent.downloaders.get.assert_called_once_with(feed, mock_listener.return_value)
+        request = parent.downloaders.get.return_value.method_calls[0][1][0][0]
         self.assertEquals(request.url, os.path.join(feed, constants.DISTRIBUTION_XML))
         self.assertEquals(request.destination, os.path.join(tmp_dir,
                                                             constants.DISTRIBUTION_XML))
         self.assertEquals(file_name, os.path.join(tmp_dir, constants.DISTRIBUTION_XML))
 
-    @patch('pulp_rpm.plugins.importers.yum.parse.treeinfo.nectar_factory.create_downloader')
     @patch('pulp_rpm.plugins.importers.yum.parse.treeinfo.AggregatingEventListener')
-    def test_get_distribution_file_does_not_exists(self, mock_listener, mock_create_downloader):
+    def test_get_distribution_file_does_not_exists(self, mock_listener):
         mock_listener.return_value.succeeded_reports = []
         tmp_dir = '/tmp/'
         feed = 'http://www.foo.bar/flux/'
@@ -182,3 +183,163 @@ class TestParseTreefile(unittest.TestCase):
         model, files = DistSync.parse_treeinfo_file('/some/path')
 
         self.assertEqual(files[0]['checksumtype'], 'sha1')
+
+
+class TestUpdateCatalogEntries(unittest.TestCase):
+
+    @patch('pulp_rpm.plugins.importers.yum.parse.treeinfo.lazy_catalog.CatalogWriter')
+    def test_update_catalog_entries(self, mock_writer_class):
+        parent = MagicMock()
+        parent.conduit.importer_object_id = 'importer'
+        dist_sync = DistSync(parent, 'http://test/os/')
+        unit = Mock(storage_path='/storage/ks')
+        files = [{'relativepath': 'images/boot.iso'}, {'relativepath': 'isolinux/vmlinuz'}]
+
+        dist_sync.update_catalog_entries(unit, files)
+
+        mock_writer_class.assert_called_once_with('importer')
+        writer = mock_writer_class.return_value
+        self.assertEqual(writer.add.call_count, 2)
+        writer.add.assert_any_call('/storage/ks/images/boot.iso',
+                                   'http://test/os/images/boot.iso', unit)
+        writer.flush.assert_called_once_with()
+
+
+class TestGetStoredFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.storage_dir, 'images'))
+        with open(os.path.join(self.storage_dir, 'images', 'boot.iso'), 'w') as boot_iso:
+            boot_iso.write('boot')
+
+    def tearDown(self):
+        shutil.rmtree(self.storage_dir)
+
+    def test_stored_files(self):
+        unit = Mock(storage_path=self.storage_dir, files=[
+            {'relativepath': 'images/boot.iso', 'checksum': 'abc', 'checksumtype': 'sha'},
+            # not in storage, for example because the unit was synced with a deferred policy
+            {'relativepath': 'images/pxeboot/vmlinuz', 'checksum': 'def',
+             'checksumtype': 'sha256'},
+            {'relativepath': 'images/efiboot.img', 'checksum': None, 'checksumtype': None},
+        ])
+        new_unit = Mock(storage_path=None, files=[])
+
+        stored_files = DistSync.get_stored_files([new_unit, unit])
+
+        self.assertEqual(stored_files, {
+            ('sha1', 'abc'): os.path.join(self.storage_dir, 'images', 'boot.iso')})
+
+
+class TestImportStoredFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.stored_path = os.path.join(self.working_dir, 'old', 'images', 'boot.iso')
+        os.makedirs(os.path.dirname(self.stored_path))
+        with open(self.stored_path, 'w') as boot_iso:
+            boot_iso.write('boot')
+        self.unit = Mock(storage_path=os.path.join(self.working_dir, 'new'))
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def test_copy(self):
+        DistSync.import_stored_files(self.unit, [(self.stored_path, 'images/boot.iso')])
+
+        destination = os.path.join(self.working_dir, 'new', 'images', 'boot.iso')
+        with open(destination) as boot_iso:
+            self.assertEqual(boot_iso.read(), 'boot')
+        # the distributions don't share the file
+        self.assertFalse(os.path.samefile(self.stored_path, destination))
+        self.assertEqual(os.listdir(os.path.dirname(destination)), ['boot.iso'])
+
+    def test_same_file(self):
+        self.unit.storage_path = os.path.join(self.working_dir, 'old')
+
+        DistSync.import_stored_files(self.unit, [(self.stored_path, 'images/boot.iso')])
+
+        self.assertEqual(os.listdir(os.path.dirname(self.stored_path)), ['boot.iso'])
+
+    def test_swapped_paths(self):
+        # two files of the distribution swap paths
+        self.unit.storage_path = os.path.join(self.working_dir, 'old')
+        other_path = os.path.join(self.working_dir, 'old', 'images', 'efiboot.img')
+        with open(other_path, 'w') as efiboot:
+            efiboot.write('efiboot')
+
+        DistSync.import_stored_files(self.unit, [(self.stored_path, 'images/efiboot.img'),
+                                                 (other_path, 'images/boot.iso')])
+
+        with open(self.stored_path) as boot_iso:
+            self.assertEqual(boot_iso.read(), 'efiboot')
+        with open(other_path) as efiboot:
+            self.assertEqual(efiboot.read(), 'boot')
+
+
+class TestImportDownloadedFile(unittest.TestCase):
+
+    def setUp(self):
+        self.working_dir = tempfile.mkdtemp()
+        self.destination = os.path.join(self.working_dir, 'images', 'boot.iso')
+        os.makedirs(os.path.dirname(self.destination))
+        with open(self.destination, 'w') as boot_iso:
+            boot_iso.write('boot')
+        self.unit = Mock(storage_path=self.working_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.working_dir)
+
+    def test_import(self):
+        # a file linked from another distribution must not be written to
+        linked_path = os.path.join(self.working_dir, 'linked.iso')
+        os.link(self.destination, linked_path)
+
+        DistSync.import_downloaded_file(self.unit, '/tmp/boot.iso', 'images/boot.iso')
+
+        self.assertFalse(os.path.exists(self.destination))
+        with open(linked_path) as linked:
+            self.assertEqual(linked.read(), 'boot')
+        self.unit.safe_import_content.assert_called_once_with('/tmp/boot.iso', 'images/boot.iso')
+
+
+class TestRunReusesStoredFiles(unittest.TestCase):
+
+    @patch('pulp_rpm.plugins.importers.yum.parse.treeinfo.repo_controller')
+    @patch.object(DistSync, 'import_downloaded_file')
+    @patch.object(DistSync, 'import_stored_files')
+    @patch.object(DistSync, 'update_catalog_entries')
+    @patch.object(DistSync, 'download_files',
+                  return_value=[('/tmp/vmlinuz', 'images/pxeboot/vmlinuz')])
+    @patch.object(DistSync, 'get_stored_files')
+    @patch.object(DistSync, 'process_distribution', return_value=[])
+    @patch.object(DistSync, 'parse_treeinfo_file')
+    @patch.object(DistSync, 'get_treefile', return_value='/tmp/treeinfo')
+    def test_run(self, mock_get_treefile, mock_parse, mock_process, mock_get_stored,
+                 mock_download, mock_update_catalog, mock_import_stored, mock_import_downloaded,
+                 mock_repo_controller):
+        parent = MagicMock()
+        parent.download_deferred = False
+        dist_sync = DistSync(parent, 'http://test/os/')
+        unit = MagicMock(timestamp=None)
+        boot_iso = {'relativepath': 'images/boot.iso', 'checksum': 'abc',
+                    'checksumtype': 'sha256'}
+        vmlinuz = {'relativepath': 'images/pxeboot/vmlinuz', 'checksum': 'def',
+                   'checksumtype': 'sha256'}
+        mock_parse.return_value = (unit, [boot_iso, vmlinuz])
+        mock_repo_controller.find_repo_content_units.return_value = []
+        mock_get_stored.return_value = {('sha256', 'abc'): '/storage/old/images/boot.iso'}
+        imports = Mock()
+        imports.attach_mock(mock_import_stored, 'stored')
+        imports.attach_mock(mock_import_downloaded, 'downloaded')
+
+        dist_sync._run('/tmp')
+
+        # only the file whose checksum is not stored is downloaded
+        mock_download.assert_called_once_with('/tmp', [vmlinuz])
+        # stored files are copied before any download replaces a file they are copied from
+        self.assertEqual(imports.mock_calls, [
+            call.stored(unit, [('/storage/old/images/boot.iso', 'images/boot.iso')]),
+            call.downloaded(unit, '/tmp/vmlinuz', 'images/pxeboot/vmlinuz')])
+        unit.save.assert_called_once_with()
@@ -50,6 +50,21 @@ class TestPackages(TestCase):
         self.assertEqual(packages.primary, fake_create_downloader())
         self.assertEqual(packages.container, fake_container())
 
+    @patch('pulp_rpm.plugins.importers.yum.repomd.alternate.ContentContainer')
+    @patch('pulp_rpm.plugins.importers.yum.repomd.alternate.create_downloader')
+    def test_construction_shared_downloaders(self, fake_create_downloader, fake_container):
+        base_url = str(uuid4())
+        downloaders = Mock()
+
+        # test
+        packages = Packages(base_url, Mock(), Mock(), str(uuid4()), Mock(),
+                            downloaders=downloaders)
+
+        # validation
+        downloaders.get.assert_called_once_with(base_url)
+        self.assertFalse(fake_create_downloader.called)
+        self.assertEqual(packages.primary, downloaders.get.return_value)
+
     @patch('pulp_rpm.plugins.importers.yum.repomd.alternate.create_downloader', Mock())
     def test_downloader(self):
         # test
@@ -78,6 +93,21 @@ class TestPackages(TestCase):
         fake_container().download.assert_called_with(
             packages.primary, fake_requests(), packages.listener)
 
+    @patch('pulp_rpm.plugins.importers.yum.repomd.alternate.create_downloader', Mock())
+    @patch('pulp_rpm.plugins.importers.yum.repomd.alternate.ContentContainer')
+    @patch('pulp_rpm.plugins.importers.yum.repomd.alternate.Packages.get_requests')
+    def test_download_throttled(self, fake_requests, fake_container):
+        concurrency = Mock()
+
+        # test
+        packages = Packages('http://host', None, [], '', Mock(), concurrency=concurrency)
+        packages.download_packages()
+
+        # validation
+        concurrency.throttle.assert_called_once_with(fake_requests())
+        fake_container().download.assert_called_with(
+            packages.primary, concurrency.throttle.return_value, packages.listener)
+
     @patch('pulp_rpm.plugins.importers.yum.repomd.alternate.create_downloader', Mock())
     @patch('pulp_rpm.plugins.importers.yum.repomd.alternate.ContentContainer', Mock())
     @patch('pulp_rpm.plugins.importers.yum.repomd.alternate.Request')
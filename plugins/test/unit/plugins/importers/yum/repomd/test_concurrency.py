@@ -0,0 +1,112 @@
+import threading
+import unittest
+
+import mock
+
+from pulp_rpm.plugins.importers.yum.repomd import concurrency
+
+
+class Request(object):
+    def __init__(self, url):
+        self.url = url
+
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+    def setUp(self):
+        self.concurrency = concurrency.AdaptiveConcurrency(4)
+
+    def test_throttle(self):
+        requests = [Request('http://a/1'), Request('http://b/1')]
+
+        self.assertEqual(list(self.concurrency.throttle(requests)), requests)
+
+        self.assertEqual(self.concurrency.hosts['a'].in_flight, 1)
+        self.assertEqual(self.concurrency.limits, {'a': 4, 'b': 4})
+
+    def test_throttle_waits_for_free_slot(self):
+        self.concurrency.max_concurrent = 1
+        requests = self.concurrency.throttle([Request('http://a/1'), Request('http://a/2')])
+        requests.next()
+        timer = threading.Timer(0.1, self.concurrency.succeeded, ['http://a/1', 10])
+        timer.start()
+
+        # blocks until the first download has finished
+        self.assertEqual(requests.next().url, 'http://a/2')
+        timer.join()
+        self.assertEqual(self.concurrency.hosts['a'].in_flight, 1)
+
+    def test_throttle_cancelled(self):
+        self.concurrency.max_concurrent = 1
+        requests = self.concurrency.throttle([Request('http://a/1'), Request('http://a/2')])
+        requests.next()
+        timer = threading.Timer(0.1, self.concurrency.cancel)
+        timer.start()
+
+        self.assertRaises(StopIteration, requests.next)
+        timer.join()
+
+    def test_ramp_up(self):
+        self.concurrency.acquire('http://a/0')
+        state = self.concurrency.hosts['a']
+        state.limit = 2
+
+        for i in range(2):
+            self.concurrency.acquire('http://a/%d' % (i + 1))
+            self.concurrency.succeeded('http://a/%d' % (i + 1), 100)
+
+        self.assertEqual(state.limit, 3)
+        self.assertEqual(state.successes, 0)
+        self.assertEqual(self.concurrency.bytes_downloaded, 200)
+
+    def test_ramp_up_within_max(self):
+        for i in range(10):
+            self.concurrency.acquire('http://a/%d' % i)
+            self.concurrency.succeeded('http://a/%d' % i, 100)
+
+        self.assertEqual(self.concurrency.hosts['a'].limit, 4)
+
+    def test_back_off_on_throttle_response(self):
+        for i in range(3):
+            self.concurrency.acquire('http://a/%d' % i)
+        self.concurrency.acquire('http://a/late')
+
+        self.concurrency.failed('http://a/0', {'response_code': 503})
+        # downloads that were running at the old limit don't back off again
+        self.concurrency.failed('http://a/1', {'response_code': 503})
+        self.assertEqual(self.concurrency.hosts['a'].limit, 2)
+
+        self.concurrency.failed('http://a/2', {'response_code': 404})
+        self.concurrency.acquire('http://a/3')
+        self.concurrency.failed('http://a/3', {})
+        self.assertEqual(self.concurrency.hosts['a'].limit, 1)
+        self.assertEqual(self.concurrency.hosts['a'].in_flight, 1)
+
+    def test_no_back_off_on_not_found(self):
+        self.concurrency.acquire('http://a/0')
+
+        self.concurrency.failed('http://a/0', {'response_code': 404})
+
+        self.assertEqual(self.concurrency.hosts['a'].limit, 4)
+        self.assertEqual(self.concurrency.hosts['a'].in_flight, 0)
+
+    @mock.patch.object(concurrency.time, 'time')
+    def test_back_off_on_latency_spike(self, mock_time):
+        mock_time.return_value = 0
+        self.concurrency.acquire('http://a/0')
+        mock_time.return_value = 1
+        self.concurrency.succeeded('http://a/0', 1000)
+
+        self.concurrency.acquire('http://a/1')
+        mock_time.return_value = 11
+        # 10 bytes per second against an average of 1000
+        self.concurrency.succeeded('http://a/1', 100)
+
+        self.assertEqual(self.concurrency.hosts['a'].limit, 2)
+        self.assertEqual(self.concurrency.throughput, 100)
+
+    def test_unknown_download(self):
+        self.concurrency.succeeded('http://a/0', 100)
+        self.concurrency.failed('http://a/0', None)
+
+        self.assertEqual(self.concurrency.hosts, {})
+        self.assertEqual(self.concurrency.throughput, 0)
@@ -2,7 +2,7 @@ import unittest
 
 import mock
 from pulp.plugins.conduits.unit_import import ImportUnitConduit
-from pulp.plugins.model import Unit, Repository
+from pulp.plugins.model import Unit
 from pulp.server.db.model.criteria import UnitAssociationCriteria
 import pulp.server.managers.factory as manager_factory
 
@@ -35,16 +35,17 @@ class TestAssociate(unittest.TestCase):
         pass
 
     @skip_broken
-    @mock.patch.object(associate, '_associate_unit', autospec=True)
-    def test_no_units_provided(self, mock_associate):
-        self.conduit.get_source_units.return_value = self.group_units
+    @mock.patch.object(associate, 'associate_copies_for_repo', autospec=True,
+                       side_effect=lambda units, dest_repo: list(units))
+    @mock.patch.object(associate, 'find_source_units', autospec=True)
+    def test_no_units_provided(self, mock_find, mock_associate_copies):
+        mock_find.return_value = self.group_units
 
         associate.associate(self.source_repo, self.dest_repo, self.conduit, self.config)
 
-        self.assertEqual(mock_associate.call_count, 2)
-        # confirms that it used the conduit's get_source_units() method
-        mock_associate.assert_any_call(self.dest_repo, self.conduit, self.group_units[0])
-        mock_associate.assert_any_call(self.dest_repo, self.conduit, self.group_units[1])
+        # confirms that it used find_source_units()
+        mock_find.assert_called_once_with(self.source_repo)
+        mock_associate_copies.assert_called_once_with(self.group_units, self.dest_repo)
 
     @skip_broken
     @mock.patch.object(associate, 'copy_rpms', autospec=True)
@@ -64,8 +65,9 @@ class TestAssociate(unittest.TestCase):
     @skip_broken
     @mock.patch.object(associate, 'copy_rpms_by_name', autospec=True)
     @mock.patch('pulp_rpm.plugins.importers.yum.existing.get_existing_units', autospec=True)
-    @mock.patch.object(associate, '_associate_unit', wraps=lambda x, y, z: z)
-    def test_copy_group_recursive(self, mock_associate, mock_get_existing, mock_copy):
+    @mock.patch.object(associate, 'associate_copies_for_repo', autospec=True,
+                       side_effect=lambda units, dest_repo: list(units))
+    def test_copy_group_recursive(self, mock_associate_copies, mock_get_existing, mock_copy):
         self.config.override_config = {constants.CONFIG_RECURSIVE: True}
         self.conduit.get_source_units.return_value = []
         # make it look like half of the RPMs named by the groups being copied
@@ -93,8 +95,9 @@ class TestAssociate(unittest.TestCase):
     @skip_broken
     @mock.patch.object(associate, 'filter_available_rpms', autospec=True, return_value=[])
     @mock.patch.object(associate, 'copy_rpms', autospec=True)
-    @mock.patch.object(associate, '_associate_unit', wraps=lambda x, y, z: z)
-    def test_copy_categories(self, mock_associate_unit, mock_copy_rpms, mock_filter):
+    @mock.patch.object(associate, 'associate_copies_for_repo', autospec=True,
+                       side_effect=lambda units, dest_repo: list(units))
+    def test_copy_categories(self, mock_associate_copies, mock_copy_rpms, mock_filter):
         mock_copy_rpms.return_value = set()
         self.config.override_config = {constants.CONFIG_RECURSIVE: True}
         groups_to_copy = model_factory.group_units(2)
@@ -106,11 +109,170 @@ class TestAssociate(unittest.TestCase):
                                   self.config, self.category_units)
 
         self.assertEqual(set(ret), set(self.category_units) | set(groups_to_copy))
-        self.assertEqual(mock_associate_unit.call_count, 4)
-        mock_associate_unit.assert_any_call(self.dest_repo, self.conduit, self.category_units[0])
-        mock_associate_unit.assert_any_call(self.dest_repo, self.conduit, self.category_units[1])
-        mock_associate_unit.assert_any_call(self.dest_repo, self.conduit, groups_to_copy[0])
-        mock_associate_unit.assert_any_call(self.dest_repo, self.conduit, groups_to_copy[1])
+        self.assertEqual(mock_associate_copies.call_count, 2)
+        mock_associate_copies.assert_any_call(self.category_units, self.dest_repo)
+        mock_associate_copies.assert_any_call(groups_to_copy, self.dest_repo)
+
+
+class TestAssociateStreaming(unittest.TestCase):
+    def setUp(self):
+        self.source_repo = mock.MagicMock(repo_id='repo-source')
+        self.dest_repo = mock.MagicMock(repo_id='repo-dest')
+        self.config = mock.MagicMock()
+        self.config.get.return_value = False
+
+    @mock.patch.object(associate, 'copy_rpms', autospec=True, return_value=set())
+    @mock.patch.object(associate.bulk, 'associate_units', autospec=True)
+    @mock.patch.object(associate, 'associate_copies_for_repo', autospec=True)
+    @mock.patch.object(associate, 'find_source_units', autospec=True)
+    def test_no_units_provided(self, mock_find, mock_associate_copies, mock_associate_units,
+                               mock_copy_rpms):
+        rpm = models.RPM(id='rpm1')
+        group = models.PackageGroup(id='group1')
+        erratum = models.Errata(id='erratum1')
+        distribution = models.Distribution(id='distribution1')
+        group_copy = models.PackageGroup(id='group2')
+        mock_find.return_value = iter([rpm, group, erratum, distribution])
+        mock_associate_copies.return_value = [group_copy]
+
+        ret = associate.associate(self.source_repo, self.dest_repo, mock.MagicMock(),
+                                  self.config)
+
+        mock_find.assert_called_once_with(self.source_repo)
+        mock_associate_copies.assert_called_once_with([group], self.dest_repo)
+        # the units that are not copied are associated together
+        mock_associate_units.assert_called_once_with(self.dest_repo, [erratum, distribution])
+        self.assertEqual(set(mock_copy_rpms.call_args[0][0]), set([rpm]))
+        self.assertEqual(set(ret), set([rpm, group_copy, erratum, distribution]))
+
+
+class TestAssociateCopiesForRepo(unittest.TestCase):
+    @mock.patch.object(associate.bulk, 'associate_units', autospec=True)
+    @mock.patch.object(associate.bulk, 'upsert_units', autospec=True)
+    def test_copies(self, mock_upsert, mock_associate_units):
+        dest_repo = mock.MagicMock(repo_id='repo-dest')
+        groups = [models.PackageGroup(package_group_id='group%d' % i, repo_id='repo-source')
+                  for i in range(2)]
+        category = models.PackageCategory(package_category_id='category1',
+                                          repo_id='repo-source')
+        mock_upsert.side_effect = lambda model_class, units: units
+
+        ret = associate.associate_copies_for_repo(groups + [category], dest_repo)
+
+        # one request saves the copies of each type
+        self.assertEqual(mock_upsert.call_count, 2)
+        upserted = dict((call[0][0], call[0][1]) for call in mock_upsert.call_args_list)
+        self.assertEqual([unit.package_group_id for unit in upserted[models.PackageGroup]],
+                         ['group0', 'group1'])
+        self.assertEqual(len(upserted[models.PackageCategory]), 1)
+        self.assertTrue(all(unit.repo_id == 'repo-dest' for unit in ret))
+        self.assertEqual(len(ret), 3)
+        mock_associate_units.assert_called_once_with(dest_repo, ret)
+
+    @mock.patch.object(associate.bulk, 'associate_units', autospec=True)
+    @mock.patch.object(associate.bulk, 'upsert_units', autospec=True)
+    @mock.patch.object(models.YumMetadataFile, 'safe_import_content', autospec=True)
+    @mock.patch.object(models.YumMetadataFile, 'set_storage_path', autospec=True)
+    def test_metadata_file(self, mock_set_path, mock_import, mock_upsert, mock_associate_units):
+        dest_repo = mock.MagicMock(repo_id='repo-dest')
+        unit = models.YumMetadataFile(data_type='productid', repo_id='repo-source')
+        unit._storage_path = '/var/lib/pulp/content/productid.gz'
+        mock_upsert.side_effect = lambda model_class, units: units
+
+        ret = associate.associate_copies_for_repo([unit], dest_repo)
+
+        mock_set_path.assert_called_once_with(ret[0], 'productid.gz')
+        mock_import.assert_called_once_with(ret[0], '/var/lib/pulp/content/productid.gz')
+
+    @mock.patch.object(associate.bulk, 'associate_units', autospec=True)
+    @mock.patch.object(associate.bulk, 'upsert_units', autospec=True)
+    def test_nothing(self, mock_upsert, mock_associate_units):
+        self.assertEqual(associate.associate_copies_for_repo([], mock.MagicMock()), [])
+
+        self.assertFalse(mock_upsert.called)
+
+
+class TestFindSourceUnits(unittest.TestCase):
+    @mock.patch.object(associate.repo_controller, 'find_repo_content_units', autospec=True)
+    @mock.patch.object(associate.plugin_api, 'get_unit_model_by_id', autospec=True)
+    @mock.patch.object(associate, 'RepositoryContentUnit')
+    def test_fields(self, mock_rcu, mock_get_model, mock_find):
+        repo = mock.MagicMock(repo_id='repo1')
+        mock_rcu.objects.return_value.distinct.return_value = ['rpm', 'package_group']
+        mock_get_model.side_effect = {'rpm': models.RPM,
+                                      'package_group': models.PackageGroup}.get
+        mock_find.side_effect = lambda *args, **kwargs: iter([kwargs['unit_fields']])
+
+        ret = list(associate.find_source_units(repo))
+
+        mock_rcu.objects.assert_called_once_with(repo_id='repo1')
+        # RPMs are only loaded with the fields needed to associate them, and groups are
+        # loaded whole since they are copied
+        self.assertEqual(ret, [('id',) + models.RPM.unit_key_fields, None])
+        self.assertTrue(mock_find.call_args_list[0][1]['yield_content_unit'])
+
+
+class TestFindParentUnits(unittest.TestCase):
+    @mock.patch.object(models.PackageGroup, 'objects')
+    @mock.patch.object(models.Errata, 'objects')
+    def test_find(self, mock_errata_objects, mock_group_objects):
+        erratum = models.Errata(id='erratum1')
+        group = models.PackageGroup(id='group1')
+        mock_errata_objects.filter.return_value.only.return_value = [erratum]
+        mock_group_objects.filter.return_value.only.return_value = [group]
+        units = [models.RPM(id='rpm1'), erratum, group]
+
+        ret = list(associate.find_parent_units(units))
+
+        self.assertEqual(set(ret), set([erratum, group]))
+        mock_errata_objects.filter.assert_called_once_with(id__in=('erratum1',))
+        mock_errata_objects.filter.return_value.only.assert_called_once_with('pkglist')
+        mock_group_objects.filter.assert_called_once_with(id__in=('group1',))
+        mock_group_objects.filter.return_value.only.assert_called_once_with(
+            *associate.CHILD_FIELDS[models.PackageGroup])
+
+    def test_no_parents(self):
+        self.assertEqual(list(associate.find_parent_units([models.RPM(id='rpm1')])), [])
+
+
+class TestCopyRPMsBulk(unittest.TestCase):
+    @mock.patch.object(associate.bulk, 'associate_units', autospec=True)
+    def test_without_deps(self, mock_associate_units):
+        dest_repo = mock.MagicMock()
+        rpms = [models.RPM(id='rpm%d' % i) for i in range(3)]
+
+        ret = associate.copy_rpms(rpms, mock.MagicMock(), dest_repo, mock.MagicMock(), False)
+
+        self.assertEqual(ret, set(rpms))
+        self.assertEqual(mock_associate_units.call_count, 1)
+        self.assertEqual(list(mock_associate_units.call_args[0][1]), rpms)
+
+    @mock.patch.object(associate.existing, 'get_existing_units', autospec=True)
+    @mock.patch.object(associate.bulk, 'associate_units', autospec=True)
+    def test_with_deps(self, mock_associate_units, mock_get_existing):
+        """
+        Test that dependencies are found a level at a time, that units are only examined once,
+        and that dependencies already in the destination repo are not copied.
+        """
+        dest_repo = mock.MagicMock()
+        rpms = [models.RPM(id='rpm%d' % i) for i in range(5)]
+        solver = mock.MagicMock()
+        # rpm0 requires rpm1, which requires rpm2 and rpm0, and rpm2 requires rpm3 and rpm1
+        solver.find_dependent_rpms.side_effect = [set(rpms[1:2]), set([rpms[0], rpms[2]]),
+                                                  set(rpms[1:4]), set()]
+        mock_get_existing.return_value = [rpms[3]]
+
+        ret = associate.copy_rpms(rpms[:1], mock.MagicMock(), dest_repo, mock.MagicMock(), True,
+                                  solver)
+
+        self.assertEqual(ret, set(rpms[:3]))
+        levels = [call[0][0] for call in solver.find_dependent_rpms.call_args_list]
+        self.assertEqual(levels, [set(rpms[:1]), set(rpms[1:2]), set(rpms[2:3]), set(rpms[3:4])])
+        # existence in the destination repo is checked once, for all dependencies
+        self.assertEqual(mock_get_existing.call_count, 1)
+        self.assertEqual(len(mock_get_existing.call_args[0][0]), 3)
+        copied = set(mock_associate_units.call_args_list[-1][0][1])
+        self.assertEqual(copied, set(rpms[1:3]))
 
 
 @skip_broken
@@ -268,65 +430,6 @@ class TestIdentifyChildrenToCopy(unittest.TestCase):
         self.assertEqual(rpm_search_dicts, units[0].metadata['pkglist'][0]['packages'])
 
 
-class TestAssociateUnit(unittest.TestCase):
-    def setUp(self):
-        self.repo = Repository('repo1')
-
-    @skip_broken
-    @mock.patch('shutil.copyfile')
-    def test_rpm(self, mock_copyfile):
-        model = model_factory.rpm_models(1)[0]
-        unit = Unit(model.TYPE, model.unit_key, model.metadata, '/')
-
-        # passing "None" ensures that the importer isn't being called
-        ret = associate._associate_unit('', None, unit)
-
-        self.assertTrue(ret is unit)
-        self.assertEqual(mock_copyfile.call_count, 0)
-
-    @skip_broken
-    def test_distribution(self):
-        unit = model_factory.drpm_units(1)[0]
-        mock_conduit = mock.MagicMock(spec_set=ImportUnitConduit)
-
-        ret = associate._associate_unit('repo2', mock_conduit, unit)
-
-        self.assertTrue(ret is unit)
-        mock_conduit.associate_unit.assert_called_once_with(unit)
-
-    @skip_broken
-    @mock.patch('shutil.copyfile')
-    def test_yum_md_file(self, mock_copyfile):
-        mock_conduit = mock.MagicMock(spec_set=ImportUnitConduit('', '', '', ''))
-        model = model_factory.yum_md_file()
-        unit = Unit(model.TYPE, model.unit_key, model.metadata, '/foo/bar')
-
-        associate._associate_unit(self.repo, mock_conduit, unit)
-
-        expected_key = {'repo_id': self.repo.id, 'data_type': model.unit_key['data_type']}
-        self.assertEqual(mock_conduit.init_unit.call_args[0][0], model.TYPE)
-        self.assertEqual(mock_conduit.init_unit.call_args[0][1], expected_key)
-        self.assertEqual(mock_conduit.init_unit.call_args[0][2], model.metadata)
-
-        mock_conduit.save_unit.assert_called_once_with(mock_conduit.init_unit.return_value)
-
-        mock_copyfile.assert_called_once_with(unit.storage_path,
-                                              mock_conduit.init_unit.return_value.storage_path)
-
-    @skip_broken
-    def test_group(self):
-        unit = model_factory.group_units(1)[0]
-        mock_conduit = mock.MagicMock()
-
-        ret = associate._associate_unit(self.repo, mock_conduit, unit)
-
-        saved_unit = mock_conduit.save_unit.call_args[0][0]
-
-        self.assertTrue(ret is mock_conduit.save_unit.return_value)
-        self.assertEqual(saved_unit.unit_key['repo_id'], self.repo.id)
-        self.assertEqual(saved_unit.unit_key['id'], unit.unit_key['id'])
-
-
 class TestGetRPMSToCopyByKey(unittest.TestCase):
     def setUp(self):
         # Code below causes EL6 to fail. We believe due to unittest2 backport incorrectly running
@@ -289,6 +289,45 @@ class TestMatch(DepsolveTestCase):
         self.assertEqual(satisfactions, expected_satisfactions)
 
 
+class TestGetRequirements(unittest.TestCase):
+    """
+    Test the Solver.get_requirements() method.
+    """
+
+    def setUp(self):
+        self.solver = depsolve.Solver(mock.MagicMock())
+        self.firefox = models.RPM(id='firefox', requires=[{'name': 'xulrunner'}])
+        self.sqlite = models.RPM(id='sqlite', requires=[])
+
+    @mock.patch.object(models.RPM, 'objects')
+    def test_requirements(self, mock_objects):
+        """
+        Test that the requirements of each unit are returned.
+        """
+        mock_objects.filter.return_value.only.return_value = [self.firefox, self.sqlite]
+
+        requirements = list(self.solver.get_requirements([self.firefox, self.sqlite]))
+
+        self.assertEqual([r.name for r in requirements], ['xulrunner'])
+        self.assertEqual(set(mock_objects.filter.call_args[1]['id__in']),
+                         set(['firefox', 'sqlite']))
+
+    @mock.patch.object(models.RPM, 'objects')
+    def test_cached(self, mock_objects):
+        """
+        Test that the requirements of a unit are only queried once.
+        """
+        mock_objects.filter.return_value.only.return_value = [self.firefox]
+        list(self.solver.get_requirements([self.firefox]))
+
+        mock_objects.filter.return_value.only.return_value = [self.sqlite]
+        requirements = list(self.solver.get_requirements([self.firefox, self.sqlite]))
+
+        self.assertEqual([r.name for r in requirements], ['xulrunner'])
+        self.assertEqual(mock_objects.filter.call_count, 2)
+        self.assertEqual(list(mock_objects.filter.call_args[1]['id__in']), ['sqlite'])
+
+
 class TestRequirement(unittest.TestCase):
     """
     Test the Requirement class.
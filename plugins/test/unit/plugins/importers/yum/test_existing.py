@@ -0,0 +1,62 @@
+import unittest
+
+import mock
+
+from pulp_rpm.plugins.db import models
+from pulp_rpm.plugins.importers.yum import existing
+
+
+class TestFindRPMsByNEVRA(unittest.TestCase):
+    def setUp(self):
+        self.repo = mock.MagicMock(repo_id='repo1')
+        self.units = [
+            models.RPM(id='a', name='foo', epoch='0', version='1.0', release='1', arch='x86_64'),
+            models.RPM(id='b', name='foo', epoch='0', version='1.1', release='1', arch='x86_64'),
+            models.RPM(id='c', name='bar', epoch='0', version='2.0', release='1', arch='noarch'),
+        ]
+
+    @mock.patch.object(existing, 'RepositoryContentUnit')
+    @mock.patch.object(models.RPM, 'objects')
+    def test_find(self, mock_objects, mock_rcu):
+        mock_objects.filter.return_value.only.return_value = self.units
+        # only "c" is in the repository
+        mock_rcu.objects.return_value.scalar.return_value = ['c']
+        search_dicts = [
+            {'name': 'foo', 'epoch': '0', 'version': '1.0', 'release': '1', 'arch': 'x86_64',
+             'checksum': None, 'checksumtype': None},
+            {'name': 'bar', 'version': '2.0', 'release': '1', 'arch': 'noarch'},
+        ]
+
+        ret = list(existing.find_rpms_by_nevra(search_dicts, self.repo))
+
+        self.assertEqual(ret, [self.units[2]])
+        # candidates are found with one query by name and arch
+        self.assertEqual(mock_objects.filter.call_count, 1)
+        query = mock_objects.filter.call_args[1]
+        self.assertEqual(set(query['name__in']), set(['foo', 'bar']))
+        self.assertEqual(set(query['arch__in']), set(['x86_64', 'noarch']))
+        # "b" has a different version, so only "a" and "c" are looked up in the repository
+        rcu_query = mock_rcu.objects.call_args[1]
+        self.assertEqual(set(rcu_query['unit_id__in']), set(['a', 'c']))
+        self.assertEqual(rcu_query['repo_id'], 'repo1')
+
+    @mock.patch.object(existing, 'RepositoryContentUnit')
+    @mock.patch.object(models.RPM, 'objects')
+    def test_any_arch(self, mock_objects, mock_rcu):
+        mock_objects.filter.return_value.only.return_value = self.units
+        mock_rcu.objects.return_value.scalar.return_value = ['a', 'b']
+
+        ret = list(existing.find_rpms_by_nevra([{'name': 'foo'}], self.repo))
+
+        self.assertEqual(set(ret), set(self.units[:2]))
+        self.assertTrue('arch__in' not in mock_objects.filter.call_args[1])
+
+    @mock.patch.object(existing, 'RepositoryContentUnit')
+    @mock.patch.object(models.RPM, 'objects')
+    def test_no_candidates(self, mock_objects, mock_rcu):
+        mock_objects.filter.return_value.only.return_value = []
+
+        ret = list(existing.find_rpms_by_nevra([{'name': 'baz', 'arch': 'noarch'}], self.repo))
+
+        self.assertEqual(ret, [])
+        self.assertFalse(mock_rcu.objects.called)
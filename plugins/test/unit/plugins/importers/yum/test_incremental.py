@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from pulp_rpm.plugins.db import models
+from pulp_rpm.plugins.distributors.export_distributor import incremental_bundle
+from pulp_rpm.plugins.importers.yum import incremental
+
+
+MODULE = 'pulp_rpm.plugins.importers.yum.incremental'
+
+
+class TestImportUnits(unittest.TestCase):
+    """
+    Test importing the units of an incremental export
+    """
+
+    def setUp(self):
+        self.repo_dir = tempfile.mkdtemp()
+        self.repo = mock.Mock()
+        self.rpm_key = {'name': 'foo', 'epoch': '0', 'version': '1', 'release': '1',
+                        'arch': 'noarch', 'checksumtype': 'sha256', 'checksum': 'abc'}
+        self.rpm_metadata = {'filename': 'foo-1-1.noarch.rpm', 'size': 5,
+                             'repodata': {'primary': '<package/>'}, 'not_a_field': 1}
+
+        writer = incremental_bundle.BundleWriter(self.repo_dir)
+        writer.initialize()
+        writer.add_unit('rpm', self.rpm_key, self.rpm_metadata)
+        writer.add_unit('erratum', {'errata_id': 'RHSA-1'},
+                        {'from': 'security@example.com', 'pkglist': [{'name': 'new'}]})
+        writer.finalize()
+        self.index = incremental_bundle.read_index(self.repo_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.repo_dir)
+
+    @mock.patch.object(models.RPM, 'safe_import_content')
+    @mock.patch(MODULE + '.bulk')
+    def test_import_units(self, mock_bulk, mock_import):
+        mock_bulk.insert_units.side_effect = lambda model_class, units: list(units)
+        progress_callback = mock.Mock()
+
+        incremental.import_units(self.repo, self.repo_dir, self.index,
+                                 progress_callback=progress_callback)
+
+        mock_import.assert_called_once_with(os.path.join(self.repo_dir, 'foo-1-1.noarch.rpm'))
+        self.assertEqual([c[0][0] for c in mock_bulk.insert_units.call_args_list],
+                         [models.RPM, models.Errata])
+        pages = [c[0][1] for c in mock_bulk.associate_units.call_args_list]
+        self.assertEqual([c[0][0] for c in mock_bulk.associate_units.call_args_list],
+                         [self.repo, self.repo])
+        self.assertEqual(len(pages), 2)
+        [rpm], [erratum] = pages
+        self.assertTrue(isinstance(rpm, models.RPM))
+        self.assertEqual(rpm.unit_key, self.rpm_key)
+        self.assertEqual(rpm.size, 5)
+        self.assertEqual(rpm.repodata, {'primary': '<package/>'})
+        self.assertTrue(isinstance(erratum, models.Errata))
+        self.assertEqual(erratum.errata_from, 'security@example.com')
+        self.assertEqual(progress_callback.call_args_list,
+                         [mock.call([rpm]), mock.call([erratum])])
+
+    @mock.patch(MODULE + '.PAGE_SIZE', 2)
+    @mock.patch(MODULE + '.bulk')
+    def test_pages(self, mock_bulk):
+        repo_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, repo_dir)
+        writer = incremental_bundle.BundleWriter(repo_dir)
+        writer.initialize()
+        for i in range(5):
+            writer.add_unit('package_group', {'id': 'group%d' % i, 'repo_id': 'repo1'}, {})
+        writer.finalize()
+        index = incremental_bundle.read_index(repo_dir)
+        mock_bulk.insert_units.side_effect = lambda model_class, units: list(units)
+
+        incremental.import_units(self.repo, repo_dir, index)
+
+        self.assertEqual([len(c[0][1]) for c in mock_bulk.associate_units.call_args_list],
+                         [2, 2, 1])
+
+    @mock.patch(MODULE + '.bulk')
+    def test_progress_callback_stops_import(self, mock_bulk):
+        mock_bulk.insert_units.side_effect = lambda model_class, units: list(units)
+        progress_callback = mock.Mock(side_effect=ValueError)
+
+        self.assertRaises(ValueError, incremental.import_units, self.repo, self.repo_dir,
+                          self.index, progress_callback=progress_callback)
+
+        # no page is saved after the callback raised
+        self.assertEqual(mock_bulk.insert_units.call_count, 1)
+        self.assertEqual(progress_callback.call_count, 1)
+
+    @mock.patch(MODULE + '.verification')
+    @mock.patch.object(models.RPM, 'safe_import_content')
+    @mock.patch(MODULE + '.bulk')
+    def test_validate(self, mock_bulk, mock_import, mock_verification):
+        mock_bulk.insert_units.side_effect = lambda model_class, units: list(units)
+        with open(os.path.join(self.repo_dir, 'foo-1-1.noarch.rpm'), 'w') as package_file:
+            package_file.write('rpm')
+
+        incremental.import_units(self.repo, self.repo_dir, self.index, validate=True)
+
+        self.assertEqual(mock_verification.verify_checksum.call_count, 1)
+        self.assertEqual(mock_verification.verify_checksum.call_args[0][1:], ('sha256', 'abc'))
+
+    @mock.patch.object(models.RPM, 'safe_import_content')
+    @mock.patch(MODULE + '.bulk')
+    def test_existing_units(self, mock_bulk, mock_import):
+        existing_rpm = mock.Mock()
+        existing_erratum = mock.Mock(pkglist=[{'name': 'old'}])
+        mock_bulk.insert_units.side_effect = lambda model_class, units: (
+            [existing_rpm] if model_class is models.RPM else [existing_erratum])
+
+        incremental.import_units(self.repo, self.repo_dir, self.index)
+
+        mock_bulk.associate_units.assert_has_calls(
+            [mock.call(self.repo, [existing_rpm]), mock.call(self.repo, [existing_erratum])])
+        # the files of packages that are already saved are not imported again
+        self.assertFalse(mock_import.called)
+        self.assertEqual(existing_erratum.pkglist, [{'name': 'old'}, {'name': 'new'}])
+        existing_erratum.save.assert_called_once_with()
@@ -17,6 +17,8 @@ class TestPackageListener(unittest.TestCase):
         self.config = mock.MagicMock()
         self.metadata_files = mock.MagicMock()
         self.report = mock.MagicMock()
+        self.concurrency = mock.MagicMock()
+        self.set_progress = mock.MagicMock()
 
     @skip_broken
     @mock.patch('pulp.server.controllers.repository.associate_single_unit')
@@ -101,3 +103,14 @@ class TestPackageListener(unittest.TestCase):
 
         mock_verify_checksum.assert_called_once()
         self.assertFalse(self.progress_report['content'].success.called)
+
+    def test_download_failed(self):
+        self.report.error_report = {'response_code': 503}
+        content_listener = listener.PackageListener(self, self.metadata_files)
+
+        content_listener.download_failed(self.report)
+
+        self.concurrency.failed.assert_called_once_with(self.report.url, self.report.error_report)
+        self.progress_report['content'].download_stats.assert_called_once_with(self.concurrency)
+        self.progress_report['content'].failure.assert_called_once_with(
+            self.report.data, self.report.error_report)
@@ -175,6 +175,8 @@ class TestGetRemoteUnits(TestPurgeBase):
             self.assertTrue(model.as_named_tuple in ret)
 
 
+@mock.patch.object(purge, '_old_version_groups',
+                   side_effect=OperationFailure('mocked failure'))
 class TestRemoveOldVersions(TestPurgeBase):
     def setUp(self):
         super(TestRemoveOldVersions, self).setUp()
@@ -186,7 +188,7 @@ class TestRemoveOldVersions(TestPurgeBase):
         self.drpms.extend(model_factory.drpm_models(2, False))
 
     @skip_broken
-    def test_rpm_one(self):
+    def test_rpm_one(self, mock_groups):
         self.conduit.get_units = mock.MagicMock(
             spec_set=self.conduit.get_units,
             side_effect=lambda criteria: self.rpms if ids.TYPE_ID_RPM in criteria.type_ids else [])
@@ -199,7 +201,7 @@ class TestRemoveOldVersions(TestPurgeBase):
         self.assertEqual(self.conduit.remove_unit.call_count, 2)
 
     @skip_broken
-    def test_rpm_two(self):
+    def test_rpm_two(self, mock_groups):
         self.conduit.get_units = mock.MagicMock(
             spec_set=self.conduit.get_units,
             side_effect=lambda criteria: self.rpms if ids.TYPE_ID_RPM in criteria.type_ids else [])
@@ -210,7 +212,7 @@ class TestRemoveOldVersions(TestPurgeBase):
         self.conduit.remove_unit.assert_called_once_with(self.rpms[0])
 
     @skip_broken
-    def test_srpm_one(self):
+    def test_srpm_one(self, mock_groups):
         self.conduit.get_units = mock.MagicMock(
             spec_set=self.conduit.get_units,
             side_effect=lambda criteria: self.srpms if ids.TYPE_ID_SRPM in criteria.type_ids else []
@@ -224,7 +226,7 @@ class TestRemoveOldVersions(TestPurgeBase):
         self.assertEqual(self.conduit.remove_unit.call_count, 2)
 
     @skip_broken
-    def test_srpm_two(self):
+    def test_srpm_two(self, mock_groups):
         self.conduit.get_units = mock.MagicMock(
             spec_set=self.conduit.get_units,
             side_effect=lambda criteria: self.srpms if ids.TYPE_ID_SRPM in criteria.type_ids else []
@@ -236,7 +238,7 @@ class TestRemoveOldVersions(TestPurgeBase):
         self.conduit.remove_unit.assert_called_once_with(self.srpms[0])
 
     @skip_broken
-    def test_drpm_one(self):
+    def test_drpm_one(self, mock_groups):
         self.conduit.get_units = mock.MagicMock(
             spec_set=self.conduit.get_units,
             side_effect=lambda criteria: self.drpms if ids.TYPE_ID_DRPM in criteria.type_ids else []
@@ -250,7 +252,7 @@ class TestRemoveOldVersions(TestPurgeBase):
         self.assertEqual(self.conduit.remove_unit.call_count, 2)
 
     @skip_broken
-    def test_drpm_two(self):
+    def test_drpm_two(self, mock_groups):
         self.conduit.get_units = mock.MagicMock(
             spec_set=self.conduit.get_units,
             side_effect=lambda criteria: self.drpms if ids.TYPE_ID_DRPM in criteria.type_ids else []
@@ -262,6 +264,79 @@ class TestRemoveOldVersions(TestPurgeBase):
         self.conduit.remove_unit.assert_called_once_with(self.drpms[0])
 
 
+class TestRemoveOldVersionsAggregation(TestPurgeBase):
+    def setUp(self):
+        super(TestRemoveOldVersionsAggregation, self).setUp()
+        self.conduit.repo = mock.MagicMock()
+
+    @mock.patch.object(repo_controller, 'disassociate_units')
+    @mock.patch.object(purge, '_old_version_groups')
+    def test_disassociates_old_ids(self, mock_groups, mock_disassociate):
+        versions = [
+            {'_id': 'a', 'epoch': '0', 'version_sort_index': '01-1', 'release_sort_index': '01-1'},
+            {'_id': 'b', 'epoch': '0', 'version_sort_index': '01-2', 'release_sort_index': '01-1'},
+        ]
+        mock_groups.side_effect = lambda unit_type, repo_id, num_to_keep: \
+            [{'versions': versions}] if unit_type is models.RPM else []
+
+        purge.remove_old_versions(1, self.conduit)
+
+        self.assertEqual(mock_groups.call_count, 3)
+        mock_groups.assert_any_call(models.RPM, self.conduit.repo_id, 1)
+        self.assertEqual(mock_disassociate.call_count, 1)
+        repo, units = mock_disassociate.call_args[0]
+        self.assertTrue(repo is self.conduit.repo)
+        self.assertEqual([unit.id for unit in units], ['a'])
+
+    @mock.patch.object(purge, '_remove_old_versions_in_memory')
+    @mock.patch.object(purge, '_old_version_groups',
+                       side_effect=OperationFailure('mocked failure'))
+    def test_falls_back_when_aggregation_fails(self, mock_groups, mock_in_memory):
+        purge.remove_old_versions(2, self.conduit)
+
+        self.assertEqual(mock_in_memory.call_count, 3)
+        mock_in_memory.assert_any_call(models.DRPM, 2, self.conduit)
+
+
+class TestOldVersionIdGenerator(unittest.TestCase):
+    def _version(self, unit_id, epoch, version, release):
+        return {'_id': unit_id, 'epoch': epoch, 'version_sort_index': version,
+                'release_sort_index': release}
+
+    def test_keeps_newest(self):
+        group = {'versions': [
+            self._version('new', '0', '01-3', '01-1'),
+            self._version('old', '0', '01-1', '01-1'),
+            self._version('mid', '0', '01-2', '01-1'),
+        ]}
+
+        result = list(purge._old_version_id_generator([group], 2))
+
+        self.assertEqual(result, ['old'])
+
+    def test_epoch_wins(self):
+        # epoch 10 must sort after epoch 9, which a plain string comparison gets wrong
+        group = {'versions': [
+            self._version('epoch10', '10', '01-1', '01-1'),
+            self._version('epoch9', '9', '01-5', '01-1'),
+        ]}
+
+        result = list(purge._old_version_id_generator([group], 1))
+
+        self.assertEqual(result, ['epoch9'])
+
+    def test_same_version_kept_together(self):
+        group = {'versions': [
+            self._version('a1', '0', '01-2', '01-1'),
+            self._version('a2', '0', '01-2', '01-1'),
+            self._version('b', '0', '01-1', '01-1'),
+        ]}
+
+        result = list(purge._old_version_id_generator([group], 1))
+
+        self.assertEqual(result, ['b'])
+
+
 class TestPurgeUnwantedUnits(TestPurgeBase):
     @mock.patch.object(purge, 'get_remote_units', autospec=True)
     def test_remove_missing_false(self, mock_get_remote):
@@ -449,41 +524,57 @@ class RemoveRepoDuplicateNevra(TestPurgeBase):
         repo_rcu_ids = set([rcu.unit_id for rcu in repo_rcu])
         self.assertFalse(self.duplicate_unit_ids.intersection(repo_rcu_ids))
 
-    def test_duplicate_nevra_generators(self):
-        # the two different duplicate nevra generators (mapreduce vs. aggregation) should return
-        # exactly the same list of packages. The two mechanisms operate slightly differently, so
-        # the return values need to be sorted before comparison.
-        unit = self.UNIT_TYPES[0]
-        fields = purge._duplicate_key_nevra_fields(unit)
+    def test_duplicate_nevra_groups_match_in_memory(self):
+        # the aggregation and in-memory group finders should find exactly the same duplicates.
+        # the two mechanisms order groups differently, so the results are sorted for comparison.
+        unit_type = self.UNIT_TYPES[0]
         try:
-            aggregated_units = sorted(purge._duplicate_key_id_generator_aggregation(unit, fields))
+            aggregated = sorted(purge._duplicate_nevra_id_generator(
+                purge._duplicate_nevra_groups(unit_type, self.repo_a.repo_id)))
         except OperationFailure:
-            self.skipTest("Aggregation fails on mongodb < 2.6, skipping generator comparison")
-        mapreduced_units = sorted(purge._duplicate_key_id_generator_mapreduce(unit, fields))
-        # units were returned by each mechanism
-        self.assertTrue(mapreduced_units)
-        self.assertTrue(aggregated_units)
-        # the two mechanisms returned the same units
-        self.assertEqual(mapreduced_units, aggregated_units)
-
-
-@mock.patch.object(models.RPM, 'objects')
-@mock.patch.object(purge, '_duplicate_key_id_generator_aggregation')
-@mock.patch.object(purge, '_duplicate_key_id_generator_mapreduce')
-class RemoveRepoDuplicateNevraGenerators(unittest.TestCase):
-    """Test the generator selection logic in _duplicate_key_id_generator"""
-    def test_aggregation_by_default(self, mapreduce, aggregate, manager):
-        # aggregate raises no exception, aggregation generator is used
-        manager.aggregate.return_value = None
-        purge._duplicate_key_id_generator(models.RPM)
-        self.assertTrue(aggregate.called)
-        self.assertFalse(mapreduce.called)
+            self.skipTest("$lookup fails on mongodb < 3.2, skipping group finder comparison")
+        in_memory = sorted(purge._duplicate_nevra_id_generator(
+            purge._duplicate_nevra_groups_in_memory(unit_type, self.repo_a.repo_id)))
+        # duplicates were found by each mechanism
+        self.assertTrue(aggregated)
+        self.assertTrue(in_memory)
+        # the two mechanisms found the same duplicates
+        self.assertEqual(aggregated, in_memory)
+
+
+@mock.patch.object(platform_model.Repository, 'objects')
+@mock.patch.object(repo_controller, 'disassociate_units')
+@mock.patch.object(purge, '_duplicate_nevra_groups_in_memory')
+@mock.patch.object(purge, '_duplicate_nevra_groups')
+class RemoveRepoDuplicateNevraGroups(unittest.TestCase):
+    """Test the group finder selection logic in remove_repo_duplicate_nevra"""
+    def test_aggregation_by_default(self, aggregate, in_memory, disassociate, repo_objects):
+        aggregate.return_value = []
+        purge.remove_repo_duplicate_nevra('repo1')
+        self.assertEqual(aggregate.call_count, 3)
+        self.assertFalse(in_memory.called)
+        repo_objects.get.assert_called_once_with(repo_id='repo1')
 
     @mock.patch('logging.Logger.info')
-    def test_mapreduce_when_aggregation_fails(self, logger, mapreduce, aggregate, manager):
-        # when the attempt to use aggregation fails, mapreduce is used and a message is logged
-        manager.aggregate.side_effect = OperationFailure("mocked failure")
-        purge._duplicate_key_id_generator(models.RPM)
-        self.assertFalse(aggregate.called)
-        self.assertTrue(mapreduce.called)
-        self.assertEqual(logger.call_count, 1)
+    def test_in_memory_when_aggregation_fails(self, logger, aggregate, in_memory, disassociate,
+                                              repo_objects):
+        # when the attempt to use aggregation fails, the in-memory method is used
+        aggregate.side_effect = OperationFailure("mocked failure")
+        in_memory.return_value = []
+        purge.remove_repo_duplicate_nevra('repo1')
+        self.assertEqual(in_memory.call_count, 3)
+        self.assertEqual(logger.call_count, 3)
+
+    def test_keeps_most_recent(self, aggregate, in_memory, disassociate, repo_objects):
+        aggregate.side_effect = lambda unit_type, repo_id: [{'units': [
+            {'unit_id': 'old', 'updated': '2016-01-01T00:00:00Z'},
+            {'unit_id': 'new', 'updated': '2016-01-02T00:00:00Z'},
+            {'unit_id': 'older', 'updated': '2015-01-01T00:00:00Z'},
+        ]}] if unit_type is models.RPM else []
+
+        purge.remove_repo_duplicate_nevra('repo1')
+
+        self.assertEqual(disassociate.call_count, 1)
+        repo, units = disassociate.call_args[0]
+        self.assertTrue(repo is repo_objects.get.return_value)
+        self.assertEqual(sorted(unit.id for unit in units), ['old', 'older'])
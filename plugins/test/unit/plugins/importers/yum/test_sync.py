@@ -303,6 +303,115 @@ class TestParseMirrorlist(BaseSyncTest):
         self.assertEqual(ret, ['https://some/url/'])
 
 
+class TestImportIncrementalExport(BaseSyncTest):
+    def setUp(self):
+        super(TestImportIncrementalExport, self).setUp()
+        self.reposync.set_progress = mock.MagicMock(spec_set=self.reposync.set_progress)
+        self.conduit.build_success_report = mock.MagicMock()
+        self.conduit.build_failure_report = mock.MagicMock()
+        self.index = {'version': 1, 'bundles': [{'file': 'rpm-0001.json.gz', 'type_id': 'rpm',
+                                                 'units': 3, 'checksum': 'abc'}]}
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.incremental_bundle.read_index')
+    def test_get_incremental_export(self, mock_read_index):
+        self.config.override_config[importer_constants.KEY_FEED] = 'file:///mnt/export/repo/'
+        mock_read_index.return_value = self.index
+
+        ret = self.reposync._get_incremental_export()
+
+        self.assertEqual(ret, ('/mnt/export/repo/', self.index))
+        mock_read_index.assert_called_once_with('/mnt/export/repo/')
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.incremental_bundle.read_index')
+    def test_get_incremental_export_remote_feed(self, mock_read_index):
+        self.assertEqual(self.reposync._get_incremental_export(), None)
+        self.assertFalse(mock_read_index.called)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.incremental_bundle.read_index',
+                return_value=None)
+    def test_get_incremental_export_no_index(self, mock_read_index):
+        self.config.override_config[importer_constants.KEY_FEED] = 'file:///mnt/repo/'
+
+        self.assertEqual(self.reposync._get_incremental_export(), None)
+
+    def test_run_imports_incremental_export(self):
+        self.reposync._get_incremental_export = mock.MagicMock(return_value=('/dir', self.index))
+        self.reposync.import_incremental_export = mock.MagicMock()
+
+        report = self.reposync.run()
+
+        self.reposync.import_incremental_export.assert_called_once_with('/dir', self.index)
+        self.assertTrue(report is self.reposync.import_incremental_export.return_value)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.incremental.import_units')
+    def test_import_incremental_export(self, mock_import_units):
+        def import_units(repo, repo_dir, index, validate, progress_callback):
+            progress_callback([mock.Mock(), mock.Mock()])
+        mock_import_units.side_effect = import_units
+
+        report = self.reposync.import_incremental_export('/dir', self.index)
+
+        self.assertTrue(report is self.conduit.build_success_report.return_value)
+        self.assertEqual(self.reposync.content_report['items_total'], 3)
+        self.assertEqual(self.reposync.content_report['items_left'], 1)
+        self.assertEqual(self.reposync.content_report['state'], constants.STATE_COMPLETE)
+        self.assertEqual(self.reposync.progress_report['errata']['state'],
+                         constants.STATE_SKIPPED)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.incremental.import_units')
+    def test_import_incremental_export_cancelled(self, mock_import_units):
+        # the real set_progress checks whether the sync has been cancelled
+        del self.reposync.set_progress
+        self.conduit.build_cancel_report = mock.MagicMock()
+
+        def import_units(repo, repo_dir, index, validate, progress_callback):
+            self.reposync.cancelled = True
+            progress_callback([mock.Mock()])
+            self.fail('the import was not stopped')
+        mock_import_units.side_effect = import_units
+
+        report = self.reposync.import_incremental_export('/dir', self.index)
+
+        self.assertTrue(report is self.conduit.build_cancel_report.return_value)
+        self.assertTrue(report.canceled_flag)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.incremental.import_units',
+                side_effect=ValueError)
+    def test_import_incremental_export_failure(self, mock_import_units):
+        report = self.reposync.import_incremental_export('/dir', self.index)
+
+        self.assertTrue(report is self.conduit.build_failure_report.return_value)
+        self.assertEqual(self.reposync.content_report['state'], constants.STATE_FAILED)
+
+
+class TestCatalogGenerator(BaseSyncTest):
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.lazy_catalog.CatalogWriter')
+    def test_catalog_generator(self, mock_writer_class):
+        self.conduit.importer_object_id = 'abc123'
+        unit = mock.Mock(filename='foo.rpm', download_path='Packages/foo.rpm',
+                         storage_path='/storage/foo.rpm')
+
+        units = list(self.reposync.catalog_generator(self.url, [unit]))
+
+        self.assertEqual(units, [unit])
+        unit.set_storage_path.assert_called_once_with('foo.rpm')
+        mock_writer_class.assert_called_once_with('abc123')
+        writer = mock_writer_class.return_value
+        writer.add.assert_called_once_with('/storage/foo.rpm',
+                                           'http://pulpproject.org/Packages/foo.rpm', unit)
+        writer.flush.assert_called_once_with()
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.lazy_catalog.CatalogWriter')
+    def test_catalog_generator_closed(self, mock_writer_class):
+        units = self.reposync.catalog_generator(self.url, [mock.Mock(), mock.Mock()])
+        units.next()
+
+        units.close()
+
+        # the entries of the units that were generated are still written
+        mock_writer_class.return_value.flush.assert_called_once_with()
+
+
 @skip_broken
 class TestRun(BaseSyncTest):
     def setUp(self):
@@ -1637,6 +1746,29 @@ class TestFilteredUnitGenerator(BaseSyncTest):
         self.assertEqual(result, units[:2])
 
 
+class TestLargestFirst(unittest.TestCase):
+    def setUp(self):
+        self.units = [mock.Mock(size=size, unit_key_as_named_tuple=i)
+                      for i, size in enumerate([10, 300, 20, 100, 300])]
+
+    def test_all_units_ordered(self):
+        reopen_units = mock.Mock()
+
+        result = list(RepoSync._largest_first(iter(self.units), reopen_units))
+
+        self.assertEqual(result, [self.units[i] for i in (1, 4, 3, 2, 0)])
+        self.assertFalse(reopen_units.called)
+
+    @mock.patch('pulp_rpm.plugins.importers.yum.sync.LARGEST_FIRST_COUNT', 2)
+    def test_largest_then_metadata_order(self):
+        reopen_units = mock.Mock(return_value=iter(self.units))
+
+        result = list(RepoSync._largest_first(iter(self.units), reopen_units))
+
+        self.assertEqual(result, [self.units[i] for i in (1, 4, 0, 2, 3)])
+        reopen_units.assert_called_once_with()
+
+
 @skip_broken
 class TestAlreadyDownloadedUnits(BaseSyncTest):
     @mock.patch('pulp.plugins.conduits.repo_sync.RepoSyncConduit.search_all_units', autospec=True)
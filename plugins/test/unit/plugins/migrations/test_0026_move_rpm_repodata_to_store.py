@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from pulp.server.db.migrate.models import _import_all_the_way
+
+PATH_TO_MODULE = 'pulp_rpm.plugins.migrations.0026_move_rpm_repodata_to_store'
+migration = _import_all_the_way(PATH_TO_MODULE)
+
+
+@mock.patch(PATH_TO_MODULE + '.repodata_store')
+@mock.patch(PATH_TO_MODULE + '.connection')
+class TestMigrate(unittest.TestCase):
+    """
+    Test migration 0026
+    """
+
+    def test_migrate(self, connection, repodata_store):
+        repodata = {'primary': '<package/>', 'filelists': '<package/>', 'other': '<package/>'}
+        rpm_collection = mock.MagicMock()
+        rpm_collection.find.return_value.batch_size.return_value = [
+            {'_id': 'rpm1', 'checksumtype': 'sha256', 'checksum': 'abc', 'repodata': repodata}]
+        srpm_collection = mock.MagicMock()
+        srpm_collection.find.return_value.batch_size.return_value = []
+        connection.get_database.return_value = {'units_rpm': rpm_collection,
+                                                'units_srpm': srpm_collection}
+        repodata_store.get_store_dir.return_value = '/nonexistent/rpm_repodata'
+
+        migration.migrate()
+
+        rpm_collection.find.assert_called_once_with(
+            {'repodata': {'$nin': [{}, None]}}, ['checksumtype', 'checksum', 'repodata'])
+        repodata_store.write.assert_called_once_with('sha256', 'abc', repodata)
+        rpm_collection.update_one.assert_called_once_with({'_id': 'rpm1'},
+                                                          {'$set': {'repodata': {}}})
+        self.assertFalse(srpm_collection.update_one.called)
+
+    def test_remove_orphaned_repodata(self, connection, repodata_store):
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir)
+        os.makedirs(os.path.join(store_dir, 'sha256', 'ab'))
+        for name in ('cd.json.gz', 'ef.json.gz', 'ef.json.gz.tmp'):
+            open(os.path.join(store_dir, 'sha256', 'ab', name), 'w').close()
+        repodata_store.get_store_dir.return_value = store_dir
+        repodata_store.REPODATA_FILE_SUFFIX = '.json.gz'
+        rpm_collection = mock.MagicMock()
+        rpm_collection.distinct.return_value = ['abcd']
+        srpm_collection = mock.MagicMock()
+        srpm_collection.distinct.return_value = []
+
+        migration._remove_orphaned_repodata({'units_rpm': rpm_collection,
+                                             'units_srpm': srpm_collection})
+
+        query = rpm_collection.distinct.call_args[0][1]
+        self.assertEqual(query['checksumtype'], 'sha256')
+        self.assertEqual(sorted(query['checksum']['$in']), ['abcd', 'abef'])
+        repodata_store.delete.assert_called_once_with('sha256', 'abef')
@@ -36,3 +36,52 @@ class NectarFactoryTests(unittest.TestCase):
     def test_unknown_scheme(self):
         self.assertRaises(ValueError, nectar_factory.create_downloader, 'foo://bar',
                           self.mock_config, self.mock_event_listener)
+
+
+@mock.patch.object(nectar_factory, 'create_downloader')
+class SharedDownloadersTests(unittest.TestCase):
+    def setUp(self):
+        super(SharedDownloadersTests, self).setUp()
+        self.mock_config = mock.MagicMock()
+        self.downloaders = nectar_factory.SharedDownloaders(self.mock_config)
+
+    def test_reuse(self, mock_create):
+        mock_listener = mock.MagicMock()
+
+        downloader = self.downloaders.get('https://foo/repo/', mock_listener)
+        # http and https are downloaded by the same class, so they share the downloader
+        second_downloader = self.downloaders.get('http://foo/repo/images/')
+
+        mock_create.assert_called_once_with('https://foo/repo/', self.mock_config)
+        self.assertTrue(downloader is mock_create.return_value)
+        self.assertTrue(second_downloader is downloader)
+        # the listener of the latest caller receives the reports
+        self.assertTrue(downloader.event_listener is not mock_listener)
+
+    def test_listener(self, mock_create):
+        mock_listener = mock.MagicMock()
+
+        downloader = self.downloaders.get('https://foo/repo/', mock_listener)
+
+        self.assertTrue(downloader.event_listener is mock_listener)
+
+    def test_separate_schemes(self, mock_create):
+        mock_create.side_effect = lambda url, config: mock.MagicMock()
+
+        http_downloader = self.downloaders.get('https://foo/repo/')
+        file_downloader = self.downloaders.get('file:///foo/repo/')
+
+        self.assertEqual(mock_create.call_count, 2)
+        self.assertTrue(http_downloader is not file_downloader)
+
+    def test_cancel(self, mock_create):
+        downloader = self.downloaders.get('https://foo/repo/')
+
+        self.downloaders.cancel()
+
+        downloader.cancel.assert_called_once_with()
+
+    def test_unknown_scheme(self, mock_create):
+        mock_create.side_effect = ValueError
+
+        self.assertRaises(ValueError, self.downloaders.get, 'foo://bar')